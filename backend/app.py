@@ -3,22 +3,47 @@ Aplicação ClickSafe - Análise de URLs com integração ao banco de dados.
 """
 import asyncio
 import json
+import logging
+import os
 import sys
-from typing import Optional
+import time
+from typing import AsyncIterator, Iterable, Optional, Tuple
 from urllib.parse import urlparse
 from storage.db import (
     init_db,
+    is_db_initialized,
     clear_all_data,
     insert_analysis,
+    update_analysis_score,
+    update_analysis_explanation,
     insert_reputation_check,
     insert_heuristic_hit,
     insert_ai_request,
+    insert_analysis_spans,
+    get_analysis_by_id,
     get_analysis_by_url,
+    get_analysis_explanation,
     get_full_analysis,
+    get_stale_pending_explanations,
+    get_latest_analyses_by_urls,
     get_analyses_stats
 )
-from services.reputation import consolidate_reputation
-from services.xai import explain_result
+from services.reputation import (
+    consolidate_reputation,
+    positive_floor,
+    record_source_result,
+    score_sources,
+    NOT_QUERIED_REASONS,
+)
+from services.sources import SOURCE_REGISTRY
+from services.vt import poll_vt
+from services.circuit_breaker import is_failure
+from services.llm_queue import LLM_QUEUE, LLMUnavailable
+from services.worker_pool import WorkerPool
+from services.metrics import ANALYSES_IN_FLIGHT, record_cache
+from services.tracing import Trace, span, start_trace
+from services.log import get_logger, start_log_context, bind_log_context
+from services.xai import MODEL, PROMPT_TOKEN_BUDGET, build_prompt, estimate_tokens, explain_result, explain_result_stream
 from services.heuristics import (
     extract_url_components,
     # Domain heuristics
@@ -56,6 +81,55 @@ from services.heuristics import (
 )
 
 
+log = get_logger("app")
+
+# Níveis de análise, do mais rápido para o mais completo:
+# - quick: só heurísticas léxicas e fontes locais (sem rede nem IA)
+# - standard: + fontes de reputação rápidas (ex.: GSB) e heurísticas de DNS
+# - deep: tudo (WHOIS, HTTP, geolocalização, VirusTotal e explicação de IA)
+ANALYSIS_LEVELS = ("quick", "standard", "deep")
+DEFAULT_ANALYSIS_LEVEL = os.getenv("CLICKSAFE_ANALYSIS_LEVEL", "deep")
+
+# Classes de latência das fontes de reputação consultadas em cada nível (None = todas)
+_LEVEL_LATENCY_CLASSES = {
+    "quick": ("local",),
+    "standard": ("local", "fast"),
+    "deep": None,
+}
+
+# Nível mínimo de cada heurística que usa a rede (as restantes são léxicas e correm em todos os níveis)
+HEURISTIC_LEVELS = {
+    "DOMAIN_DNS_ANOMALY": "standard",
+    "DOMAIN_AGE": "deep",
+    "DOMAIN_EXPIRATION": "deep",
+    "DOMAIN_SSL_INVALID": "deep",
+    "DOMAIN_GEOLOCATION_RISK": "deep",
+    "MULTIPLE_REDIRECTS": "deep",
+}
+
+
+# Pontos de cada heurística acionada, por severidade (score de heurísticas = soma, máximo 100)
+SEVERITY_SCORES = {
+    "LOW": 5.0,      # 5 pontos por heurística LOW
+    "MEDIUM": 15.0,  # 15 pontos por heurística MEDIUM
+    "HIGH": 40.0,    # 40 pontos por heurística HIGH
+    "CRITICAL": 70.0 # 70 pontos por heurística CRITICAL
+}
+
+
+def validate_analysis_level(analysis_level: Optional[str]) -> str:
+    """Devolve o nível pedido (ou o padrão); lança ValueError se for desconhecido."""
+    analysis_level = analysis_level or DEFAULT_ANALYSIS_LEVEL
+    if analysis_level not in ANALYSIS_LEVELS:
+        raise ValueError(f"Nível de análise inválido: '{analysis_level}' (use {', '.join(ANALYSIS_LEVELS)})")
+    return analysis_level
+
+
+def levels_covering(analysis_level: str) -> Tuple[str, ...]:
+    """Níveis cujas análises servem um pedido deste nível (o próprio e os mais completos)."""
+    return ANALYSIS_LEVELS[ANALYSIS_LEVELS.index(analysis_level):]
+
+
 def normalize_url(url: str) -> str:
     """
     Normaliza uma URL para comparação e armazenamento.
@@ -92,14 +166,38 @@ def normalize_url(url: str) -> str:
 def _reputation_status_to_db_status(status: str) -> str:
     """
     Converte o status da API de reputação para o formato do banco.
-    POSITIVE/NEGATIVE/UNKNOWN -> POSITIVE/NEGATIVE
+    POSITIVE/NEGATIVE/UNKNOWN (qualquer outro valor é tratado como UNKNOWN)
     """
-    if status == "POSITIVE":
-        return "POSITIVE"
-    elif status == "NEGATIVE":
-        return "NEGATIVE"
-    else:  # UNKNOWN
-        return "NEGATIVE"  # UNKNOWN é tratado como NEGATIVE no banco
+    if status in ("POSITIVE", "NEGATIVE"):
+        return status
+    return "UNKNOWN"
+
+
+def uses_heuristics_only(analysis_level: str, source_names: Iterable[str]) -> bool:
+    """
+    Indica se o score de uma análise vem só das heurísticas: níveis sem IA em
+    que não foi planeada nenhuma fonte externa (mesmo que depois fique por
+    consultar). As fontes locais (lista de bloqueio) não contam, para o
+    veredito do nível não depender de o ficheiro existir: só podem subir o
+    score (ver `combine_scores`).
+    """
+    return analysis_level != "deep" and all(
+        SOURCE_REGISTRY[name].latency_class == "local" for name in source_names
+    )
+
+
+def combine_scores(reputation_score: float, heuristics_score: float, heuristics_only: bool,
+                   positive_floor: float = 0.0) -> float:
+    """
+    Score final de uma análise (0-100): com `heuristics_only` (ver
+    `uses_heuristics_only`, gravado em analyses) o de heurísticas, subido até
+    `positive_floor` (peso × 100 da fonte local POSITIVE, se houver); senão
+    `calculate_final_score`. O mesmo para o pipeline e para o rescoring
+    offline (rescore.py).
+    """
+    if heuristics_only:
+        return max(heuristics_score, positive_floor)
+    return calculate_final_score(reputation_score=reputation_score, heuristics_score=heuristics_score)
 
 
 def calculate_final_score(
@@ -156,23 +254,10 @@ def _get_heuristics_config() -> dict:
     return config
 
 
-async def run_heuristics(url: str) -> dict:
+def heuristic_checks(url: str, analysis_level: str = "deep") -> list:
     """
-    Executa todas as heurísticas na URL.
-    
-    Retorna:
-        {
-            "score": float,  # Score de 0-100
-            "hits": [        # Lista de heurísticas acionadas
-                {
-                    "code": str,
-                    "severity": str,
-                    "triggered": bool,
-                    "details": str
-                },
-                ...
-            ]
-        }
+    Verificações do nível de análise para a URL, como tuplos
+    (função, código_heurística, argumentos, descrição).
     """
     # Extrai componentes da URL
     dominio, caminho, parametros = extract_url_components(url)
@@ -220,17 +305,35 @@ async def run_heuristics(url: str) -> dict:
         (check_repeated_words, "KEYWORD_REPETITION", (url,), "Repetição de palavras-chave"),
     ]
     
-    # Busca configurações de todas as heurísticas de uma vez
-    heuristics_config = _get_heuristics_config()
+    # Só as heurísticas disponíveis neste nível de análise
+    allowed_levels = ANALYSIS_LEVELS[:ANALYSIS_LEVELS.index(analysis_level) + 1]
+    return [h for h in heuristics_map if HEURISTIC_LEVELS.get(h[1], "quick") in allowed_levels]
+
+
+async def run_heuristics(url: str, analysis_level: str = "deep") -> dict:
+    """
+    Executa as heurísticas do nível de análise na URL (ver HEURISTIC_LEVELS;
+    no nível "deep" executa todas).
     
-    # Valores simplificados por severidade (quando acionadas)
-    # Fórmula simples: soma direta, máximo 100
-    SEVERITY_SCORES = {
-        "LOW": 5.0,      # 5 pontos por heurística LOW
-        "MEDIUM": 15.0,  # 15 pontos por heurística MEDIUM
-        "HIGH": 40.0,    # 40 pontos por heurística HIGH
-        "CRITICAL": 70.0 # 70 pontos por heurística CRITICAL
-    }
+    Retorna:
+        {
+            "score": float,  # Score de 0-100
+            "hits": [        # Lista de heurísticas acionadas
+                {
+                    "code": str,
+                    "severity": str,
+                    "triggered": bool,
+                    "details": str,
+                    "elapsed_ms": float  # Duração da verificação
+                },
+                ...
+            ]
+        }
+    """
+    heuristics_map = heuristic_checks(url, analysis_level)
+    
+    # Busca configurações de todas as heurísticas de uma vez (fora do event loop)
+    heuristics_config = await asyncio.to_thread(_get_heuristics_config)
     
     hits = []
     score_by_severity = {
@@ -242,9 +345,16 @@ async def run_heuristics(url: str) -> dict:
     
     # Executa cada heurística
     for func, code, args, description in heuristics_map:
+        heuristic_span = None
         try:
-            # Chama a função
-            result = func(*args)
+            # Chama a função (medida: o tempo fica no hit e na linha temporal da análise)
+            # As de rede (WHOIS, DNS, SSL, geolocalização, redirecionamentos) bloqueiam:
+            # correm numa thread para não parar o event loop (e as outras análises)
+            with span(f"heuristic.{code}") as heuristic_span:
+                if code in HEURISTIC_LEVELS:
+                    result = await asyncio.to_thread(func, *args)
+                else:
+                    result = func(*args)
             
             # Busca configuração da heurística (severidade)
             config = heuristics_config.get(code, {"severity": "MEDIUM"})
@@ -270,18 +380,20 @@ async def run_heuristics(url: str) -> dict:
                 "code": code,
                 "severity": severity,
                 "triggered": triggered,
-                "details": details
+                "details": details,
+                "elapsed_ms": round(heuristic_span.elapsed_ms, 3)
             })
             
         except Exception as e:
-            print(f"⚠ Erro ao executar heurística {code}: {e}")
+            log.warning("Erro ao executar heurística %s: %s", code, e)
             # Em caso de erro, adiciona como não acionada
             config = heuristics_config.get(code, {"severity": "MEDIUM"})
             hits.append({
                 "code": code,
                 "severity": config["severity"],
                 "triggered": False,
-                "details": f"Erro: {str(e)}"
+                "details": f"Erro: {str(e)}",
+                "elapsed_ms": round(heuristic_span.elapsed_ms, 3) if heuristic_span else None
             })
     
     # Calcula score final de forma simples: soma direta dos pontos
@@ -301,15 +413,12 @@ async def run_heuristics(url: str) -> dict:
     # Limita o máximo a 100
     final_score = min(100.0, final_score)
     
-    # Log do cálculo (simplificado)
-    print(f"\n Cálculo do Score de Heurísticas:")
-    if score_breakdown:
-        for severity, breakdown in score_breakdown.items():
-            print(f"   {severity}: {breakdown['count']} heurística(s) × {breakdown['points_per_item']} = {breakdown['total_points']} pontos")
-        print(f"   Score total: {final_score:.2f}/100")
-    else:
-        print(f"   Nenhuma heurística acionada")
-        print(f"   Score: 0.00/100")
+    # Log do cálculo (só formatado com o nível DEBUG ativo)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Score de heurísticas: %.2f/100 (%s)", final_score, ", ".join(
+            f"{severity}: {b['count']} × {b['points_per_item']} = {b['total_points']}"
+            for severity, b in score_breakdown.items()
+        ) or "nenhuma heurística acionada")
     
     return {
         "score": final_score,
@@ -317,179 +426,801 @@ async def run_heuristics(url: str) -> dict:
     }
 
 
-async def analyze_url(url: str) -> dict:
+# Tarefas em background (referência forte para não serem recolhidas pelo GC)
+_background_tasks = set()
+
+# Workers que geram explicações adiadas (`analyze_url(..., defer_explanation=True)`)
+EXPLANATION_WORKERS = int(os.getenv("CLICKSAFE_EXPLANATION_WORKERS", "2"))
+# Máximo de explicações à espera na fila (as seguintes recebem logo a explicação manual)
+EXPLANATION_QUEUE_SIZE = int(os.getenv("CLICKSAFE_EXPLANATION_QUEUE_SIZE", "1000"))
+EXPLANATION_POOL = WorkerPool("explanations", workers=EXPLANATION_WORKERS, max_pending=EXPLANATION_QUEUE_SIZE)
+
+# Explicações pendentes há mais do que isto (s) no arranque ficaram órfãs (ex.: reinício do servidor)
+EXPLANATION_STALE_SECONDS = float(os.getenv("CLICKSAFE_EXPLANATION_STALE_SECONDS", "600"))
+
+# Texto gravado em analyses.explanation enquanto a explicação está pendente
+EXPLANATION_PENDING_TEXT = "Explicação em preparação..."
+
+# Eventos das explicações pendentes neste processo (acordam o long-polling)
+_explanation_events = {}
+_EXPLANATION_POLL_INTERVAL = 1.0
+
+# Espera máxima (s) pela explicação em curso antes de a refazer com o resultado do VirusTotal
+_EXPLANATION_REFRESH_WAIT = 300.0
+
+
+def _schedule_background(coro) -> asyncio.Task:
+    """Agenda uma coroutine em background no event loop atual."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def wait_background_tasks() -> int:
+    """
+    Aguarda as tarefas em background deste event loop (ex.: VirusTotal adiado
+    com `defer_vt`). Usado pelos processos que terminam (scan.py, worker.py)
+    para não deixarem análises pendentes a meio.
+    retorna o número de tarefas aguardadas
+    """
+    loop = asyncio.get_running_loop()
+    tasks = [task for task in _background_tasks if task.get_loop() is loop]
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return len(tasks)
+
+
+def _save_reputation_check(analysis_id: int, source_name: str, source_data: dict) -> None:
+    """Salva o resultado de uma fonte de reputação em reputation_checks."""
+    status = _reputation_status_to_db_status(source_data["status"])
+    raw_json = json.dumps(source_data.get("raw", {}), sort_keys=True)
+    reason = source_data.get("reason", "ok")
+    elapsed_ms = source_data.get("elapsed_ms")
+    
+    insert_reputation_check(
+        analysis_id=analysis_id,
+        source=source_name,
+        status=status,
+        raw_json=raw_json,
+        reason=reason,
+        elapsed_ms=elapsed_ms
+    )
+    log.debug("Verificação salva: %s %s (%s)", source_name, status, reason)
+
+
+async def _complete_vt_enrichment(analysis_id: int, url: str, normalized_url: str, verdict: dict) -> None:
+    """
+    Termina em background uma análise do VirusTotal que ficou pendente:
+    1. Aguarda o resultado (polling)
+    2. Salva a verificação em reputation_checks
+    3. Recalcula o score de reputação e o score final (combine_scores)
+    4. Atualiza a análise no banco: enrichment_status "complete", ou "failed"
+       se o VirusTotal falhar (timeout, erro, exceção ou cancelamento - o
+       score fica o calculado sem ele)
+    5. Atualiza a explicação, que foi escrita sem o resultado do VirusTotal
+    """
+    rep_result = verdict["rep_result"]
+    pending = rep_result["sources"]["VIRUSTOTAL"]
+    updated = False
+    try:
+        vt = await poll_vt(pending["raw"]["analysis_id"])
+        vt["elapsed_ms"] = (pending.get("elapsed_ms") or 0) + (vt.get("elapsed_ms") or 0)
+        record_source_result("VIRUSTOTAL", vt)
+        _save_reputation_check(analysis_id, "VIRUSTOTAL", vt)
+        
+        sources = {**rep_result["sources"], "VIRUSTOTAL": vt}
+        reputation_score, final_status = score_sources(sources)
+        new_score = combine_scores(reputation_score * 100, verdict["heuristics_score"], verdict["heuristics_only"],
+                                   positive_floor(sources) * 100)
+        enrichment_status = "failed" if is_failure(vt) else "complete"
+        update_analysis_score(analysis_id, new_score, enrichment_status=enrichment_status)
+        updated = True
+        log.info("VirusTotal concluído em background (%s): score %.2f/100", vt.get("reason", "ok"), new_score,
+                 extra={"analysis_id": analysis_id})
+        
+        new_rep_result = {**rep_result, "sources": sources, "_score": reputation_score, "final_status": final_status}
+        await _refresh_explanation(analysis_id, url, normalized_url, verdict, new_rep_result, new_score)
+    except Exception as e:
+        log.warning("Erro ao concluir VirusTotal em background: %s", e, extra={"analysis_id": analysis_id})
+    finally:
+        if not updated:
+            # Mantém o score original, mas não deixa a análise pendente para sempre
+            existing = get_analysis_by_id(analysis_id)
+            if existing:
+                update_analysis_score(analysis_id, existing["score"], enrichment_status="failed")
+
+
+async def _refresh_explanation(
+    analysis_id: int,
+    url: str,
+    normalized_url: str,
+    verdict: dict,
+    rep_result: dict,
+    final_score: float
+) -> None:
+    """
+    Refaz a explicação de uma análise cujo resultado mudou em background
+    (ex.: VirusTotal adiado). Nos níveis sem IA volta a escrever a explicação
+    manual; no nível "deep" só chama a IA se o score mudou, depois de
+    esperar pela explicação em curso (para esta não a sobrescrever).
+    """
+    heuristics_result = verdict["heuristics_result"]
+    analysis_level = verdict["analysis_level"]
+    if analysis_level != "deep":
+        update_analysis_explanation(
+            analysis_id, _fallback_explanation(rep_result, heuristics_result, analysis_level),
+            explanation_status="complete"
+        )
+        return
+    if final_score == verdict["final_score"]:
+        return
+    
+    await wait_for_explanation(analysis_id, timeout=_EXPLANATION_REFRESH_WAIT)
+    update_analysis_explanation(analysis_id, EXPLANATION_PENDING_TEXT, explanation_status="pending")
+    _explanation_events[analysis_id] = asyncio.Event()
+    try:
+        explanation = await _generate_explanation(normalized_url, heuristics_result, rep_result, final_score)
+        update_analysis_explanation(analysis_id, explanation, explanation_status="complete")
+        _save_ai_request(
+            analysis_id, url, heuristics_result, rep_result, final_score,
+            rep_result["_score"] * 100, verdict["heuristics_score"], explanation
+        )
+        log.debug("Explicação refeita com o novo score", extra={"analysis_id": analysis_id})
+    finally:
+        row = get_analysis_explanation(analysis_id)
+        if row and row["explanation_status"] == "pending":
+            # Cancelado a meio: fica a explicação manual, já com o resultado do VirusTotal
+            update_analysis_explanation(analysis_id, _fallback_explanation(rep_result, heuristics_result),
+                                        explanation_status="complete")
+        event = _explanation_events.pop(analysis_id, None)
+        if event is not None:
+            event.set()
+
+
+def _fallback_explanation(rep_result: dict, heuristics_result: dict, analysis_level: str = "deep") -> str:
+    """
+    Explicação manual (determinística) usada quando a IA não está disponível
+    e nos níveis de análise sem IA ("quick" e "standard").
+    """
+    final_reputation_status = rep_result.get("final_status", "UNKNOWN")
+    explanation_parts = []
+
+    gsb = rep_result["sources"].get("GOOGLE_SAFE_BROWSING", {})
+    vt = rep_result["sources"].get("VIRUSTOTAL", {})
+    
+    if not rep_result["sources"]:
+        # Nível "quick" sem fontes locais: nenhuma fonte de reputação consultada
+        explanation_parts.append("Fontes de reputação não consultadas.")
+    elif final_reputation_status == "POSITIVE":
+        # Identifica qual fonte detectou a ameaça
+        if gsb.get("status") == "POSITIVE":
+            explanation_parts.append("URL marcada como maliciosa por Google Safe Browsing.")
+        elif vt.get("status") == "POSITIVE":
+            explanation_parts.append("URL marcada como maliciosa por VirusTotal (GSB não detectou ameaça).")
+    elif final_reputation_status == "NEGATIVE":
+        # Todas as fontes verificadas retornaram negativo
+        checked_sources = []
+        if gsb.get("status") == "NEGATIVE":
+            checked_sources.append("Google Safe Browsing")
+        if vt.get("status") == "NEGATIVE":
+            checked_sources.append("VirusTotal")
+        
+        if checked_sources:
+            sources_str = ", ".join(checked_sources)
+            explanation_parts.append(f"URL verificada como segura por {sources_str}.")
+        else:
+            explanation_parts.append("URL verificada como segura.")
+    else:  # UNKNOWN
+        explanation_parts.append("Resultado indeterminado - algumas fontes não estão disponíveis.")
+        if gsb.get("status", "UNKNOWN") != "UNKNOWN":
+            explanation_parts.append(f"Google Safe Browsing: {gsb['status']}.")
+        if vt.get("reason") == "stub":
+            explanation_parts.append("VirusTotal ainda não configurado.")
+    
+    if heuristics_result["hits"]:
+        triggered_count = sum(1 for h in heuristics_result["hits"] if h.get("triggered", False))
+        explanation_parts.append(f"{triggered_count} heurística(s) acionada(s).")
+    else:
+        explanation_parts.append("Heurísticas ainda não implementadas.")
+    
+    if analysis_level != "deep":
+        explanation_parts.append(f"Análise de nível '{analysis_level}' (sem todas as verificações de rede nem explicação de IA).")
+    
+    return " ".join(explanation_parts) if explanation_parts else "Análise concluída."
+
+
+def _fallback_reason(error: Exception) -> str:
+    """Motivo do fallback para as métricas da fila do modelo."""
+    return error.reason if isinstance(error, LLMUnavailable) else "error"
+
+
+async def _generate_explanation(normalized_url: str, heuristics_result: dict, rep_result: dict, final_score: float) -> str:
+    """Gera a explicação com IA; se a IA falhar usa a explicação manual."""
+    try:
+        explanation = await explain_result(normalized_url, heuristics_result, rep_result, final_score)
+        log.debug("Explicação gerada com sucesso")
+        return explanation
+    except Exception as e:
+        log.warning("Erro ao gerar explicação com IA: %s", e)
+        # Fallback para explicação manual se a IA falhar ou a fila do modelo estiver cheia
+        LLM_QUEUE.record_fallback(_fallback_reason(e))
+        return _fallback_explanation(rep_result, heuristics_result)
+
+
+def _save_ai_request(
+    analysis_id: int,
+    url: str,
+    heuristics_result: dict,
+    rep_result: dict,
+    final_score: float,
+    reputation_score: float,
+    heuristics_score: float,
+    explanation: str
+) -> None:
+    """Salva a requisição de IA (prompt e resposta) em ai_requests."""
+    try:
+        prompt = build_prompt(url, heuristics_result, rep_result, final_score)
+        with span("db.ai_request"):
+            insert_ai_request(
+                analysis_id=analysis_id,
+                model=MODEL,
+                prompt=prompt,
+                response=explanation,
+                risk_score=final_score,
+                meta=json.dumps({
+                    "reputation_score": reputation_score,
+                    "heuristics_score": heuristics_score,
+                    "final_status": rep_result.get("final_status", "UNKNOWN"),
+                    "prompt_tokens": estimate_tokens(prompt),
+                    "prompt_token_budget": PROMPT_TOKEN_BUDGET
+                })
+            )
+        log.debug("Requisição de IA salva (modelo: %s)", MODEL)
+    except Exception as e:
+        log.warning("Erro ao salvar requisição de IA: %s", e, extra={"analysis_id": analysis_id})
+
+
+def _submit_explanation_job(
+    analysis_id: int,
+    url: str,
+    normalized_url: str,
+    heuristics_result: dict,
+    rep_result: dict,
+    final_score: float,
+    reputation_score: float,
+    heuristics_score: float
+) -> None:
+    """Coloca a geração da explicação de uma análise na fila dos workers de background."""
+    _explanation_events[analysis_id] = asyncio.Event()
+
+    async def job():
+        try:
+            explanation = await _generate_explanation(normalized_url, heuristics_result, rep_result, final_score)
+            update_analysis_explanation(analysis_id, explanation, explanation_status="complete")
+            _save_ai_request(
+                analysis_id, url, heuristics_result, rep_result,
+                final_score, reputation_score, heuristics_score, explanation
+            )
+            log.debug("Explicação gerada em background", extra={"analysis_id": analysis_id})
+        finally:
+            event = _explanation_events.pop(analysis_id, None)
+            if event is not None:
+                event.set()
+
+    try:
+        EXPLANATION_POOL.submit(job)
+    except asyncio.QueueFull:
+        # Fila cheia: explicação manual já, em vez de deixar a análise pendente
+        log.warning("Fila de explicações cheia (%d): explicação manual", EXPLANATION_POOL.pending,
+                    extra={"analysis_id": analysis_id})
+        LLM_QUEUE.record_fallback("explanation_queue_full")
+        update_analysis_explanation(analysis_id, _fallback_explanation(rep_result, heuristics_result),
+                                    explanation_status="complete")
+        _explanation_events.pop(analysis_id).set()
+        return
+    log.debug("Explicação na fila (%d à espera)", EXPLANATION_POOL.pending, extra={"analysis_id": analysis_id})
+
+
+def recover_pending_explanations(older_than_seconds: float = EXPLANATION_STALE_SECONDS) -> int:
+    """
+    Termina as explicações que ficaram pendentes sem job (a fila de explicações
+    vive em memória e perde-se quando o servidor para). Chamado no arranque dos
+    servidores: grava a explicação manual, reconstruída a partir das
+    verificações e heurísticas guardadas.
+    retorna o número de análises atualizadas
+    """
+    analysis_ids = get_stale_pending_explanations(older_than_seconds)
+    for analysis_id in analysis_ids:
+        analysis = get_full_analysis(analysis_id)
+        sources = {
+            check["source"]: {"status": check["status"], "reason": check.get("reason") or "ok"}
+            for check in analysis["reputation_checks"]
+        }
+        _, final_status = score_sources(sources)
+        rep_result = {"sources": sources, "final_status": final_status}
+        heuristics_result = {"hits": [{"triggered": bool(hit["triggered"])} for hit in analysis["heuristics_hits"]]}
+        update_analysis_explanation(
+            analysis_id, _fallback_explanation(rep_result, heuristics_result, analysis["analysis_level"]),
+            explanation_status="complete"
+        )
+    if analysis_ids:
+        log.warning("%d explicações pendentes sem job: gravada a explicação manual", len(analysis_ids))
+    return len(analysis_ids)
+
+
+async def wait_for_explanation(analysis_id: int, timeout: float = 0) -> Optional[dict]:
+    """
+    Long-polling da explicação de uma análise: espera até `timeout` segundos
+    enquanto a explicação estiver pendente.
+    Retorna id, explanation e explanation_status, ou None se a análise não existir.
+    """
+    deadline = time.monotonic() + max(0.0, timeout)
+    while True:
+        row = await asyncio.to_thread(get_analysis_explanation, analysis_id)
+        if row is None or row["explanation_status"] != "pending":
+            return row
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return row
+        event = _explanation_events.get(analysis_id)
+        # Sem evento (ex.: job noutro processo) volta a consultar o banco periodicamente
+        try:
+            if event is not None:
+                await asyncio.wait_for(event.wait(), timeout=remaining)
+            else:
+                await asyncio.sleep(min(remaining, _EXPLANATION_POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _score_url(normalized_url: str, defer_vt: bool = False, analysis_level: str = "deep",
+                     reputation_mode: Optional[str] = None) -> dict:
+    """
+    Consulta as fontes de reputação, executa as heurísticas e calcula o score final,
+    com as fontes e heurísticas do nível de análise (`reputation_mode`: ver
+    `consolidate_reputation`; por padrão CLICKSAFE_REPUTATION_MODE).
+    Retorna o veredito: rep_result, heuristics_result, reputation_score,
+    heuristics_score, final_score, heuristics_only, vt_pending e analysis_level.
+    """
+    with span("reputation"):
+        rep_result = await consolidate_reputation(
+            normalized_url, mode=reputation_mode, defer_vt=defer_vt,
+            latency_classes=_LEVEL_LATENCY_CLASSES[analysis_level]
+        )
+    vt_pending = rep_result["sources"].get("VIRUSTOTAL", {}).get("reason") == "pending"
+    
+    # Executa heurísticas (usa URL normalizada)
+    with span("heuristics"):
+        heuristics_result = await run_heuristics(normalized_url, analysis_level)
+    
+    # Calcula scores
+    # _score vem de 0.0-1.0, converter para 0-100
+    reputation_score = rep_result["_score"] * 100
+    # Score de heurísticas (sempre existe, será 0.0 se nenhuma acionada)
+    heuristics_score = heuristics_result.get("score", 0.0)
+    
+    heuristics_only = uses_heuristics_only(analysis_level, rep_result["sources"])
+    final_score = combine_scores(reputation_score, heuristics_score, heuristics_only,
+                                 positive_floor(rep_result["sources"]) * 100)
+    if heuristics_only:
+        log.debug("Score final (sem fontes de reputação externas): %.2f/100", final_score)
+    else:
+        log.debug("Score final: (reputação %.2f × 0.7) + (heurísticas %.2f × 0.3) = %.2f/100",
+                  reputation_score, heuristics_score, final_score)
+    
+    return {
+        "rep_result": rep_result,
+        "heuristics_result": heuristics_result,
+        "reputation_score": reputation_score,
+        "heuristics_score": heuristics_score,
+        "final_score": final_score,
+        "heuristics_only": heuristics_only,
+        "vt_pending": vt_pending,
+        "analysis_level": analysis_level,
+    }
+
+
+def _store_analysis(url: str, normalized_url: str, verdict: dict, explanation: str, explanation_status: str = "complete") -> int:
+    """
+    Salva a análise, as verificações de reputação e as heurísticas no banco
+    (e agenda o VirusTotal pendente). Retorna o ID da análise.
+    """
+    rep_result = verdict["rep_result"]
+    heuristics_result = verdict["heuristics_result"]
+    
+    # Salva a análise no banco
+    with span("db.insert_analysis"):
+        analysis_id = insert_analysis(
+            url=url,
+            normalized_url=normalized_url,
+            score=verdict["final_score"],
+            explanation=explanation,
+            enrichment_status="pending" if verdict["vt_pending"] else "complete",
+            explanation_status=explanation_status,
+            analysis_level=verdict["analysis_level"],
+            heuristics_only=verdict["heuristics_only"]
+        )
+    bind_log_context(analysis_id=analysis_id)
+    
+    # Salva cada verificação de reputação
+    with span("db.reputation_checks"):
+        for source_name, source_data in rep_result["sources"].items():
+            # Só salva se foi realmente verificada (não foi "not_checked" nem "over_budget")
+            # As pendentes ("pending") são salvas quando terminarem em background
+            if source_data.get("reason") in NOT_QUERIED_REASONS:
+                log.debug("%s: não verificado (%s)", source_name, source_data.get("reason"))
+                continue
+            
+            _save_reputation_check(analysis_id, source_name, source_data)
+    
+    # VirusTotal pendente: termina em background e atualiza o score
+    if verdict["vt_pending"]:
+        log.debug("VirusTotal pendente - a concluir em background")
+        _schedule_background(_complete_vt_enrichment(analysis_id, url, normalized_url, verdict))
+    
+    # Salva resultados de heurísticas
+    if heuristics_result["hits"]:
+        with span("db.heuristics_hits"):
+            for hit in heuristics_result["hits"]:
+                insert_heuristic_hit(
+                    analysis_id=analysis_id,
+                    heuristic_code=hit["code"],
+                    severity=hit["severity"],
+                    triggered=hit.get("triggered", False),
+                    details=hit.get("details"),
+                    elapsed_ms=hit.get("elapsed_ms")
+                )
+    
+    log.info("Análise gravada: score %.2f/100", verdict["final_score"],
+             extra={"triggered": sum(1 for hit in heuristics_result["hits"] if hit.get("triggered"))})
+    return analysis_id
+
+
+def _finish_trace(trace: Optional[Trace], analysis_id: Optional[int] = None) -> Optional[list]:
+    """
+    Fecha a linha temporal do pedido e devolve os spans (None sem tracing).
+    Se a análise foi criada neste pedido (analysis_id), grava-os em analysis_spans.
+    """
+    if trace is None:
+        return None
+    spans = trace.finish()
+    if analysis_id is not None:
+        try:
+            insert_analysis_spans(analysis_id, spans)
+        except Exception as e:
+            log.warning("Erro ao salvar a linha temporal da análise: %s", e, extra={"analysis_id": analysis_id})
+    return spans
+
+
+def _load_traced_analysis(analysis_id: int, trace: Optional[Trace], created: bool, include_trace: bool) -> dict:
+    """Lê a análise completa, fecha a linha temporal e junta-a ao resultado se pedida."""
+    with span("db.load_analysis"):
+        analysis = get_full_analysis(analysis_id)
+    spans = _finish_trace(trace, analysis_id if created else None)
+    if include_trace:
+        analysis["trace"] = spans or []
+    return analysis
+
+
+async def analyze_url(
+    url: str,
+    defer_vt: bool = False,
+    defer_explanation: bool = False,
+    analysis_level: Optional[str] = None,
+    include_trace: bool = False
+) -> dict:
     """
     Analisa uma URL completa:
     1. Consulta fontes de reputação (GSB real, VT/PT mockados)
     2. Salva no banco de dados
     3. Retorna o resultado completo
+    
+    Com `defer_vt=True`, se o VirusTotal ainda tiver a análise em fila, a
+    resposta é devolvida logo (enrichment_status "pending") e o VirusTotal é
+    terminado em background, atualizando o score da análise no banco.
+    
+    Com `defer_explanation=True` a análise é devolvida assim que o score está
+    calculado (explanation_status "pending"); a explicação é gerada pelos
+    workers de background e pode ser obtida em `wait_for_explanation`.
+    
+    `analysis_level` ("quick", "standard" ou "deep", padrão DEFAULT_ANALYSIS_LEVEL)
+    escolhe as verificações feitas (ver ANALYSIS_LEVELS); só o nível "deep" usa
+    a IA. Uma análise guardada só é reutilizada se tiver sido feita com um
+    nível igual ou mais completo.
+    
+    As etapas (fontes, heurísticas, IA, banco) são medidas com services.tracing;
+    numa análise nova a linha temporal fica em analysis_spans e as durações
+    das heurísticas em heuristics_hits.elapsed_ms. Com `include_trace=True`
+    a linha temporal deste pedido vem em "trace".
     """
+    ANALYSES_IN_FLIGHT.inc()
+    try:
+        return await _analyze_url(url, defer_vt, defer_explanation, analysis_level, include_trace)
+    finally:
+        ANALYSES_IN_FLIGHT.dec()
+
+
+async def _analyze_url(
+    url: str,
+    defer_vt: bool,
+    defer_explanation: bool,
+    analysis_level: Optional[str],
+    include_trace: bool
+) -> dict:
+    """Corpo de `analyze_url` (o invólucro conta as análises em curso)."""
+    analysis_level = validate_analysis_level(analysis_level)
+    trace = start_trace("analyze_url")
+    if trace is not None:
+        trace.attrs["analysis_level"] = analysis_level
+    
     # Normaliza a URL
     normalized_url = normalize_url(url)
+    start_log_context(url=normalized_url, analysis_level=analysis_level)
     
-    # Verifica se já existe análise recente
-    existing = get_analysis_by_url(normalized_url)
+    # Verifica se já existe análise recente (de um nível igual ou mais completo)
+    with span("db.cache_lookup") as lookup_span:
+        existing = get_analysis_by_url(normalized_url, levels_covering(analysis_level))
+        lookup_span.attrs["hit"] = existing is not None
+    record_cache("analysis", existing is not None)
     if existing:
-        print(f"Análise existente encontrada (ID: {existing['id']})")
-        return get_full_analysis(existing['id'])
+        bind_log_context(analysis_id=existing['id'])
+        log.debug("Análise existente encontrada")
+        return _load_traced_analysis(existing['id'], trace, created=False, include_trace=include_trace)
     
     # Consulta fontes de reputação
-    print(f"Analisando URL: {url}")
-    print(f"Normalizada: {normalized_url}")
-    
-    rep_result = await consolidate_reputation(normalized_url)
+    log.debug("Analisando URL: %s", url)
     
-    # Executa heurísticas (usa URL normalizada)
-    heuristics_result = await run_heuristics(normalized_url)
+    verdict = await _score_url(normalized_url, defer_vt=defer_vt, analysis_level=analysis_level)
+    rep_result = verdict["rep_result"]
+    heuristics_result = verdict["heuristics_result"]
+    final_score = verdict["final_score"]
     
-    # Calcula scores
-    # _score vem de 0.0-1.0, converter para 0-100
-    reputation_score = rep_result["_score"] * 100
-    final_reputation_status = rep_result.get("final_status", "UNKNOWN")
-    # Score de heurísticas (sempre existe, será 0.0 se nenhuma acionada)
-    heuristics_score = heuristics_result.get("score", 0.0)
+    if analysis_level != "deep":
+        # Níveis sem IA: explicação manual, sem requisição de IA
+        explanation = _fallback_explanation(rep_result, heuristics_result, analysis_level)
+        analysis_id = _store_analysis(url, normalized_url, verdict, explanation)
+        return _load_traced_analysis(analysis_id, trace, created=True, include_trace=include_trace)
     
-    # Log dos scores individuais
-    print(f"\nScores Individuais:")
-    print(f"   Reputação: {reputation_score:.2f}/100")
-    print(f"   Heurísticas: {heuristics_score:.2f}/100")
+    # Gera explicação usando IA (xai), ou deixa-a pendente para os workers de background
+    if defer_explanation:
+        log.debug("Explicação adiada - será gerada em background")
+        explanation = EXPLANATION_PENDING_TEXT
+    else:
+        log.debug("Gerando explicação com IA")
+        with span("explanation"):
+            explanation = await _generate_explanation(normalized_url, heuristics_result, rep_result, final_score)
     
-    # Calcula score final combinado
-    final_score = calculate_final_score(
-        reputation_score=reputation_score,
-        heuristics_score=heuristics_score
+    analysis_id = _store_analysis(
+        url, normalized_url, verdict, explanation,
+        explanation_status="pending" if defer_explanation else "complete"
     )
     
-    # Log do cálculo final
-    print(f"\n Cálculo do Score Final:")
-    print(f"   (Reputação × 70%) + (Heurísticas × 30%)")
-    print(f"   ({reputation_score:.2f} × 0.7) + ({heuristics_score:.2f} × 0.3)")
-    print(f"   = {reputation_score * 0.7:.2f} + {heuristics_score * 0.3:.2f}")
-    print(f"   = {final_score:.2f}/100")
+    if defer_explanation:
+        # A requisição de IA é salva pelo worker quando a explicação estiver pronta
+        _submit_explanation_job(
+            analysis_id, url, normalized_url, heuristics_result, rep_result,
+            final_score, verdict["reputation_score"], verdict["heuristics_score"]
+        )
+    else:
+        _save_ai_request(
+            analysis_id, url, heuristics_result, rep_result,
+            final_score, verdict["reputation_score"], verdict["heuristics_score"], explanation
+        )
+    
+    # Retorna análise completa
+    return _load_traced_analysis(analysis_id, trace, created=True, include_trace=include_trace)
+
+
+async def analyze_url_stream(
+    url: str,
+    defer_vt: bool = False,
+    analysis_level: Optional[str] = None
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Versão em streaming de `analyze_url`, que devolve eventos (nome, dados):
+    
+    - "analysis": análise já salva com o score (explanation_status "pending")
+    - "token": pedaço da explicação à medida que o modelo o gera ({"text": ...})
+    - "done": explicação completa, já salva em analyses e ai_requests
+      ({"id", "explanation", "explanation_status", "fallback"})
     
-    # Gera explicação usando IA (xai)
-    print("Gerando explicação com IA...")
+    Se a IA falhar a meio, o evento "done" traz a explicação manual
+    (fallback=True), que substitui o texto recebido até aí.
+    Nos níveis sem IA ("quick", "standard") não há eventos "token".
+    """
+    ANALYSES_IN_FLIGHT.inc()
     try:
-        explanation = explain_result(normalized_url, heuristics_result, rep_result, final_score)
-        print("✓ Explicação gerada com sucesso")
-    except Exception as e:
-        print(f"⚠ Erro ao gerar explicação com IA: {e}")
-        # Fallback para explicação manual se a IA falhar
-        explanation_parts = []
+        async for event in _analyze_url_stream(url, defer_vt, analysis_level):
+            yield event
+    finally:
+        ANALYSES_IN_FLIGHT.dec()
+
+
+async def _analyze_url_stream(
+    url: str,
+    defer_vt: bool,
+    analysis_level: Optional[str]
+) -> AsyncIterator[Tuple[str, dict]]:
+    """Corpo de `analyze_url_stream` (o invólucro conta as análises em curso)."""
+    analysis_level = validate_analysis_level(analysis_level)
+    trace = start_trace("analyze_url_stream")
+    if trace is not None:
+        trace.attrs["analysis_level"] = analysis_level
+    normalized_url = normalize_url(url)
+    start_log_context(url=normalized_url, analysis_level=analysis_level, stream=True)
     
-        gsb = rep_result["sources"]["GOOGLE_SAFE_BROWSING"]
-        vt = rep_result["sources"].get("VIRUSTOTAL", {})
-        
-        if final_reputation_status == "POSITIVE":
-            # Identifica qual fonte detectou a ameaça
-            if gsb["status"] == "POSITIVE":
-                explanation_parts.append("URL marcada como maliciosa por Google Safe Browsing.")
-            elif vt.get("status") == "POSITIVE":
-                explanation_parts.append("URL marcada como maliciosa por VirusTotal (GSB não detectou ameaça).")
-        elif final_reputation_status == "NEGATIVE":
-            # Todas as fontes verificadas retornaram negativo
-            checked_sources = []
-            if gsb["status"] == "NEGATIVE":
-                checked_sources.append("Google Safe Browsing")
-            if vt.get("status") == "NEGATIVE":
-                checked_sources.append("VirusTotal")
-            
-            if checked_sources:
-                sources_str = ", ".join(checked_sources)
-                explanation_parts.append(f"URL verificada como segura por {sources_str}.")
-            else:
-                explanation_parts.append("URL verificada como segura.")
-        else:  # UNKNOWN
-            explanation_parts.append("Resultado indeterminado - algumas fontes não estão disponíveis.")
-            if gsb["status"] != "UNKNOWN":
-                explanation_parts.append(f"Google Safe Browsing: {gsb['status']}.")
-            if vt.get("reason") == "stub":
-                explanation_parts.append("VirusTotal ainda não configurado.")
-        
-        if heuristics_result["hits"]:
-            triggered_count = sum(1 for h in heuristics_result["hits"] if h.get("triggered", False))
-            explanation_parts.append(f"{triggered_count} heurística(s) acionada(s).")
+    with span("db.cache_lookup") as lookup_span:
+        existing = get_analysis_by_url(normalized_url, levels_covering(analysis_level))
+        lookup_span.attrs["hit"] = existing is not None
+    record_cache("analysis", existing is not None)
+    if existing:
+        bind_log_context(analysis_id=existing['id'])
+        log.debug("Análise existente encontrada")
+        analysis = get_full_analysis(existing['id'])
+        _finish_trace(trace)
+        yield "analysis", analysis
+        yield "done", {
+            "id": analysis["id"],
+            "explanation": analysis["explanation"],
+            "explanation_status": analysis["explanation_status"],
+            "fallback": False,
+        }
+        return
+    
+    log.debug("Analisando URL (streaming): %s", url)
+    
+    verdict = await _score_url(normalized_url, defer_vt=defer_vt, analysis_level=analysis_level)
+    rep_result = verdict["rep_result"]
+    heuristics_result = verdict["heuristics_result"]
+    final_score = verdict["final_score"]
+    
+    if analysis_level != "deep":
+        explanation = _fallback_explanation(rep_result, heuristics_result, analysis_level)
+        analysis_id = _store_analysis(url, normalized_url, verdict, explanation)
+        _finish_trace(trace, analysis_id)
+        yield "analysis", get_full_analysis(analysis_id)
+        yield "done", {
+            "id": analysis_id,
+            "explanation": explanation,
+            "explanation_status": "complete",
+            "fallback": False,
+        }
+        return
+    
+    analysis_id = _store_analysis(url, normalized_url, verdict, EXPLANATION_PENDING_TEXT, explanation_status="pending")
+    yield "analysis", get_full_analysis(analysis_id)
+    
+    log.debug("Gerando explicação com IA (streaming)")
+    chunks = []
+    fallback = False
+    completed = False
+    try:
+        try:
+            with span("explanation", stream=True):
+                async for token in explain_result_stream(normalized_url, heuristics_result, rep_result, final_score):
+                    chunks.append(token)
+                    yield "token", {"text": token}
+            explanation = "".join(chunks).strip()
+            log.debug("Explicação gerada com sucesso")
+        except Exception as e:
+            log.warning("Erro ao gerar explicação com IA: %s", e)
+            explanation = ""
+            fallback_reason = _fallback_reason(e)
         else:
-            explanation_parts.append("Heurísticas ainda não implementadas.")
+            fallback_reason = "empty"
+        if not explanation:
+            # Fallback para explicação manual se a IA falhar (ou não devolver texto)
+            explanation = _fallback_explanation(rep_result, heuristics_result)
+            fallback = True
+            LLM_QUEUE.record_fallback(fallback_reason)
         
-        explanation = " ".join(explanation_parts) if explanation_parts else "Análise concluída."
+        update_analysis_explanation(analysis_id, explanation, explanation_status="complete")
+        completed = True
+    finally:
+        if not completed:
+            # Cliente desligou a meio do streaming: não deixa a análise pendente para sempre
+            update_analysis_explanation(
+                analysis_id, _fallback_explanation(rep_result, heuristics_result), explanation_status="complete"
+            )
     
-    # Salva a análise no banco
-    print("Salvando no banco de dados...")
-    analysis_id = insert_analysis(
-        url=url,
-        normalized_url=normalized_url,
-        score=final_score,
-        explanation=explanation
+    _save_ai_request(
+        analysis_id, url, heuristics_result, rep_result,
+        final_score, verdict["reputation_score"], verdict["heuristics_score"], explanation
     )
-    print(f"Análise criada com ID: {analysis_id}")
+    _finish_trace(trace, analysis_id)
+    yield "done", {
+        "id": analysis_id,
+        "explanation": explanation,
+        "explanation_status": "complete",
+        "fallback": fallback,
+    }
+
+
+# Lotes (`analyze_batch`): análises em simultâneo e máximo de URLs por pedido
+BATCH_CONCURRENCY = int(os.getenv("CLICKSAFE_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_URLS = int(os.getenv("CLICKSAFE_BATCH_MAX_URLS", "5000"))
+
+
+def summarize_analysis(url: str, analysis: dict, cached: bool) -> dict:
+    """Resultado compacto de uma URL num lote (a análise completa fica em /api/analysis/{id})."""
+    return {
+        "url": url,
+        "id": analysis["id"],
+        "normalized_url": analysis.get("url_normalized"),
+        "score": analysis["score"],
+        "analysis_level": analysis.get("analysis_level"),
+        "enrichment_status": analysis.get("enrichment_status"),
+        "explanation_status": analysis.get("explanation_status"),
+        "explanation": analysis.get("explanation"),
+        "cached": cached,
+    }
+
+
+async def analyze_batch(
+    urls: Iterable[str],
+    concurrency: Optional[int] = None,
+    analysis_level: Optional[str] = None,
+    defer_vt: bool = False,
+    defer_explanation: bool = False
+) -> AsyncIterator[dict]:
+    """
+    Analisa um lote de URLs e devolve um resultado por URL à medida que terminam.
     
-    # Salva cada verificação de reputação
-    print("Salvando verificações de reputação...")
-    for source_name, source_data in rep_result["sources"].items():
-        # APIVOID desabilitado temporariamente - ignora se aparecer
-        if source_name == "APIVOID":
-            print(f"   - {source_name}: ignorado (desabilitado temporariamente)")
-            continue
-        
-        # Só salva se foi realmente verificada (não foi "not_checked")
-        if source_data.get("reason") == "not_checked":
-            print(f"   - {source_name}: não verificado (verificação anterior detectou ameaça)")
+    1. Normaliza as URLs e remove duplicadas (fica a primeira ocorrência)
+    2. Busca de uma vez as que já têm análise no banco (nível igual ou mais
+       completo) e devolve-as logo (cached=True)
+    3. Analisa as restantes com `analyze_url`, no máximo `concurrency` em
+       simultâneo (padrão BATCH_CONCURRENCY), pela ordem em que terminam
+    
+    Cada resultado é o resumo de `summarize_analysis`, ou {"url", "error"} se a
+    URL falhar (as outras continuam).
+    """
+    analysis_level = validate_analysis_level(analysis_level)
+    concurrency = max(1, concurrency or BATCH_CONCURRENCY)
+    
+    unique = {}
+    for url in urls:
+        url = (url or "").strip()
+        if not url:
             continue
-        
-        status = _reputation_status_to_db_status(source_data["status"])
-        raw_json = json.dumps(source_data)
-        reason = source_data.get("reason", "ok")
-        elapsed_ms = source_data.get("elapsed_ms")
-        
-        insert_reputation_check(
-            analysis_id=analysis_id,
-            source=source_name,
-            status=status,
-            raw_json=raw_json,
-            reason=reason,
-            elapsed_ms=elapsed_ms
-        )
-        print(f"   ✓ {source_name}: {status} ({reason})")
+        try:
+            unique.setdefault(normalize_url(url), url)
+        except Exception as e:
+            yield {"url": url, "error": f"URL inválida: {e}"}
     
-    # Salva resultados de heurísticas (vazias por hora)
-    if heuristics_result["hits"]:
-        print("Salvando resultados de heurísticas...")
-        for hit in heuristics_result["hits"]:
-            insert_heuristic_hit(
-                analysis_id=analysis_id,
-                heuristic_code=hit["code"],
-                severity=hit["severity"],
-                triggered=hit.get("triggered", False),
-                details=hit.get("details")
-            )
-            print(f"   ✓ {hit['code']}: {hit['severity']} (triggered={hit.get('triggered', False)})")
-    else:
-        print("Heurísticas vazias (não implementadas ainda)")
+    cached = get_latest_analyses_by_urls(list(unique), levels_covering(analysis_level))
+    for normalized_url, analysis in cached.items():
+        yield summarize_analysis(unique[normalized_url], analysis, cached=True)
     
-    # Salva requisição de IA
-    print("Salvando requisição de IA...")
-    try:
-        from services.xai import MODEL, build_prompt
-        prompt = build_prompt(url, heuristics_result, rep_result, final_score)
-        insert_ai_request(
-            analysis_id=analysis_id,
-            model=MODEL,
-            prompt=prompt,
-            response=explanation,
-            risk_score=final_score,
-            meta=json.dumps({
-                "reputation_score": reputation_score,
-                "heuristics_score": heuristics_score,
-                "final_status": final_reputation_status
-            })
-        )
-        print(f"   ✓ Requisição de IA salva (modelo: {MODEL})")
-    except Exception as e:
-        print(f"   ⚠ Erro ao salvar requisição de IA: {e}")
+    pending = [(normalized, url) for normalized, url in unique.items() if normalized not in cached]
+    if not pending:
+        return
+    log.info("Lote: %d em cache, %d a analisar (%d em simultâneo)", len(cached), len(pending), concurrency)
     
-    # Retorna análise completa
-    return get_full_analysis(analysis_id)
+    results: asyncio.Queue = asyncio.Queue()
+    remaining = iter(pending)
+    
+    async def worker():
+        for _, url in remaining:
+            try:
+                analysis = await analyze_url(
+                    url, defer_vt=defer_vt, defer_explanation=defer_explanation, analysis_level=analysis_level
+                )
+                await results.put(summarize_analysis(url, analysis, cached=False))
+            except Exception as e:
+                log.warning("Erro ao analisar %s no lote: %s", url, e)
+                await results.put({"url": url, "error": str(e)})
+    
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(pending)))]
+    try:
+        for _ in range(len(pending)):
+            yield await results.get()
+    finally:
+        # Cliente desligou a meio: as análises ainda por começar não são feitas
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
 
 
 async def main():
@@ -505,6 +1236,14 @@ async def main():
     # Verifica se deve limpar o banco antes
     clear_db = "--clear" in sys.argv or "-c" in sys.argv
     
+    # Nível de análise: --level=quick|standard|deep
+    level_args = [arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--level=")]
+    analysis_level = level_args[-1] if level_args else None
+    
+    # Análises em simultâneo: --concurrency=N
+    concurrency_args = [arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--concurrency=")]
+    concurrency = int(concurrency_args[-1]) if concurrency_args else BATCH_CONCURRENCY
+    
     # Pega URLs dos argumentos da linha de comando
     urls_from_args = [arg for arg in sys.argv[1:] if not arg.startswith("--") and not arg.startswith("-")]
     
@@ -514,9 +1253,10 @@ async def main():
     else:
         test_urls = TEST_URLS
     
-    # Inicializa o banco de dados
-    print("Inicializando banco de dados...")
-    init_db()
+    # Inicializa o banco de dados (só se ainda não tiver o schema atual)
+    if not is_db_initialized():
+        print("Inicializando banco de dados...")
+        init_db()
     
     # Limpa o banco se solicitado
     if clear_db:
@@ -524,10 +1264,17 @@ async def main():
         clear_all_data()
         print()
     
-    # Processa cada URL
-    for url in test_urls:
+    # Analisa as URLs em simultâneo (no máximo `concurrency`) e mostra os resultados pela ordem dada
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def bounded_analyze(url):
+        async with semaphore:
+            return await analyze_url(url, analysis_level=analysis_level)
+    
+    results = await asyncio.gather(*[bounded_analyze(url) for url in test_urls])
+    
+    for url, result in zip(test_urls, results):
         print("\n" + "="*60)
-        result = await analyze_url(url)
         
         if result:
             # Determina status final baseado no score
@@ -580,14 +1327,17 @@ async def main():
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] in ["--help", "-h"]:
-        print("Uso: python app.py [--clear] [URL1] [URL2] ...")
+        print("Uso: python app.py [--clear] [--level=NÍVEL] [URL1] [URL2] ...")
         print("\nOpções:")
         print("  --clear, -c    Limpa o banco de dados antes de executar")
+        print("  --level=NÍVEL  Nível de análise: quick, standard ou deep (padrão)")
+        print("  --concurrency=N  Análises em simultâneo (padrão: CLICKSAFE_BATCH_CONCURRENCY)")
         print("  URL1 URL2 ...  URLs para analisar (opcional)")
         print("\nExemplos:")
         print("  python app.py")
         print("  python app.py --clear")
         print("  python app.py https://example.com")
+        print("  python app.py --level=quick https://example.com")
         print("  python app.py --clear https://google.com https://example.com")
         sys.exit(0)
     
@@ -0,0 +1,368 @@
+#backend/benchmarks/bench_pipeline.py
+"""
+Suite de benchmarks do pipeline, contra os stand-ins locais dos serviços
+externos (`upstreams.py`: GSB, VirusTotal, WHOIS, DNS, ip-api, o site
+analisado e o Ollama), com latência configurável e num banco temporário.
+
+Mede:
+- `normalize_url` e cada heurística léxica (`heuristic.<código>`);
+- `run_heuristics` por nível (no "deep" inclui WHOIS, DNS, ip-api e o site);
+- `consolidate_reputation` (standard: blocklist + GSB; deep: + VirusTotal);
+- `explain_result` (sem o cache de explicações);
+- escritas e leituras de `storage/db.py`;
+- `POST /api/analyze` de ponta a ponta (`server.py`), com URLs novas a cada pedido.
+
+O resultado é um JSON com a mediana, p95, média, etc. (ms por operação) de
+cada benchmark e os metadados da execução (commit, Python, latências), para
+comparar entre commits com `--compare`.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_pipeline --output bench.json
+    python -m benchmarks.bench_pipeline --only "heuristic|normalize" --repeat 50
+    python -m benchmarks.bench_pipeline --latency gsb=150,vt=400 --output lento.json
+    python -m benchmarks.bench_pipeline --output novo.json --compare bench.json --fail-on-regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.upstreams import DEFAULT_LATENCY_MS, run_upstreams
+from services.circuit_breaker import percentile
+
+# Versão do formato do JSON de resultados
+RESULTS_SCHEMA = 1
+
+# URLs de teste: cobrem os padrões que as heurísticas léxicas procuram
+CORPUS = [
+    "https://www.example.com/",
+    "http://example.org/about/team",
+    "https://secure-login-update.example.xyz/account/verify?user=me@example.com&token=abc123",
+    "http://paypa1-secure.com/signin/confirm.php?redirect=http://evil.example.net/&session=1",
+    "https://a.b.c.d.example.co.uk/free/prize/winner/claim/now/today/index.html",
+    "http://192.168.10.20/admin/login?password=123&email=x@y.pt",
+    "https://bit.ly/3xYzAbC",
+    "https://example.com/download/invoice.pdf.exe?data=VGhpcyBpcyBhIHRlc3Qgc3RyaW5nIHdpdGggbW9yZSB0aGFuIDEwMCBjaGFyYWN0ZXJz",
+]
+
+
+class Benchmark(object):
+    """
+    Um benchmark: `run()` é uma operação (síncrona ou coroutine). Cada amostra
+    corre `number` operações; o resultado é o tempo por operação em ms.
+    """
+
+    def __init__(self, name: str, run: Callable[[], Any], repeat: int = 20, number: int = 1,
+                 is_async: bool = False):
+        self.name = name
+        self.run = run
+        self.repeat = repeat
+        self.number = number
+        self.is_async = is_async
+
+    async def measure(self, repeat: Optional[int] = None) -> List[float]:
+        # Aquecimento (imports, caches de compilação de regex, ligações)
+        await self._call()
+        samples = []
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            for _ in range(self.number):
+                await self._call()
+            samples.append((time.perf_counter() - start) * 1000 / self.number)
+        return samples
+
+    async def _call(self) -> None:
+        result = self.run()
+        if self.is_async:
+            await result
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "samples": len(samples),
+        "median": round(statistics.median(samples), 4),
+        "p95": round(percentile(samples, 95), 4),
+        "mean": round(statistics.mean(samples), 4),
+        "min": round(min(samples), 4),
+        "max": round(max(samples), 4),
+        "stdev": round(statistics.stdev(samples), 4) if len(samples) > 1 else 0.0,
+    }
+
+
+def _cycle(values: List) -> Callable[[], Any]:
+    """Devolve, a cada chamada, o elemento seguinte de `values` (em ciclo)."""
+    state = {"i": -1}
+
+    def next_value():
+        state["i"] = (state["i"] + 1) % len(values)
+        return values[state["i"]]
+    return next_value
+
+
+def _unique_urls(prefix: str) -> Callable[[], str]:
+    """URLs do corpus com um parâmetro único (nunca vêm do cache de análises)."""
+    next_url = _cycle(CORPUS)
+    counter = {"n": 0}
+
+    def unique():
+        counter["n"] += 1
+        url = next_url()
+        separator = "&" if "?" in url else "?"
+        return f"{url}{separator}{prefix}={counter['n']}-{time.time_ns()}"
+    return unique
+
+
+def _run_checks(calls: List) -> None:
+    # Como em run_heuristics: uma exceção conta como verificação sem resultado
+    for func, args in calls:
+        try:
+            func(*args)
+        except Exception:
+            pass
+
+
+def build_core_benchmarks() -> List[Benchmark]:
+    """Benchmarks chamados diretamente (importa o backend: só depois de `run_upstreams`)."""
+    from app import HEURISTIC_LEVELS, heuristic_checks, normalize_url, run_heuristics
+    from services.reputation import consolidate_reputation
+    from services.xai import explain_result
+    from storage.db import (
+        get_analysis_by_url,
+        get_full_analysis,
+        insert_analysis,
+        insert_heuristic_hit,
+    )
+
+    benchmarks = [Benchmark("normalize_url", lambda: [normalize_url(u) for u in CORPUS], repeat=50, number=20)]
+
+    # Cada heurística léxica sobre o corpus inteiro (as de rede são medidas em run_heuristics.deep)
+    checks: Dict[str, List] = {}
+    for url in CORPUS:
+        for func, code, args, _ in heuristic_checks(url, "quick"):
+            if code not in HEURISTIC_LEVELS:
+                checks.setdefault(code, []).append((func, args))
+    for code, calls in checks.items():
+        benchmarks.append(Benchmark(f"heuristic.{code}", lambda calls=calls: _run_checks(calls), repeat=30, number=10))
+
+    next_url = _cycle(CORPUS)
+    for level, repeat in (("quick", 30), ("standard", 20), ("deep", 10)):
+        benchmarks.append(Benchmark(
+            f"run_heuristics.{level}", lambda level=level: run_heuristics(next_url(), level),
+            repeat=repeat, is_async=True))
+
+    benchmarks.append(Benchmark(
+        "consolidate_reputation.standard",
+        lambda: consolidate_reputation(next_url(), latency_classes=("local", "fast")), repeat=20, is_async=True))
+    benchmarks.append(Benchmark(
+        "consolidate_reputation.deep", lambda: consolidate_reputation(next_url(), mode="parallel"),
+        repeat=20, is_async=True))
+
+    verdict = {
+        "heuristics": {"score": 55.0, "hits": [
+            {"code": "DOMAIN_TLD_RISK", "severity": "MEDIUM", "triggered": True, "details": "TLD suspeito: detectado"},
+            {"code": "PARAMS_SENSITIVE_VARIABLES", "severity": "HIGH", "triggered": True,
+             "details": "Variáveis sensíveis: detectado"},
+            {"code": "DOMAIN_HAS_HTTPS", "severity": "LOW", "triggered": False, "details": "Ausência de HTTPS: não detectado"},
+        ]},
+        "reputation": {"sources": {
+            "GOOGLE_SAFE_BROWSING": {"status": "NEGATIVE", "reason": "ok", "raw": {}, "elapsed_ms": 40},
+            "VIRUSTOTAL": {"status": "UNKNOWN", "reason": "timeout", "raw": {}, "elapsed_ms": 10000},
+        }, "_score": 0.5, "final_status": "UNKNOWN"},
+    }
+    benchmarks.append(Benchmark(
+        "explain_result",
+        lambda: explain_result(next_url(), verdict["heuristics"], verdict["reputation"], 58.0, use_cache=False),
+        repeat=10, is_async=True))
+
+    # Banco: a análise e as heurísticas tal como `_store_analysis` as grava, e as leituras do cache/API
+    db_url = _unique_urls("db")
+    hit_codes = sorted({code for url in CORPUS for _, code, _, _ in heuristic_checks(url, "deep")})
+    stored = {}
+
+    def insert_one():
+        url = db_url()
+        stored["url"], stored["id"] = url, insert_analysis(url, url, 42.0, "explicação", analysis_level="standard")
+
+    def insert_hits():
+        for code in hit_codes:
+            insert_heuristic_hit(stored["id"], code, "MEDIUM", code.startswith("DOMAIN"), f"{code}: detectado", 0.05)
+
+    insert_one()
+    benchmarks += [
+        Benchmark("db.insert_analysis", insert_one, repeat=30, number=10),
+        Benchmark("db.insert_heuristic_hits", insert_hits, repeat=20),
+        Benchmark("db.get_analysis_by_url", lambda: get_analysis_by_url(stored["url"], ("standard", "deep")),
+                  repeat=30, number=20),
+        Benchmark("db.get_full_analysis", lambda: get_full_analysis(stored["id"]), repeat=30, number=10),
+    ]
+    return benchmarks
+
+
+def run_api_benchmarks(levels: List[str], repeat: Optional[int], only: Optional[re.Pattern]) -> Dict[str, Dict]:
+    """`POST /api/analyze` de ponta a ponta (middleware, pipeline, banco, explicação)."""
+    from fastapi.testclient import TestClient
+    from server import app
+
+    results = {}
+    with TestClient(app) as client:
+        for level in levels:
+            name = f"api.analyze.{level}"
+            if only and not only.search(name):
+                continue
+            next_url = _unique_urls(f"api{level}")
+
+            def request():
+                response = client.post("/api/analyze", json={"url": next_url(), "analysis_level": level})
+                response.raise_for_status()
+
+            request()  # aquecimento
+            samples = []
+            for _ in range(repeat or (5 if level == "deep" else 15)):
+                start = time.perf_counter()
+                request()
+                samples.append((time.perf_counter() - start) * 1000)
+            results[name] = summarize(samples)
+            _print_result(name, results[name])
+    return results
+
+
+def _git_revision() -> Dict[str, Any]:
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--", "."))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def _print_result(name: str, result: Dict[str, float]) -> None:
+    print(f"{name:<44} {result['median']:>10.4f} {result['p95']:>10.4f} {result['mean']:>10.4f} {result['samples']:>5}")
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    """
+    Compara as medianas com um resultado anterior; devolve os benchmarks que
+    ficaram mais lentos do que `threshold` (ex.: 0.1 = 10%).
+    """
+    regressions = []
+    print(f"\n{'benchmark':<44} {'antes ms':>10} {'agora ms':>10} {'razão':>7}")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            print(f"{name:<44} {'-':>10} {result['median']:>10.4f} {'novo':>7}")
+            continue
+        ratio = result["median"] / before["median"] if before["median"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  ▲ mais lento"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  ▼ mais rápido"
+        print(f"{name:<44} {before['median']:>10.4f} {result['median']:>10.4f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def _parse_latency(value: str) -> Dict[str, float]:
+    """"gsb=80,vt=300" ou um número para todos os serviços."""
+    if "=" not in value:
+        return {name: float(value) for name in DEFAULT_LATENCY_MS}
+    latency = {}
+    for item in value.split(","):
+        name, ms = item.split("=", 1)
+        if name.strip() not in DEFAULT_LATENCY_MS:
+            raise argparse.ArgumentTypeError(f"serviço desconhecido: {name} (use {', '.join(DEFAULT_LATENCY_MS)})")
+        latency[name.strip()] = float(ms)
+    return latency
+
+
+async def _run_core(benchmarks: List[Benchmark], repeat: Optional[int]) -> Dict[str, Dict]:
+    from services.xai import close_ollama_client
+
+    results = {}
+    try:
+        for benchmark in benchmarks:
+            results[benchmark.name] = summarize(await benchmark.measure(repeat))
+            _print_result(benchmark.name, results[benchmark.name])
+    finally:
+        # A ligação ao Ollama pertence a este event loop (o TestClient usa outro)
+        await close_ollama_client()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline contra stand-ins locais dos serviços externos")
+    parser.add_argument("--output", default=None, help="ficheiro JSON com os resultados")
+    parser.add_argument("--compare", default=None, help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="variação da mediana considerada regressão")
+    parser.add_argument("--fail-on-regression", action="store_true", help="termina com código 1 se houver regressões")
+    parser.add_argument("--only", default=None, help="regex: só os benchmarks cujo nome corresponde")
+    parser.add_argument("--repeat", type=int, default=None, help="amostras por benchmark (substitui o padrão de cada um)")
+    parser.add_argument("--latency", type=_parse_latency, default={},
+                        help=f"latência dos stand-ins em ms: um valor ou nome=ms ({','.join(DEFAULT_LATENCY_MS)})")
+    parser.add_argument("--prefill-ms", type=float, default=0.2, help="Ollama: ms por token do prompt")
+    parser.add_argument("--eval-ms", type=float, default=1.0, help="Ollama: ms por token gerado")
+    parser.add_argument("--num-predict", type=int, default=32, help="Ollama: tokens gerados por explicação")
+    parser.add_argument("--api-levels", default="quick,standard", help="níveis medidos em /api/analyze")
+    args = parser.parse_args()
+    only = re.compile(args.only) if args.only else None
+
+    db_dir = tempfile.TemporaryDirectory(prefix="clicksafe-bench-")
+    # Configuração lida na importação do backend (banco temporário, logs só de avisos, sem worker de jobs)
+    os.environ["CLICKSAFE_DB_PATH"] = str(Path(db_dir.name) / "bench.db")
+    os.environ.setdefault("CLICKSAFE_LOG_LEVEL", "WARNING")
+    os.environ["CLICKSAFE_JOBS_IN_SERVER"] = "0"
+
+    latency = {**DEFAULT_LATENCY_MS, **args.latency}
+    with run_upstreams(latency, args.prefill_ms, args.eval_ms, args.num_predict):
+        from storage.db import init_db
+        init_db()
+
+        print(f"{'benchmark':<44} {'p50 ms':>10} {'p95 ms':>10} {'média ms':>10} {'n':>5}")
+        benchmarks = [b for b in build_core_benchmarks() if not only or only.search(b.name)]
+        results = asyncio.run(_run_core(benchmarks, args.repeat))
+        levels = [level.strip() for level in args.api_levels.split(",") if level.strip()]
+        results.update(run_api_benchmarks(levels, args.repeat, only))
+
+    report = {
+        "schema": RESULTS_SCHEMA,
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **_git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency_ms": latency,
+            "ollama": {"prefill_ms_per_token": args.prefill_ms, "eval_ms_per_token": args.eval_ms,
+                       "num_predict": args.num_predict},
+            "corpus_size": len(CORPUS),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados gravados em {args.output}")
+    db_dir.cleanup()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"\n{len(regressions)} regressões acima de {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
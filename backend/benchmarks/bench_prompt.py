@@ -0,0 +1,207 @@
+#backend/benchmarks/bench_prompt.py
+"""
+Benchmark: latência de geração com o prompt anterior (dicionários brutos das
+fontes) vs. o prompt compacto com orçamento de tokens (`services/xai.py`).
+
+Por padrão usa o stand-in local do Ollama (`ollama_standin.py`), em que o
+tempo de prefill é proporcional ao tamanho do prompt; com `--base-url` mede
+contra um Ollama real.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_prompt
+    python -m benchmarks.bench_prompt --iterations 50 --prefill-ms 2
+    python -m benchmarks.bench_prompt --base-url http://localhost:11434
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.ollama_standin import run_standin
+from services.circuit_breaker import percentile
+from services.xai import OllamaClient, build_prompt, estimate_tokens, _risk_classification, _format_score
+
+
+def legacy_build_prompt(url: str, heuristics: Dict[str, Any], reputation: Dict[str, Any], final_score: float = None) -> str:
+    """Prompt anterior (dicionários brutos das fontes), mantido só para comparação."""
+
+    heur_score = heuristics.get("score", 0.0)
+    hits = heuristics.get("hits", [])
+    rep_score = reputation.get("_score", 0.0)
+    final_status = reputation.get("final_status", "UNKNOWN")
+    sources = reputation.get("sources", {})
+
+    # Determina classificação baseada no score final
+    risk_classification = _risk_classification(final_score)
+    final_score_str = _format_score(final_score)
+
+    # Conta heurísticas acionadas por severidade
+    triggered_by_severity = {"LOW": 0, "MEDIUM": 0, "HIGH": 0, "CRITICAL": 0}
+    triggered_hits = []
+    for hit in hits:
+        if hit.get("triggered", False):
+            severity = hit.get("severity", "MEDIUM")
+            triggered_by_severity[severity] = triggered_by_severity.get(severity, 0) + 1
+            triggered_hits.append({
+                "code": hit.get("code"),
+                "severity": severity,
+                "details": hit.get("details", "")
+            })
+
+    # Resumo das fontes de reputação
+    gsb = sources.get("GOOGLE_SAFE_BROWSING", {})
+    vt = sources.get("VIRUSTOTAL", {})
+    gsb_status = gsb.get("status", "UNKNOWN")
+    vt_status = vt.get("status", "UNKNOWN")
+
+    return f"""
+És um assistente de cibersegurança. Gera um resumo curto e objetivo para o utilizador final.
+
+URL analisada: {url}
+
+[Score Final de Risco]
+- Score: {final_score_str}/100
+- Classificação: {risk_classification}
+- Interpretação: 0-49=SEGURO, 50-79=SUSPEITO, 80-100=MALICIOSO
+
+[Reputação]
+[Reputaçao]
+- Score (0-100): {rep_score:.2f}/100
+- Estado geral: {final_status}  
+- Fontes:
+  - Google Safe Browsing: {sources.get("GOOGLE_SAFE_BROWSING",{})}
+  - VirusTotal: {sources.get("VIRUSTOTAL",{})}
+  - APIVOID: (desabilitado temporariamente)
+
+[Heurísticas]
+- Score (0-100): {heur_score:.2f}/100
+- Heurísticas acionadas: {len(triggered_hits)} de {len(hits)} total
+- Por severidade: LOW={triggered_by_severity['LOW']}, MEDIUM={triggered_by_severity['MEDIUM']}, HIGH={triggered_by_severity['HIGH']}, CRITICAL={triggered_by_severity['CRITICAL']}
+- Principais detecções: {', '.join([h['code'] for h in triggered_hits[:5]]) if triggered_hits else 'Nenhuma'}
+
+Instruções de resposta organizada:
+1) Comece com um rótulo de risco: "{risk_classification}" (baseado no score {final_score_str}/100)
+2) Explique em 2-4 frases os motivos principais (cite fontes de reputação e heurísticas mais relevantes)
+3) Termine com uma recomendação prática de forma a conferir clareza e indicações sobre o que fazer (ex.: "evitar clicar", "verificar remetente", etc.).
+Evite conceitos muito técnicos de forma excessiva e não inventes dados não fornecidos.
+    """.strip()
+
+
+def _vt_raw(malicious: int) -> Dict[str, Any]:
+    # Resposta do VirusTotal tal como fica em reputation["sources"]["VIRUSTOTAL"]["raw"]
+    stats = {"malicious": malicious, "suspicious": 1 if malicious else 0, "harmless": 62, "undetected": 24}
+    return {"stats": {**stats, "total_engines": sum(stats.values())}, **stats, "url": "https://www.virustotal.com/gui/url/" + "f" * 64}
+
+
+def _gsb_raw(positive: bool) -> Dict[str, Any]:
+    if not positive:
+        return {}
+    return {"matches": [{
+        "threatType": "SOCIAL_ENGINEERING",
+        "platformType": "ANY_PLATFORM",
+        "threatEntryType": "URL",
+        "threat": {"url": "https://login-secure-example.com/verify"},
+        "cacheDuration": "300s",
+    }]}
+
+
+def _hits(triggered_codes):
+    codes = [
+        ("DOMAIN_AGE_RECENT", "HIGH", "Domínio registado recentemente"),
+        ("SUSPICIOUS_TLD", "MEDIUM", "TLD suspeito"),
+        ("SIMILAR_KNOWN_DOMAIN", "CRITICAL", "Domínio semelhante a um domínio conhecido"),
+        ("SENSITIVE_PARAMS", "HIGH", "Parâmetros sensíveis na URL"),
+        ("LONG_PATH", "LOW", "Caminho excessivamente longo"),
+        ("NO_HTTPS", "MEDIUM", "Não usa HTTPS"),
+    ] + [(f"HEURISTIC_{i}", "LOW", f"Heurística {i}") for i in range(22)]
+    return [{
+        "code": code,
+        "severity": severity,
+        "triggered": code in triggered_codes,
+        "details": f"{description}: {'detectado' if code in triggered_codes else 'não detectado'}",
+    } for code, severity, description in codes]
+
+
+SCENARIOS = {
+    "seguro": (
+        "https://example.com/",
+        {"score": 0.0, "hits": _hits(set())},
+        {"sources": {
+            "GOOGLE_SAFE_BROWSING": {"status": "NEGATIVE", "reason": "ok", "raw": _gsb_raw(False), "elapsed_ms": 140},
+            "VIRUSTOTAL": {"status": "NEGATIVE", "reason": "ok", "raw": _vt_raw(0), "elapsed_ms": 8200},
+        }, "_score": 0.0, "final_status": "NEGATIVE"},
+        0.0,
+    ),
+    "suspeito": (
+        "https://secure-login-update.example.xyz/account/verify?user=me@example.com&token=abc",
+        {"score": 60.0, "hits": _hits({"DOMAIN_AGE_RECENT", "SUSPICIOUS_TLD", "SENSITIVE_PARAMS", "NO_HTTPS"})},
+        {"sources": {
+            "GOOGLE_SAFE_BROWSING": {"status": "NEGATIVE", "reason": "ok", "raw": _gsb_raw(False), "elapsed_ms": 150},
+            "VIRUSTOTAL": {"status": "UNKNOWN", "reason": "timeout", "raw": {}, "elapsed_ms": 60000},
+        }, "_score": 0.5, "final_status": "UNKNOWN"},
+        53.0,
+    ),
+    "malicioso": (
+        "https://login-secure-example.com/verify",
+        {"score": 85.0, "hits": _hits({"SIMILAR_KNOWN_DOMAIN", "DOMAIN_AGE_RECENT", "SENSITIVE_PARAMS", "LONG_PATH"})},
+        {"sources": {
+            "GOOGLE_SAFE_BROWSING": {"status": "POSITIVE", "reason": "ok", "raw": _gsb_raw(True), "elapsed_ms": 130},
+            "VIRUSTOTAL": {"status": "POSITIVE", "reason": "ok", "raw": _vt_raw(9), "elapsed_ms": 7000},
+        }, "_score": 1.0, "final_status": "POSITIVE"},
+        95.5,
+    ),
+}
+
+
+async def _measure(client: OllamaClient, prompt: str, iterations: int):
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await client.generate(prompt)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def run(args) -> None:
+    standin = nullcontext(args.base_url) if args.base_url else run_standin(
+        prefill_ms_per_token=args.prefill_ms, eval_ms_per_token=args.eval_ms, num_predict=args.num_predict
+    )
+    with standin as base_url:
+        client = OllamaClient(base_url=base_url, num_predict=args.num_predict, max_connections=1)
+        print(f"Ollama: {base_url} | iterações: {args.iterations} | num_predict: {args.num_predict}")
+        print(f"{'cenário':<10} {'prompt':<9} {'chars':>6} {'tokens':>7} {'média ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        try:
+            for name, (url, heuristics, reputation, score) in SCENARIOS.items():
+                prompts = {
+                    "anterior": legacy_build_prompt(url, heuristics, reputation, score),
+                    "compacto": build_prompt(url, heuristics, reputation, score, token_budget=args.token_budget),
+                }
+                for label, prompt in prompts.items():
+                    await client.generate(prompt)  # aquecimento
+                    latencies = await _measure(client, prompt, args.iterations)
+                    print(f"{name:<10} {label:<9} {len(prompt):>6} {estimate_tokens(prompt):>7} "
+                          f"{statistics.mean(latencies):>9.1f} {percentile(latencies, 50):>8.1f} "
+                          f"{percentile(latencies, 95):>8.1f}")
+        finally:
+            await client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark do prompt anterior vs. prompt compacto")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--base-url", default=None, help="Ollama real (por padrão usa o stand-in local)")
+    parser.add_argument("--num-predict", type=int, default=32)
+    parser.add_argument("--prefill-ms", type=float, default=1.0, help="stand-in: ms por token do prompt")
+    parser.add_argument("--eval-ms", type=float, default=2.0, help="stand-in: ms por token gerado")
+    parser.add_argument("--token-budget", type=int, default=None, help="orçamento do prompt compacto")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
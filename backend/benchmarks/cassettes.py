@@ -0,0 +1,83 @@
+#backend/benchmarks/cassettes.py
+"""
+Cassetes das respostas dos serviços externos (ver `services/cassettes.py`).
+
+- `from-db`: cria gravações das camadas gsb e vt a partir das respostas
+  guardadas em reputation_checks (consultas com reason "ok"). O banco só
+  guarda o veredito das heurísticas, por isso as camadas whois, dns,
+  geolocation e http_probe só se gravam correndo o pipeline com
+  CLICKSAFE_CASSETTE_MODE=record;
+- `stats`: gravações por camada (respostas e exceções).
+
+Uso (a partir de backend/):
+    python -m benchmarks.cassettes from-db --output cassetes.jsonl
+    CLICKSAFE_CASSETTE_MODE=record CLICKSAFE_CASSETTE_PATH=cassetes.jsonl python scan.py urls.txt --level deep
+    CLICKSAFE_CASSETTE_MODE=replay CLICKSAFE_CASSETTE_PATH=cassetes.jsonl python scan.py urls.txt --level deep
+    python -m benchmarks.cassettes stats cassetes.jsonl
+"""
+import argparse
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.cassettes import CASSETTE_PATH, CassetteStore
+
+# Fonte de reputação (reputation_checks.source) -> camada
+_SOURCE_LAYERS = {
+    "GOOGLE_SAFE_BROWSING": "gsb",
+    "VIRUSTOTAL": "vt",
+}
+
+
+def _vt_url_object(url: str, raw: Dict) -> Dict:
+    """Objeto URL da API v3 com as estatísticas guardadas (o que `check_vt` lê de `analyze_url`)."""
+    stats = {k: v for k, v in raw.get("stats", {}).items() if k != "total_engines"}
+    return {"data": {"type": "url", "id": url, "attributes": {"last_analysis_stats": stats}}}
+
+
+def entries_from_db(rows: Iterable[Dict]) -> Iterator[Dict]:
+    """Gravações (camada, chave, resposta) a partir das linhas de `get_reputation_payloads`."""
+    for row in rows:
+        raw = json.loads(row["raw_json"] or "{}")
+        layer = _SOURCE_LAYERS[row["source"]]
+        response = _vt_url_object(row["url_normalized"], raw) if layer == "vt" else raw
+        yield {"layer": layer, "key": row["url_normalized"], "response": response, "elapsed_ms": row["elapsed_ms"]}
+
+
+def from_db(args: argparse.Namespace) -> None:
+    from storage.db import get_reputation_payloads
+    rows = get_reputation_payloads(list(_SOURCE_LAYERS))
+    count = CassetteStore(args.output, mode="record").add_many(entries_from_db(rows))
+    print(f"{count} gravações acrescentadas a {args.output}")
+
+
+def stats(args: argparse.Namespace) -> None:
+    store = CassetteStore(args.path, mode="replay")
+    responses, errors = Counter(), Counter()
+    for entry in store.entries():
+        (errors if "error" in entry else responses)[entry["layer"]] += 1
+    print(f"{'camada':<14} {'respostas':>10} {'exceções':>10}")
+    for layer in sorted(set(responses) | set(errors)):
+        print(f"{layer:<14} {responses[layer]:>10} {errors[layer]:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cassetes das respostas dos serviços externos")
+    commands = parser.add_subparsers(dest="command", required=True)
+    db_parser = commands.add_parser("from-db", help="grava as respostas de GSB e VirusTotal guardadas no banco")
+    db_parser.add_argument("--output", default=CASSETTE_PATH, help="ficheiro de cassetes (acrescenta)")
+    stats_parser = commands.add_parser("stats", help="gravações por camada")
+    stats_parser.add_argument("path", nargs="?", default=CASSETTE_PATH, help="ficheiro de cassetes")
+    args = parser.parse_args()
+    if args.command == "from-db":
+        from_db(args)
+    else:
+        stats(args)
+
+
+if __name__ == "__main__":
+    main()
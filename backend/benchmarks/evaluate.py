@@ -0,0 +1,450 @@
+#backend/benchmarks/evaluate.py
+"""
+Avaliação offline da qualidade de deteção contra o custo do pipeline, num
+corpus de URLs rotuladas (maliciosa/benigna) com as respostas dos serviços
+externos gravadas.
+
+1. `record`: grava o corpus (JSONL, uma URL por linha) a partir de um
+   ficheiro de rótulos. Por padrão lê as respostas das análises guardadas no
+   banco (de preferência de nível "deep": reputation_checks e os
+   heuristics_hits das heurísticas de rede); com `--live` consulta as fontes
+   e corre as heurísticas de rede (com `--standins`, contra os stand-ins de
+   `upstreams.py`).
+2. `run`: passa o corpus por `_score_url` (`consolidate_reputation`,
+   `run_heuristics` e `calculate_final_score`) em cada configuração
+   (nível:modo), com as fontes de reputação e as heurísticas de rede
+   servidas pelas respostas gravadas - sem rede. Por configuração mostra a
+   precisão e o recall nos limiares de score (50 e 80), o tempo do nosso
+   código por URL, o tempo dos serviços externos gravado por URL (soma no
+   modo sequencial, a maior no paralelo) e as chamadas de rede por URL.
+
+Ficheiro de rótulos: uma linha "url,rótulo" (1/0, malicious/benign, ...);
+linhas vazias e começadas por # são ignoradas.
+
+Uso (a partir de backend/):
+    python -m benchmarks.evaluate record rotulos.csv --output corpus.jsonl
+    python -m benchmarks.evaluate record rotulos.csv --live --standins --output corpus.jsonl
+    python -m benchmarks.evaluate run corpus.jsonl --output avaliacao.json
+    python -m benchmarks.evaluate run corpus.jsonl --configs quick,deep:parallel --thresholds 50,70,80
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_pipeline import _git_revision
+
+# Versão do formato do corpus e do JSON de resultados
+CORPUS_SCHEMA = 1
+RESULTS_SCHEMA = 1
+
+DEFAULT_THRESHOLDS = (50.0, 80.0)
+
+# Configurações avaliadas por padrão (nível:modo de consulta das fontes)
+DEFAULT_CONFIGS = (
+    "quick:sequential",
+    "standard:sequential",
+    "standard:parallel",
+    "deep:sequential",
+    "deep:parallel",
+)
+
+# Pedidos de rede de cada heurística de rede (WHOIS, DNS, HTTP ao site;
+# a geolocalização resolve o IP e consulta o ip-api)
+HEURISTIC_NETWORK_CALLS = {
+    "DOMAIN_AGE": 1,
+    "DOMAIN_EXPIRATION": 1,
+    "DOMAIN_SSL_INVALID": 1,
+    "DOMAIN_DNS_ANOMALY": 1,
+    "DOMAIN_GEOLOCATION_RISK": 2,
+    "MULTIPLE_REDIRECTS": 1,
+}
+
+_POSITIVE_LABELS = {"1", "true", "malicious", "malware", "phishing", "positive"}
+_NEGATIVE_LABELS = {"0", "false", "benign", "safe", "negative"}
+
+
+def read_labels(path: str) -> List[Tuple[str, bool]]:
+    """Lê o ficheiro de rótulos: [(url, maliciosa)]."""
+    labels = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            url, _, label = line.rpartition(",")
+            label = label.strip().lower()
+            if not url or label not in _POSITIVE_LABELS | _NEGATIVE_LABELS:
+                raise ValueError(f"{path}:{line_number}: esperado 'url,rótulo' (1/0, malicious/benign)")
+            labels.append((url.strip(), label in _POSITIVE_LABELS))
+    return labels
+
+
+def read_corpus(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    for entry in entries:
+        if entry.get("schema") != CORPUS_SCHEMA:
+            raise ValueError(f"{path}: formato de corpus desconhecido ({entry.get('schema')})")
+    return entries
+
+
+def write_corpus(path: str, entries: Iterable[Dict]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False, sort_keys=True) + "\n")
+
+
+# ------------------------------------------------------------------ gravação
+
+def _stored_source_result(check: Dict) -> Dict:
+    """Resultado padronizado de uma fonte a partir de reputation_checks."""
+    return {
+        "status": check["status"],
+        "reason": check.get("reason") or "ok",
+        "raw": json.loads(check.get("raw_json") or "{}"),
+        "elapsed_ms": check.get("elapsed_ms"),
+    }
+
+
+def _stored_heuristic_result(hit: Dict) -> Optional[bool]:
+    """Resultado de uma heurística a partir de heuristics_hits (None = erro na verificação)."""
+    if hit["triggered"]:
+        return True
+    details = hit.get("details") or ""
+    if details.startswith("Erro:") or details.endswith("erro na verificação"):
+        return None
+    return False
+
+
+def record_from_db(labels: Sequence[Tuple[str, bool]]) -> List[Dict]:
+    """Corpus a partir da análise mais recente de cada URL (de preferência de nível "deep")."""
+    from app import HEURISTIC_LEVELS, normalize_url
+    from storage.db import get_analysis_by_url, get_heuristics_hits, get_reputation_checks
+
+    entries = []
+    for url, malicious in labels:
+        normalized = normalize_url(url)
+        analysis = get_analysis_by_url(normalized, ("deep",)) or get_analysis_by_url(normalized)
+        if not analysis:
+            print(f"aviso: {normalized} não tem análises no banco - ignorada", file=sys.stderr)
+            continue
+        sources = {
+            check["source"]: _stored_source_result(check)
+            for check in get_reputation_checks(analysis["id"], include_raw=True)
+        }
+        heuristics = {
+            hit["heuristic_code"]: {"result": _stored_heuristic_result(hit), "elapsed_ms": hit["elapsed_ms"]}
+            for hit in get_heuristics_hits(analysis["id"])
+            if hit["heuristic_code"] in HEURISTIC_LEVELS
+        }
+        entries.append({
+            "schema": CORPUS_SCHEMA,
+            "url": normalized,
+            "malicious": malicious,
+            "recorded_from": f"analysis:{analysis['id']}:{analysis['analysis_level']}",
+            "sources": sources,
+            "heuristics": heuristics,
+        })
+    return entries
+
+
+async def record_live(labels: Sequence[Tuple[str, bool]]) -> List[Dict]:
+    """Corpus com as respostas atuais: todas as fontes ativas e todas as heurísticas de rede."""
+    from app import HEURISTIC_LEVELS, heuristic_checks, normalize_url
+    from services.sources import get_sources
+
+    entries = []
+    for url, malicious in labels:
+        normalized = normalize_url(url)
+        sources = [s for s in get_sources() if s.is_available()]
+        results = await asyncio.gather(*[
+            s.check(normalized, s.breaker.current_timeout()) for s in sources
+        ], return_exceptions=True)
+        recorded_sources = {}
+        for source, result in zip(sources, results):
+            if isinstance(result, Exception):
+                result = {"status": "UNKNOWN", "reason": f"error:{type(result).__name__}", "raw": {}, "elapsed_ms": None}
+            recorded_sources[source.name] = result
+
+        heuristics = {}
+        for func, code, args, _ in heuristic_checks(normalized, "deep"):
+            if code not in HEURISTIC_LEVELS:
+                continue
+            start = time.perf_counter()
+            try:
+                result = func(*args)
+            except Exception:
+                result = None
+            heuristics[code] = {
+                "result": result if isinstance(result, bool) else None,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+            }
+        entries.append({
+            "schema": CORPUS_SCHEMA,
+            "url": normalized,
+            "malicious": malicious,
+            "recorded_from": "live",
+            "sources": recorded_sources,
+            "heuristics": heuristics,
+        })
+        print(f"gravada: {normalized}", file=sys.stderr)
+    return entries
+
+
+# -------------------------------------------------------------------- replay
+
+class Replay(object):
+    """
+    Serve as respostas gravadas do corpus no lugar das fontes de reputação
+    (`ReputationSource.check`) e das heurísticas de rede (`heuristic_checks`),
+    e conta, para a URL em curso, as chamadas de rede e o tempo gravado dos
+    serviços externos.
+
+    Respostas em falta no corpus: a fonte fica com reason "not_checked" (fora
+    do score) e a heurística com erro na verificação; contam em `missing`.
+    """
+
+    def __init__(self, entries: Sequence[Dict]):
+        self.entries = {entry["url"]: entry for entry in entries}
+        self.begin()
+
+    def begin(self) -> None:
+        """Zera os contadores (no início de cada URL)."""
+        self.network_calls = 0
+        self.source_ms: List[float] = []
+        self.heuristic_ms = 0.0
+        self.missing = 0
+
+    def upstream_ms(self, mode: str) -> float:
+        """Tempo gravado dos serviços externos: fontes em sequência (soma) ou em paralelo (a maior)."""
+        sources_ms = sum(self.source_ms) if mode == "sequential" else max(self.source_ms, default=0.0)
+        return sources_ms + self.heuristic_ms
+
+    def _source_check(self, source):
+        async def check(url: str, timeout: float, **options) -> Dict:
+            recorded = self.entries.get(url, {}).get("sources", {}).get(source.name)
+            if recorded is None:
+                self.missing += 1
+                return {"status": "UNKNOWN", "reason": "not_checked", "raw": {}, "elapsed_ms": 0}
+            if source.latency_class != "local":
+                self.network_calls += 1
+            self.source_ms.append(recorded.get("elapsed_ms") or 0.0)
+            return dict(recorded)
+        return check
+
+    def _heuristic_check(self, url: str, code: str):
+        def check() -> Optional[bool]:
+            recorded = self.entries.get(url, {}).get("heuristics", {}).get(code)
+            if recorded is None:
+                self.missing += 1
+                return None
+            self.network_calls += HEURISTIC_NETWORK_CALLS.get(code, 1)
+            self.heuristic_ms += recorded.get("elapsed_ms") or 0.0
+            return recorded["result"]
+        return check
+
+    @contextlib.contextmanager
+    def installed(self):
+        """
+        Liga o replay; cada entrada começa com circuit breakers novos e sem
+        estatísticas das fontes (o resultado não depende da ordem das configurações).
+        """
+        import app
+        from services.circuit_breaker import CircuitBreaker
+        from services.source_stats import SOURCE_STATS
+        from services.sources import SOURCE_REGISTRY
+
+        original_checks = app.heuristic_checks
+
+        def heuristic_checks(url: str, analysis_level: str = "deep") -> list:
+            return [
+                (self._heuristic_check(url, code), code, (), description) if code in app.HEURISTIC_LEVELS
+                else (func, code, args, description)
+                for func, code, args, description in original_checks(url, analysis_level)
+            ]
+
+        saved = {name: (source.check, source.breaker) for name, source in SOURCE_REGISTRY.items()}
+        SOURCE_STATS.reset()
+        for source in SOURCE_REGISTRY.values():
+            source.check = self._source_check(source)
+            source.breaker = CircuitBreaker(source.name, default_timeout=source.breaker.default_timeout,
+                                            min_timeout=source.breaker.min_timeout,
+                                            max_timeout=source.breaker.max_timeout)
+        app.heuristic_checks = heuristic_checks
+        try:
+            yield self
+        finally:
+            app.heuristic_checks = original_checks
+            for name, (check, breaker) in saved.items():
+                SOURCE_REGISTRY[name].check = check
+                SOURCE_REGISTRY[name].breaker = breaker
+            SOURCE_STATS.reset()
+
+
+# ----------------------------------------------------------------- avaliação
+
+def classification_metrics(scores: Sequence[Tuple[float, bool]], threshold: float) -> Dict:
+    """Precisão e recall com "maliciosa" = score >= threshold (None quando indefinidos)."""
+    tp = sum(1 for score, malicious in scores if score >= threshold and malicious)
+    fp = sum(1 for score, malicious in scores if score >= threshold and not malicious)
+    fn = sum(1 for score, malicious in scores if score < threshold and malicious)
+    tn = len(scores) - tp - fp - fn
+    return {
+        "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+    }
+
+
+def parse_config(text: str) -> Tuple[str, str]:
+    """"nível[:modo]" -> (nível, modo); o modo padrão é o sequencial."""
+    from app import validate_analysis_level
+    level, _, mode = text.partition(":")
+    mode = mode or "sequential"
+    if mode not in ("sequential", "parallel"):
+        raise ValueError(f"Modo inválido: '{mode}' (use sequential ou parallel)")
+    return validate_analysis_level(level), mode
+
+
+async def evaluate_config(entries: Sequence[Dict], level: str, mode: str,
+                          thresholds: Sequence[float]) -> Dict:
+    """Passa o corpus pelo pipeline com as respostas gravadas numa configuração."""
+    from app import _score_url
+
+    replay = Replay(entries)
+    scores, compute_ms, upstream_ms, network_calls, missing, urls = [], [], [], [], 0, {}
+    with replay.installed():
+        for entry in entries:
+            replay.begin()
+            start = time.perf_counter()
+            verdict = await _score_url(entry["url"], analysis_level=level, reputation_mode=mode)
+            compute_ms.append((time.perf_counter() - start) * 1000)
+            upstream_ms.append(replay.upstream_ms(mode))
+            network_calls.append(replay.network_calls)
+            missing += replay.missing
+            scores.append((verdict["final_score"], bool(entry["malicious"])))
+            urls[entry["url"]] = round(verdict["final_score"], 2)
+
+    return {
+        "level": level,
+        "mode": mode,
+        "urls": len(entries),
+        "thresholds": {f"{t:g}": classification_metrics(scores, t) for t in thresholds},
+        "ms_per_url": round(statistics.mean(compute_ms), 3) if compute_ms else None,
+        "upstream_ms_per_url": round(statistics.mean(upstream_ms), 1) if upstream_ms else None,
+        "network_calls_per_url": round(statistics.mean(network_calls), 2) if network_calls else None,
+        "missing_responses": missing,
+        "scores": urls,
+    }
+
+
+def _format_metric(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def print_report(results: Dict[str, Dict], thresholds: Sequence[float]) -> None:
+    header = f"{'configuração':<22}"
+    for t in thresholds:
+        header += f" {'P@' + format(t, 'g'):>7} {'R@' + format(t, 'g'):>7}"
+    header += f" {'ms/URL':>9} {'ms ext./URL':>12} {'chamadas/URL':>13}"
+    print(header)
+    for name, result in results.items():
+        line = f"{name:<22}"
+        for t in thresholds:
+            metrics = result["thresholds"][f"{t:g}"]
+            line += f" {_format_metric(metrics['precision']):>7} {_format_metric(metrics['recall']):>7}"
+        line += (f" {result['ms_per_url']:>9.2f} {result['upstream_ms_per_url']:>12.1f}"
+                 f" {result['network_calls_per_url']:>13.2f}")
+        if result["missing_responses"]:
+            line += f"  ({result['missing_responses']} respostas em falta)"
+        print(line)
+
+
+def run(args: argparse.Namespace) -> None:
+    from storage.db import init_db, is_db_initialized
+
+    if not is_db_initialized():
+        # Severidades das heurísticas (tabela heuristics)
+        init_db()
+    entries = read_corpus(args.corpus)
+    thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+    configs = [parse_config(c.strip()) for c in args.configs.split(",") if c.strip()]
+    positives = sum(1 for e in entries if e["malicious"])
+    print(f"corpus: {len(entries)} URLs ({positives} maliciosas, {len(entries) - positives} benignas)")
+
+    results = {}
+    for level, mode in configs:
+        results[f"{level}:{mode}"] = asyncio.run(evaluate_config(entries, level, mode, thresholds))
+    print_report(results, thresholds)
+
+    if args.output:
+        report = {
+            "schema": RESULTS_SCHEMA,
+            "meta": {
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                **_git_revision(),
+                "python": platform.python_version(),
+                "corpus": args.corpus,
+                "urls": len(entries),
+                "malicious": positives,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"resultados gravados em {args.output}")
+
+
+def record(args: argparse.Namespace) -> None:
+    labels = read_labels(args.labels)
+    entries = asyncio.run(record_live(labels)) if args.live else record_from_db(labels)
+    write_corpus(args.output, entries)
+    print(f"{len(entries)} de {len(labels)} URLs gravadas em {args.output}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Avaliação offline da deteção (precisão/recall) contra o custo")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="grava o corpus com as respostas dos serviços externos")
+    record_parser.add_argument("labels", help="ficheiro com linhas 'url,rótulo'")
+    record_parser.add_argument("--output", required=True, help="corpus JSONL")
+    record_parser.add_argument("--live", action="store_true",
+                               help="consulta as fontes e corre as heurísticas de rede (em vez de ler o banco)")
+    record_parser.add_argument("--standins", action="store_true",
+                               help="com --live: usa os stand-ins locais dos serviços externos")
+
+    run_parser = commands.add_parser("run", help="avalia as configurações com as respostas gravadas")
+    run_parser.add_argument("corpus", help="corpus JSONL gravado com 'record'")
+    run_parser.add_argument("--configs", default=",".join(DEFAULT_CONFIGS),
+                            help="configurações nível[:modo] separadas por vírgula")
+    run_parser.add_argument("--thresholds", default=",".join(f"{t:g}" for t in DEFAULT_THRESHOLDS),
+                            help="limiares de score (maliciosa se score >= limiar)")
+    run_parser.add_argument("--output", default=None, help="ficheiro JSON com os resultados")
+    args = parser.parse_args()
+
+    # Configuração lida na importação do backend: logs só de avisos
+    os.environ.setdefault("CLICKSAFE_LOG_LEVEL", "WARNING")
+    if args.command == "record" and args.standins:
+        from benchmarks.upstreams import run_upstreams
+        with run_upstreams():
+            record(args)
+    elif args.command == "record":
+        record(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
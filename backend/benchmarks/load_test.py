@@ -0,0 +1,477 @@
+#backend/benchmarks/load_test.py
+"""
+Gerador de carga para os servidores FastAPI (`server.py` / `server_network.py`).
+
+Envia `POST /api/analyze` a um ritmo fixo (`--rate`) ou em rampa (`--rate`
+até `--ramp-to`), em malha aberta: os pedidos saem à hora marcada, mesmo
+que os anteriores ainda não tenham terminado, como com utilizadores reais.
+Uma fração `--hit-ratio` dos pedidos repete URLs já analisadas (acertos no
+cache de análises); as restantes são URLs novas.
+
+Por padrão arranca o servidor num processo à parte, com os serviços
+externos substituídos pelos stand-ins locais (`upstreams.py`) e um banco
+temporário; com `--target` usa um servidor já a correr.
+
+O relatório, por janela de `--window` segundos, tem o ritmo pedido e o
+conseguido, latências p50/p95/p99, erros e, lidos de /metrics, o tempo
+médio das operações no banco (SQLite), a espera e a geração no modelo
+(Ollama), as explicações manuais por fila cheia e o lag do event loop. A
+primeira janela em que o servidor deixa de acompanhar a carga é indicada
+como ponto de saturação, com a etapa que mais piorou.
+
+Uso (a partir de backend/):
+    python -m benchmarks.load_test --rate 5 --ramp-to 60 --duration 120 --output carga.json
+    python -m benchmarks.load_test --app server_network --rate 20 --duration 60 --hit-ratio 0.8
+    python -m benchmarks.load_test --target http://192.168.1.10:8000 --rate 10 --duration 30
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_pipeline import CORPUS, _git_revision, _parse_latency
+from benchmarks.upstreams import DEFAULT_LATENCY_MS, run_upstreams
+from services.circuit_breaker import percentile
+
+_BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Critérios de saturação de uma janela
+_SATURATION_THROUGHPUT = 0.9   # conseguido abaixo de 90% do pedido
+_SATURATION_P95_FACTOR = 3.0   # p95 acima de 3x o da primeira janela
+_SATURATION_ERROR_RATE = 0.01  # mais de 1% de erros
+
+_METRIC_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$")
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Texto do Prometheus -> {"nome{labels}": valor}."""
+    metrics = {}
+    for line in text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match:
+            metrics[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return metrics
+
+
+def _total(metrics: Dict[str, float], name: str, label: str = "") -> float:
+    """Soma das séries `name` (com `label`, ex.: 'stage="llm.generate"', contido nos labels)."""
+    return sum(value for key, value in metrics.items()
+               if (key == name or key.startswith(name + "{")) and label in key)
+
+
+def _mean_ms(before: Dict[str, float], after: Dict[str, float], histogram: str, label: str = "") -> Optional[float]:
+    """Média (ms) das observações de um histograma entre duas leituras de /metrics."""
+    count = _total(after, histogram + "_count", label) - _total(before, histogram + "_count", label)
+    if count <= 0:
+        return None
+    return (_total(after, histogram + "_sum", label) - _total(before, histogram + "_sum", label)) / count * 1000
+
+
+def window_metrics(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, Optional[float]]:
+    """O que mudou no servidor numa janela: banco, modelo, event loop."""
+    return {
+        "db_ms": _mean_ms(before, after, "clicksafe_db_operation_duration_seconds"),
+        "llm_wait_ms": _mean_ms(before, after, "clicksafe_stage_duration_seconds", 'stage="llm.queue_wait"'),
+        "llm_generate_ms": _mean_ms(before, after, "clicksafe_stage_duration_seconds", 'stage="llm.generate"'),
+        "llm_queue_depth": after.get("clicksafe_llm_queue_depth"),
+        "llm_fallbacks": _total(after, "clicksafe_llm_fallbacks_total") - _total(before, "clicksafe_llm_fallbacks_total"),
+        "loop_lag_ms": _mean_ms(before, after, "clicksafe_event_loop_lag_seconds"),
+        "analyses_in_flight": after.get("clicksafe_analyses_in_flight"),
+    }
+
+
+def arrival_times(rate: float, ramp_to: Optional[float], duration: float) -> List[float]:
+    """Instantes (s) de envio: ritmo fixo, ou a subir linearmente de `rate` até `ramp_to`."""
+    times = []
+    t = 0.0
+    while True:
+        current = rate if ramp_to is None else rate + (ramp_to - rate) * t / duration
+        t += 1.0 / max(current, 0.01)
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+class LoadRecord(object):
+    __slots__ = ("sent_at", "latency_ms", "status", "hit")
+
+    def __init__(self, sent_at: float, hit: bool):
+        self.sent_at = sent_at
+        self.latency_ms: Optional[float] = None
+        self.status = "pending"
+        self.hit = hit
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+    @property
+    def finished_at(self) -> Optional[float]:
+        return None if self.latency_ms is None else self.sent_at + self.latency_ms / 1000
+
+
+class LoadGenerator(object):
+    """Envia os pedidos à hora marcada e guarda um `LoadRecord` por pedido."""
+
+    def __init__(self, base_url: str, level: str, hit_ratio: float, max_in_flight: int, timeout: float,
+                 defer_explanation: bool = False, corpus: Optional[List[str]] = None, seed: int = 1):
+        self.base_url = base_url.rstrip("/")
+        self.level = level
+        self.hit_ratio = hit_ratio
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.defer_explanation = defer_explanation
+        self.corpus = corpus or CORPUS
+        self.random = random.Random(seed)
+        self.records: List[LoadRecord] = []
+        self.snapshots: List = []  # (instante, métricas)
+        self._in_flight = 0
+        self._fresh = 0
+        self._run_id = f"{int(time.time())}"
+
+    def _next_url(self, hit: bool) -> str:
+        url = self.random.choice(self.corpus)
+        if hit:
+            return url
+        self._fresh += 1
+        separator = "&" if "?" in url else "?"
+        return f"{url}{separator}load={self._run_id}-{self._fresh}"
+
+    def _payload(self, url: str) -> dict:
+        return {"url": url, "analysis_level": self.level, "defer_explanation": self.defer_explanation}
+
+    async def warm_up(self, client: httpx.AsyncClient) -> None:
+        """Analisa as URLs do corpus uma vez, para os acertos no cache já as encontrarem no banco."""
+        semaphore = asyncio.Semaphore(4)
+
+        async def one(url):
+            async with semaphore:
+                response = await client.post(f"{self.base_url}/api/analyze", json=self._payload(url))
+                response.raise_for_status()
+        await asyncio.gather(*(one(url) for url in self.corpus))
+
+    async def _send(self, client: httpx.AsyncClient, record: LoadRecord, url: str, start: float) -> None:
+        self._in_flight += 1
+        try:
+            response = await client.post(f"{self.base_url}/api/analyze", json=self._payload(url))
+            record.status = response.status_code
+        except httpx.TimeoutException:
+            record.status = "timeout"
+        except httpx.HTTPError as e:
+            record.status = type(e).__name__
+        finally:
+            record.latency_ms = (time.monotonic() - start - record.sent_at) * 1000
+            self._in_flight -= 1
+
+    async def _scrape(self, client: httpx.AsyncClient, start: float, interval: float, stop: asyncio.Event) -> None:
+        while True:
+            try:
+                response = await client.get(f"{self.base_url}/metrics")
+                self.snapshots.append((time.monotonic() - start, parse_metrics(response.text)))
+            except httpx.HTTPError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+                return
+            except asyncio.TimeoutError:
+                continue
+
+    async def run(self, arrivals: List[float], window: float) -> None:
+        limits = httpx.Limits(max_connections=self.max_in_flight + 1, max_keepalive_connections=self.max_in_flight)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, trust_env=False) as client:
+            await self.warm_up(client)
+            tasks = []
+            stop = asyncio.Event()
+            start = time.monotonic()
+            scraper = asyncio.create_task(self._scrape(client, start, window, stop))
+            for at in arrivals:
+                delay = at - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                hit = self.random.random() < self.hit_ratio
+                record = LoadRecord(at, hit)
+                self.records.append(record)
+                if self._in_flight >= self.max_in_flight:
+                    # O cliente não envia mais do que `max_in_flight` de cada vez
+                    record.status = "client_limit"
+                    continue
+                tasks.append(asyncio.create_task(self._send(client, record, self._next_url(hit), start)))
+            if tasks:
+                await asyncio.wait(tasks)
+            stop.set()
+            await scraper
+
+
+def _latency_stats(records: List[LoadRecord]) -> Dict[str, Optional[float]]:
+    latencies = [r.latency_ms for r in records if r.ok]
+    return {
+        "p50_ms": round(percentile(latencies, 50), 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 1) if latencies else None,
+    }
+
+
+def _snapshot_at(snapshots: List, t: float) -> Dict[str, float]:
+    """Leitura de /metrics mais próxima do instante `t`."""
+    if not snapshots:
+        return {}
+    return min(snapshots, key=lambda s: abs(s[0] - t))[1]
+
+
+def build_windows(records: List[LoadRecord], snapshots: List, window: float, duration: float) -> List[Dict]:
+    windows = []
+    count = int(duration // window) + (1 if duration % window else 0)
+    for i in range(count):
+        start, end = i * window, min((i + 1) * window, duration)
+        sent = [r for r in records if start <= r.sent_at < end]
+        completed = [r for r in records if r.ok and r.finished_at is not None and start <= r.finished_at < end]
+        errors = [r for r in sent if r.status not in (200, "pending")]
+        # Pedidos enviados até ao fim da janela e ainda sem resposta
+        backlog = sum(1 for r in records if r.sent_at < end and r.status != "client_limit"
+                      and (r.finished_at is None or r.finished_at >= end))
+        windows.append({
+            "start_s": start,
+            "offered_rps": round(len(sent) / (end - start), 2),
+            "throughput_rps": round(len(completed) / (end - start), 2),
+            "requests": len(sent),
+            "backlog": backlog,
+            "error_rate": round(len(errors) / len(sent), 4) if sent else 0.0,
+            "hit_ratio": round(sum(1 for r in sent if r.hit) / len(sent), 3) if sent else 0.0,
+            **_latency_stats(sent),
+            **window_metrics(_snapshot_at(snapshots, start), _snapshot_at(snapshots, end)),
+        })
+    return windows
+
+
+def find_saturation(windows: List[Dict]) -> Optional[Dict]:
+    """
+    Primeira janela em que o servidor deixa de acompanhar a carga (débito
+    abaixo do pedido com pedidos a acumular, p95 ou erros) e a etapa que
+    mais piorou em relação à primeira janela.
+    """
+    baseline = next((w for w in windows if w["p95_ms"]), None)
+    if baseline is None:
+        return None
+    previous = None
+    for w in windows:
+        reasons = []
+        # O débito só conta se os pedidos por responder também estiverem a acumular
+        if (previous is not None and w["backlog"] > previous["backlog"]
+                and w["throughput_rps"] < _SATURATION_THROUGHPUT * w["offered_rps"]):
+            reasons.append(f"débito {w['throughput_rps']} de {w['offered_rps']} req/s, "
+                           f"{w['backlog']} pedidos por responder")
+        if w["p95_ms"] and w["p95_ms"] > _SATURATION_P95_FACTOR * baseline["p95_ms"]:
+            reasons.append(f"p95 {w['p95_ms']:.0f} ms (início: {baseline['p95_ms']:.0f} ms)")
+        if w["error_rate"] > _SATURATION_ERROR_RATE:
+            reasons.append(f"{w['error_rate']:.1%} de erros")
+        if reasons:
+            return {"start_s": w["start_s"], "offered_rps": w["offered_rps"], "reasons": reasons,
+                    "bottleneck": _bottleneck(baseline, w)}
+        previous = w
+    return None
+
+
+def _bottleneck(baseline: Dict, w: Dict) -> str:
+    """Etapa com o maior aumento de tempo (ms) entre a primeira janela e a saturada."""
+    if w["llm_fallbacks"]:
+        return f"Ollama: fila do modelo cheia ({w['llm_fallbacks']:.0f} explicações manuais na janela)"
+    growth = {}
+    for key, label in (("llm_wait_ms", "Ollama: espera por vaga no modelo"),
+                       ("db_ms", "SQLite: operações no banco"),
+                       ("loop_lag_ms", "event loop: código síncrono/CPU")):
+        if w.get(key) is not None:
+            growth[label] = (w[key], w[key] - (baseline.get(key) or 0.0))
+    if not growth:
+        return "indeterminado (sem métricas do servidor)"
+    label, (value, delta) = max(growth.items(), key=lambda item: item[1][1])
+    return f"{label} ({value:.1f} ms em média, +{delta:.1f} ms)"
+
+
+def _fmt(value, spec: str = ".0f") -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(windows: List[Dict], summary: Dict, saturation: Optional[Dict]) -> None:
+    print(f"{'t (s)':>6} {'pedido':>7} {'feito':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'erros':>6} {'hits':>5} {'pend':>5} "
+          f"{'db ms':>7} {'llm esp':>8} {'llm ger':>8} {'fila':>5} {'manual':>6} {'lag ms':>7}")
+    for w in windows:
+        print(f"{w['start_s']:>6.0f} {w['offered_rps']:>7.1f} {w['throughput_rps']:>7.1f} {_fmt(w['p50_ms']):>7} "
+              f"{_fmt(w['p95_ms']):>7} {_fmt(w['p99_ms']):>7} {w['error_rate']:>6.1%} {w['hit_ratio']:>5.0%} {w['backlog']:>5} "
+              f"{_fmt(w['db_ms'], '.2f'):>7} {_fmt(w['llm_wait_ms']):>8} {_fmt(w['llm_generate_ms']):>8} "
+              f"{_fmt(w['llm_queue_depth']):>5} {_fmt(w['llm_fallbacks']):>6} {_fmt(w['loop_lag_ms'], '.1f'):>7}")
+    print(f"\n{summary['requests']} pedidos, {summary['completed']} com sucesso ({summary['throughput_rps']} req/s), "
+          f"erros: {summary['errors'] or 'nenhum'}")
+    print(f"latência p50/p95/p99: {_fmt(summary['p50_ms'])}/{_fmt(summary['p95_ms'])}/{_fmt(summary['p99_ms'])} ms "
+          f"| acertos no cache p95: {_fmt(summary['hit_p95_ms'])} ms | URLs novas p95: {_fmt(summary['miss_p95_ms'])} ms")
+    if saturation:
+        print(f"Saturação a partir de t={saturation['start_s']:.0f}s (~{saturation['offered_rps']} req/s): "
+              f"{'; '.join(saturation['reasons'])}\n  etapa que mais piorou: {saturation['bottleneck']}")
+    else:
+        print("Sem saturação no intervalo de carga testado")
+
+
+def summarize_run(records: List[LoadRecord], duration: float) -> Dict:
+    errors: Dict[str, int] = {}
+    for r in records:
+        if not r.ok:
+            errors[str(r.status)] = errors.get(str(r.status), 0) + 1
+    completed = [r for r in records if r.ok]
+    last = max((r.finished_at for r in completed), default=duration)
+    return {
+        "requests": len(records),
+        "completed": len(completed),
+        "throughput_rps": round(len(completed) / max(last, duration), 2),
+        "error_rate": round(1 - len(completed) / len(records), 4) if records else 0.0,
+        "errors": errors,
+        **_latency_stats(records),
+        "hit_p95_ms": _latency_stats([r for r in records if r.hit])["p95_ms"],
+        "miss_p95_ms": _latency_stats([r for r in records if not r.hit])["p95_ms"],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(args) -> None:
+    """Processo do servidor: stand-ins dos serviços externos + uvicorn com a app pedida."""
+    with run_upstreams({**DEFAULT_LATENCY_MS, **args.latency}, args.prefill_ms, args.eval_ms, args.num_predict):
+        import uvicorn
+        module = importlib.import_module(args.app)
+        uvicorn.run(module.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def start_server(args, db_dir: str) -> subprocess.Popen:
+    """Arranca `--serve` num processo à parte e espera que responda em /api/health."""
+    env = {
+        **os.environ,
+        "CLICKSAFE_DB_PATH": str(Path(db_dir) / "load.db"),
+        "CLICKSAFE_LOG_LEVEL": os.environ.get("CLICKSAFE_LOG_LEVEL", "WARNING"),
+        "CLICKSAFE_JOBS_IN_SERVER": "0",
+        "CLICKSAFE_EXPLANATION_CACHE": "1" if args.explanation_cache else "0",
+    }
+    latency = ",".join(f"{name}={ms}" for name, ms in {**DEFAULT_LATENCY_MS, **args.latency}.items())
+    command = [sys.executable, "-m", "benchmarks.load_test", "--serve", "--app", args.app, "--port", str(args.port),
+               "--latency", latency, "--prefill-ms", str(args.prefill_ms), "--eval-ms", str(args.eval_ms),
+               "--num-predict", str(args.num_predict)]
+    process = subprocess.Popen(command, cwd=str(_BACKEND_DIR), env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"O servidor terminou ao arrancar (código {process.returncode})")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/api/health", timeout=1, trust_env=False).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("O servidor não respondeu em 60 s")
+
+
+def _load_corpus(path: Optional[str]) -> List[str]:
+    if not path:
+        return list(CORPUS)
+    with open(path, "r", encoding="utf-8") as f:
+        urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if not urls:
+        raise SystemExit(f"Corpus vazio: {path}")
+    return urls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gerador de carga para POST /api/analyze")
+    parser.add_argument("--rate", type=float, default=5.0, help="pedidos por segundo (início da rampa)")
+    parser.add_argument("--ramp-to", type=float, default=None, help="ritmo no fim do teste (rampa linear)")
+    parser.add_argument("--duration", type=float, default=60.0, help="duração em segundos")
+    parser.add_argument("--window", type=float, default=5.0, help="segundos por linha do relatório")
+    parser.add_argument("--hit-ratio", type=float, default=0.5, help="fração de pedidos a URLs já analisadas")
+    parser.add_argument("--level", default="deep", help="nível de análise dos pedidos (só o \"deep\" usa o modelo)")
+    parser.add_argument("--defer-explanation", action="store_true", help="pedidos com defer_explanation")
+    parser.add_argument("--corpus", default=None, help="ficheiro com uma URL por linha (padrão: corpus dos benchmarks)")
+    parser.add_argument("--max-in-flight", type=int, default=512, help="pedidos em simultâneo no cliente")
+    parser.add_argument("--timeout", type=float, default=60.0, help="timeout de cada pedido (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="ficheiro JSON com o relatório")
+    parser.add_argument("--target", default=None, help="servidor já a correr (ex.: http://localhost:8000)")
+    parser.add_argument("--app", default="server", choices=("server", "server_network"), help="servidor a arrancar")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--latency", type=_parse_latency, default={},
+                        help=f"latência dos stand-ins em ms: um valor ou nome=ms ({','.join(DEFAULT_LATENCY_MS)})")
+    parser.add_argument("--prefill-ms", type=float, default=0.5, help="Ollama: ms por token do prompt")
+    parser.add_argument("--eval-ms", type=float, default=10.0, help="Ollama: ms por token gerado")
+    parser.add_argument("--num-predict", type=int, default=32, help="Ollama: tokens gerados por explicação")
+    parser.add_argument("--explanation-cache", action=argparse.BooleanOptionalAction, default=False,
+                        help="cache de explicações no servidor (desligado: cada URL nova chega ao modelo)")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    args.port = args.port or _free_port()
+    corpus = _load_corpus(args.corpus)
+    arrivals = arrival_times(args.rate, args.ramp_to, args.duration)
+    generator = LoadGenerator(args.target or f"http://127.0.0.1:{args.port}", args.level, args.hit_ratio,
+                              args.max_in_flight, args.timeout, args.defer_explanation, corpus, args.seed)
+
+    db_dir = tempfile.TemporaryDirectory(prefix="clicksafe-load-")
+    process = None if args.target else start_server(args, db_dir.name)
+    try:
+        print(f"{len(arrivals)} pedidos em {args.duration:g}s contra {generator.base_url} "
+              f"({args.rate:g}{f' -> {args.ramp_to:g}' if args.ramp_to is not None else ''} req/s, "
+              f"{args.hit_ratio:.0%} acertos, nível {args.level})\n")
+        asyncio.run(generator.run(arrivals, args.window))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        db_dir.cleanup()
+
+    windows = build_windows(generator.records, generator.snapshots, args.window, args.duration)
+    summary = summarize_run(generator.records, args.duration)
+    saturation = find_saturation(windows)
+    print_report(windows, summary, saturation)
+
+    if args.output:
+        report = {
+            "meta": {
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                **_git_revision(),
+                "target": args.target or args.app,
+                "rate": args.rate, "ramp_to": args.ramp_to, "duration_s": args.duration,
+                "hit_ratio": args.hit_ratio, "level": args.level, "defer_explanation": args.defer_explanation,
+                "explanation_cache": args.explanation_cache,
+                "latency_ms": None if args.target else {**DEFAULT_LATENCY_MS, **args.latency},
+                "ollama": None if args.target else {"prefill_ms_per_token": args.prefill_ms,
+                                                    "eval_ms_per_token": args.eval_ms, "num_predict": args.num_predict},
+            },
+            "summary": summary,
+            "saturation": saturation,
+            "windows": windows,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nRelatório gravado em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
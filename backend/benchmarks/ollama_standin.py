@@ -0,0 +1,116 @@
+#backend/benchmarks/ollama_standin.py
+"""
+Servidor local que imita a API HTTP do Ollama (POST /api/generate), para
+medir o backend sem um modelo real.
+
+A latência segue um modelo simples de inferência:
+    prefill = tokens do prompt x `prefill_ms_per_token`
+    geração = `num_predict` tokens x `eval_ms_per_token`
+Responde com ou sem streaming (NDJSON), como o Ollama.
+
+Uso:
+    with run_standin(prefill_ms_per_token=1.0) as base_url:
+        client = OllamaClient(base_url=base_url)
+"""
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_CHARS_PER_TOKEN = 3.5
+_REPLY = ("SEGURO: a URL foi verificada pelas fontes de reputação e não apresenta sinais de risco. "
+          "Recomendação: pode abrir o link, mas verifique sempre o remetente.").split(" ")
+
+
+def _make_handler(prefill_ms_per_token: float, eval_ms_per_token: float, default_num_predict: int):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path != "/api/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = request.get("prompt", "")
+            options = request.get("options") or {}
+            num_predict = int(options.get("num_predict", default_num_predict))
+            prompt_tokens = int(math.ceil(len(prompt) / _CHARS_PER_TOKEN))
+            tokens = [(_REPLY[i % len(_REPLY)] + " ") for i in range(num_predict)]
+
+            start = time.perf_counter()
+            time.sleep(prompt_tokens * prefill_ms_per_token / 1000.0)
+            prefill_s = time.perf_counter() - start
+            stats = {
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prefill_s * 1e9),
+                "eval_count": num_predict,
+            }
+
+            if not request.get("stream", True):
+                time.sleep(num_predict * eval_ms_per_token / 1000.0)
+                self._send_json(200, {"model": request.get("model"), "response": "".join(tokens).strip(),
+                                      "done": True, **stats})
+                return
+
+            # Streaming: uma linha JSON por token (chunked)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(eval_ms_per_token / 1000.0)
+                self._write_chunk({"model": request.get("model"), "response": token, "done": False})
+            self._write_chunk({"model": request.get("model"), "response": "", "done": True, **stats})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, payload: dict) -> None:
+            data = (json.dumps(payload) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+@contextmanager
+def run_standin(prefill_ms_per_token: float = 1.0, eval_ms_per_token: float = 5.0,
+                num_predict: int = 64, host: str = "127.0.0.1", port: int = 0):
+    """Arranca o servidor numa thread e devolve o seu base URL (porta livre se `port=0`)."""
+    server = ThreadingHTTPServer((host, port), _make_handler(prefill_ms_per_token, eval_ms_per_token, num_predict))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Servidor stand-in da API do Ollama")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--prefill-ms", type=float, default=1.0, help="ms por token do prompt")
+    parser.add_argument("--eval-ms", type=float, default=5.0, help="ms por token gerado")
+    args = parser.parse_args()
+    with run_standin(args.prefill_ms, args.eval_ms, port=args.port) as url:
+        print(f"Stand-in do Ollama em {url} (Ctrl+C para sair)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
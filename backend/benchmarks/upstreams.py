@@ -0,0 +1,284 @@
+#backend/benchmarks/upstreams.py
+"""
+Servidores locais que imitam os serviços externos do pipeline, para medir o
+backend sem rede e com latência controlada:
+
+- Google Safe Browsing (POST threatMatches:find) e VirusTotal (POST /urls,
+  GET /analyses/{id}, GET /urls/{id});
+- ip-api.com (GET /json/{ip});
+- o próprio site analisado (certificado SSL e redirecionamentos): um proxy
+  HTTP local (HTTP_PROXY/HTTPS_PROXY) que responde 200 aos pedidos http:// e
+  recusa os túneis https:// (CONNECT), depois da latência configurada;
+- DNS (UDP): responde A 93.184.216.34 a tudo, exceto nomes com "nxdomain";
+- WHOIS (TCP): registo com datas de criação e expiração fixas (e o
+  servidor de cada TLD, nas consultas que o cliente faz à IANA);
+- Ollama: `ollama_standin.py`.
+
+`run_upstreams()` arranca todos, aponta o backend para eles (variáveis de
+ambiente, resolver do dnspython e socket do cliente whois) e repõe tudo no
+fim. As variáveis de ambiente são lidas quando os módulos do backend são
+importados: importe `app`/`services` só dentro do `with`.
+
+Uso:
+    with run_upstreams(latency_ms={"gsb": 80, "vt": 300}) as urls:
+        from app import analyze_url
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+import dns.message
+import dns.rcode
+import dns.resolver
+import dns.rrset
+from whois.whois import NICClient
+
+from benchmarks.ollama_standin import run_standin
+
+# Latência padrão (ms) de cada serviço
+DEFAULT_LATENCY_MS = {
+    "gsb": 20.0,
+    "vt": 40.0,
+    "ip_api": 15.0,
+    "site": 30.0,
+    "dns": 2.0,
+    "whois": 25.0,
+}
+
+_STANDIN_IP = "93.184.216.34"
+
+_WHOIS_RECORD = (
+    "Domain Name: {domain}\r\n"
+    "Registrar: Stand-in Registrar\r\n"
+    "Creation Date: 2015-03-14T00:00:00Z\r\n"
+    "Registry Expiry Date: 2031-03-14T00:00:00Z\r\n"
+    "Name Server: NS1.EXAMPLE.NET\r\n"
+)
+
+# Route: (método, caminho, corpo) -> (status, resposta JSON)
+Route = Callable[[str, str, bytes], Tuple[int, dict]]
+
+
+def _gsb_route(method: str, path: str, body: bytes) -> Tuple[int, dict]:
+    """Sem ameaças, exceto URLs com "malware" ou "phishing"."""
+    request = json.loads(body or b"{}")
+    entries = request.get("threatInfo", {}).get("threatEntries", [])
+    matches = [{
+        "threatType": "SOCIAL_ENGINEERING",
+        "platformType": "ANY_PLATFORM",
+        "threatEntryType": "URL",
+        "threat": {"url": e["url"]},
+        "cacheDuration": "300s",
+    } for e in entries if "malware" in e.get("url", "") or "phishing" in e.get("url", "")]
+    return 200, ({"matches": matches} if matches else {})
+
+
+def _vt_url_object(url_id: str, malicious: int = 0) -> dict:
+    stats = {"malicious": malicious, "suspicious": 0, "harmless": 62, "undetected": 24, "timeout": 0}
+    return {"data": {"type": "url", "id": url_id, "attributes": {"last_analysis_stats": stats}}}
+
+
+def _vt_route(method: str, path: str, body: bytes) -> Tuple[int, dict]:
+    """
+    A submissão (POST /urls) já devolve o objeto URL, sem a análise em fila:
+    o cliente não entra no ciclo de polling (3 s entre consultas).
+    """
+    if method == "POST" and path.rstrip("/").endswith("/urls"):
+        malicious = 5 if b"malware" in body or b"phishing" in body else 0
+        return 200, _vt_url_object("standin", malicious)
+    if method == "GET" and "/analyses/" in path:
+        return 200, {"data": {"type": "analysis", "attributes": {"status": "completed", "url_id": "standin"}}}
+    if method == "GET" and "/urls/" in path:
+        return 200, _vt_url_object(path.rsplit("/", 1)[-1])
+    return 404, {"error": {"code": "NotFoundError", "message": path}}
+
+
+def _ip_api_route(method: str, path: str, body: bytes) -> Tuple[int, dict]:
+    return 200, {"status": "success", "country": "United States", "countryCode": "US",
+                 "regionName": "Massachusetts", "city": "Norwell", "isp": "Stand-in ISP",
+                 "query": path.rsplit("/", 1)[-1]}
+
+
+def _site_route(method: str, path: str, body: bytes) -> Tuple[int, dict]:
+    return 200, {"ok": True}
+
+
+def _make_http_handler(route: Route, latency_ms: float):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _respond(self, method: str) -> None:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+            time.sleep(latency_ms / 1000.0)
+            status, payload = route(method, self.path, body)
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_POST(self):
+            self._respond("POST")
+
+        def do_CONNECT(self):
+            # Túnel https:// do proxy do site: recusado (o cliente vê um erro de ligação)
+            time.sleep(latency_ms / 1000.0)
+            self.send_response(502)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            self.close_connection = True
+
+    return Handler
+
+
+@contextmanager
+def run_http_standin(route: Route, latency_ms: float = 0.0, host: str = "127.0.0.1"):
+    """Servidor HTTP numa thread com as respostas de `route`; devolve o base URL."""
+    server = ThreadingHTTPServer((host, 0), _make_http_handler(route, latency_ms))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class _DNSHandler(socketserver.BaseRequestHandler):
+    latency_ms = 0.0
+
+    def handle(self):
+        data, sock = self.request
+        query = dns.message.from_wire(data)
+        response = dns.message.make_response(query)
+        question = query.question[0]
+        if "nxdomain" in question.name.to_text():
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        else:
+            response.answer.append(dns.rrset.from_text(question.name, 60, "IN", "A", _STANDIN_IP))
+        time.sleep(self.latency_ms / 1000.0)
+        sock.sendto(response.to_wire(), self.client_address)
+
+
+class _WhoisHandler(socketserver.StreamRequestHandler):
+    latency_ms = 0.0
+
+    def handle(self):
+        query = self.rfile.readline().decode("utf-8", "replace").strip()
+        time.sleep(self.latency_ms / 1000.0)
+        if "." not in query:
+            # Consulta de um TLD (como à IANA): indica o servidor whois do TLD
+            self.wfile.write(f"domain:       {query.upper()}\nwhois:        whois.standin.test\n".encode("utf-8"))
+            return
+        self.wfile.write(_WHOIS_RECORD.format(domain=query.upper()).encode("utf-8"))
+
+
+@contextmanager
+def _run_socketserver(server_class, handler, latency_ms: float, host: str = "127.0.0.1"):
+    handler_class = type(handler.__name__, (handler,), {"latency_ms": latency_ms})
+    server = server_class((host, 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def _use_dns_server(port: int):
+    """Aponta o resolver padrão do dnspython (usado pelas heurísticas) para o servidor local."""
+    previous = dns.resolver.default_resolver
+    resolver = dns.resolver.Resolver(configure=False)
+    resolver.nameservers = ["127.0.0.1"]
+    resolver.port = port
+    resolver.lifetime = 2.0
+    dns.resolver.default_resolver = resolver
+    try:
+        yield
+    finally:
+        dns.resolver.default_resolver = previous
+
+
+@contextmanager
+def _use_whois_server(port: int):
+    """O cliente whois liga sempre à porta 43 do servidor do TLD: redireciona as ligações para o servidor local."""
+
+    class _RedirectSocket(socket.socket):
+        def connect(self, address):
+            super().connect(("127.0.0.1", port))
+
+    previous = NICClient.__dict__["get_socket"]
+    NICClient.get_socket = staticmethod(lambda: _RedirectSocket(socket.AF_INET, socket.SOCK_STREAM))
+    try:
+        yield
+    finally:
+        NICClient.get_socket = previous
+
+
+@contextmanager
+def _environ(**values):
+    previous = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+@contextmanager
+def run_upstreams(latency_ms: Optional[Dict[str, float]] = None, prefill_ms_per_token: float = 0.2,
+                  eval_ms_per_token: float = 1.0, num_predict: int = 32):
+    """
+    Arranca todos os stand-ins e configura o backend para os usar.
+    `latency_ms`: latência por serviço (chaves de DEFAULT_LATENCY_MS); o Ollama
+    segue o modelo de `ollama_standin.py`. Devolve os URLs/portas de cada um.
+    """
+    latency = {**DEFAULT_LATENCY_MS, **(latency_ms or {})}
+    with ExitStack() as stack:
+        urls = {
+            "gsb": stack.enter_context(run_http_standin(_gsb_route, latency["gsb"])),
+            "vt": stack.enter_context(run_http_standin(_vt_route, latency["vt"])),
+            "ip_api": stack.enter_context(run_http_standin(_ip_api_route, latency["ip_api"])),
+            "site": stack.enter_context(run_http_standin(_site_route, latency["site"])),
+            "ollama": stack.enter_context(run_standin(prefill_ms_per_token, eval_ms_per_token, num_predict)),
+        }
+        dns_port = stack.enter_context(_run_socketserver(socketserver.ThreadingUDPServer, _DNSHandler, latency["dns"]))
+        whois_port = stack.enter_context(_run_socketserver(socketserver.ThreadingTCPServer, _WhoisHandler, latency["whois"]))
+        urls["dns"] = f"127.0.0.1:{dns_port}"
+        urls["whois"] = f"127.0.0.1:{whois_port}"
+        stack.enter_context(_use_dns_server(dns_port))
+        stack.enter_context(_use_whois_server(whois_port))
+        stack.enter_context(_environ(
+            GSB_API_KEY="standin",
+            GSB_API_URL=f"{urls['gsb']}/v4/threatMatches:find",
+            VT_API_KEY="standin",
+            VT_API_URL=f"{urls['vt']}/api/v3",
+            CLICKSAFE_IP_API_URL=f"{urls['ip_api']}/json",
+            OLLAMA_BASE_URL=urls["ollama"],
+            OLLAMA_NUM_PREDICT=str(num_predict),
+            # Pedidos ao site analisado (e à lista de sufixos do tldextract) vão para o proxy local
+            HTTP_PROXY=urls["site"],
+            HTTPS_PROXY=urls["site"],
+            NO_PROXY="127.0.0.1,localhost",
+        ))
+        yield urls
@@ -0,0 +1,131 @@
+"""
+Rescoring offline do ClickSafe - recalcula os scores das análises guardadas
+depois de mudar a severidade das heurísticas (heuristics.default_severity),
+SEVERITY_SCORES ou os pesos das fontes, sem repetir as análises (sem rede).
+
+1. Copia a severidade atual de cada heurística para os heuristics_hits gravados;
+2. Por blocos de análises (ordem de id), uma consulta agrega os pontos das
+   heurísticas acionadas e o consenso das fontes em reputation_checks;
+3. Recalcula o score de heurísticas, o de reputação (`weighted_consensus`)
+   e o final (`combine_scores`), e grava só os que mudaram.
+
+As análises com o VirusTotal ainda pendente ficam de fora (o score é
+atualizado quando ele terminar). O score final segue a mesma regra de
+`_score_url` (`combine_scores`, com o heuristics_only gravado na análise).
+
+Também disponível em `POST /api/admin/rescore`.
+
+    python rescore.py [--batch-size=N] [--dry-run]
+"""
+import argparse
+import sys
+import threading
+import time
+from typing import Dict, Optional
+from storage.db import (
+    is_db_initialized,
+    get_rescoring_inputs,
+    sync_heuristic_hit_severities,
+    update_analysis_scores,
+)
+from app import SEVERITY_SCORES, combine_scores
+from services.reputation import _status_to_score, weighted_consensus
+from services.sources import SOURCE_REGISTRY
+from services.log import get_logger
+
+log = get_logger("rescore")
+
+# Análises por consulta/transação
+RESCORE_BATCH_SIZE = 20000
+
+# Diferença mínima para gravar um score
+_SCORE_EPSILON = 1e-6
+
+
+class RescoreBusy(Exception):
+    """Já está a correr um rescoring neste processo."""
+
+
+_rescore_lock = threading.Lock()
+
+
+def rescore_row(row: Dict) -> float:
+    """Score final de uma análise a partir dos agregados de `get_rescoring_inputs`."""
+    heuristics_score = min(100.0, row["heuristic_points"])
+    reputation_score = weighted_consensus(row["total_weight"], row["weighted"], row["positive_floor"])
+    return combine_scores(reputation_score * 100, heuristics_score, bool(row["heuristics_only"]),
+                          row["positive_floor"] * 100)
+
+
+def rescore_analyses(batch_size: int = RESCORE_BATCH_SIZE, dry_run: bool = False,
+                     db_path: Optional[str] = None) -> Dict:
+    """
+    Recalcula e grava os scores de todas as análises completas.
+    Com `dry_run` só conta o que mudaria (nem os heuristics_hits são atualizados).
+    Lança RescoreBusy se já houver um rescoring a correr.
+
+    Retorna {analyses, changed, hits_updated, max_delta, elapsed_s, dry_run}.
+    """
+    if not _rescore_lock.acquire(blocking=False):
+        raise RescoreBusy("Já está a correr um rescoring")
+    try:
+        kwargs = {"db_path": db_path} if db_path else {}
+        start = time.perf_counter()
+        hits_updated = 0 if dry_run else sync_heuristic_hit_severities(**kwargs)
+        weights = {name: source.weight for name, source in SOURCE_REGISTRY.items()}
+        statuses = {status: _status_to_score(status) for status in ("POSITIVE", "NEGATIVE", "UNKNOWN")}
+
+        analyses = changed = 0
+        max_delta = 0.0
+        after_id = 0
+        while True:
+            rows = get_rescoring_inputs(after_id, batch_size, SEVERITY_SCORES, weights, statuses, **kwargs)
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                score = rescore_row(row)
+                delta = abs(score - row["score"])
+                if delta > _SCORE_EPSILON:
+                    updates.append((row["id"], score))
+                    max_delta = max(max_delta, delta)
+            if updates and not dry_run:
+                update_analysis_scores(updates, **kwargs)
+            analyses += len(rows)
+            changed += len(updates)
+            after_id = rows[-1]["id"]
+            log.debug("Rescoring: %d análises (%d alteradas)", analyses, changed)
+
+        result = {
+            "analyses": analyses,
+            "changed": changed,
+            "hits_updated": hits_updated,
+            "max_delta": round(max_delta, 4),
+            "elapsed_s": round(time.perf_counter() - start, 3),
+            "dry_run": dry_run,
+        }
+        log.info("Rescoring concluído: %d de %d análises alteradas", changed, analyses, extra=result)
+        return result
+    finally:
+        _rescore_lock.release()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recalcula os scores das análises guardadas (sem rede)")
+    parser.add_argument("--batch-size", type=int, default=RESCORE_BATCH_SIZE, help="análises por consulta")
+    parser.add_argument("--dry-run", action="store_true", help="só conta as análises cujo score mudaria")
+    args = parser.parse_args()
+
+    # Sem banco inicializado não há análises para recalcular
+    if not is_db_initialized():
+        print("Banco de dados não inicializado: nada a recalcular", file=sys.stderr)
+        sys.exit(1)
+    result = rescore_analyses(batch_size=args.batch_size, dry_run=args.dry_run)
+    verb = "mudariam" if args.dry_run else "alteradas"
+    print(f"{result['changed']} de {result['analyses']} análises {verb} "
+          f"(maior diferença {result['max_delta']:.2f}), {result['hits_updated']} heuristics_hits com nova severidade, "
+          f"{result['elapsed_s']:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
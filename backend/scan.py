@@ -0,0 +1,225 @@
+"""
+Scanner em lote do ClickSafe - analisa URLs de um ficheiro (ou stdin) em streaming.
+
+Lê uma URL por linha (linhas vazias e começadas por # são ignoradas),
+analisa até `--concurrency` em simultâneo e escreve em stdout uma linha
+NDJSON por URL, pela ordem em que terminam. Os logs do pipeline vão para
+stderr com `--verbose` (por padrão só os avisos e erros).
+
+A memória é constante: a leitura só avança quando há vaga na fila interna.
+Com `--checkpoint`, a última linha até à qual tudo foi analisado é gravada
+periodicamente; se o ficheiro de checkpoint existir, o scan continua a
+partir daí (as URLs que terminaram depois dessa linha antes de uma
+interrupção são analisadas - e escritas - outra vez, mas vêm do banco).
+Com `--defer-vt` as linhas são escritas sem esperar pelo VirusTotal, mas o
+scan só termina depois de as verificações em background atualizarem o banco.
+
+Uso (a partir de backend/):
+    python scan.py urls.txt --concurrency 16 --level quick > resultados.ndjson
+    cat urls.txt | python scan.py - --checkpoint scan.ckpt
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, TextIO
+from storage.db import init_db, is_db_initialized, get_analysis_by_url
+from services.log import setup_logging
+from app import (
+    analyze_url,
+    normalize_url,
+    summarize_analysis,
+    levels_covering,
+    validate_analysis_level,
+    wait_background_tasks,
+)
+
+# Threads por análise em curso: a heurística de rede atual e as fontes de reputação síncronas (GSB, VirusTotal)
+_THREADS_PER_ANALYSIS = 3
+
+
+class ScanCheckpoint(object):
+    """
+    Checkpoint de um scan: a maior linha L tal que todas as linhas até L já
+    terminaram (as análises terminam fora de ordem). Só guarda as linhas
+    terminadas acima de L, que nunca passam da janela de URLs em curso.
+    """
+
+    def __init__(self, path: Optional[str], source: str, save_every: int = 100):
+        self.path = path
+        self.source = source
+        self.save_every = save_every
+        self.line = 0
+        self._done = set()
+        self._unsaved = 0
+
+    def load(self) -> int:
+        """Lê o checkpoint (se existir) e devolve a linha a partir da qual continuar."""
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("source") != self.source:
+            raise ValueError(f"O checkpoint {self.path} é de outra entrada ({data.get('source')})")
+        self.line = int(data.get("line", 0))
+        return self.line
+
+    def done(self, line_no: int) -> None:
+        """Marca uma linha como terminada e avança o checkpoint."""
+        self._done.add(line_no)
+        while self.line + 1 in self._done:
+            self.line += 1
+            self._done.discard(self.line)
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"source": self.source, "line": self.line, "updated_at": time.time()}, f)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+
+async def _scan_url(url: str, analysis_level: str, defer_vt: bool) -> dict:
+    """Resultado de uma URL: do banco se já tiver análise do nível pedido, senão do pipeline."""
+    try:
+        existing = get_analysis_by_url(normalize_url(url), levels_covering(analysis_level))
+        if existing:
+            return summarize_analysis(url, existing, cached=True)
+        analysis = await analyze_url(url, defer_vt=defer_vt, analysis_level=analysis_level)
+        return summarize_analysis(url, analysis, cached=False)
+    except Exception as e:
+        return {"url": url, "error": str(e)}
+
+
+async def scan(
+    source: TextIO,
+    output: TextIO,
+    concurrency: int = 8,
+    analysis_level: Optional[str] = None,
+    defer_vt: bool = False,
+    checkpoint: Optional[ScanCheckpoint] = None,
+    start_line: int = 0
+) -> dict:
+    """
+    Analisa as URLs de `source` (uma por linha, a partir de `start_line`) e
+    escreve os resultados NDJSON em `output`.
+    retorna o resumo: total, cached, errors e elapsed_s
+    """
+    analysis_level = validate_analysis_level(analysis_level)
+    checkpoint = checkpoint or ScanCheckpoint(None, "")
+    # As heurísticas de rede e as fontes síncronas correm em threads (asyncio.to_thread):
+    # o executor padrão (min(32, CPUs + 4)) limitaria as `concurrency` análises em simultâneo
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=concurrency * _THREADS_PER_ANALYSIS + 1, thread_name_prefix="scan")
+    )
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    summary = {"total": 0, "cached": 0, "errors": 0}
+    start = time.monotonic()
+
+    async def reader():
+        line_no = 0
+        try:
+            while True:
+                line = await asyncio.to_thread(source.readline)
+                if not line:
+                    break
+                line_no += 1
+                if line_no <= start_line:
+                    continue
+                url = line.strip()
+                if not url or url.startswith("#"):
+                    checkpoint.done(line_no)
+                    continue
+                await queue.put((line_no, url))
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            line_no, url = item
+            result = await _scan_url(url, analysis_level, defer_vt)
+            output.write(json.dumps({"line": line_no, **result}, ensure_ascii=False) + "\n")
+            output.flush()
+            summary["total"] += 1
+            summary["cached"] += 1 if result.get("cached") else 0
+            summary["errors"] += 1 if "error" in result else 0
+            checkpoint.done(line_no)
+
+    try:
+        await asyncio.gather(reader(), *[worker() for _ in range(concurrency)])
+        # Com defer_vt o VirusTotal termina em background: espera por ele antes de sair
+        await wait_background_tasks()
+    finally:
+        checkpoint.save()
+    summary["elapsed_s"] = round(time.monotonic() - start, 2)
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Analisa em lote URLs de um ficheiro (ou stdin) e escreve NDJSON")
+    parser.add_argument("input", nargs="?", default="-", help="ficheiro com uma URL por linha (- para stdin)")
+    parser.add_argument("--concurrency", type=int, default=8, help="análises em simultâneo")
+    parser.add_argument("--level", default=None, help="nível de análise: quick, standard ou deep")
+    parser.add_argument("--defer-vt", action="store_true", help="não esperar pelo VirusTotal")
+    parser.add_argument("--checkpoint", default=None, help="ficheiro de checkpoint (continua a partir dele se existir)")
+    parser.add_argument("--restart", action="store_true", help="ignora o checkpoint existente")
+    parser.add_argument("--verbose", action="store_true", help="mostra todos os logs do pipeline em stderr")
+    args = parser.parse_args()
+
+    source_name = "-" if args.input == "-" else os.path.abspath(args.input)
+    checkpoint = ScanCheckpoint(args.checkpoint, source_name)
+    start_line = 0 if args.restart else checkpoint.load()
+    if start_line:
+        print(f"A continuar do checkpoint: linha {start_line}", file=sys.stderr)
+
+    # O logging escreve em stderr; sem --verbose só os avisos e erros
+    setup_logging("INFO" if args.verbose else "WARNING")
+    output = sys.stdout
+    logs = sys.stderr if args.verbose else open(os.devnull, "w")
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    try:
+        # stdout fica só com o NDJSON: os prints do pipeline vão para `logs`
+        with contextlib.redirect_stdout(logs):
+            if not is_db_initialized():
+                init_db()
+            summary = asyncio.run(scan(
+                source, output,
+                concurrency=max(1, args.concurrency),
+                analysis_level=args.level,
+                defer_vt=args.defer_vt,
+                checkpoint=checkpoint,
+                start_line=start_line
+            ))
+    except KeyboardInterrupt:
+        print(f"\nInterrompido na linha {checkpoint.line}", file=sys.stderr)
+        sys.exit(130)
+    except BrokenPipeError:
+        # Quem lia o stdout fechou (ex.: `| head`): termina sem traceback
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if logs is not sys.stderr:
+            logs.close()
+
+    rate = summary["total"] / summary["elapsed_s"] if summary["elapsed_s"] else 0.0
+    print(f"{summary['total']} URLs ({summary['cached']} do banco, {summary['errors']} erros) "
+          f"em {summary['elapsed_s']}s ({rate:.1f}/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
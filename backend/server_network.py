@@ -2,16 +2,29 @@
 Servidor FastAPI para o ClickSafe - Versão para Rede Local.
 """
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import List, Literal, Optional
+import asyncio
+import json
 import socket
 from pathlib import Path
-from storage.db import init_db, get_analysis_by_url, get_full_analysis, get_analyses_stats
-from app import analyze_url
+from storage.db import init_db, is_db_initialized, get_job, get_analysis_by_url, get_analysis_status, get_full_analysis, get_analysis_spans, get_analyses_stats
+from app import (analyze_url, analyze_url_stream, analyze_batch, wait_for_explanation, recover_pending_explanations,
+                 EXPLANATION_POOL, BATCH_MAX_URLS)
+from services.source_stats import SOURCE_STATS
+from services.loop_monitor import LOOP_MONITOR
+from services.profiler import PROFILE_MAX_SECONDS, ProfilerBusy, check_admin_token, run_profile
+from services.log import get_logger
+from services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, http_metrics_middleware, render as render_metrics
+from worker import JobWorker, JOBS_IN_SERVER, submit_job
+from rescore import RESCORE_BATCH_SIZE, RescoreBusy, rescore_analyses
+from services.xai import close_ollama_client, get_llm_stats
+from services.reputation import get_source_stats
+from services.blocklist import load_blocklist
 
 def get_local_ip():
     """Obtém o IP da máquina na rede local"""
@@ -33,11 +46,26 @@ FRONTEND_DIR = BACKEND_DIR.parent / "frontend"
 FRONTEND_DIST = FRONTEND_DIR / "dist"
 
 
+JOB_WORKER = JobWorker()
+log = get_logger("api")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager para inicializar o banco de dados"""
-    # Startup
-    init_db()
+    # Startup: init_db() só num banco por inicializar (não repõe o schema nem as heurísticas a cada arranque)
+    if not is_db_initialized():
+        init_db()
+    # Carrega o histórico de reputation_checks para ordenar as fontes de reputação
+    SOURCE_STATS.load_history()
+    # Lê a blocklist local antes do primeiro pedido
+    load_blocklist()
+    # Explicações que ficaram pendentes quando o servidor parou (a fila de explicações vive em memória)
+    recover_pending_explanations()
+    # Worker da fila durável de jobs neste processo (podem correr mais com `python worker.py`)
+    job_task = asyncio.create_task(JOB_WORKER.run()) if JOBS_IN_SERVER else None
+    # Lag do event loop e stacks do código síncrono que o bloqueia (ver /metrics)
+    LOOP_MONITOR.start()
     print(f"\n{'='*60}")
     print(f"ClickSafe Server - Modo Rede Local")
     print(f"{'='*60}")
@@ -51,7 +79,13 @@ async def lifespan(app: FastAPI):
     print(f"API Docs: http://{LOCAL_IP}:8000/docs")
     print(f"{'='*60}\n")
     yield
-    # Shutdown (se necessário no futuro)
+    # Shutdown: para o worker de jobs e os de explicações e fecha a ligação persistente ao Ollama
+    if job_task is not None:
+        await JOB_WORKER.stop()
+        await job_task
+    await EXPLANATION_POOL.stop()
+    await LOOP_MONITOR.stop()
+    await close_ollama_client()
 
 
 app = FastAPI(title="ClickSafe API - Network Mode", version="1.0.0", lifespan=lifespan)
@@ -66,6 +100,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Duração dos pedidos por rota (exportada em /metrics)
+app.middleware("http")(http_metrics_middleware)
+
 if FRONTEND_DIST.exists() and (FRONTEND_DIST / "index.html").exists():
     app.mount("/assets", StaticFiles(directory=FRONTEND_DIST / "assets"), name="assets")
     
@@ -73,18 +110,29 @@ if FRONTEND_DIST.exists() and (FRONTEND_DIST / "index.html").exists():
     @app.get("/")
     async def serve_frontend():
         return FileResponse(FRONTEND_DIST / "index.html")
-    
-    @app.get("/{full_path:path}")
-    async def serve_frontend_routes(full_path: str):
-        if full_path.startswith("api/") or full_path.startswith("docs") or full_path == "openapi.json":
-            raise HTTPException(status_code=404, detail="Not found")
-        file_path = FRONTEND_DIST / full_path
-        if file_path.exists() and file_path.is_file():
-            return FileResponse(file_path)
-        return FileResponse(FRONTEND_DIST / "index.html")
+
+AnalysisLevel = Literal["quick", "standard", "deep"]
+
 
 class URLRequest(BaseModel):
     url: str
+    defer_vt: bool = False  # não esperar pelo VirusTotal (termina em background)
+    defer_explanation: bool = False  # devolver logo o score (explicação gerada em background)
+    analysis_level: Optional[AnalysisLevel] = None  # quick/standard/deep (padrão: CLICKSAFE_ANALYSIS_LEVEL)
+
+
+class BatchRequest(BaseModel):
+    urls: List[str]
+    analysis_level: Optional[AnalysisLevel] = None
+    defer_vt: bool = False
+    defer_explanation: bool = False
+    concurrency: Optional[int] = None  # análises em simultâneo (padrão: CLICKSAFE_BATCH_CONCURRENCY)
+
+
+class JobRequest(BaseModel):
+    urls: List[str]
+    analysis_level: Optional[AnalysisLevel] = None
+    defer_vt: bool = False
 
 
 class URLResponse(BaseModel):
@@ -95,46 +143,64 @@ class URLResponse(BaseModel):
     normalized_url: Optional[str] = None
     score: float
     explanation: Optional[str] = None
+    enrichment_status: Optional[str] = None
+    explanation_status: Optional[str] = None
+    analysis_level: Optional[str] = None
     reputation_checks: list = []
     heuristic_hits: list = []
     ai_requests: list = []
+    trace: Optional[list] = None  # linha temporal das etapas (só com ?trace=1)
+
+
+def _to_url_response(result: dict) -> URLResponse:
+    """Converte o resultado de `analyze_url`/`get_full_analysis` no modelo de resposta."""
+    # Mapear campos para o formato esperado
+    if 'heuristics_hits' in result:
+        result['heuristic_hits'] = result.pop('heuristics_hits')
+    if 'normalized_url' not in result and 'url_normalized' in result:
+        result['normalized_url'] = result.pop('url_normalized')
+    
+    # Garantir que todos os campos obrigatórios existem
+    if 'heuristic_hits' not in result:
+        result['heuristic_hits'] = []
+    if 'reputation_checks' not in result:
+        result['reputation_checks'] = []
+    if 'ai_requests' not in result:
+        result['ai_requests'] = []
+    
+    # Remover campos extras que não estão no modelo (link_id, hostname, etc)
+    # Manter apenas os campos esperados pelo URLResponse
+    allowed_fields = {'id', 'url', 'normalized_url', 'score', 'explanation', 'enrichment_status', 'explanation_status',
+                     'analysis_level', 'reputation_checks', 'heuristic_hits', 'ai_requests', 'trace'}
+    filtered_result = {k: v for k, v in result.items() if k in allowed_fields}
+    return URLResponse(**filtered_result)
+
+
+def _sse(event: str, data) -> str:
+    """Formata um evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @app.post("/api/analyze", response_model=URLResponse)
-async def analyze_url_endpoint(request: URLRequest, http_request: Request):
+async def analyze_url_endpoint(request: URLRequest, http_request: Request, trace: bool = False):
+    """
+    Analisa uma URL e retorna o resultado completo.
+    Com `?trace=1` inclui a linha temporal das etapas do pedido (campo "trace").
+    """
     try:
-        print(f"\n[API] Recebida requisição para analisar: {request.url}")
-        print(f"[API] Origin: {http_request.headers.get('origin', 'N/A')}")
-        print(f"[API] User-Agent: {http_request.headers.get('user-agent', 'N/A')[:50]}...")
-        
-        result = await analyze_url(request.url)
-        print(f"[API] Análise concluída. Preparando resposta...")
-        print(f"[API] Campos no resultado: {list(result.keys())}")
-        
-        # Mapear campos para o formato esperado
-        if 'heuristics_hits' in result:
-            result['heuristic_hits'] = result.pop('heuristics_hits')
-        if 'normalized_url' not in result and 'url_normalized' in result:
-            result['normalized_url'] = result.pop('url_normalized')
-        
-        # Garantir que todos os campos obrigatórios existem
-        if 'heuristic_hits' not in result:
-            result['heuristic_hits'] = []
-        if 'reputation_checks' not in result:
-            result['reputation_checks'] = []
-        if 'ai_requests' not in result:
-            result['ai_requests'] = []
-        
-        # Remover campos extras que não estão no modelo (link_id, hostname, etc)
-        # Manter apenas os campos esperados pelo URLResponse
-        allowed_fields = {'id', 'url', 'normalized_url', 'score', 'explanation', 
-                         'reputation_checks', 'heuristic_hits', 'ai_requests'}
-        filtered_result = {k: v for k, v in result.items() if k in allowed_fields}
+        log.debug("Recebida requisição para analisar: %s", request.url,
+                  extra={"origin": http_request.headers.get("origin"),
+                         "user_agent": (http_request.headers.get("user-agent") or "")[:50]})
         
-        print(f"[API] Retornando resposta com {len(filtered_result.get('heuristic_hits', []))} heurísticas")
-        print(f"[API] Campos filtrados: {list(filtered_result.keys())}")
-        response = URLResponse(**filtered_result)
-        print(f"[API] Resposta criada com sucesso")
+        result = await analyze_url(
+            request.url,
+            defer_vt=request.defer_vt,
+            defer_explanation=request.defer_explanation,
+            analysis_level=request.analysis_level,
+            include_trace=trace
+        )
+        response = _to_url_response(result)
+        log.debug("Retornando resposta com %d heurísticas", len(response.heuristic_hits))
         return response
     except HTTPException:
         # Re-raise HTTP exceptions (já são erros HTTP apropriados)
@@ -142,10 +208,68 @@ async def analyze_url_endpoint(request: URLRequest, http_request: Request):
     except Exception as e:
         import traceback
         error_detail = f"Erro ao analisar URL: {str(e)}\n{traceback.format_exc()}"
-        print(f"\n[API] ERRO: {error_detail}")
+        log.error("Erro ao analisar URL: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=error_detail)
 
 
+@app.post("/api/analyze/batch")
+async def analyze_batch_endpoint(request: BatchRequest):
+    """
+    Analisa um lote de URLs (até CLICKSAFE_BATCH_MAX_URLS) e devolve os
+    resultados em NDJSON (uma linha JSON por URL) à medida que terminam.
+    URLs repetidas são analisadas uma vez; as que já têm análise no banco
+    vêm primeiro (`cached: true`). Erros de uma URL vêm como {"url", "error"}.
+    """
+    if len(request.urls) > BATCH_MAX_URLS:
+        raise HTTPException(status_code=413, detail=f"Máximo de {BATCH_MAX_URLS} URLs por lote")
+
+    async def lines():
+        async for result in analyze_batch(
+            request.urls,
+            concurrency=request.concurrency,
+            analysis_level=request.analysis_level,
+            defer_vt=request.defer_vt,
+            defer_explanation=request.defer_explanation
+        ):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/api/analyze/stream")
+async def analyze_url_stream_endpoint(
+    url: str,
+    http_request: Request,
+    defer_vt: bool = False,
+    analysis_level: Optional[AnalysisLevel] = None
+):
+    """
+    Analisa uma URL e envia o resultado por Server-Sent Events:
+    - `analysis`: análise com o score, logo que está calculada
+    - `token`: pedaços da explicação à medida que o modelo os gera
+    - `done`: explicação completa e id da análise persistida
+    - `error`: erro na análise
+    """
+    log.debug("Recebida requisição (streaming) para analisar: %s", url,
+              extra={"origin": http_request.headers.get("origin")})
+
+    async def events():
+        try:
+            async for event, data in analyze_url_stream(url, defer_vt=defer_vt, analysis_level=analysis_level):
+                if event == "analysis":
+                    data = _to_url_response(data).model_dump()
+                yield _sse(event, data)
+        except Exception as e:
+            log.error("Erro ao analisar URL (streaming): %s", e, exc_info=True)
+            yield _sse("error", {"detail": f"Erro ao analisar URL: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.api_route("/", methods=["GET"], include_in_schema=False)
 async def root_fallback():
     """Fallback se o frontend não estiver buildado"""
@@ -156,10 +280,20 @@ async def root_fallback():
             "local_ip": LOCAL_IP,
             "endpoints": {
                 "analyze": "/api/analyze",
+                "analyze_stream": "/api/analyze/stream?url=...",
+                "analyze_batch": "/api/analyze/batch",
+                "jobs": "/api/jobs",
+                "job": "/api/jobs/{id}",
                 "health": "/api/health",
+                "metrics": "/metrics",
                 "analysis_by_id": "/api/analysis/{id}",
+                "analysis_status": "/api/analysis/{id}/status",
+                "analysis_explanation": "/api/analysis/{id}/explanation",
                 "analysis_by_url": "/api/analysis/url/{url}",
                 "stats": "/api/stats",
+                "reputation_stats": "/api/reputation/stats",
+                "llm_stats": "/api/llm/stats",
+                "loop_stats": "/api/loop/stats",
                 "docs": "/docs"
             },
             "network_access": f"http://{LOCAL_IP}:8000",
@@ -167,6 +301,67 @@ async def root_fallback():
         }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """
+    Métricas no formato de texto do Prometheus: latência dos pedidos, de cada
+    etapa, de cada fonte e do banco, caches, análises em curso e fila do modelo.
+    """
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.post("/api/admin/profile", include_in_schema=False)
+async def profile_endpoint(
+    mode: str = "sample",
+    seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS, description="Duração do profiling"),
+    interval_ms: float = Query(5, ge=1, description="Intervalo entre amostras (modo sample)"),
+    all_threads: bool = False,
+    url: Optional[str] = Query(None, description="Modo cprofile: mede só a análise desta URL"),
+    analysis_level: Optional[AnalysisLevel] = None,
+    limit: int = Query(40, ge=1, le=500),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Profiling do processo (header X-Admin-Token = CLICKSAFE_ADMIN_TOKEN):
+    `sample` devolve stacks colapsados, `cprofile` o relatório do pstats
+    (do event loop durante `seconds`, ou de uma análise com `url`) e
+    `tracemalloc` os locais que mais memória alocaram.
+    """
+    if not check_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Acesso negado (defina CLICKSAFE_ADMIN_TOKEN e envie-o em X-Admin-Token)")
+    target = None
+    if url and mode == "cprofile":
+        target = lambda: analyze_url(url, analysis_level=analysis_level)
+    try:
+        report = await run_profile(mode, seconds=seconds, interval_ms=interval_ms, all_threads=all_threads,
+                                   target=target, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(report)
+
+
+@app.post("/api/admin/rescore", include_in_schema=False)
+async def rescore_endpoint(
+    dry_run: bool = False,
+    batch_size: int = Query(RESCORE_BATCH_SIZE, ge=100, le=200000, description="Análises por consulta"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Recalcula os scores das análises guardadas com a severidade atual das
+    heurísticas, sem repetir as análises (ver `rescore.py`; header X-Admin-Token).
+    Com `dry_run` só conta as análises cujo score mudaria.
+    """
+    if not check_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Acesso negado (defina CLICKSAFE_ADMIN_TOKEN e envie-o em X-Admin-Token)")
+    try:
+        # Consultas em bloco ao SQLite: numa thread, para não bloquear o event loop
+        return await asyncio.to_thread(rescore_analyses, batch_size=batch_size, dry_run=dry_run)
+    except RescoreBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 @app.get("/api/health")
 async def health_check():
     """
@@ -181,20 +376,25 @@ async def health_check():
 
 
 @app.get("/api/analysis/{analysis_id}")
-async def get_analysis(analysis_id: int):
+async def get_analysis(analysis_id: int, payloads: bool = False, trace: bool = False):
     """
     Busca uma análise pelo ID.
+    Com `?payloads=1` inclui as respostas integrais das fontes e os prompts de IA.
+    Com `?trace=1` inclui a linha temporal gravada quando a análise foi feita.
     """
-    analysis = get_full_analysis(analysis_id)
+    analysis = get_full_analysis(analysis_id, include_payloads=payloads)
     if not analysis:
         raise HTTPException(status_code=404, detail="Análise não encontrada")
+    if trace:
+        analysis["trace"] = get_analysis_spans(analysis_id)
     return analysis
 
 
 @app.get("/api/analysis/url/{url:path}")
-async def get_analysis_by_url_endpoint(url: str):
+async def get_analysis_by_url_endpoint(url: str, payloads: bool = False):
     """
     Busca a análise mais recente de uma URL.
+    Com `?payloads=1` inclui as respostas integrais das fontes e os prompts de IA.
     """
     # Adicionar http:// se não tiver protocolo
     if not url.startswith(("http://", "https://")):
@@ -204,8 +404,102 @@ async def get_analysis_by_url_endpoint(url: str):
     if not analysis:
         raise HTTPException(status_code=404, detail="Análise não encontrada para esta URL")
     
-    return get_full_analysis(analysis['id'])
+    return get_full_analysis(analysis['id'], include_payloads=payloads)
+
+
+@app.get("/api/reputation/stats")
+async def reputation_stats():
+    """
+    Estatísticas móveis de cada fonte de reputação (taxa de positivos,
+    latência mediana/p95, taxa de falhas, estado do circuit breaker) e a
+    ordem usada no modo sequencial.
+    """
+    return get_source_stats()
+
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """
+    Métricas da fila do modelo (profundidade, tempos de espera e de geração,
+    pedidos recusados e taxa de fallback), do cache de explicações e das
+    explicações adiadas à espera dos workers.
+    """
+    return {
+        **get_llm_stats(),
+        "deferred_explanations_pending": EXPLANATION_POOL.pending,
+    }
+
+
+@app.get("/api/loop/stats")
+async def loop_stats():
+    """
+    Estado do event loop: maior atraso de agendamento observado e os últimos
+    bloqueios acima do limite, com o stack do código que estava a correr.
+    """
+    return LOOP_MONITOR.snapshot()
+
+
+@app.post("/api/jobs")
+async def create_job_endpoint(request: JobRequest):
+    """
+    Cria um job durável com as URLs e devolve logo o id; as análises são
+    feitas pelos workers (no servidor e/ou `python worker.py`).
+    """
+    try:
+        job = submit_job(request.urls, analysis_level=request.analysis_level, defer_vt=request.defer_vt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    JOB_WORKER.notify()
+    return job
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_endpoint(job_id: int, items: bool = True):
+    """
+    Progresso de um job (itens por estado) e, com `items`, o resultado de
+    cada URL (analysis_id, score ou erro).
+    """
+    job = get_job(job_id, include_items=items)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+@app.get("/api/analysis/{analysis_id}/status")
+async def get_analysis_status_endpoint(analysis_id: int):
+    """
+    Estado leve de uma análise (id, score, enrichment_status), para acompanhar
+    análises com fontes a terminar em background (ex.: VirusTotal com defer_vt).
+    """
+    status = get_analysis_status(analysis_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Análise não encontrada")
+    return status
 
 
+@app.get("/api/analysis/{analysis_id}/explanation")
+async def get_analysis_explanation_endpoint(
+    analysis_id: int,
+    wait: float = Query(0, ge=0, le=60, description="Segundos a esperar enquanto a explicação estiver pendente")
+):
+    """
+    Explicação de uma análise (id, explanation, explanation_status).
+    Com `wait` faz long-polling: responde assim que a explicação estiver pronta
+    ou ao fim de `wait` segundos (ainda com explanation_status "pending").
+    """
+    result = await wait_for_explanation(analysis_id, timeout=wait)
+    if not result:
+        raise HTTPException(status_code=404, detail="Análise não encontrada")
+    return result
 
 
+# Rotas do frontend (SPA): registadas no fim para a rota catch-all não esconder as rotas GET da API
+if FRONTEND_DIST.exists() and (FRONTEND_DIST / "index.html").exists():
+    @app.get("/{full_path:path}")
+    async def serve_frontend_routes(full_path: str):
+        if full_path.startswith("api/") or full_path.startswith("docs") or full_path == "openapi.json":
+            raise HTTPException(status_code=404, detail="Not found")
+        file_path = FRONTEND_DIST / full_path
+        if file_path.exists() and file_path.is_file():
+            return FileResponse(file_path)
+        return FileResponse(FRONTEND_DIST / "index.html")
@@ -5,6 +5,7 @@ import requests
 import asyncio
 from typing import Dict
 from pathlib import Path
+from ..log import get_logger
 
 try:
     from dotenv import load_dotenv
@@ -14,6 +15,8 @@ try:
 except Exception:
     pass
 
+log = get_logger("apivoid")
+
 async def check_apivoid(url: str, timeout: int = 5) -> Dict:
     start_time = time.time()
     api_key = os.getenv("APIVOID_API_KEY")
@@ -37,7 +40,7 @@ async def check_apivoid(url: str, timeout: int = 5) -> Dict:
             requests.get, endpoint, params=params, timeout=timeout
         )
 
-        print("\nDEBUG APIVOID RAW RESPONSE:\n", response.text, "\n")
+        log.debug("Resposta APIVoid (%d): %s", response.status_code, response.text)
 
         #Pode dar erro se a resposta for HTML em vez de JSON
         try:
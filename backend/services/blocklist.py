@@ -0,0 +1,112 @@
+#backend/services/blocklist.py
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+# Ficheiro(s) de blocklist local: um domínio ou URL por linha, linhas com # são comentários.
+# Vários ficheiros podem ser indicados separados por os.pathsep (":" em Linux/macOS).
+BLOCKLIST_PATH = os.getenv(
+    "CLICKSAFE_BLOCKLIST_PATH",
+    str(Path(__file__).parent.parent / "storage" / "blocklist.txt")
+)
+
+_lock = threading.Lock()
+_cache = {"signature": None, "hosts": set(), "urls": set()}
+
+
+def _paths():
+    return [Path(p) for p in BLOCKLIST_PATH.split(os.pathsep) if p]
+
+
+def _signature():
+    # (caminho, mtime) de cada ficheiro existente - permite recarregar quando mudam
+    return tuple((str(p), p.stat().st_mtime) for p in _paths() if p.exists())
+
+
+def load_blocklist() -> Tuple[Set[str], Set[str]]:
+    """
+    Carrega (com cache) as entradas da blocklist local.
+    Retorna (hosts, urls): hostnames bloqueados e URLs exatas bloqueadas.
+    """
+    signature = _signature()
+    with _lock:
+        if _cache["signature"] == signature:
+            return _cache["hosts"], _cache["urls"]
+
+        hosts, urls = set(), set()
+        for path in _paths():
+            if not path.exists():
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = line.split("#", 1)[0].strip().lower()
+                    if not entry:
+                        continue
+                    if "://" in entry:
+                        urls.add(entry.rstrip("/"))
+                    else:
+                        hosts.add(entry.strip("."))
+
+        _cache.update({"signature": signature, "hosts": hosts, "urls": urls})
+        return hosts, urls
+
+
+def is_blocklist_available() -> bool:
+    """True se existir pelo menos um ficheiro de blocklist configurado."""
+    return any(p.exists() for p in _paths())
+
+
+def _match(url: str, hosts: Set[str], urls: Set[str]) -> Optional[str]:
+    if url.lower().rstrip("/") in urls:
+        return url
+    hostname = (urlparse(url).hostname or "").lower()
+    # Verifica o hostname e todos os domínios pai (a.b.example.com -> b.example.com -> example.com)
+    labels = hostname.split(".")
+    for i in range(len(labels) - 1):
+        candidate = ".".join(labels[i:])
+        if candidate in hosts:
+            return candidate
+    return None
+
+
+def _lookup(url: str) -> Dict:
+    # Parte síncrona da verificação: stat dos ficheiros, (re)leitura da lista e procura
+    if not is_blocklist_available():
+        return {"status": "UNKNOWN", "reason": "no_list", "raw": {}}
+    hosts, urls = load_blocklist()
+    match = _match(url, hosts, urls)
+    return {
+        "status": "POSITIVE" if match else "NEGATIVE",
+        "reason": "ok",
+        "raw": {"match": match, "entries": len(hosts) + len(urls)},
+    }
+
+
+async def check_blocklist(url: str, timeout: float = None) -> Dict:
+    """
+    Verifica a URL na blocklist local (sem rede).
+
+    A leitura dos ficheiros corre numa thread (`asyncio.to_thread`), para não
+    bloquear o event loop quando a lista muda e é recarregada; os servidores
+    carregam-na no arranque (`load_blocklist`).
+
+    Retorna o formato padronizado das fontes de reputação:
+    - POSITIVE: URL ou domínio presente na blocklist
+    - NEGATIVE: não encontrado
+    - UNKNOWN: nenhuma blocklist configurada (reason "no_list")
+    """
+    start_time = time.time()
+    try:
+        result = await asyncio.to_thread(_lookup, url)
+    except Exception as e:
+        result = {
+            "status": "UNKNOWN",
+            "reason": f"error:{type(e).__name__}:{str(e)}",
+            "raw": {},
+        }
+    result["elapsed_ms"] = int((time.time() - start_time) * 1000)
+    return result
@@ -0,0 +1,190 @@
+#backend/services/cassettes.py
+"""
+Gravação e replay das respostas dos serviços externos ("cassetes"), para
+correr o pipeline sem rede e sempre com as mesmas respostas.
+
+Camadas (chave de cada gravação):
+- gsb: `SafeBrowsing.lookup_url` (URL)
+- vt: `Virustotal.analyze_url` (URL) e `wait_for_analysis` ("analyses/<id>")
+- whois: texto da resposta WHOIS (domínio)
+- dns: endereços do registo A (domínio)
+- geolocation: resposta do ip-api (IP)
+- http_probe: pedido GET ao site analisado - status e redirecionamentos (URL)
+
+Modo (CLICKSAFE_CASSETTE_MODE):
+- off (padrão): chamadas normais, sem gravar;
+- record: faz a chamada e acrescenta a resposta (ou a exceção) ao ficheiro;
+- replay: responde só do ficheiro; uma chamada sem gravação lança
+  `CassetteMiss` (tratada como erro da fonte/heurística) e nunca vai à rede.
+
+O ficheiro (CLICKSAFE_CASSETTE_PATH) é JSONL, uma gravação por linha; para a
+mesma camada e chave vale a mais recente. Com CLICKSAFE_CASSETTE_LATENCY=recorded
+o replay espera a latência gravada (por padrão responde logo).
+As cassetes também podem ser criadas a partir do banco: ver
+`benchmarks/cassettes.py`.
+"""
+import importlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from .log import get_logger
+
+log = get_logger("cassettes")
+
+CASSETTE_MODES = ("off", "record", "replay")
+CASSETTE_LAYERS = ("gsb", "vt", "whois", "dns", "geolocation", "http_probe")
+
+CASSETTE_MODE = os.getenv("CLICKSAFE_CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CLICKSAFE_CASSETTE_PATH", str(Path(__file__).parent.parent / "storage" / "cassettes.jsonl"))
+CASSETTE_LATENCY = os.getenv("CLICKSAFE_CASSETTE_LATENCY", "none")
+
+
+class CassetteMiss(Exception):
+    """Chamada sem gravação no modo replay."""
+
+    def __init__(self, layer: str, key: str):
+        Exception.__init__(self, f"Sem gravação para {layer}:{key}")
+        self.layer = layer
+        self.key = key
+
+
+def _describe_error(error: BaseException) -> Dict:
+    """Exceção em formato JSON: classe, args e os atributos simples."""
+    return {
+        "type": f"{type(error).__module__}:{type(error).__qualname__}",
+        "args": [a if isinstance(a, (str, int, float, bool)) or a is None else str(a) for a in error.args],
+        "attrs": {k: v for k, v in vars(error).items()
+                  if isinstance(v, (str, int, float, bool)) or v is None},
+    }
+
+
+def _rebuild_error(error: Dict) -> BaseException:
+    """Recria a exceção gravada (as classes com outro __init__ são criadas sem o chamar)."""
+    module_name, _, qualname = error["type"].partition(":")
+    cls: Any = importlib.import_module(module_name)
+    for part in qualname.split("."):
+        cls = getattr(cls, part)
+    if not (isinstance(cls, type) and issubclass(cls, BaseException)):
+        raise TypeError(f"{error['type']} não é uma exceção")
+    try:
+        rebuilt = cls(*error.get("args", []))
+    except TypeError:
+        rebuilt = cls.__new__(cls)
+        rebuilt.args = tuple(error.get("args", []))
+    rebuilt.__dict__.update(error.get("attrs", {}))
+    return rebuilt
+
+
+class CassetteStore(object):
+    """
+    Gravações das respostas dos serviços externos, por (camada, chave).
+
+    Parâmetros:
+        path (str): ficheiro JSONL das gravações
+        mode (str): "off", "record" ou "replay" (ver CASSETTE_MODES)
+        replay_latency (bool): no replay, espera a latência gravada
+    """
+
+    def __init__(self, path: str, mode: str = "off", replay_latency: bool = False):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Modo de cassete inválido: {mode} (use {', '.join(CASSETTE_MODES)})")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._entries: Optional[Dict[Tuple[str, str], Dict]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self) -> Dict[Tuple[str, str], Dict]:
+        with self._lock:
+            if self._entries is None:
+                entries = {}
+                if os.path.exists(self.path):
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        for line in f:
+                            if line.strip():
+                                entry = json.loads(line)
+                                entries[(entry["layer"], entry["key"])] = entry
+                self._entries = entries
+                log.info("Cassetes carregadas de %s: %d gravações", self.path, len(entries))
+            return self._entries
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def entries(self) -> List[Dict]:
+        """Gravações em vigor (a mais recente de cada camada e chave)."""
+        return list(self._load().values())
+
+    def get(self, layer: str, key: str) -> Optional[Dict]:
+        return self._load().get((layer, key))
+
+    def add(self, layer: str, key: str, response: Any = None, error: Optional[Dict] = None,
+            elapsed_ms: Optional[float] = None) -> Dict:
+        """Acrescenta uma gravação ao ficheiro (e à memória, se já carregada)."""
+        entry = {
+            "layer": layer,
+            "key": key,
+            "elapsed_ms": elapsed_ms,
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["response"] = response
+        line = json.dumps(entry, ensure_ascii=False, sort_keys=True) + "\n"
+        with self._lock:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            if self._entries is not None:
+                self._entries[(layer, key)] = entry
+        return entry
+
+    def add_many(self, entries: Iterable[Dict]) -> int:
+        """Acrescenta várias gravações {layer, key, response, elapsed_ms}; devolve quantas."""
+        count = 0
+        for entry in entries:
+            self.add(entry["layer"], entry["key"], response=entry.get("response"),
+                     error=entry.get("error"), elapsed_ms=entry.get("elapsed_ms"))
+            count += 1
+        return count
+
+    def call(self, layer: str, key: str, func: Callable[..., Any], *args) -> Any:
+        """
+        `func(*args)` através das cassetes: no modo off chama-a; no record chama-a
+        e grava o resultado (ou a exceção, que volta a ser lançada); no replay
+        devolve (ou lança) o que foi gravado para (camada, chave).
+        """
+        if self.mode == "off":
+            return func(*args)
+
+        if self.mode == "replay":
+            entry = self.get(layer, key)
+            if entry is None:
+                raise CassetteMiss(layer, key)
+            if self.replay_latency and entry.get("elapsed_ms"):
+                time.sleep(entry["elapsed_ms"] / 1000.0)
+            if "error" in entry:
+                raise _rebuild_error(entry["error"])
+            return entry["response"]
+
+        start = time.perf_counter()
+        try:
+            response = func(*args)
+        except Exception as e:
+            self.add(layer, key, error=_describe_error(e),
+                     elapsed_ms=round((time.perf_counter() - start) * 1000, 3))
+            raise
+        self.add(layer, key, response=response, elapsed_ms=round((time.perf_counter() - start) * 1000, 3))
+        return response
+
+
+CASSETTES = CassetteStore(CASSETTE_PATH, CASSETTE_MODE, replay_latency=CASSETTE_LATENCY == "recorded")
@@ -0,0 +1,174 @@
+#backend/services/circuit_breaker.py
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# Estados do circuito
+CLOSED = "CLOSED"        # normal: todas as chamadas passam
+OPEN = "OPEN"            # fonte a falhar: chamadas são ignoradas (reason "circuit_open")
+HALF_OPEN = "HALF_OPEN"  # em recuperação: deixa passar algumas chamadas de teste
+
+
+def is_failure(result: Dict) -> Optional[bool]:
+    """
+    Classifica o resultado padronizado de uma fonte de reputação.
+
+    - True: falha da fonte (timeout, erro HTTP, exceção)
+    - False: resposta válida (POSITIVE/NEGATIVE ou UNKNOWN sem erro)
+    - None: não conta para o circuito (ex.: chave não configurada, resultado pendente)
+    """
+    reason = result.get("reason", "ok") or "ok"
+    if reason in ("no_key", "circuit_open", "not_checked", "pending"):
+        return None
+    return reason == "timeout" or reason.startswith("error:")
+
+
+def percentile(values, p: float) -> Optional[float]:
+    """Percentil pelo método nearest-rank (p entre 0 e 100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(p / 100.0 * len(ordered))))
+    return float(ordered[rank - 1])
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker com janela deslizante para uma fonte de reputação.
+
+    Guarda as últimas `window_size` chamadas (sucesso/falha e latência).
+    Abre o circuito quando a taxa de erro da janela passa `error_threshold`,
+    espera `cooldown` segundos e depois entra em HALF_OPEN, deixando passar
+    até `half_open_max_calls` chamadas de teste. Se o teste tiver sucesso o
+    circuito fecha, se falhar volta a abrir.
+
+    O timeout da fonte acompanha o p99 das latências observadas
+    (p99 x `timeout_factor`), limitado entre `min_timeout` e `max_timeout`.
+    Enquanto não houver `min_calls` amostras usa `default_timeout`.
+    As chamadas que dão timeout entram na janela como amostras censuradas
+    (a latência real é pelo menos o tempo esperado), para o timeout poder
+    voltar a crescer quando a fonte fica mais lenta; e a chamada de teste
+    em HALF_OPEN usa sempre `default_timeout`, para uma fonte lenta mas
+    saudável não voltar a abrir o circuito por causa de um timeout curto.
+    """
+
+    def __init__(self, name: str,
+                 default_timeout: float,
+                 min_timeout: float = 0.5,
+                 max_timeout: Optional[float] = None,
+                 window_size: int = 50,
+                 min_calls: int = 5,
+                 error_threshold: float = 0.5,
+                 cooldown: float = 30.0,
+                 half_open_max_calls: int = 1,
+                 timeout_factor: float = 1.5):
+        self.name = name
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout if max_timeout is not None else default_timeout
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.half_open_max_calls = half_open_max_calls
+        self.timeout_factor = timeout_factor
+
+        self._calls = deque(maxlen=window_size)      # True = falha
+        self._latencies = deque(maxlen=window_size)  # ms das chamadas com sucesso ou timeout
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self) -> None:
+        # Passado o cooldown, um circuito aberto passa a aceitar chamadas de teste
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_in_flight = 0
+
+    def allow_request(self) -> bool:
+        """Indica se a próxima chamada à fonte deve ser feita."""
+        with self._lock:
+            self._refresh_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            return False
+
+    def record(self, failed: Optional[bool], elapsed_ms: Optional[int] = None,
+               timed_out: bool = False) -> None:
+        """
+        Regista o resultado de uma chamada feita depois de `allow_request()`.
+        `failed=None` (resultado que não conta, ver `is_failure`) só liberta a vaga de teste.
+        `timed_out=True` guarda `elapsed_ms` como amostra censurada de latência.
+        """
+        with self._lock:
+            if failed is None:
+                if self._state == HALF_OPEN and self._half_open_in_flight > 0:
+                    self._half_open_in_flight -= 1
+                return
+            self._calls.append(bool(failed))
+            if elapsed_ms is not None and (not failed or timed_out):
+                self._latencies.append(elapsed_ms)
+
+            if self._state == HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    # Recuperou: recomeça com a janela limpa
+                    self._state = CLOSED
+                    self._calls.clear()
+                return
+
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                if self._error_rate() >= self.error_threshold:
+                    self._open()
+
+    def _error_rate(self) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(self._calls) / len(self._calls)
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        """Percentil (ms) das latências (sucessos e timeouts) na janela."""
+        with self._lock:
+            return percentile(list(self._latencies), p)
+
+    def current_timeout(self) -> float:
+        """Timeout (segundos) a usar na próxima chamada."""
+        with self._lock:
+            self._refresh_state()
+            if self._state == HALF_OPEN or len(self._latencies) < self.min_calls:
+                return self.default_timeout
+            p99_s = percentile(list(self._latencies), 99) / 1000.0
+        return max(self.min_timeout, min(self.max_timeout, p99_s * self.timeout_factor))
+
+    def snapshot(self) -> Dict:
+        """Estado atual do circuito (para logs/endpoints)."""
+        with self._lock:
+            self._refresh_state()
+            latencies = list(self._latencies)
+            snapshot = {
+                "state": self._state,
+                "calls": len(self._calls),
+                "error_rate": round(self._error_rate(), 4),
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+            }
+        snapshot["timeout_s"] = round(self.current_timeout(), 3)
+        return snapshot
@@ -0,0 +1,157 @@
+#backend/services/explanation_cache.py
+import asyncio
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from .log import get_logger
+
+log = get_logger("explanation_cache")
+
+# Liga/desliga o cache de explicações ("0" desliga)
+EXPLANATION_CACHE_ENABLED = os.getenv("CLICKSAFE_EXPLANATION_CACHE", "1") != "0"
+
+# Entradas mantidas em memória (LRU) e na tabela explanation_cache
+EXPLANATION_CACHE_SIZE = int(os.getenv("CLICKSAFE_EXPLANATION_CACHE_SIZE", "1024"))
+EXPLANATION_CACHE_DB_SIZE = int(os.getenv("CLICKSAFE_EXPLANATION_CACHE_DB_SIZE", "10000"))
+
+# Marcadores gravados no template no lugar dos valores específicos de cada análise
+URL_PLACEHOLDER = "{{URL}}"
+HOST_PLACEHOLDER = "{{HOST}}"
+SCORE_PLACEHOLDER = "{{SCORE}}"
+
+
+def to_template(explanation: str, url: str, score_str: Optional[str] = None) -> str:
+    """Substitui a URL, o hostname e o score da explicação pelos marcadores."""
+    template = explanation
+    if url:
+        template = template.replace(url, URL_PLACEHOLDER)
+        hostname = urlparse(url).hostname
+        if hostname:
+            template = template.replace(hostname, HOST_PLACEHOLDER)
+    if score_str:
+        template = template.replace(score_str, SCORE_PLACEHOLDER)
+    return template
+
+
+def from_template(template: str, url: str, score_str: Optional[str] = None) -> str:
+    """Preenche os marcadores do template com a URL, o hostname e o score da análise atual."""
+    explanation = template.replace(URL_PLACEHOLDER, url)
+    explanation = explanation.replace(HOST_PLACEHOLDER, urlparse(url).hostname or url)
+    return explanation.replace(SCORE_PLACEHOLDER, score_str or "N/A")
+
+
+class ExplanationCache(object):
+    """
+    Cache de explicações indexado pela assinatura do veredito.
+
+    Guarda até `max_entries` templates em memória (LRU) e persiste-os na
+    tabela explanation_cache (até `max_db_entries`, removendo os usados há
+    mais tempo), para que sobrevivam a reinícios do servidor.
+    Se a tabela não existir (ex.: `init_db()` não foi chamado) funciona só em memória.
+    """
+
+    def __init__(self, max_entries: int = EXPLANATION_CACHE_SIZE,
+                 max_db_entries: int = EXPLANATION_CACHE_DB_SIZE,
+                 db_path: Optional[str] = None,
+                 persist: bool = True):
+        self.max_entries = max_entries
+        self.max_db_entries = max_db_entries
+        self.db_path = db_path
+        self.persist = persist
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _db_kwargs(self) -> Dict:
+        return {"db_path": self.db_path} if self.db_path else {}
+
+    def _remember(self, signature: str, template: str) -> None:
+        with self._lock:
+            self._entries[signature] = template
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, signature: str) -> Optional[str]:
+        """Template guardado para a assinatura, ou None."""
+        template = self._get_memory(signature)
+        if template is not None:
+            return template
+        return self._get_db(signature)
+
+    async def lookup(self, signature: str) -> Optional[str]:
+        """Como `get`, mas a consulta à tabela (só sem acerto em memória) corre numa thread."""
+        template = self._get_memory(signature)
+        if template is not None:
+            return template
+        if not self.persist:
+            return self._get_db(signature)
+        return await asyncio.to_thread(self._get_db, signature)
+
+    async def store(self, signature: str, template: str, model: str) -> None:
+        """Como `put`, com a escrita na tabela numa thread."""
+        if not self.persist:
+            self.put(signature, template, model)
+            return
+        await asyncio.to_thread(self.put, signature, template, model)
+
+    def _get_memory(self, signature: str) -> Optional[str]:
+        with self._lock:
+            template = self._entries.get(signature)
+            if template is not None:
+                self._entries.move_to_end(signature)
+                self.hits += 1
+            return template
+
+    def _get_db(self, signature: str) -> Optional[str]:
+        row = None
+        if self.persist:
+            try:
+                from storage.db import get_cached_explanation
+                row = get_cached_explanation(signature, **self._db_kwargs())
+            except sqlite3.Error as e:
+                log.warning("Cache de explicações indisponível: %s", e)
+
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        self._remember(signature, row["template"])
+        with self._lock:
+            self.hits += 1
+        return row["template"]
+
+    def put(self, signature: str, template: str, model: str) -> None:
+        self._remember(signature, template)
+        if not self.persist:
+            return
+        try:
+            from storage.db import save_cached_explanation
+            save_cached_explanation(signature, model, template, max_entries=self.max_db_entries, **self._db_kwargs())
+        except sqlite3.Error as e:
+            log.warning("Cache de explicações indisponível: %s", e)
+
+    def clear(self) -> None:
+        """Limpa o cache em memória (a tabela não é alterada)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": EXPLANATION_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+EXPLANATION_CACHE = ExplanationCache()
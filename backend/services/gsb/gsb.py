@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import time
@@ -5,6 +6,7 @@ import requests
 from pathlib import Path
 from typing import Dict, Optional
 from .about import __version__
+from ..cassettes import CASSETTES
 
 # Carrega .env.local se existir
 try:
@@ -15,6 +17,9 @@ try:
 except ImportError:
     pass  
 
+# Endpoint da API (alterável para testes e benchmarks com um servidor local)
+GSB_API_URL = os.getenv("GSB_API_URL", "https://safebrowsing.googleapis.com/v4/threatMatches:find")
+
 
 class SafeBrowsingException(Exception):
     """Exceção base genérica para erros do Safe Browsing."""
@@ -59,12 +64,15 @@ class SafeBrowsing(object):
     Parâmetros:
         key (str): chave da API (GSB API key)
         api_url (str): URL base da API (padrão da versão 4)
+        timeout (float): timeout de cada requisição HTTP em segundos
     """
 
     def __init__(self, key,
-                 api_url='https://safebrowsing.googleapis.com/v4/threatMatches:find'):
+                 api_url=GSB_API_URL,
+                 timeout=None):
         self.api_key = key
         self.api_url = api_url
+        self.timeout = timeout
 
 
     def lookup_urls(self, urls, platforms=["ANY_PLATFORM"]):
@@ -111,7 +119,8 @@ class SafeBrowsing(object):
                 self.api_url,
                 data=json.dumps(safe_browsing_request),           # converte o corpo para JSON
                 params={'key': self.api_key},    # inclui a chave da API nos parâmetros
-                headers=headers
+                headers=headers,
+                timeout=self.timeout
             )
 
             # Tratamento de resposta
@@ -152,7 +161,6 @@ class SafeBrowsing(object):
 
                 # Tratamento de erros HTTP
                 if r.status_code == 400:
-                    print(r.json())
                     # Erro 400: requisição inválida (ex: chave incorreta)
                     if r.json()['error']['message'] == 'API key not valid. Please pass a valid API key.':
                         raise SafeBrowsingInvalidApiKey()
@@ -188,7 +196,7 @@ class SafeBrowsing(object):
         return r[url]
 
 
-async def check_gsb(url: str, timeout: int = 3) -> Dict:
+async def check_gsb(url: str, timeout: float = 3) -> Dict:
     """
     Função assíncrona para verificar URL no Google Safe Browsing.
     
@@ -211,7 +219,7 @@ async def check_gsb(url: str, timeout: int = 3) -> Dict:
     
     # Verifica se a API key está configurada
     api_key = os.getenv("GSB_API_KEY", "")
-    if not api_key:
+    if not api_key and not CASSETTES.replaying:
         elapsed_ms = int((time.time() - start_time) * 1000)
         return {
             "status": "UNKNOWN",
@@ -222,11 +230,11 @@ async def check_gsb(url: str, timeout: int = 3) -> Dict:
     
     try:
         # Cria instância do SafeBrowsing
-        sb = SafeBrowsing(api_key)
+        sb = SafeBrowsing(api_key, timeout=timeout)
         
-        # Executa a verificação (síncrona, mas em contexto assíncrono)
-        # Em produção, pode ser melhor usar httpx para requisições assíncronas
-        result = sb.lookup_url(url)
+        # Executa a verificação síncrona numa thread para não bloquear o event loop
+        # (através das cassetes: ver services/cassettes.py)
+        result = await asyncio.to_thread(CASSETTES.call, "gsb", url, sb.lookup_url, url)
         
         elapsed_ms = int((time.time() - start_time) * 1000)
         
@@ -243,6 +251,14 @@ async def check_gsb(url: str, timeout: int = 3) -> Dict:
             "elapsed_ms": elapsed_ms
         }
         
+    except requests.exceptions.Timeout:
+        elapsed_ms = int((time.time() - start_time) * 1000)
+        return {
+            "status": "UNKNOWN",
+            "reason": "timeout",
+            "raw": {},
+            "elapsed_ms": elapsed_ms
+        }
     except SafeBrowsingInvalidApiKey:
         elapsed_ms = int((time.time() - start_time) * 1000)
         return {
@@ -10,6 +10,14 @@ import requests  #para fazer requisições HTTP
 import ipaddress  #para verificar endereços IP
 from difflib import SequenceMatcher  #para comparar similaridade de strings - typosquatting
 import base64  #para verificar codificação base64
+import os
+from .log import get_logger  #logging estruturado (mensagens só formatadas se o nível estiver ativo)
+from .cassettes import CASSETTES  #gravação/replay das respostas externas (ver services/cassettes.py)
+
+log = get_logger("heuristics")
+
+# Serviço de geolocalização de IPs (alterável para testes e benchmarks com um servidor local)
+IP_API_URL = os.getenv("CLICKSAFE_IP_API_URL", "http://ip-api.com/json")
 
 
 #receber o url e extraior dominio, caminho, parametros
@@ -26,6 +34,37 @@ def extract_url_components(url):
 #resposta --> ('www.google.com', '/search', 'client=opera-gx&q=vscode+collaborative+coding&sourceid=opera&ie=UTF-8&oe=UTF-8')
 
 
+#-----------------------------------------------Chamadas de rede---------------------------------------------------------
+#passam pelas cassetes (camadas whois, dns, http_probe e geolocation) para poderem ser gravadas e reproduzidas
+
+
+#consulta whois do dominio
+def consultar_whois(dominio):
+    if CASSETTES.mode == "off":
+        return whois.whois(dominio)
+    #grava/reproduz o texto da resposta e interpreta-o como o whois.whois
+    texto = CASSETTES.call("whois", dominio, lambda: whois.whois(dominio, inc_raw=True)["raw"])
+    return whois.parser.WhoisEntry.load(whois.extract_domain(dominio), texto)
+
+
+#enderecos IPv4 (registo A) do dominio - lanca NXDOMAIN/NoAnswer como o dnspython
+def resolver_ipv4(dominio):
+    return CASSETTES.call("dns", dominio, lambda: [r.address for r in dns.resolver.resolve(dominio, "A")])
+
+
+#pedido GET ao site: status e numero de redirecionamentos - lanca as excecoes do requests (ex.: SSLError)
+def sondar_url(url):
+    def pedido():
+        resposta = requests.get(url, timeout=5)
+        return {"status_code": resposta.status_code, "redirects": len(resposta.history)}
+    return CASSETTES.call("http_probe", url, pedido)
+
+
+#resposta do ip-api para o IP
+def consultar_ip_api(ip):
+    return CASSETTES.call("geolocation", ip, lambda: requests.get(f"{IP_API_URL}/{ip}", timeout=5).json())
+
+
 #-----------------------------------------------Analise do dominio---------------------------------------------------------
 
 
@@ -35,7 +74,7 @@ def extract_url_components(url):
 def check_domain_age_recent(dominio):
     try:
         #consulta as informações do domínio usando a biblioteca whois
-        info_dominio = whois.whois(dominio)
+        info_dominio = consultar_whois(dominio)
 
         #datas de criação
         data_criacao = info_dominio.creation_date
@@ -51,7 +90,7 @@ def check_domain_age_recent(dominio):
     
     #em caso de erro na consulta whois, retorna None
     except Exception as e:
-        print(f"Erro ao verificar idade do domínio: {e}")
+        log.warning("Erro ao verificar idade do domínio: %s", e)
         return None
 
 
@@ -61,7 +100,7 @@ def check_domain_age_recent(dominio):
 def check_domain_age_expiring(dominio):
     try:
         #consulta as informações do domínio usando a biblioteca whois
-        info_dominio = whois.whois(dominio)
+        info_dominio = consultar_whois(dominio)
 
         #data expiração
         data_expiracao = info_dominio.expiration_date
@@ -79,7 +118,7 @@ def check_domain_age_expiring(dominio):
         return False  #dominio normal
     #em caso de erro na consulta whois, retorna None
     except Exception as e:
-        print(f"Erro ao verificar idade do domínio: {e}")
+        log.warning("Erro ao verificar idade do domínio: %s", e)
         return None
     
 #pequeno teste
@@ -201,8 +240,7 @@ def check_similar_known_domains(dominio):
     for conhecido in DOMINIOS_CONHECIDOS:
         #se a similaridade for maior ou igual a 0.7 (70%) mas menor que 1 (iguais) consideramos suspeito
         if similar(dominio_base, conhecido) >= 0.7 and similar(dominio_base, conhecido) < 1.0:
-            #print para teste - pode ser removido depois  
-            print (f"Dominio suspeito: {dominio_base} é similar a {conhecido} com similaridade {similar(dominio_base, conhecido)}")
+            log.debug("Dominio suspeito: %s é similar a %s", dominio_base, conhecido)
             return True  #dominio suspeito
         
     return False  #dominio normal
@@ -257,15 +295,15 @@ def usa_https(url):
 #verifica se o certificado SSL é valido
 def certificado_ssl_ok(url):
     try:
-        resposta = requests.get(url, timeout=5)
+        sondar_url(url)
         # se chegou aqui sem erro de SSL, consideramos OK
         return True
     except requests.exceptions.SSLError as e:
-        print("Erro de SSL:", e)
+        log.debug("Erro de SSL: %s", e)
         return False
     except requests.exceptions.RequestException as e:
         # outros erros (timeout, DNS, etc.) não dizem necessariamente que o certificado é mau
-        print("Erro ao aceder ao site:", e)
+        log.debug("Erro ao aceder ao site: %s", e)
         return None  # None = não foi possível concluir
 
 #pequeno teste
@@ -278,14 +316,14 @@ def certificado_ssl_ok(url):
 def check_dns_records(dominio):
     try:
         #tenta resolver o dominio
-        dns.resolver.resolve(dominio, 'A')  #registo A (IPv4)
+        resolver_ipv4(dominio)  #registo A (IPv4)
         return True  #registos DNS encontrados
     except dns.resolver.NoAnswer:
         return False  #nenhum registo encontrado
     except dns.resolver.NXDOMAIN:
         return False  #dominio nao existe
     except Exception as e:
-        print(f"Erro ao verificar registos DNS: {e}")
+        log.warning("Erro ao verificar registos DNS: %s", e)
         return None  #erro desconhecido
 
 #pequeno teste
@@ -301,21 +339,18 @@ def check_dns_records(dominio):
 #obter o endereco IP do dominio
 def obter_ip(dominio):
     try:
-        resposta = dns.resolver.resolve(dominio, "A")
-        for rdata in resposta:
-            return rdata.address  # ex: "142.250.184.78"
+        for endereco in resolver_ipv4(dominio):
+            return endereco  # ex: "142.250.184.78"
     #retorna None em caso de erro - ou nao encontrado
     except Exception as e:
-        print("Erro ao resolver IP do domínio:", e)
+        log.debug("Erro ao resolver IP do domínio: %s", e)
         return None
 
 #usa ip lookup para geolocalizar o endereco IP
 def geolocalizar_ip(ip):
     try:
         #usa o servico ip-api.com para obter informacoes de localizacao
-        url = f"http://ip-api.com/json/{ip}"
-        resp = requests.get(url, timeout=5)
-        dados = resp.json()
+        dados = consultar_ip_api(ip)
 
         #se nao for sucesso, retorna None
         if dados.get("status") != "success":
@@ -330,7 +365,7 @@ def geolocalizar_ip(ip):
         }
     #retorna None em caso de erro
     except Exception as e:
-        print("Erro ao localizar IP:", e)
+        log.warning("Erro ao localizar IP: %s", e)
         return None
 
 PAIS_ESPERADO_POR_TLD = {
@@ -415,18 +450,18 @@ def check_suspicious_server_location(dominio):
     #obter o endereco IP do dominio
     ip = obter_ip(dominio)
     if not ip:
-        print("Nao foi possivel obter o IP do dominio.")
+        log.debug("Nao foi possivel obter o IP do dominio %s", dominio)
         return None  #nao foi possivel obter o IP
 
     #geolocalizar o IP
     info_localizacao = geolocalizar_ip(ip)
     if not info_localizacao:
-        print("Nao foi possivel localizar o IP")
+        log.debug("Nao foi possivel localizar o IP %s", ip)
         return None  #nao foi possivel localizar o IP
 
     pais_servidor = info_localizacao.get("pais")
     if not pais_servidor:
-        print("Pais do servidor nao encontrado.")
+        log.debug("Pais do servidor nao encontrado (%s)", ip)
         return None  #pais nao encontrado
 
     #extrai o TLD do dominio
@@ -437,16 +472,16 @@ def check_suspicious_server_location(dominio):
     
     #veridica se o pais do servidor é suspeito
     if pais_servidor in PAISES_SUSPEITOS:
-        print (f"Pais do servidor suspeito: {pais_servidor}")
+        log.debug("Pais do servidor suspeito: %s", pais_servidor)
         #pais do servidor é suspeito
         return True
     
     #verifica se o pais do servidor é diferente do esperado
     if pais_esperado:
-        print (f"Pais do servidor: {pais_servidor}, Pais esperado para TLD .{tld}: {pais_esperado}")
+        log.debug("Pais do servidor: %s, Pais esperado para TLD .%s: %s", pais_servidor, tld, pais_esperado)
         #compara o pais do servidor com o pais esperado
         return pais_servidor != pais_esperado  #retorna True se for diferente (suspeito)
-    print("Pais esperado para o TLD nao encontrado.")
+    log.debug("Pais esperado para o TLD .%s nao encontrado", tld)
     return False  #sem informacao suficiente para determinar suspeita
 
 #pequeno teste
@@ -821,12 +856,11 @@ def check_url_shortener(dominio):
 
 def check_multiple_redirects(url):
     try:
-        resposta = requests.get(url, timeout=5)
         #verifica o numero de redirecionamentos
-        num_redirects = len(resposta.history)
+        num_redirects = sondar_url(url)["redirects"]
         return num_redirects > 3  #retorna True se houver mais de 3 redirecionamentos
     except Exception as e:
-        print(f"Erro ao verificar redirecionamentos: {e}")
+        log.debug("Erro ao verificar redirecionamentos: %s", e)
         return False  # tratamos de erros como "não foi detetada cadeia longa"
     
 #pequeno teste
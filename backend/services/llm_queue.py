@@ -0,0 +1,170 @@
+#backend/services/llm_queue.py
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from .circuit_breaker import percentile
+from .metrics import METRICS_ENABLED, REGISTRY
+from .tracing import span
+
+# Gerações em simultâneo no Ollama (workers; único limite de concorrência do modelo),
+# pedidos à espera e tempo máximo de espera por uma vaga
+LLM_WORKERS = int(os.getenv("CLICKSAFE_LLM_WORKERS", "2"))
+LLM_MAX_QUEUE = int(os.getenv("CLICKSAFE_LLM_MAX_QUEUE", "8"))
+LLM_MAX_WAIT_S = float(os.getenv("CLICKSAFE_LLM_MAX_WAIT_S", "10"))
+
+# Amostras guardadas para as métricas de espera/serviço
+_WINDOW_SIZE = 200
+
+
+class LLMUnavailable(RuntimeError):
+    """
+    Pedido ao modelo recusado pela fila (o chamador deve usar a explicação manual).
+    reason: "queue_full", "wait_budget" (espera estimada acima do limite) ou "wait_timeout"
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class LLMQueue(object):
+    """
+    Fila limitada de pedidos ao modelo (Ollama) com backpressure.
+
+    No máximo `workers` gerações correm em simultâneo e no máximo `max_queue`
+    pedidos esperam por uma vaga. Um pedido é recusado logo (LLMUnavailable)
+    se a fila estiver cheia ou se a espera estimada (pedidos à frente x tempo
+    médio de geração / workers) passar `max_wait_s`; se mesmo assim esperar
+    mais do que `max_wait_s`, desiste. Assim, num pico de pedidos, os que
+    não cabem recebem a explicação manual em vez de ficarem pendurados.
+    """
+
+    def __init__(self, workers: int = LLM_WORKERS,
+                 max_queue: int = LLM_MAX_QUEUE,
+                 max_wait_s: float = LLM_MAX_WAIT_S):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_s = max_wait_s
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self._waiting = 0
+        self._in_flight = 0
+        self._waits = deque(maxlen=_WINDOW_SIZE)     # segundos à espera de vaga
+        self._services = deque(maxlen=_WINDOW_SIZE)  # segundos de geração
+        self._counters = {"admitted": 0, "completed": 0, "failed": 0}
+        self._rejected: Dict[str, int] = {}
+        self._fallbacks: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _ensure_semaphore(self) -> asyncio.Semaphore:
+        # O semáforo pertence ao event loop onde foi criado
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.workers)
+            self._loop = loop
+            self._waiting = 0
+            self._in_flight = 0
+        return self._semaphore
+
+    def estimated_wait_s(self) -> float:
+        """Espera estimada por uma vaga para um novo pedido (0 se houver vaga ou sem histórico)."""
+        with self._lock:
+            ahead = self._waiting + self._in_flight - self.workers + 1
+            services = list(self._services)
+        if ahead <= 0 or not services:
+            return 0.0
+        return ahead * (sum(services) / len(services)) / self.workers
+
+    def _reject(self, reason: str, message: str) -> None:
+        with self._lock:
+            self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        raise LLMUnavailable(reason, message)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Reserva uma vaga para uma geração (`async with LLM_QUEUE.slot(): ...`).
+        Lança LLMUnavailable se a fila estiver cheia ou a espera passar o limite.
+        """
+        semaphore = self._ensure_semaphore()
+        if self._waiting + self._in_flight >= self.workers + self.max_queue:
+            self._reject("queue_full", f"fila do modelo cheia ({self._waiting} pedidos à espera)")
+        estimate = self.estimated_wait_s()
+        if estimate > self.max_wait_s:
+            self._reject("wait_budget", f"espera estimada de {estimate:.1f}s acima de {self.max_wait_s:.1f}s")
+
+        start = time.monotonic()
+        self._waiting += 1
+        try:
+            with span("llm.queue_wait"):
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            self._reject("wait_timeout", f"sem vaga no modelo após {self.max_wait_s:.1f}s")
+        finally:
+            self._waiting -= 1
+
+        waited = time.monotonic() - start
+        if METRICS_ENABLED:
+            LLM_QUEUE_WAIT_SECONDS.observe(waited)
+        with self._lock:
+            self._waits.append(waited)
+            self._counters["admitted"] += 1
+        self._in_flight += 1
+        service_start = time.monotonic()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self._in_flight -= 1
+            semaphore.release()
+            with self._lock:
+                self._services.append(time.monotonic() - service_start)
+                self._counters["failed" if failed else "completed"] += 1
+
+    def record_fallback(self, reason: str) -> None:
+        """Regista que foi usada a explicação manual (ex.: "queue_full", "error")."""
+        with self._lock:
+            self._fallbacks[reason] = self._fallbacks.get(reason, 0) + 1
+        if METRICS_ENABLED:
+            LLM_FALLBACKS.labels(reason).inc()
+
+    def snapshot(self) -> Dict:
+        """Métricas da fila: profundidade, tempos de espera/geração e taxa de fallback."""
+        with self._lock:
+            waits = [round(w * 1000, 1) for w in self._waits]
+            services = [round(s * 1000, 1) for s in self._services]
+            fallbacks = sum(self._fallbacks.values())
+            requests = self._counters["completed"] + fallbacks
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "max_wait_s": self.max_wait_s,
+                "queue_depth": self._waiting,
+                "in_flight": self._in_flight,
+                **self._counters,
+                "rejected": dict(self._rejected),
+                "fallbacks": dict(self._fallbacks),
+                "fallback_rate": round(fallbacks / requests, 4) if requests else 0.0,
+                "wait_p50_ms": percentile(waits, 50),
+                "wait_p95_ms": percentile(waits, 95),
+                "service_p50_ms": percentile(services, 50),
+                "service_p95_ms": percentile(services, 95),
+            }
+
+
+LLM_QUEUE = LLMQueue()
+
+LLM_FALLBACKS = REGISTRY.counter("clicksafe_llm_fallbacks_total",
+                                 "Explicações manuais usadas em vez do modelo, por razão", ("reason",))
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram("clicksafe_llm_queue_wait_seconds",
+                                            "Espera por uma vaga no modelo (pedidos admitidos)")
+
+REGISTRY.gauge("clicksafe_llm_queue_depth", "Pedidos à espera de vaga no modelo",
+               function=lambda: LLM_QUEUE._waiting)
+REGISTRY.gauge("clicksafe_llm_in_flight", "Gerações a decorrer no modelo",
+               function=lambda: LLM_QUEUE._in_flight)
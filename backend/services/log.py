@@ -0,0 +1,131 @@
+#backend/services/log.py
+"""
+Logging estruturado do ClickSafe.
+
+- Uma linha JSON por mensagem (ou texto, com CLICKSAFE_LOG_FORMAT=text),
+  com o contexto da análise em curso (url, analysis_id, nível) preenchido
+  por `start_log_context`/`bind_log_context`;
+- O nível é verificado antes de qualquer formatação: use
+  `log.debug("... %s", valor)` (nunca f-strings) e, para blocos com vários
+  cálculos, `if log.isEnabledFor(logging.DEBUG):`;
+- O handler só põe o registo numa fila; a formatação e a escrita (stderr)
+  são feitas por uma thread, fora do event loop.
+
+Em produção, CLICKSAFE_LOG_LEVEL=WARNING deixa o custo do logging quase nulo.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, TextIO
+
+# Nível mínimo (DEBUG, INFO, WARNING, ERROR) e formato ("json" ou "text")
+LOG_LEVEL = os.getenv("CLICKSAFE_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("CLICKSAFE_LOG_FORMAT", "json")
+
+# Logger raiz do ClickSafe (os módulos usam filhos: clicksafe.app, clicksafe.reputation, ...)
+ROOT_LOGGER = "clicksafe"
+
+# Contexto da análise em curso (contextvar: cada task asyncio tem o seu)
+_log_context: contextvars.ContextVar = contextvars.ContextVar("clicksafe_log_context", default={})
+
+# Atributos de um LogRecord que não são campos extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "context", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+def start_log_context(**fields) -> None:
+    """Começa o contexto de logging de uma análise (substitui o anterior nesta task)."""
+    _log_context.set({k: v for k, v in fields.items() if v is not None})
+
+
+def bind_log_context(**fields) -> None:
+    """Acrescenta campos ao contexto atual (ex.: analysis_id depois de gravar a análise)."""
+    _log_context.set({**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Põe o registo na fila com o contexto da task que o emitiu. Não formata
+    a mensagem (o QueueHandler padrão fá-lo na thread que chama): isso fica
+    para a thread do listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.context = _log_context.get()
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON: ts, level, logger, msg, o contexto da análise e os campos de `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legível para desenvolvimento: hora, nível, contexto e mensagem."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s%(ctx)s %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = getattr(record, "context", None) or {}
+        record.ctx = "".join(f" [{k}={v}]" for k, v in context.items() if k != "url")
+        return super().format(record)
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream: Optional[TextIO] = None) -> None:
+    """
+    Configura o logger "clicksafe" (pode ser chamada de novo para mudar o
+    nível, o formato ou o destino, ex.: `setup_logging("WARNING")` num CLI).
+    """
+    global _listener
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel((level or LOG_LEVEL).upper())
+    logger.propagate = False
+
+    if _listener is not None and fmt is None and stream is None:
+        return
+    if _listener is not None:
+        _listener.stop()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == "text" else JsonFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(_ContextQueueHandler(log_queue))
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger de um módulo ("clicksafe.<name>"); configura o logging na primeira utilização."""
+    if _listener is None:
+        setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -0,0 +1,177 @@
+#backend/services/loop_monitor.py
+"""
+Monitor do event loop: mede o atraso de agendamento (lag) e deteta bloqueios.
+
+Uma task acorda a cada `interval` segundos e mede quanto tarde acordou; o
+atraso vai para o histograma `clicksafe_event_loop_lag_seconds`. Uma thread
+de vigia confirma que a task continua a acordar: se o loop ficar parado mais
+de `threshold_ms`, captura o stack da thread do loop (o código síncrono que
+o está a bloquear), escreve-o no log e conta o bloqueio em
+`clicksafe_event_loop_blocks_total`, com a linha do código do ClickSafe
+onde estava parado.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+from .log import get_logger
+from .metrics import METRICS_ENABLED, REGISTRY
+
+# Liga/desliga o monitor ("0" desliga)
+LOOP_MONITOR_ENABLED = os.getenv("CLICKSAFE_LOOP_MONITOR", "1") != "0"
+
+# Intervalo (s) entre amostras e duração (ms) a partir da qual o loop conta como bloqueado
+LOOP_MONITOR_INTERVAL = float(os.getenv("CLICKSAFE_LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("CLICKSAFE_LOOP_BLOCK_THRESHOLD_MS", "100"))
+
+# Frames do próprio código (backend/) - o local do bloqueio é o mais interno deles
+_BACKEND_DIR = str(Path(__file__).resolve().parent.parent)
+
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "clicksafe_event_loop_lag_seconds", "Atraso de agendamento do event loop")
+LOOP_BLOCKS = REGISTRY.counter(
+    "clicksafe_event_loop_blocks_total", "Bloqueios do event loop acima do limite, por local no código",
+    ("location",))
+
+log = get_logger("loop_monitor")
+
+
+def _format_loop_stack(frame) -> str:
+    """Stack da thread do loop, a partir do callback que o loop está a correr (sem os frames do asyncio)."""
+    stack = traceback.extract_stack(frame)
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i].name == "_run" and stack[i].filename.endswith(os.path.join("asyncio", "events.py")):
+            stack = stack[i + 1:]
+            break
+    return "".join(traceback.format_list(stack))
+
+
+def _blocking_location(frame) -> str:
+    """Local ("ficheiro:linha função") do frame mais interno do backend, ou o mais interno de todos."""
+    innermost = None
+    location = None
+    while frame is not None:
+        code = frame.f_code
+        here = f"{Path(code.co_filename).name}:{frame.f_lineno} {code.co_name}"
+        innermost = innermost or here
+        if location is None and code.co_filename.startswith(_BACKEND_DIR) and "loop_monitor" not in code.co_filename:
+            location = here
+        frame = frame.f_back
+    return location or innermost or "desconhecido"
+
+
+class LoopMonitor(object):
+    """
+    Monitor de lag e bloqueios de um event loop (`start()` dentro do loop,
+    `await stop()` para parar). Os últimos bloqueios ficam em `snapshot()`.
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL,
+                 threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS, history: int = 20):
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self.blocks = deque(maxlen=history)
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = time.monotonic()
+        self._tick_count = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Começa a monitorizar o event loop atual."""
+        if not LOOP_MONITOR_ENABLED or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._thread.join(timeout=1)
+        self._thread = None
+
+    async def _sample(self) -> None:
+        """Mede quanto tarde a task acorda em relação ao pedido."""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_tick = now
+            if lag * 1000 > self.threshold_ms:
+                self._close_block(lag * 1000)
+            self._tick_count += 1
+            if METRICS_ENABLED:
+                LOOP_LAG_SECONDS.observe(lag)
+            if lag * 1000 > self.max_lag_ms:
+                self.max_lag_ms = lag * 1000
+
+    def _close_block(self, lag_ms: float) -> None:
+        """Grava a duração total do bloqueio que a thread de vigia detetou (se detetou)."""
+        with self._lock:
+            block = self.blocks[-1] if self.blocks else None
+            if block is None or block["_tick"] != self._tick_count:
+                return
+            block["blocked_ms"] = round(lag_ms, 1)
+        log.info("Event loop desbloqueado após %.0f ms (%s)", lag_ms, block["location"])
+
+    def _watch(self) -> None:
+        """Thread de vigia: captura o stack do loop quando a task de amostragem deixa de acordar."""
+        reported_tick = -1
+        check_every = max(0.01, min(self.interval, self.threshold_ms / 1000.0) / 2)
+        while not self._stop.wait(check_every):
+            tick = self._tick_count
+            stalled_ms = (time.monotonic() - self._last_tick - self.interval) * 1000
+            if stalled_ms <= self.threshold_ms or tick == reported_tick:
+                continue
+            # Um registo por bloqueio (até a task voltar a acordar)
+            reported_tick = tick
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            location = _blocking_location(frame)
+            stack = _format_loop_stack(frame)
+            if METRICS_ENABLED:
+                LOOP_BLOCKS.labels(location).inc()
+            with self._lock:
+                self.blocks.append({
+                    "detected_at": time.time(),
+                    "blocked_ms": round(stalled_ms, 1),  # atualizado com a duração total quando o loop recuperar
+                    "location": location,
+                    "stack": stack,
+                    "_tick": tick,
+                })
+            log.warning("Event loop bloqueado há %.0f ms em %s", stalled_ms, location, extra={"stack": stack})
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            blocks: List[Dict] = [{k: v for k, v in b.items() if not k.startswith("_")} for b in self.blocks]
+        return {
+            "enabled": LOOP_MONITOR_ENABLED and self._task is not None,
+            "interval_s": self.interval,
+            "threshold_ms": self.threshold_ms,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "recent_blocks": blocks,
+        }
+
+
+LOOP_MONITOR = LoopMonitor()
@@ -0,0 +1,313 @@
+#backend/services/metrics.py
+"""
+Métricas operacionais do ClickSafe no formato de texto do Prometheus
+(exposto em GET /metrics pelos servidores).
+
+Contadores, gauges e histogramas simples, sem dependências: registar uma
+observação é uma pesquisa binária nos limites dos buckets e três somas
+sob um lock (algumas centenas de nanossegundos), por isso podem ser usados
+no caminho quente. Os filhos de cada métrica (um por combinação de labels)
+ficam em cache - guarde-os (`.labels(...)`) quando os labels são fixos.
+"""
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .log import get_logger
+
+log = get_logger("metrics")
+
+# Liga/desliga o registo de métricas ("0" desliga; /metrics continua a responder)
+METRICS_ENABLED = os.getenv("CLICKSAFE_METRICS", "1") != "0"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets (s) para latências: de 1 ms a 60 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Buckets (s) para operações locais rápidas (banco, cache): de 50 µs a 1 s
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(object):
+    """Base: nome, ajuda, labels e os filhos por combinação de valores."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        # Filhos pelos valores tal como foram passados (evita converter para str a cada chamada)
+        self._lookup: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Filho para esta combinação de labels (criado na primeira utilização)."""
+        child = self._lookup.get(values)
+        if child is None:
+            key = tuple(str(v) for v in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: esperados labels {self.labelnames}, recebidos {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+                self._lookup[values] = child
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _CounterChild(object):
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in list(self._children.items())]
+
+
+class _GaugeChild(object):
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        # Com `function`, o valor é lido no momento da exportação (ex.: tamanho de uma fila)
+        self.function = function
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._children[()].dec(amount)
+
+    def set(self, value: float) -> None:
+        self._children[()].set(value)
+
+    def _samples(self) -> List[str]:
+        if self.function is not None:
+            try:
+                return [f"{self.name} {_format_value(self.function())}"]
+            except Exception as e:
+                log.warning("Erro ao ler a métrica %s: %s", self.name, e)
+                return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in list(self._children.items())]
+
+
+class _HistogramChild(object):
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # o último é +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.bounds + (math.inf,), counts):
+                cumulative += n
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry(object):
+    """Conjunto de métricas exportadas em /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Reimportar um módulo não duplica a métrica
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Todas as métricas no formato de texto do Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Métricas do pipeline (as restantes são registadas pelos módulos que as alimentam)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "clicksafe_http_request_duration_seconds", "Duração dos pedidos HTTP", ("method", "route", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "clicksafe_stage_duration_seconds", "Duração de cada etapa da análise (spans de services.tracing)", ("stage",))
+SOURCE_SECONDS = REGISTRY.histogram(
+    "clicksafe_source_duration_seconds", "Duração das consultas às fontes de reputação", ("source", "outcome"))
+DB_SECONDS = REGISTRY.histogram(
+    "clicksafe_db_operation_duration_seconds", "Duração das leituras e escritas no banco durante a análise",
+    ("operation",), buckets=FAST_BUCKETS)
+CACHE_REQUESTS = REGISTRY.counter(
+    "clicksafe_cache_requests_total", "Consultas aos caches (analysis = análises no banco, explanation = explicações)",
+    ("cache", "result"))
+ANALYSES_IN_FLIGHT = REGISTRY.gauge(
+    "clicksafe_analyses_in_flight", "Análises a decorrer neste processo")
+
+
+# Histogramas de cada etapa, por nome (resolvidos uma vez)
+_stage_children: Dict[str, tuple] = {}
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Regista a duração de uma etapa; as etapas "db.*" vão também para DB_SECONDS."""
+    if not METRICS_ENABLED:
+        return
+    children = _stage_children.get(name)
+    if children is None:
+        children = (STAGE_SECONDS.labels(name),)
+        if name.startswith("db."):
+            children += (DB_SECONDS.labels(name[3:]),)
+        _stage_children[name] = children
+    for child in children:
+        child.observe(seconds)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    if METRICS_ENABLED:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+async def http_metrics_middleware(request, call_next):
+    """
+    Middleware HTTP dos servidores (`app.middleware("http")(http_metrics_middleware)`):
+    regista a duração de cada pedido por método, rota (o padrão, não o caminho) e status.
+    Nas respostas em streaming conta até ao início da resposta.
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        if METRICS_ENABLED:
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(request.method, route, status).observe(time.perf_counter() - start)
@@ -0,0 +1,174 @@
+#backend/services/profiler.py
+"""
+Profiling a pedido no processo em produção (endpoint /api/admin/profile).
+
+Três modos, todos durante `seconds` segundos sem parar o servidor:
+- "sample": profiler por amostragem - uma thread lê o stack das threads a
+  cada `interval_ms` e devolve stacks colapsados ("a;b;c N", o formato dos
+  flame graphs). Custo baixo e independente do número de chamadas.
+- "cprofile": cProfile na thread do event loop (todas as coroutines que
+  correm nesse intervalo) ou numa única análise (`url`); devolve o relatório
+  do pstats.
+- "tracemalloc": compara dois snapshots do tracemalloc e devolve os locais
+  que mais memória alocaram no intervalo.
+
+Só um profiling corre de cada vez. O endpoint só fica ativo se
+CLICKSAFE_ADMIN_TOKEN estiver definido (e o pedido trouxer esse token).
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+
+# Token dos endpoints de administração (sem token ficam desativados)
+ADMIN_TOKEN = os.getenv("CLICKSAFE_ADMIN_TOKEN")
+
+# Limites de um profiling
+PROFILE_MAX_SECONDS = float(os.getenv("CLICKSAFE_PROFILE_MAX_SECONDS", "60"))
+PROFILE_MODES = ("sample", "cprofile", "tracemalloc")
+
+# Frames guardados por alocação no modo tracemalloc
+_TRACEMALLOC_FRAMES = 10
+
+
+class ProfilerBusy(Exception):
+    """Já está a correr um profiling neste processo."""
+
+
+_profile_lock = threading.Lock()
+
+
+def check_admin_token(token: Optional[str]) -> bool:
+    """Indica se o token dá acesso aos endpoints de administração (sempre False sem CLICKSAFE_ADMIN_TOKEN)."""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest((token or "").encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+class SamplingProfiler(object):
+    """
+    Amostrador de stacks numa thread: a cada `interval` segundos lê
+    `sys._current_frames()` e conta cada stack (da raiz para a folha).
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[set] = None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids and thread_id not in self.thread_ids):
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Stacks colapsados, um por linha ("raiz;...;folha contagem"), dos mais frequentes para os menos."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+async def _sample(seconds: float, interval_ms: float, all_threads: bool) -> str:
+    thread_ids = None if all_threads else {threading.get_ident()}
+    profiler = SamplingProfiler(interval=interval_ms / 1000.0, thread_ids=thread_ids)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    header = f"# {profiler.samples} amostras a cada {interval_ms:g} ms durante {seconds:g}s\n"
+    return header + profiler.collapsed()
+
+
+async def _cprofile(seconds: float, target: Optional[Callable[[], Awaitable]], limit: int, sort: str) -> str:
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        if target is not None:
+            await target()
+        else:
+            await asyncio.sleep(seconds)
+    finally:
+        profile.disable()
+    elapsed = time.perf_counter() - start
+    out = io.StringIO()
+    what = "de uma análise" if target is not None else "da thread do event loop"
+    out.write(f"# cProfile {what} durante {elapsed:.2f}s\n")
+    pstats.Stats(profile, stream=out).sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+async def _tracemalloc(seconds: float, limit: int) -> str:
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(_TRACEMALLOC_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    lines = [f"# tracemalloc: {seconds:g}s, memória rastreada {current / 1024:.1f} KiB (pico {peak / 1024:.1f} KiB)",
+             f"# top {limit} locais por memória alocada no intervalo"]
+    lines.extend(str(stat) for stat in stats[:limit])
+    return "\n".join(lines) + "\n"
+
+
+async def run_profile(
+    mode: str = "sample",
+    seconds: float = 10.0,
+    interval_ms: float = 5.0,
+    all_threads: bool = False,
+    target: Optional[Callable[[], Awaitable]] = None,
+    limit: int = 40,
+    sort: str = "cumulative"
+) -> str:
+    """
+    Corre um profiling e devolve o relatório em texto.
+    `target` (só no modo "cprofile"): coroutine a medir em vez de um intervalo fixo.
+    Lança ValueError em parâmetros inválidos e ProfilerBusy se já houver um a correr.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Modo de profiling inválido: '{mode}' (use {', '.join(PROFILE_MODES)})")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise ValueError(f"seconds deve estar entre 0 e {PROFILE_MAX_SECONDS:g}")
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("Já está a correr um profiling neste processo")
+    try:
+        if mode == "sample":
+            return await _sample(seconds, max(1.0, interval_ms), all_threads)
+        if mode == "cprofile":
+            return await _cprofile(seconds, target, limit, sort)
+        return await _tracemalloc(seconds, limit)
+    finally:
+        _profile_lock.release()
@@ -1,92 +1,299 @@
 #backend/services/reputation.py
-from typing import Dict
-from .gsb import check_gsb
-from .vt import check_vt
-# APIVOID desabilitado temporariamente
-# from .apivoid.apivoidrep import check_apivoid
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from .circuit_breaker import is_failure
+from .source_stats import SOURCE_STATS, order_for_verdict
+from .sources import ReputationSource, SOURCE_REGISTRY, get_sources
+from .metrics import METRICS_ENABLED, SOURCE_SECONDS
+from .tracing import span
+from .log import get_logger
+
+log = get_logger("reputation")
+
+# Modo de consulta: "sequential" (para na primeira fonte POSITIVE) ou "parallel"
+REPUTATION_MODE = os.getenv("CLICKSAFE_REPUTATION_MODE", "sequential")
+
+# Orçamentos por pedido: latência total (ms) e custo total (soma de ReputationSource.cost)
+LATENCY_BUDGET_MS = float(os.getenv("CLICKSAFE_REPUTATION_LATENCY_BUDGET_MS", "65000"))
+COST_BUDGET = float(os.getenv("CLICKSAFE_REPUTATION_COST_BUDGET", "10"))
+
+# Reasons de fontes sem resultado: não consultadas ou ainda pendentes
+# (não contam para o score nem são gravadas - as pendentes são gravadas quando terminarem)
+NOT_QUERIED_REASONS = ("not_checked", "over_budget", "pending")
+
+# Folga dada à própria fonte para devolver o seu timeout antes de cancelarmos a chamada
+_DEADLINE_GRACE_S = 0.5
 
 
 def _status_to_score(status: str) -> float:
     """
     Converte status de reputação para score numérico (0.0 = seguro, 1.0 = perigoso).
-    
+
     - POSITIVE (malicioso): 1.0
     - NEGATIVE (seguro/não malicioso): 0.0
     - UNKNOWN (indeterminado): 0.5
     """
     return {"POSITIVE": 1.0, "NEGATIVE": 0.0, "UNKNOWN": 0.5}.get(status, 0.5)
 
-async def consolidate_reputation(url: str) -> Dict:
+
+def get_circuit_states() -> Dict[str, Dict]:
+    """Estado atual do circuit breaker de cada fonte."""
+    return {name: source.breaker.snapshot() for name, source in SOURCE_REGISTRY.items()}
+
+
+def get_source_stats() -> Dict:
     """
-    Verifica reputação de forma sequencial:
-    1. Verifica GSB primeiro
-    2. Se GSB for POSITIVE (malicioso), retorna imediatamente
-    3. Se GSB for NEGATIVE (seguro), verifica VirusTotal
-    4. Se VirusTotal for POSITIVE, retorna como malicioso
-    5. Se VirusTotal for NEGATIVE, retorna como seguro
-    (APIVOID desabilitado temporariamente)
+    Estatísticas de cada fonte registada (taxa de positivos, latência p50/p95,
+    taxa de falhas), estado do circuit breaker e a ordem sequencial atual.
     """
+    stats = SOURCE_STATS.snapshot()
     sources = {}
-    
-    #1. Verifica Google Safe Browsing primeiro
-    print("  Verificando Google Safe Browsing...")
-    gsb = await check_gsb(url)
-    sources["GOOGLE_SAFE_BROWSING"] = gsb
-    
-    #Se GSB for POSITIVE (malicioso), retorna imediatamente
-    if gsb["status"] == "POSITIVE":
-        print("  GSB detectou ameaça - marcando como malicioso")
-        # Preenche os outros como não verificados
-        sources["VIRUSTOTAL"] = {"status": "UNKNOWN", "reason": "not_checked", "raw": {}}
-        # APIVOID desabilitado
-        # sources["APIVOID"] = {"status": "UNKNOWN", "reason": "not_checked", "raw": {}}
-        return {"sources": sources, "_score": 1.0, "final_status": "POSITIVE"}
-    
-    #2. GSB foi NEGATIVE, verifica VirusTotal
-    print("  GSB não detectou ameaça - verificando VirusTotal...")
-    
-    vt = await check_vt(url)
-    sources["VIRUSTOTAL"] = vt
-    
-    #Se VirusTotal estiver implementado e for POSITIVE, retorna
-    if vt["status"] == "POSITIVE":
-        print("  VirusTotal detectou ameaça - marcando como malicioso")
-        # APIVOID desabilitado
-        # sources["APIVOID"] = {"status": "UNKNOWN", "reason": "not_checked", "raw": {}}
-        return {"sources": sources, "_score": 1.0, "final_status": "POSITIVE"}
-    
-    #3. VirusTotal foi NEGATIVE ou UNKNOWN - APIVOID desabilitado
-    if vt["status"] == "NEGATIVE":
-        print("  VirusTotal não detectou ameaça")
+    for name, source in SOURCE_REGISTRY.items():
+        sources[name] = {
+            **source.describe(),
+            **stats.get(name, SOURCE_STATS.get(name).snapshot()),
+            "circuit": source.breaker.snapshot(),
+        }
+    selected, _ = plan_sources(LATENCY_BUDGET_MS, COST_BUDGET, "sequential")
+    return {
+        "history_loaded": SOURCE_STATS.loaded,
+        "sequential_order": [s.name for s in selected],
+        "sources": sources,
+    }
+
+
+def _not_queried(reason: str) -> Dict:
+    return {"status": "UNKNOWN", "reason": reason, "raw": {}}
+
+
+def plan_sources(
+    latency_budget_ms: float,
+    cost_budget: float,
+    mode: str = "sequential",
+    latency_classes: Optional[Sequence[str]] = None
+) -> Tuple[List[ReputationSource], List[ReputationSource]]:
+    """
+    Escolhe as fontes a consultar e a ordem, dentro dos orçamentos.
+
+    No modo sequencial as fontes são ordenadas pelo tempo esperado até um
+    veredito decisivo (latência mediana observada / taxa de positivos, ver
+    `services/source_stats.py`); sem histórico isto equivale a ordenar pela
+    classe de latência. No modo paralelo ordena por latência, custo e peso.
+    Uma fonte fica de fora se ultrapassar o orçamento de custo ou de latência
+    (p95 observado; no modo sequencial a latência acumula, no paralelo conta
+    apenas a maior).
+    Com `latency_classes` só são consideradas as fontes dessas classes
+    (ex.: ("local",) para não usar a rede).
+
+    Retorna (selecionadas, fora_do_orçamento).
+    """
+    candidates = [s for s in get_sources() if s.is_available()
+                  and (latency_classes is None or s.latency_class in latency_classes)]
+    if mode == "sequential":
+        candidates = order_for_verdict(candidates)
     else:
-        print("  VirusTotal não disponível")
-    
-    # APIVOID desabilitado temporariamente
-    # if vt["status"] == "NEGATIVE":
-    #     print("  VirusTotal não detectou ameaça - verificando APIVOID...")
-    # else:
-    #     print("  VirusTotal não disponível - verificando APIVOID...")
-    # 
-    # apivoid = await check_apivoid(url)
-    # sources["APIVOID"] = apivoid
-    # 
-    # #Se APIVOID estiver implementado e for POSITIVE, retorna
-    # if apivoid["status"] == "POSITIVE":
-    #     print("  APIVOID detectou ameaça - marcando como malicioso")
-    #     return {"sources": sources, "_score": 1.0, "final_status": "POSITIVE"}
-    
-    #4. Todas as fontes verificadas retornaram NEGATIVE ou UNKNOWN
-    #Se todas forem NEGATIVE, é seguro. Se alguma for UNKNOWN, é indeterminado.
-    all_negative = all(s["status"] == "NEGATIVE" for s in sources.values())
-    
-    if all_negative:
-        print("  Todas as fontes verificadas indicam que a URL é segura")
-        final_status = "NEGATIVE"
-        score = 0.0
+        candidates.sort(key=lambda s: (s.expected_latency_ms, s.cost, -s.weight))
+
+    selected, skipped = [], []
+    cost_spent = 0.0
+    latency_spent = 0.0
+    for source in candidates:
+        expected_ms = SOURCE_STATS.expected_latency_ms(source.name, source.expected_latency_ms, p=95)
+        latency_after = latency_spent + expected_ms if mode == "sequential" else expected_ms
+        if cost_spent + source.cost > cost_budget or latency_after > latency_budget_ms:
+            skipped.append(source)
+            continue
+        selected.append(source)
+        cost_spent += source.cost
+        if mode == "sequential":
+            latency_spent = latency_after
+    return selected, skipped
+
+
+def weighted_consensus(total_weight: float, weighted: float, positive_floor: float) -> float:
+    """
+    Score do consenso a partir dos agregados das fontes consultadas: soma dos
+    pesos, soma de peso × _status_to_score e maior peso de uma fonte POSITIVE
+    (0 se nenhuma). Também usado no rescoring offline, com os agregados em SQL.
+    """
+    if total_weight == 0:
+        return 0.5
+    return max(weighted / total_weight, positive_floor)
+
+
+def positive_floor(sources: Dict[str, Dict]) -> float:
+    """Maior peso de uma fonte consultada com resultado POSITIVE (0 se nenhuma)."""
+    floor = 0.0
+    for name, result in sources.items():
+        if result.get("status") == "POSITIVE" and result.get("reason") not in NOT_QUERIED_REASONS:
+            source = SOURCE_REGISTRY.get(name)
+            floor = max(floor, source.weight if source else 0.5)
+    return floor
+
+
+def score_sources(sources: Dict[str, Dict]) -> Tuple[float, str]:
+    """
+    Consenso ponderado dos resultados das fontes consultadas.
+
+    - Score = média de _status_to_score ponderada pelo peso (confiança) de cada fonte
+    - Uma fonte POSITIVE garante pelo menos o seu peso como score
+      (ex.: GSB com peso 1.0 continua a dar 1.0 sozinho)
+    - Estado final: POSITIVE se alguma fonte for POSITIVE, NEGATIVE se todas
+      forem NEGATIVE, UNKNOWN caso contrário (ou se nenhuma foi consultada)
+
+    Retorna (score 0.0-1.0, final_status).
+    """
+    total_weight = 0.0
+    weighted = 0.0
+    positive_floor = 0.0
+    statuses = []
+    for name, result in sources.items():
+        if result.get("reason") in NOT_QUERIED_REASONS:
+            continue
+        source = SOURCE_REGISTRY.get(name)
+        weight = source.weight if source else 0.5
+        status = result.get("status", "UNKNOWN")
+        statuses.append(status)
+        total_weight += weight
+        weighted += weight * _status_to_score(status)
+        if status == "POSITIVE":
+            positive_floor = max(positive_floor, weight)
+
+    if not statuses or total_weight == 0:
+        return 0.5, "UNKNOWN"
+
+    score = weighted_consensus(total_weight, weighted, positive_floor)
+    if "POSITIVE" in statuses:
+        return score, "POSITIVE"
+    if all(s == "NEGATIVE" for s in statuses):
+        return score, "NEGATIVE"
+    return score, "UNKNOWN"
+
+
+def record_source_result(name: str, result: Dict) -> None:
+    """Regista nas estatísticas de uma fonte um resultado obtido fora de `consolidate_reputation` (ex.: polling em background)."""
+    SOURCE_STATS.record(name, result)
+
+
+async def _guarded_check(
+    source: ReputationSource,
+    url: str,
+    max_timeout: Optional[float] = None,
+    options: Optional[Dict] = None
+) -> Dict:
+    """
+    Executa a verificação de uma fonte através do seu circuit breaker.
+
+    - Circuito aberto: não chama a fonte e devolve UNKNOWN com reason "circuit_open"
+    - Circuito fechado/semiaberto: chama a fonte com o timeout adaptativo
+      (limitado a `max_timeout`, o que resta do orçamento de latência) e
+      regista o resultado (erro/timeout ou sucesso + latência)
+
+    O `asyncio.wait_for` só cancela a coroutine: as fontes síncronas (GSB,
+    VirusTotal) correm em threads e recebem o mesmo timeout, que respeitam
+    sozinhas (o VirusTotal deixa de fazer polling no prazo), para a thread
+    não continuar a correr depois de a consulta ser dada como timeout.
+    """
+    breaker = source.breaker
+    if not breaker.allow_request():
+        return {"status": "UNKNOWN", "reason": "circuit_open", "raw": {}, "elapsed_ms": 0}
+
+    timeout = breaker.current_timeout()
+    if max_timeout is not None:
+        timeout = max(0.1, min(timeout, max_timeout))
+    start_time = time.time()
+    with span(f"reputation.{source.name}") as source_span:
+        try:
+            result = await asyncio.wait_for(
+                source.check(url, timeout, **(options or {})),
+                timeout=timeout + _DEADLINE_GRACE_S
+            )
+        except asyncio.TimeoutError:
+            result = {
+                "status": "UNKNOWN",
+                "reason": "timeout",
+                "raw": {},
+                "elapsed_ms": int((time.time() - start_time) * 1000)
+            }
+        source_span.attrs.update(status=result.get("status"), reason=result.get("reason"))
+
+    failed = is_failure(result)
+    breaker.record(failed, result.get("elapsed_ms"), timed_out=result.get("reason") == "timeout")
+    if METRICS_ENABLED:
+        outcome = "skipped" if failed is None else ("error" if failed else "ok")
+        SOURCE_SECONDS.labels(source.name, outcome).observe(source_span.elapsed_ms / 1000.0)
+    SOURCE_STATS.record(source.name, result)
+    return result
+
+
+async def consolidate_reputation(
+    url: str,
+    mode: Optional[str] = None,
+    latency_budget_ms: Optional[float] = None,
+    cost_budget: Optional[float] = None,
+    defer_vt: bool = False,
+    latency_classes: Optional[Sequence[str]] = None
+) -> Dict:
+    """
+    Verifica reputação usando as fontes registadas em `services/sources.py`.
+
+    1. Escolhe as fontes ativas que cabem nos orçamentos de latência e custo
+       (ver `plan_sources`), das mais rápidas/baratas para as mais lentas
+    2. Modo sequencial: consulta uma a uma e para na primeira POSITIVE
+       (as restantes ficam com reason "not_checked")
+       Modo paralelo: consulta todas ao mesmo tempo
+    3. Calcula o score com consenso ponderado (ver `score_sources`)
+
+    Cada fonte passa pelo seu circuit breaker: fontes com o circuito aberto
+    não são consultadas e ficam UNKNOWN com reason "circuit_open".
+    Fontes fora do orçamento ficam UNKNOWN com reason "over_budget".
+    Com `defer_vt=True` o VirusTotal não espera por análises em fila: fica
+    UNKNOWN com reason "pending" (fora do score) para ser terminado em background.
+    Com `latency_classes` só consulta as fontes dessas classes (ver `plan_sources`);
+    as restantes não aparecem no resultado.
+    """
+    options = {"defer_vt": defer_vt}
+    mode = mode or REPUTATION_MODE
+    latency_budget_ms = LATENCY_BUDGET_MS if latency_budget_ms is None else latency_budget_ms
+    cost_budget = COST_BUDGET if cost_budget is None else cost_budget
+
+    selected, skipped = plan_sources(latency_budget_ms, cost_budget, mode, latency_classes)
+    sources = {}
+
+    if mode == "parallel":
+        log.debug("Verificando em paralelo: %s", [s.name for s in selected])
+        results = await asyncio.gather(*[
+            _guarded_check(source, url, max_timeout=latency_budget_ms / 1000.0, options=options)
+            for source in selected
+        ])
+        sources.update({source.name: result for source, result in zip(selected, results)})
     else:
-        #Tem pelo menos uma UNKNOWN
-        print("  Algumas fontes não estão disponíveis - resultado indeterminado")
-        final_status = "UNKNOWN"
-        score = 0.5
-    
+        start_time = time.time()
+        for i, source in enumerate(selected):
+            remaining_s = latency_budget_ms / 1000.0 - (time.time() - start_time)
+            if remaining_s <= 0:
+                for rest in selected[i:]:
+                    sources[rest.name] = _not_queried("over_budget")
+                break
+
+            log.debug("Verificando %s", source.name)
+            result = await _guarded_check(source, url, max_timeout=remaining_s, options=options)
+            sources[source.name] = result
+
+            # Fonte POSITIVE (malicioso): as restantes não são consultadas
+            if result["status"] == "POSITIVE":
+                log.debug("%s detectou ameaça - marcando como malicioso", source.name)
+                for rest in selected[i + 1:]:
+                    sources[rest.name] = _not_queried("not_checked")
+                break
+
+    for source in skipped:
+        log.debug("%s: fora do orçamento (latência/custo)", source.name)
+        sources[source.name] = _not_queried("over_budget")
+
+    score, final_status = score_sources(sources)
+    log.debug("Reputação: %s (score %.2f)", final_status, score)
+
     return {"sources": sources, "_score": score, "final_status": final_status}
@@ -0,0 +1,141 @@
+#backend/services/source_stats.py
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+from .circuit_breaker import percentile, is_failure
+
+# Número de consultas guardadas por fonte
+WINDOW_SIZE = 500
+
+# Mínimo de amostras para confiar nas estatísticas observadas
+MIN_SAMPLES = 10
+
+# Prior (Beta) da taxa de positivos: evita 0% com poucas amostras
+_PRIOR_POSITIVE = 1.0
+_PRIOR_NEGATIVE = 20.0
+
+
+class SourceStats(object):
+    """
+    Estatísticas móveis das consultas a uma fonte de reputação:
+    taxa de positivos, latência mediana/p95 e taxa de falhas.
+    """
+
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self._samples = deque(maxlen=window_size)  # (positive, failed, elapsed_ms)
+        self._lock = threading.Lock()
+
+    def record(self, status: str, reason: Optional[str], elapsed_ms: Optional[int]) -> None:
+        failed = is_failure({"reason": reason})
+        if failed is None:
+            # Consultas que não chegaram à fonte (no_key, circuit_open, ...) não contam
+            return
+        positive = status == "POSITIVE" and not failed
+        with self._lock:
+            self._samples.append((positive, failed, elapsed_ms))
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def positive_rate(self) -> float:
+        """Taxa de positivos suavizada (nunca exatamente 0)."""
+        with self._lock:
+            positives = sum(1 for p, _, _ in self._samples if p)
+            n = len(self._samples)
+        return (positives + _PRIOR_POSITIVE) / (n + _PRIOR_POSITIVE + _PRIOR_NEGATIVE)
+
+    def failure_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, f, _ in self._samples if f) / len(self._samples)
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            latencies = [ms for _, f, ms in self._samples if ms is not None and not f]
+        return percentile(latencies, p)
+
+    def snapshot(self) -> Dict:
+        return {
+            "samples": len(self),
+            "positive_rate": round(self.positive_rate(), 4),
+            "failure_rate": round(self.failure_rate(), 4),
+            "p50_ms": self.latency_percentile(50),
+            "p95_ms": self.latency_percentile(95),
+        }
+
+
+class SourceStatsRegistry(object):
+    """Estatísticas de todas as fontes, carregadas do histórico e atualizadas em memória."""
+
+    def __init__(self):
+        self._stats: Dict[str, SourceStats] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def get(self, source: str) -> SourceStats:
+        with self._lock:
+            if source not in self._stats:
+                self._stats[source] = SourceStats()
+            return self._stats[source]
+
+    def record(self, source: str, result: Dict) -> None:
+        self.get(source).record(result.get("status", "UNKNOWN"), result.get("reason"), result.get("elapsed_ms"))
+
+    def seed(self, rows: Iterable[Dict]) -> None:
+        """Carrega linhas do histórico (mais antigas primeiro) com source/status/reason/elapsed_ms."""
+        for row in rows:
+            self.get(row["source"]).record(row["status"], row.get("reason"), row.get("elapsed_ms"))
+        self.loaded = True
+
+    def reset(self) -> None:
+        """Descarta todas as amostras (ex.: entre configurações de uma avaliação offline)."""
+        with self._lock:
+            self._stats = {}
+        self.loaded = False
+
+    def load_history(self, db_path: Optional[str] = None) -> int:
+        """
+        Lê as consultas mais recentes de reputation_checks para cada fonte.
+        Retorna o número de linhas carregadas.
+        """
+        from storage.db import get_reputation_history
+        kwargs = {"db_path": db_path} if db_path else {}
+        rows = get_reputation_history(limit_per_source=WINDOW_SIZE, **kwargs)
+        self.seed(rows)
+        return len(rows)
+
+    def expected_latency_ms(self, source: str, default_ms: float, p: float = 50) -> float:
+        """Percentil `p` da latência observada da fonte (ou `default_ms` sem amostras suficientes)."""
+        stats = self.get(source)
+        if len(stats) < MIN_SAMPLES:
+            return default_ms
+        observed = stats.latency_percentile(p)
+        return observed if observed is not None else default_ms
+
+    def time_to_verdict_ratio(self, source: str, default_ms: float) -> float:
+        """
+        Latência mediana / probabilidade de um veredito decisivo (POSITIVE sem falha).
+
+        Em modo sequencial a consulta termina na primeira fonte POSITIVE, por isso
+        ordenar as fontes por esta razão (crescente) minimiza o tempo esperado
+        até um veredito decisivo.
+        """
+        stats = self.get(source)
+        p_decisive = stats.positive_rate() * (1.0 - stats.failure_rate())
+        return self.expected_latency_ms(source, default_ms) / max(p_decisive, 1e-6)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            names = list(self._stats)
+        return {name: self.get(name).snapshot() for name in names}
+
+
+SOURCE_STATS = SourceStatsRegistry()
+
+
+def order_for_verdict(sources: List, stats: SourceStatsRegistry = SOURCE_STATS) -> List:
+    """Ordena fontes (ReputationSource) por tempo esperado até um veredito decisivo."""
+    return sorted(sources, key=lambda s: (
+        stats.time_to_verdict_ratio(s.name, s.expected_latency_ms), s.cost, -s.weight
+    ))
@@ -0,0 +1,136 @@
+#backend/services/sources.py
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+from .circuit_breaker import CircuitBreaker
+from .apivoid.apivoidrep import check_apivoid
+from .blocklist import check_blocklist, is_blocklist_available
+from .gsb import check_gsb
+from .vt import check_vt
+
+# Latência esperada (ms) de cada classe - usada para respeitar o orçamento de latência
+LATENCY_CLASSES = {
+    "local": 5,       # sem rede (ex.: blocklist local)
+    "fast": 800,      # uma requisição HTTP (ex.: GSB, APIVOID)
+    "slow": 15000,    # submissão + polling (ex.: VirusTotal)
+}
+
+# Fontes ativas (separadas por vírgula). APIVOID fica desligado por configuração.
+ENABLED_SOURCES = os.getenv(
+    "CLICKSAFE_REPUTATION_SOURCES",
+    "LOCAL_BLOCKLIST,GOOGLE_SAFE_BROWSING,VIRUSTOTAL"
+)
+
+# Timeout HTTP máximo de cada requisição ao VirusTotal (o polling pode durar mais)
+VT_REQUEST_TIMEOUT = 10
+
+
+class ReputationSource(object):
+    """
+    Fonte de reputação registada no motor de consolidação.
+
+    Parâmetros:
+        name (str): nome da fonte (gravado em reputation_checks.source)
+        check: coroutine `check(url, timeout, **options)` que devolve o formato padronizado
+               (as opções não usadas pela fonte são ignoradas, ex.: `defer_vt`)
+        cost (float): custo por consulta (quota/créditos da API), 0 = grátis
+        latency_class (str): "local", "fast" ou "slow" (ver LATENCY_CLASSES)
+        weight (float): confiança na fonte para o score ponderado (0-1)
+        breaker (CircuitBreaker): circuit breaker da fonte
+        available: função opcional que indica se a fonte pode ser usada
+    """
+
+    def __init__(self, name: str,
+                 check: Callable[..., Awaitable[Dict]],
+                 cost: float,
+                 latency_class: str,
+                 weight: float,
+                 breaker: CircuitBreaker,
+                 available: Optional[Callable[[], bool]] = None):
+        if latency_class not in LATENCY_CLASSES:
+            raise ValueError(f"Classe de latência inválida: {latency_class}")
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.latency_class = latency_class
+        self.weight = weight
+        self.breaker = breaker
+        self._available = available
+
+    @property
+    def expected_latency_ms(self) -> float:
+        return LATENCY_CLASSES[self.latency_class]
+
+    @property
+    def enabled(self) -> bool:
+        enabled = {s.strip().upper() for s in ENABLED_SOURCES.split(",") if s.strip()}
+        return self.name in enabled
+
+    def is_available(self) -> bool:
+        return self._available() if self._available else True
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "enabled": self.enabled,
+            "available": self.is_available(),
+            "cost": self.cost,
+            "latency_class": self.latency_class,
+            "weight": self.weight,
+        }
+
+
+# Registo global de fontes: nome -> ReputationSource
+SOURCE_REGISTRY: Dict[str, ReputationSource] = {}
+
+
+def register_source(source: ReputationSource) -> ReputationSource:
+    """Regista (ou substitui) uma fonte de reputação."""
+    SOURCE_REGISTRY[source.name] = source
+    return source
+
+
+def get_sources(enabled_only: bool = True) -> List[ReputationSource]:
+    """Fontes registadas, por ordem de registo."""
+    return [s for s in SOURCE_REGISTRY.values() if s.enabled or not enabled_only]
+
+
+# Fontes incluídas
+
+register_source(ReputationSource(
+    name="LOCAL_BLOCKLIST",
+    check=lambda url, timeout, **options: check_blocklist(url, timeout=timeout),
+    cost=0,
+    latency_class="local",
+    weight=0.9,
+    breaker=CircuitBreaker("LOCAL_BLOCKLIST", default_timeout=1, min_timeout=0.1),
+    available=is_blocklist_available,
+))
+
+register_source(ReputationSource(
+    name="GOOGLE_SAFE_BROWSING",
+    check=lambda url, timeout, **options: check_gsb(url, timeout=timeout),
+    cost=1,
+    latency_class="fast",
+    weight=1.0,
+    breaker=CircuitBreaker("GOOGLE_SAFE_BROWSING", default_timeout=3, min_timeout=0.5),
+))
+
+register_source(ReputationSource(
+    name="VIRUSTOTAL",
+    check=lambda url, timeout, defer_vt=False, **options: check_vt(
+        url, timeout=min(VT_REQUEST_TIMEOUT, timeout), max_wait_time=timeout, defer=defer_vt
+    ),
+    cost=5,
+    latency_class="slow",
+    weight=0.8,
+    breaker=CircuitBreaker("VIRUSTOTAL", default_timeout=60, min_timeout=5),
+))
+
+register_source(ReputationSource(
+    name="APIVOID",
+    check=lambda url, timeout, **options: check_apivoid(url, timeout=timeout),
+    cost=2,
+    latency_class="fast",
+    weight=0.5,
+    breaker=CircuitBreaker("APIVOID", default_timeout=5, min_timeout=0.5),
+))
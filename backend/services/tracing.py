@@ -0,0 +1,141 @@
+#backend/services/tracing.py
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from .metrics import observe_stage
+
+# Liga/desliga a gravação da linha temporal de cada análise ("0" desliga)
+TRACING_ENABLED = os.getenv("CLICKSAFE_TRACING", "1") != "0"
+
+# Trace e span atuais (contextvars: cada task asyncio vê os seus)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("clicksafe_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("clicksafe_span", default=None)
+
+# Id do span raiz (a própria análise); os spans de topo têm-no como pai
+ROOT_SPAN_ID = 0
+
+
+class Span(object):
+    """Etapa medida: nome, atributos (podem ser alterados durante a etapa) e duração."""
+
+    __slots__ = ("id", "parent_id", "name", "attrs", "start", "end")
+
+    def __init__(self, span_id: int, parent_id: Optional[int], name: str, attrs: Dict[str, Any]):
+        self.id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def elapsed_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+
+class Trace(object):
+    """
+    Linha temporal de uma análise: os spans terminados, com início relativo
+    ao início da análise, duração e span pai.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.attrs: Dict[str, Any] = {}
+        self.spans: List[Dict[str, Any]] = []
+        self.finished = False
+        self._next_id = ROOT_SPAN_ID + 1
+
+    def new_span(self, name: str, parent_id: Optional[int], attrs: Dict[str, Any]) -> Span:
+        span_id = self._next_id
+        self._next_id += 1
+        return Span(span_id, parent_id, name, attrs)
+
+    def record(self, span: Span) -> None:
+        if self.finished:
+            # Etapas de tarefas em background que herdaram o contexto já não entram
+            return
+        self.spans.append({
+            "id": span.id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "start_ms": round((span.start - self.start) * 1000, 3),
+            "elapsed_ms": round(span.elapsed_ms, 3),
+            "attrs": span.attrs,
+        })
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Fecha a linha temporal (ignora spans que terminem depois) e devolve-a."""
+        spans = self.to_list()
+        self.finished = True
+        return spans
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Spans por ordem de início, começando pelo span raiz (a análise inteira até agora)."""
+        root = {
+            "id": ROOT_SPAN_ID,
+            "parent_id": None,
+            "name": self.name,
+            "start_ms": 0.0,
+            "elapsed_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "attrs": self.attrs,
+        }
+        return [root] + sorted(self.spans, key=lambda s: (s["start_ms"], s["id"]))
+
+
+def start_trace(name: str) -> Optional[Trace]:
+    """
+    Começa a linha temporal de uma análise na task atual (None se o tracing
+    estiver desligado). Os spans abertos depois, incluindo em tasks criadas
+    a partir desta, ficam nela.
+    """
+    if not TRACING_ENABLED:
+        _current_trace.set(None)
+        return None
+    trace = Trace(name)
+    _current_trace.set(trace)
+    _current_span.set(ROOT_SPAN_ID)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Mede uma etapa (`with span("reputation.GSB") as s: ...`). A duração fica
+    em `s.elapsed_ms` e no histograma de etapas (services.metrics) mesmo sem
+    trace ativo; com trace, a etapa é registada (com "error" nos atributos
+    se terminar com exceção).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        current = Span(ROOT_SPAN_ID, None, name, attrs)
+        try:
+            yield current
+        finally:
+            current.end = time.perf_counter()
+            observe_stage(name, current.end - current.start)
+        return
+
+    current = trace.new_span(name, _current_span.get(), attrs)
+    token = _current_span.set(current.id)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        observe_stage(name, current.end - current.start)
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Span aberto num gerador retomado noutro contexto: repõe o pai à mão
+            _current_span.set(current.parent_id)
+        trace.record(current)
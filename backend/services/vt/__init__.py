@@ -2,6 +2,7 @@
 from .vt import (
     Virustotal,
     check_vt,
+    poll_vt,
     VirustotalException,
     VirustotalError,
     VirustotalInvalidApiKey,
@@ -13,6 +14,7 @@ from .vt import (
 __all__ = [
     'Virustotal',
     'check_vt',
+    'poll_vt',
     'VirustotalException',
     'VirustotalError',
     'VirustotalInvalidApiKey',
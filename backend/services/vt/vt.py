@@ -1,10 +1,12 @@
 
+import asyncio
 import os
 import time
 import requests
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 from json.decoder import JSONDecodeError
+from ..cassettes import CASSETTES
 
 # Carrega .env.local se existir
 try:
@@ -15,6 +17,9 @@ try:
 except ImportError:
     pass
 
+# URL base da API v3 (alterável para testes e benchmarks com um servidor local)
+VT_API_URL = os.getenv("VT_API_URL", "https://www.virustotal.com/api/v3")
+
 
 class VirustotalException(Exception):
     """Exceção base para todos os erros do VirusTotal."""
@@ -53,7 +58,7 @@ class Virustotal(object):
     """ Classe responsável por consultar a API do VirusTotal para análise de URLs. """
 
     def __init__(self, api_key: str, 
-                 api_url: str = 'https://www.virustotal.com/api/v3',
+                 api_url: str = VT_API_URL,
                  timeout: float = 10.0):
         """ Inicializa o cliente VirusTotal. """
         self.api_key = api_key
@@ -65,6 +70,12 @@ class Virustotal(object):
             "x-apikey": self.api_key,  # API v3 usa header x-apikey
         }
 
+    def _request_timeout(self, deadline: Optional[float]) -> float:
+        """Timeout de um pedido: `self.timeout`, sem passar do prazo (time.monotonic) se houver."""
+        if deadline is None:
+            return self.timeout
+        return max(0.1, min(self.timeout, deadline - time.monotonic()))
+
     def _handle_error_response(self, response: requests.Response):
         """
         Trata erros HTTP retornados pela API do VirusTotal.
@@ -111,16 +122,20 @@ class Virustotal(object):
                 error_data.get('message', 'Unknown error')
             )
 
-    def analyze_url(self, url: str) -> Dict:
+    def analyze_url(self, url: str, max_wait_time: float = 60, wait: bool = True) -> Dict:
         """
         Analisa uma URL usando a API do VirusTotal.
         
         Fluxo de trabalho:
         1. Submete a URL para análise (POST /urls)
-        2. Aguarda a análise processar (2 segundos)
+        2. Aguarda a análise processar (no máximo `max_wait_time` segundos)
         3. Consulta o resultado da análise (GET /analyses/{id})
         4. Se disponível, consulta os dados completos da URL (GET /urls/{id})
         
+        Com `wait=False` a análise é consultada uma única vez, sem esperar: se
+        ainda estiver "queued"/"in_progress" é devolvida assim (ver `wait_for_analysis`).
+        Com `wait=True` todo o fluxo (submissão incluída) termina em `max_wait_time`:
+        corre numa thread, que o `asyncio.wait_for` de quem chama não consegue parar.
         
         VirustotalInvalidApiKey: Se a chave da API for inválida
         VirustotalPermissionDenied: Se o acesso for negado
@@ -128,6 +143,7 @@ class Virustotal(object):
         VirustotalWeirdError: Para outros erros
         """
         submit_endpoint = f"{self.api_url}/urls"
+        deadline = time.monotonic() + max_wait_time if wait and max_wait_time > 0 else None
         
         try:
             # Passo 1: Submete a URL para análise
@@ -135,7 +151,7 @@ class Virustotal(object):
                 submit_endpoint,
                 headers=self.headers,
                 data={"url": url},
-                timeout=self.timeout
+                timeout=self._request_timeout(deadline)
             )
             
             if submit_response.status_code != 200:
@@ -149,68 +165,91 @@ class Virustotal(object):
             # Se a resposta já for um objeto URL, retorna diretamente
             if analysis_type == 'url':
                 return submit_data
-            
-            # Passo 2: Se for uma análise, consulta o resultado com loop até completar
-            if analysis_id and analysis_type == 'analysis':
-                analysis_endpoint = f"{self.api_url}/analyses/{analysis_id}"
                 
-                # Loop infinito até a análise ser completada (com timeout máximo de 60 segundos)
-                max_wait_time = 60  # segundos
-                retry_delay = 3  # segundos entre tentativas
-                start_wait = time.time()
-                
-                while True:
-                    # Verifica timeout máximo
-                    if time.time() - start_wait > max_wait_time:
-                        raise VirustotalWeirdError(0, 'Timeout', f'Analysis timeout after {max_wait_time}s')
-                    
-                    # Aguarda antes de verificar (exceto na primeira tentativa)
-                    if time.time() - start_wait > 0:
-                        time.sleep(retry_delay)
+        except requests.exceptions.Timeout:
+            raise VirustotalWeirdError(0, 'Timeout', 'Request timeout')
+        except requests.exceptions.RequestException as e:
+            raise VirustotalWeirdError(0, 'RequestException', str(e))
+        
+        # Passo 2: Se for uma análise, consulta o resultado com loop até completar
+        if analysis_id and analysis_type == 'analysis':
+            if deadline is None:
+                return self.wait_for_analysis(analysis_id, 0)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise VirustotalWeirdError(0, 'Timeout', f'Analysis timeout after {max_wait_time:.1f}s')
+            return self.wait_for_analysis(analysis_id, remaining)
+        
+        # Fallback: retorna dados da submissão
+        return submit_data
+
+    def wait_for_analysis(self, analysis_id: str, max_wait_time: float = 60) -> Dict:
+        """
+        Consulta uma análise (GET /analyses/{id}) até estar completa e, se
+        possível, devolve os dados completos da URL (GET /urls/{id}).
+        
+        Com `max_wait_time=0` faz uma única consulta sem esperar e devolve a
+        análise tal como está (ex.: status "queued"), para ser terminada mais tarde.
+        Não dorme nem espera por pedidos para lá de `max_wait_time`.
+        """
+        analysis_endpoint = f"{self.api_url}/analyses/{analysis_id}"
+        
+        # Loop até a análise ser completada (com timeout máximo de max_wait_time segundos)
+        retry_delay = 3  # segundos entre tentativas
+        deadline = time.monotonic() + max_wait_time if max_wait_time > 0 else None
+        
+        try:
+            while True:
+                if deadline is not None:
+                    # Verifica timeout máximo (antes de dormir: não acorda já depois do prazo)
+                    if time.monotonic() + retry_delay >= deadline:
+                        raise VirustotalWeirdError(0, 'Timeout', f'Analysis timeout after {max_wait_time:.1f}s')
                     
-                    analysis_response = requests.get(
-                        analysis_endpoint,
-                        headers=self.headers,
-                        timeout=self.timeout
-                    )
+                    # Aguarda antes de verificar (a análise demora alguns segundos)
+                    time.sleep(retry_delay)
+                
+                analysis_response = requests.get(
+                    analysis_endpoint,
+                    headers=self.headers,
+                    timeout=self._request_timeout(deadline)
+                )
+                
+                if analysis_response.status_code == 200:
+                    analysis_result = analysis_response.json()
+                    analysis_attrs = analysis_result.get('data', {}).get('attributes', {})
+                    analysis_status = analysis_attrs.get('status', '')
                     
-                    if analysis_response.status_code == 200:
-                        analysis_result = analysis_response.json()
-                        analysis_attrs = analysis_result.get('data', {}).get('attributes', {})
-                        analysis_status = analysis_attrs.get('status', '')
-                        
-                        # Se a análise estiver completa, tenta obter dados da URL
-                        if analysis_status == 'completed':
-                            # Passo 3: Tenta obter dados completos da URL se disponível
-                            url_id = analysis_attrs.get('url_id')
-                            if url_id:
-                                url_endpoint = f"{self.api_url}/urls/{url_id}"
-                                url_response = requests.get(
-                                    url_endpoint,
-                                    headers=self.headers,
-                                    timeout=self.timeout
-                                )
-                                
-                                if url_response.status_code == 200:
-                                    return url_response.json()
+                    # Se a análise estiver completa, tenta obter dados da URL
+                    if analysis_status == 'completed':
+                        # Passo 3: Tenta obter dados completos da URL se disponível
+                        url_id = analysis_attrs.get('url_id')
+                        if url_id:
+                            url_endpoint = f"{self.api_url}/urls/{url_id}"
+                            url_response = requests.get(
+                                url_endpoint,
+                                headers=self.headers,
+                                timeout=self._request_timeout(deadline)
+                            )
                             
-                            # Se não conseguir dados da URL, retorna a análise completa
-                            return analysis_result
-                        # Se ainda estiver em processamento, continua o loop
-                        elif analysis_status in ('queued', 'in_progress'):
-                            continue  # Continua aguardando
-                        else:
-                            # Status desconhecido ou erro, retorna o que temos
+                            if url_response.status_code == 200:
+                                return url_response.json()
+                        
+                        # Se não conseguir dados da URL, retorna a análise completa
+                        return analysis_result
+                    # Se ainda estiver em processamento, continua o loop (ou devolve se não for para esperar)
+                    elif analysis_status in ('queued', 'in_progress'):
+                        if max_wait_time <= 0:
                             return analysis_result
+                        continue  # Continua aguardando
                     else:
-                        # Erro HTTP, tenta novamente se não for erro fatal
-                        if analysis_response.status_code >= 500:
-                            continue  # Erro do servidor, tenta novamente
-                        else:
-                            self._handle_error_response(analysis_response)
-            
-            # Fallback: retorna dados da submissão
-            return submit_data
+                        # Status desconhecido ou erro, retorna o que temos
+                        return analysis_result
+                else:
+                    # Erro HTTP, tenta novamente se não for erro fatal
+                    if analysis_response.status_code >= 500 and max_wait_time > 0:
+                        continue  # Erro do servidor, tenta novamente
+                    else:
+                        self._handle_error_response(analysis_response)
                 
         except requests.exceptions.Timeout:
             raise VirustotalWeirdError(0, 'Timeout', 'Request timeout')
@@ -218,7 +257,7 @@ class Virustotal(object):
             raise VirustotalWeirdError(0, 'RequestException', str(e))
 
 
-async def check_vt(url: str, timeout: int = 10) -> Dict:
+async def check_vt(url: str, timeout: float = 10, max_wait_time: float = 60, defer: bool = False) -> Dict:
     """
     Verifica uma URL no VirusTotal e retorna resultado padronizado.
     
@@ -231,7 +270,7 @@ async def check_vt(url: str, timeout: int = 10) -> Dict:
     Formato de retorno:
         {
             "status": "POSITIVE" | "NEGATIVE" | "UNKNOWN",
-            "reason": "ok" | "no_key" | "error:...",
+            "reason": "ok" | "no_key" | "pending" | "error:...",
             "raw": {
                 "stats": {
                     "malicious": int,
@@ -253,12 +292,15 @@ async def check_vt(url: str, timeout: int = 10) -> Dict:
         - NEGATIVE: URL verificada como segura (sem detecções maliciosas)
         - UNKNOWN: Não foi possível determinar (sem API key, erro, ou análise incompleta)
 
+    Com `defer=True` não espera pela análise: se o VirusTotal ainda a tiver em
+    fila, devolve UNKNOWN com reason "pending" e raw["analysis_id"], para ser
+    terminada mais tarde com `poll_vt()`.
     """
     start_time = time.time()
     
     # Verifica se a API key está configurada
     api_key = os.getenv("VT_API_KEY", "")
-    if not api_key:
+    if not api_key and not CASSETTES.replaying:
         elapsed_ms = int((time.time() - start_time) * 1000)
         return {
             "status": "UNKNOWN",
@@ -267,10 +309,37 @@ async def check_vt(url: str, timeout: int = 10) -> Dict:
             "elapsed_ms": elapsed_ms
         }
     
+    # Cria cliente e analisa URL numa thread para não bloquear o event loop
+    # (através das cassetes: ver services/cassettes.py)
+    vt = Virustotal(api_key, timeout=timeout)
+    return await _run_vt(lambda: CASSETTES.call("vt", url, vt.analyze_url, url, max_wait_time, not defer),
+                         start_time, allow_pending=defer)
+
+
+async def poll_vt(analysis_id: str, timeout: float = 10, max_wait_time: float = 60) -> Dict:
+    """
+    Termina uma análise que ficou pendente (ver `check_vt(..., defer=True)`),
+    aguardando até `max_wait_time` segundos. Retorna o mesmo formato de `check_vt`.
+    """
+    start_time = time.time()
+    api_key = os.getenv("VT_API_KEY", "")
+    if not api_key and not CASSETTES.replaying:
+        return {
+            "status": "UNKNOWN",
+            "reason": "no_key",
+            "raw": {},
+            "elapsed_ms": int((time.time() - start_time) * 1000)
+        }
+    
+    vt = Virustotal(api_key, timeout=timeout)
+    return await _run_vt(lambda: CASSETTES.call("vt", f"analyses/{analysis_id}", vt.wait_for_analysis,
+                                                analysis_id, max_wait_time), start_time)
+
+
+async def _run_vt(call, start_time: float, allow_pending: bool = False) -> Dict:
+    """Executa `call` (síncrona) numa thread e converte a resposta para o formato padronizado."""
     try:
-        # Cria cliente e analisa URL
-        vt = Virustotal(api_key, timeout=timeout)
-        result = vt.analyze_url(url)
+        result = await asyncio.to_thread(call)
         
         elapsed_ms = int((time.time() - start_time) * 1000)
         
@@ -287,6 +356,19 @@ async def check_vt(url: str, timeout: int = 10) -> Dict:
             stats = attributes.get('stats', {})
             analysis_status = attributes.get('status', '')
             
+            # Análise ainda em fila e o chamador não quer esperar: fica pendente
+            if allow_pending and analysis_status in ('queued', 'in_progress'):
+                return {
+                    "status": "UNKNOWN",
+                    "reason": "pending",
+                    "raw": {
+                        "analysis_id": data.get('id', ''),
+                        "stats": stats,
+                        "message": f"Analysis status: {analysis_status}"
+                    },
+                    "elapsed_ms": elapsed_ms
+                }
+            
             # Se a análise não estiver completa após todas as tentativas, retorna UNKNOWN
             # (Isso não deveria acontecer porque analyze_url agora aguarda até completar)
             if analysis_status != 'completed':
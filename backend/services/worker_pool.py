@@ -0,0 +1,73 @@
+#backend/services/worker_pool.py
+import asyncio
+from typing import Awaitable, Callable, Optional
+from .log import get_logger
+
+log = get_logger("worker_pool")
+
+
+class WorkerPool(object):
+    """
+    Pool de workers assíncronos que consome jobs de uma fila.
+
+    Cada job é uma função que devolve uma coroutine (`job()`); os workers
+    são criados na primeira submissão, no event loop atual, e no máximo
+    `workers` jobs correm em simultâneo. Exceções dos jobs são registadas
+    e não param o worker. Com `max_pending` > 0 a fila é limitada e
+    `submit` lança asyncio.QueueFull quando está cheia.
+    """
+
+    def __init__(self, name: str, workers: int = 2, max_pending: int = 0):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_pending = max(0, max_pending)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._loop = None
+
+    def _ensure_started(self) -> asyncio.Queue:
+        # A fila e os workers pertencem ao event loop onde foram criados
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._loop = loop
+            self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        return self._queue
+
+    async def _worker(self, index: int) -> None:
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                await job()
+            except Exception as e:
+                log.exception("Erro no worker %s#%d: %s", self.name, index, e)
+            finally:
+                queue.task_done()
+
+    def submit(self, job: Callable[[], Awaitable]) -> None:
+        """
+        Coloca um job na fila (tem de ser chamado dentro de um event loop).
+        Lança asyncio.QueueFull se a fila tiver `max_pending` jobs à espera.
+        """
+        self._ensure_started().put_nowait(job)
+
+    @property
+    def pending(self) -> int:
+        """Jobs à espera na fila."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def join(self) -> None:
+        """Espera que todos os jobs submetidos terminem."""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        """Cancela os workers (os jobs ainda na fila são descartados)."""
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks and self._loop is asyncio.get_running_loop():
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._loop = None
@@ -1,103 +1,389 @@
 #backend/services/xai.py
 
+import asyncio
+import hashlib
 import json
-import subprocess
-from typing import Dict, Any
+import math
+import os
+from typing import Any, AsyncIterator, Dict, Optional
+import httpx
+from .explanation_cache import EXPLANATION_CACHE, EXPLANATION_CACHE_ENABLED, from_template, to_template
+from .llm_queue import LLM_QUEUE, LLM_WORKERS
+from .reputation import NOT_QUERIED_REASONS
+from .metrics import record_cache
+from .tracing import span
 
-MODEL = "mistral"
+MODEL = os.getenv("OLLAMA_MODEL", "mistral")
 
-def _build_prompt(url: str, heuristics: Dict[str, Any], reputation: Dict[str, Any], final_score: float = None) -> str:
+# API HTTP local do Ollama (`ollama serve`)
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
-    heur_score = heuristics.get("score", 0.0)
+# Tempo que o modelo fica carregado em memória depois de cada pedido (ex.: "30m", "-1" = sempre)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Máximo de tokens gerados por explicação
+OLLAMA_NUM_PREDICT = int(os.getenv("OLLAMA_NUM_PREDICT", "256"))
+
+# Timeout (segundos) de cada geração
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+
+# Orçamento (tokens estimados) do prompt enviado ao modelo: prompts maiores aumentam o tempo de prefill
+PROMPT_TOKEN_BUDGET = int(os.getenv("CLICKSAFE_PROMPT_TOKEN_BUDGET", "350"))
+_CHARS_PER_TOKEN = 3.5
+
+# Nomes curtos das fontes no prompt e ordem das severidades (mais graves primeiro)
+_SOURCE_LABELS = {
+    "GOOGLE_SAFE_BROWSING": "Google Safe Browsing",
+    "VIRUSTOTAL": "VirusTotal",
+    "LOCAL_BLOCKLIST": "Blocklist local",
+    "APIVOID": "APIVoid",
+}
+_SEVERITY_ORDER = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
+
+def _risk_classification(final_score: float = None) -> str:
+    """Classificação de risco baseada no score final (0-49 SEGURO, 50-79 SUSPEITO, 80-100 MALICIOSO)."""
+    if final_score is None:
+        return "INDETERMINADO"
+    if final_score >= 80:
+        return "MALICIOSO"
+    if final_score >= 50:
+        return "SUSPEITO"
+    return "SEGURO"
+
+
+def _format_score(final_score: float = None) -> str:
+    return f"{final_score:.2f}" if final_score is not None else "N/A"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimativa do número de tokens de um texto (~3.5 caracteres por token,
+    típico de tokenizadores BPE/SentencePiece como o do Mistral em português).
+    """
+    return int(math.ceil(len(text) / _CHARS_PER_TOKEN)) if text else 0
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+
+def _summarize_source(name: str, result: Dict[str, Any]) -> str:
+    """Resumo de uma linha de uma fonte de reputação (sem o payload bruto)."""
+    status = result.get("status", "UNKNOWN")
+    reason = result.get("reason", "ok")
+    line = f"{_SOURCE_LABELS.get(name, name)}: {status}"
+    stats = (result.get("raw") or {}).get("stats") or {}
+    detections = {k: stats[k] for k in ("malicious", "suspicious") if stats.get(k)}
+    if detections:
+        line += " (" + ", ".join(f"{k} {v}" for k, v in detections.items()) + ")"
+    elif reason and reason != "ok":
+        line += f" ({reason.split(':', 1)[0]})"
+    return line
+
+
+def _heuristic_description(hit: Dict[str, Any]) -> str:
+    # "Domínio registado recentemente: detectado" -> "Domínio registado recentemente"
+    details = (hit.get("details") or "").rsplit(": detectado", 1)[0]
+    return _truncate(details, 80)
+
+
+def _build_prompt(url: str, heuristics: Dict[str, Any], reputation: Dict[str, Any], final_score: float = None,
+                  token_budget: int = None) -> str:
+    """
+    Prompt compacto e estruturado para o modelo, dentro de `token_budget` tokens
+    (estimados com `estimate_tokens`; padrão PROMPT_TOKEN_BUDGET).
+
+    Em vez dos dicionários brutos das fontes, cada fonte e cada heurística
+    acionada ocupa uma linha. Se o prompt passar o orçamento, corta por esta
+    ordem: descrições das heurísticas, heurísticas menos graves, fontes não
+    consultadas e, por fim, encurta a URL.
+    """
+    token_budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    risk_classification = _risk_classification(final_score)
+    final_score_str = _format_score(final_score)
     hits = heuristics.get("hits", [])
-    rep_score = reputation.get("_score", 0.0)
-    final_status = reputation.get("final_status", "UNKNOWN")
     sources = reputation.get("sources", {})
 
-    # Determina classificação baseada no score final
-    if final_score is not None:
-        if final_score >= 80:
-            risk_classification = "MALICIOSO"
-        elif final_score >= 50:
-            risk_classification = "SUSPEITO"
-        else:
-            risk_classification = "SEGURO"
-        final_score_str = f"{final_score:.2f}"
-    else:
-        risk_classification = "INDETERMINADO"
-        final_score_str = "N/A"
-
-    # Conta heurísticas acionadas por severidade
-    triggered_by_severity = {"LOW": 0, "MEDIUM": 0, "HIGH": 0, "CRITICAL": 0}
-    triggered_hits = []
-    for hit in hits:
-        if hit.get("triggered", False):
-            severity = hit.get("severity", "MEDIUM")
-            triggered_by_severity[severity] = triggered_by_severity.get(severity, 0) + 1
-            triggered_hits.append({
-                "code": hit.get("code"),
-                "severity": severity,
-                "details": hit.get("details", "")
-            })
-
-    # Resumo das fontes de reputação
-    gsb = sources.get("GOOGLE_SAFE_BROWSING", {})
-    vt = sources.get("VIRUSTOTAL", {})
-    gsb_status = gsb.get("status", "UNKNOWN")
-    vt_status = vt.get("status", "UNKNOWN")
-
-    return f"""
-És um assistente de cibersegurança. Gera um resumo curto e objetivo para o utilizador final.
-
-URL analisada: {url}
-
-[Score Final de Risco]
-- Score: {final_score_str}/100
-- Classificação: {risk_classification}
-- Interpretação: 0-49=SEGURO, 50-79=SUSPEITO, 80-100=MALICIOSO
-
-[Reputação]
-[Reputaçao]
-- Score (0-100): {rep_score:.2f}/100
-- Estado geral: {final_status}  
-- Fontes:
-  - Google Safe Browsing: {sources.get("GOOGLE_SAFE_BROWSING",{})}
-  - VirusTotal: {sources.get("VIRUSTOTAL",{})}
-  - APIVOID: (desabilitado temporariamente)
-
-[Heurísticas]
-- Score (0-100): {heur_score:.2f}/100
-- Heurísticas acionadas: {len(triggered_hits)} de {len(hits)} total
-- Por severidade: LOW={triggered_by_severity['LOW']}, MEDIUM={triggered_by_severity['MEDIUM']}, HIGH={triggered_by_severity['HIGH']}, CRITICAL={triggered_by_severity['CRITICAL']}
-- Principais detecções: {', '.join([h['code'] for h in triggered_hits[:5]]) if triggered_hits else 'Nenhuma'}
-
-Instruções de resposta organizada:
-1) Comece com um rótulo de risco: "{risk_classification}" (baseado no score {final_score_str}/100)
-2) Explique em 2-4 frases os motivos principais (cite fontes de reputação e heurísticas mais relevantes)
-3) Termine com uma recomendação prática de forma a conferir clareza e indicações sobre o que fazer (ex.: "evitar clicar", "verificar remetente", etc.).
-Evite conceitos muito técnicos de forma excessiva e não inventes dados não fornecidos.
-    """.strip()
+    triggered = sorted(
+        (hit for hit in hits if hit.get("triggered", False)),
+        key=lambda hit: _SEVERITY_ORDER.get(hit.get("severity", "MEDIUM"), 2)
+    )
+    queried = [(name, result) for name, result in sources.items()
+               if result.get("reason") not in NOT_QUERIED_REASONS]
+    not_queried = [name for name, result in sources.items()
+                   if result.get("reason") in NOT_QUERIED_REASONS]
+
+    def render(url_text: str, max_hits: int, with_details: bool, with_not_queried: bool) -> str:
+        lines = [
+            "És um assistente de cibersegurança. Resume a análise para o utilizador final.",
+            f"URL: {url_text}",
+            f"Risco: {risk_classification} (score {final_score_str}/100; 0-49 SEGURO, 50-79 SUSPEITO, 80-100 MALICIOSO)",
+            f"Reputação: {reputation.get('_score', 0.0) * 100:.0f}/100, estado {reputation.get('final_status', 'UNKNOWN')}",
+        ]
+        lines += [f"- {_summarize_source(name, result)}" for name, result in queried]
+        if with_not_queried and not_queried:
+            lines.append(f"- Não consultadas: {', '.join(_SOURCE_LABELS.get(n, n) for n in not_queried)}")
+        lines.append(
+            f"Heurísticas: {heuristics.get('score', 0.0):.0f}/100, {len(triggered)} de {len(hits)} acionadas"
+        )
+        for hit in triggered[:max_hits]:
+            line = f"- {hit.get('code')} ({hit.get('severity', 'MEDIUM')})"
+            description = _heuristic_description(hit) if with_details else ""
+            lines.append(f"{line}: {description}" if description else line)
+        if len(triggered) > max_hits:
+            lines.append(f"- (+{len(triggered) - max_hits} menos graves)")
+        lines.append(
+            f'Responde: 1) rótulo "{risk_classification}"; 2) 2-4 frases com os motivos principais '
+            f"(fontes e heurísticas acima); 3) uma recomendação prática (ex.: evitar clicar, verificar remetente). "
+            f"Linguagem simples, sem inventar dados."
+        )
+        return "\n".join(lines)
+
+    # Do prompt mais completo para o mais curto, até caber no orçamento
+    attempts = [(url, len(triggered), True, True), (url, len(triggered), False, True)]
+    attempts += [(url, n, False, True) for n in (8, 5, 3, 1) if n < len(triggered)]
+    attempts += [(url, min(len(triggered), 1), False, False),
+                 (_truncate(url, 120), min(len(triggered), 1), False, False)]
+    for args in attempts:
+        prompt = render(*args)
+        if estimate_tokens(prompt) <= token_budget:
+            return prompt
+    return prompt
 
 
 # Exportar build_prompt como função pública para uso em app.py
-def build_prompt(url: str, heuristics: Dict[str, Any], reputation: Dict[str, Any], final_score: float = None) -> str:
+def build_prompt(url: str, heuristics: Dict[str, Any], reputation: Dict[str, Any], final_score: float = None,
+                 token_budget: int = None) -> str:
     """Função pública para construir o prompt."""
-    return _build_prompt(url, heuristics, reputation, final_score)
+    return _build_prompt(url, heuristics, reputation, final_score, token_budget)
+
+
+class OllamaClient(object):
+    """
+    Cliente assíncrono da API HTTP do Ollama (POST /api/generate).
+
+    Mantém uma ligação HTTP persistente (keep-alive) e pede ao Ollama para
+    manter o modelo carregado (`keep_alive`), evitando arrancar um processo
+    `ollama run` e recarregar o modelo a cada explicação. O cliente não limita
+    as gerações em simultâneo: esse limite é o da fila `LLM_QUEUE`
+    (`CLICKSAFE_LLM_WORKERS`), e `max_connections` só dimensiona o pool HTTP.
+
+    `base_url` pode apontar para qualquer servidor compatível (ex.: um
+    servidor local de testes) e `transport` permite injetar um transporte httpx.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL,
+                 model: str = MODEL,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE,
+                 num_predict: int = OLLAMA_NUM_PREDICT,
+                 timeout: float = OLLAMA_TIMEOUT,
+                 max_connections: int = LLM_WORKERS,
+                 options: Optional[Dict[str, Any]] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.num_predict = num_predict
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.options = options or {}
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
 
+    def _ensure_client(self) -> httpx.AsyncClient:
+        # O cliente pertence ao event loop onde foi criado
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                transport=self._transport,
+            )
+            self._loop = loop
+        return self._client
 
-def explain_result(url: str, heuristics: Dict, reputation: Dict, final_score: float = None) -> str:
+    async def generate(self, prompt: str, **options) -> str:
+        """
+        Gera a resposta do modelo para `prompt` (sem streaming).
+        `options` acrescenta/substitui opções de geração (ex.: temperature, num_predict).
+        """
+        client = self._ensure_client()
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"num_predict": self.num_predict, **self.options, **options},
+        }
+        try:
+            response = await client.post("/api/generate", json=payload)
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"ollama erro: {type(e).__name__}: {e}") from e
+
+        if response.status_code != 200:
+            raise RuntimeError(f"ollama erro: HTTP {response.status_code}: {response.text.strip()}")
+
+        try:
+            data = response.json()
+        except json.JSONDecodeError as e:
+            raise RuntimeError(f"ollama erro: resposta inválida: {e}") from e
+        if data.get("error"):
+            raise RuntimeError(f"ollama erro: {data['error']}")
+        return (data.get("response") or "").strip()
+
+    async def generate_stream(self, prompt: str, **options) -> AsyncIterator[str]:
+        """
+        Gera a resposta do modelo em streaming, devolvendo os tokens à medida
+        que o Ollama os produz.
+        """
+        client = self._ensure_client()
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": {"num_predict": self.num_predict, **self.options, **options},
+        }
+        try:
+            async with client.stream("POST", "/api/generate", json=payload) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    raise RuntimeError(f"ollama erro: HTTP {response.status_code}: {body.strip()}")
+
+                # Uma linha JSON por chunk: {"response": "...", "done": false}
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise RuntimeError(f"ollama erro: resposta inválida: {e}") from e
+                    if data.get("error"):
+                        raise RuntimeError(f"ollama erro: {data['error']}")
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"ollama erro: {type(e).__name__}: {e}") from e
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+# Cliente partilhado por todas as explicações
+_client = OllamaClient()
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Métricas do modelo: fila limitada (profundidade, espera, fallbacks) e cache de explicações."""
+    return {
+        "model": MODEL,
+        "queue": LLM_QUEUE.snapshot(),
+        "explanation_cache": EXPLANATION_CACHE.stats(),
+    }
+
+
+def get_ollama_client() -> OllamaClient:
+    return _client
+
+
+async def close_ollama_client() -> None:
+    """Fecha a ligação ao Ollama (chamado no shutdown dos servidores)."""
+    await _client.aclose()
+
+
+def verdict_signature(heuristics: Dict, reputation: Dict, final_score: float = None, model: str = MODEL) -> str:
+    """
+    Assinatura canónica do veredito (sem a URL), usada como chave do cache de explicações.
+
+    Inclui apenas o que determina a explicação: classificação de risco, estado
+    geral da reputação, fontes que sinalizaram a URL e heurísticas acionadas
+    (com severidade), além do modelo. Veredictos iguais têm a mesma assinatura.
+    """
+    sources = reputation.get("sources", {})
+    canonical = {
+        "model": model,
+        "risk": _risk_classification(final_score),
+        "final_status": reputation.get("final_status", "UNKNOWN"),
+        "positive_sources": sorted(
+            name for name, result in sources.items() if result.get("status") == "POSITIVE"
+        ),
+        "triggered": sorted(
+            f"{hit.get('code')}:{hit.get('severity', 'MEDIUM')}"
+            for hit in heuristics.get("hits", []) if hit.get("triggered", False)
+        ),
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+async def explain_result(url: str, heuristics: Dict, reputation: Dict, final_score: float = None,
+                         use_cache: bool = EXPLANATION_CACHE_ENABLED) -> str:
+    """
+    Gera a explicação da análise com o modelo.
+
+    Com `use_cache`, veredictos com a mesma assinatura (ver `verdict_signature`)
+    reutilizam a explicação já gerada, preenchendo a URL e o score atuais no
+    template, sem chamar o modelo.
     
+    As chamadas ao modelo passam pela fila limitada `LLM_QUEUE`: se estiver
+    cheia ou a espera passar o limite, lança `LLMUnavailable` logo.
+    """
+    score_str = _format_score(final_score)
+    signature = verdict_signature(heuristics, reputation, final_score) if use_cache else None
+    if signature:
+        with span("explanation.cache") as cache_span:
+            template = await EXPLANATION_CACHE.lookup(signature)
+            cache_span.attrs["hit"] = template is not None
+        record_cache("explanation", template is not None)
+        if template is not None:
+            return from_template(template, url, score_str)
+
     prompt = _build_prompt(url, heuristics, reputation, final_score)
+    # Passa pela fila limitada do modelo (LLMUnavailable se estiver cheia)
+    async with LLM_QUEUE.slot():
+        with span("llm.generate", model=MODEL):
+            explanation = await _client.generate(prompt)
 
-    proc = subprocess.run(
-        ["ollama", "run", MODEL],
-        input=prompt,
-        text=True,
-        capture_output=True,
-        timeout=120
-    )
+    if signature and explanation:
+        await EXPLANATION_CACHE.store(signature, to_template(explanation, url, score_str), MODEL)
+    return explanation
 
-    if proc.returncode != 0:
-        raise RuntimeError(f"ollama erro: {proc.stderr.strip()}")
 
-    return proc.stdout.strip()
+async def explain_result_stream(url: str, heuristics: Dict, reputation: Dict, final_score: float = None,
+                                use_cache: bool = EXPLANATION_CACHE_ENABLED) -> AsyncIterator[str]:
+    """
+    Versão em streaming de `explain_result`: devolve a explicação em pedaços
+    (tokens) à medida que o modelo os gera. Num acerto do cache devolve o
+    texto completo num único pedaço. A explicação completa é guardada no cache no fim.
+    """
+    score_str = _format_score(final_score)
+    signature = verdict_signature(heuristics, reputation, final_score) if use_cache else None
+    if signature:
+        with span("explanation.cache") as cache_span:
+            template = await EXPLANATION_CACHE.lookup(signature)
+            cache_span.attrs["hit"] = template is not None
+        record_cache("explanation", template is not None)
+        if template is not None:
+            yield from_template(template, url, score_str)
+            return
+
+    prompt = _build_prompt(url, heuristics, reputation, final_score)
+    chunks = []
+    async with LLM_QUEUE.slot():
+        with span("llm.generate", model=MODEL, stream=True):
+            async for token in _client.generate_stream(prompt):
+                chunks.append(token)
+                yield token
+
+    explanation = "".join(chunks).strip()
+    if signature and explanation:
+        await EXPLANATION_CACHE.store(signature, to_template(explanation, url, score_str), MODEL)
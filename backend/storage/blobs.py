@@ -0,0 +1,94 @@
+"""
+Armazenamento de blobs endereçados por conteúdo para o ClickSafe.
+
+Prompts de IA e respostas brutas das fontes de reputação são quase sempre
+iguais entre análises; em vez de repetir o texto em cada linha, são gravados
+uma vez na tabela `blobs` (chave = sha256 do texto), comprimidos, e as
+linhas de ai_requests/reputation_checks guardam apenas o hash.
+
+Compressão: zstd se o pacote `zstandard` estiver instalado, senão zlib.
+O codec fica gravado em cada blob, por isso ambos podem coexistir na mesma base.
+"""
+import hashlib
+import os
+import sqlite3
+import zlib
+from typing import Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # dependência opcional
+    zstandard = None
+
+# Liga/desliga a gravação de prompts e respostas brutas em blobs ("0" grava o texto na própria linha)
+BLOB_STORE_ENABLED = os.getenv("CLICKSAFE_BLOB_STORE", "1") != "0"
+
+# Codec para novos blobs: "zstd", "zlib" ou "none" (padrão: zstd se disponível)
+BLOB_CODEC = os.getenv("CLICKSAFE_BLOB_CODEC", "zstd" if zstandard else "zlib")
+BLOB_COMPRESSION_LEVEL = int(os.getenv("CLICKSAFE_BLOB_COMPRESSION_LEVEL", "6"))
+
+# Textos abaixo deste tamanho (bytes) não são comprimidos
+_MIN_COMPRESS_SIZE = 64
+
+
+def blob_hash(text: str) -> str:
+    """Hash (sha256 hex) do texto, usado como chave do blob."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compress(data: bytes, codec: str = BLOB_CODEC) -> Tuple[bytes, str]:
+    """
+    Comprime os bytes com o codec pedido.
+    Retorna (dados, codec efetivo) - "none" se o texto for curto ou a compressão não compensar.
+    """
+    if len(data) < _MIN_COMPRESS_SIZE or codec == "none":
+        return data, "none"
+    if codec == "zstd" and zstandard is not None:
+        packed = zstandard.ZstdCompressor(level=BLOB_COMPRESSION_LEVEL).compress(data)
+    else:
+        codec = "zlib"
+        packed = zlib.compress(data, BLOB_COMPRESSION_LEVEL)
+    if len(packed) >= len(data):
+        return data, "none"
+    return packed, codec
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Descomprime os bytes de um blob gravado com `codec`."""
+    if codec == "none":
+        return data
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("blob comprimido com zstd mas o pacote 'zstandard' não está instalado")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Codec de blob desconhecido: '{codec}'")
+
+
+def put_blob(cursor: sqlite3.Cursor, text: str) -> str:
+    """
+    Grava o texto na tabela blobs (se ainda não existir) usando o cursor da transação atual.
+    retorna o hash do blob
+    """
+    digest = blob_hash(text)
+    cursor.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,))
+    if cursor.fetchone() is None:
+        raw = text.encode("utf-8")
+        data, codec = compress(raw)
+        cursor.execute("""
+            INSERT OR IGNORE INTO blobs (hash, codec, size, stored_size, data)
+            VALUES (?, ?, ?, ?, ?)
+        """, (digest, codec, len(raw), len(data), data))
+    return digest
+
+
+def get_blob(cursor: sqlite3.Cursor, digest: Optional[str]) -> Optional[str]:
+    """Texto de um blob pelo hash, ou None se não existir."""
+    if not digest:
+        return None
+    cursor.execute("SELECT codec, data FROM blobs WHERE hash = ?", (digest,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return decompress(bytes(row[1]), row[0]).decode("utf-8")
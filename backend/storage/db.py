@@ -2,19 +2,29 @@
 Módulo de gerenciamento do banco de dados SQLite para ClickSafe.
 """
 # cursor.lastrowid: retorna o ID gerado automaticamente pelo AUTOINCREMENT após um INSERT (ex: PRIMARY KEY AUTOINCREMENT)
+import json
 import sqlite3
 import os
+import time
 from pathlib import Path
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Sequence, Tuple
 from contextlib import contextmanager
 from datetime import datetime
 from urllib.parse import urlparse
+from .blobs import BLOB_STORE_ENABLED, put_blob, get_blob
 
 
 # Caminho padrão do banco de dados
 DB_PATH = os.getenv('CLICKSAFE_DB_PATH', 'clicksafe.db')
 SCHEMA_PATH = Path(__file__).parent / 'schemas.sql'
 
+# Versão do schema gravada em PRAGMA user_version no fim de init_db()
+# (incrementar quando schemas.sql ou as migrações de init_db mudarem)
+SCHEMA_VERSION = 7
+
+# Máximo de valores por cláusula IN (o SQLite limita os parâmetros por consulta)
+_IN_CHUNK_SIZE = 500
+
 
 def get_db_connection(db_path: str = DB_PATH) -> sqlite3.Connection:
     """
@@ -56,6 +66,7 @@ def init_db(db_path: str = DB_PATH, schema_path: Path = SCHEMA_PATH) -> None:
         schema_sql = f.read()
     
     with get_db(db_path) as conn:
+        previous_version = conn.execute("PRAGMA user_version").fetchone()[0]
         # Check if reputation_checks table exists and needs migration
         cursor = conn.cursor()
         cursor.execute("""
@@ -90,32 +101,164 @@ def init_db(db_path: str = DB_PATH, schema_path: Path = SCHEMA_PATH) -> None:
         # Execute schema (will create all tables)
         conn.executescript(schema_sql)
         
+        # Columns added after the first release (CREATE TABLE IF NOT EXISTS does not add them)
+        _ensure_column(cursor, "analyses", "enrichment_status",
+                       "TEXT NOT NULL DEFAULT 'complete' CHECK (enrichment_status IN ('pending','complete','failed'))")
+        # enrichment_status 'failed' (o CHECK de uma coluna só muda recriando a tabela)
+        _replace_check(conn, "analyses",
+                       "CHECK (enrichment_status IN ('pending','complete'))",
+                       "CHECK (enrichment_status IN ('pending','complete','failed'))")
+        _ensure_column(cursor, "analyses", "explanation_status",
+                       "TEXT NOT NULL DEFAULT 'complete' CHECK (explanation_status IN ('pending','complete'))")
+        _ensure_column(cursor, "analyses", "analysis_level",
+                       "TEXT NOT NULL DEFAULT 'deep' CHECK (analysis_level IN ('quick','standard','deep'))")
+        added_heuristics_only = _ensure_column(
+            cursor, "analyses", "heuristics_only",
+            "INTEGER NOT NULL DEFAULT 0 CHECK (heuristics_only IN (0, 1))")
+        _ensure_column(cursor, "ai_requests", "prompt_hash", "TEXT")
+        _ensure_column(cursor, "heuristics_hits", "elapsed_ms", "REAL")
+        
         # Restore data if it was backed up
         if backup_created:
             cursor.execute("SELECT COUNT(*) FROM reputation_checks_backup")
             backup_count = cursor.fetchone()[0]
             if backup_count > 0:
-                # Only restore if source values are valid
-                cursor.execute("""
+                # Sources are validated by the reputation source registry, not by the schema
+                # (raw_hash only exists in backups taken after the blob store was added)
+                cursor.execute("PRAGMA table_info(reputation_checks_backup)")
+                backup_columns = {row[1] for row in cursor.fetchall()}
+                columns = ["analysis_id", "source", "status", "raw_json", "reason", "elapsed_ms", "checked_at"]
+                if "raw_hash" in backup_columns:
+                    columns.append("raw_hash")
+                column_list = ", ".join(columns)
+                cursor.execute(f"""
                     INSERT INTO reputation_checks 
-                    (analysis_id, source, status, raw_json, reason, elapsed_ms, checked_at)
-                    SELECT analysis_id, source, status, raw_json, reason, elapsed_ms, checked_at
+                    ({column_list})
+                    SELECT {column_list}
                     FROM reputation_checks_backup
-                    WHERE source IN ('VIRUSTOTAL', 'APIVOID', 'GOOGLE_SAFE_BROWSING')
                 """)
+                # Linhas anteriores ao blob store guardavam o resultado padronizado inteiro
+                # ({"status", "reason", "raw", ...}): fica só a resposta da fonte ("raw")
+                cursor.execute("""
+                    UPDATE reputation_checks SET raw_json = json_extract(raw_json, '$.raw')
+                    WHERE raw_hash IS NULL AND json_valid(raw_json)
+                      AND json_type(raw_json, '$.status') = 'text'
+                      AND json_type(raw_json, '$.raw') = 'object'
+                """)
+                _restore_unknown_statuses(cursor)
             cursor.execute("DROP TABLE IF EXISTS reputation_checks_backup")
             conn.commit()
         
+        if added_heuristics_only or 0 < previous_version < 7:
+            # Análises anteriores à regra atual: quick/standard sem consultas de fontes externas
+            # gravadas (só a lista de bloqueio local, ou nenhuma) foram pontuadas só com as heurísticas
+            cursor.execute("""
+                UPDATE analyses SET heuristics_only = 1
+                WHERE analysis_level != 'deep'
+                  AND NOT EXISTS (SELECT 1 FROM reputation_checks rc
+                                  WHERE rc.analysis_id = analyses.id AND rc.source != 'LOCAL_BLOCKLIST')
+            """)
+            conn.commit()
+        
         # Popular tabela heuristics
         if seed_path.exists():
             with open(seed_path, 'r', encoding='utf-8') as f:
                 seed_sql = f.read()
             conn.executescript(seed_sql)
         
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         print(f"Banco de dados inicializado em: {db_path}")
 
+
+def is_db_initialized(db_path: str = DB_PATH) -> bool:
+    """
+    Indica se o banco já foi inicializado com o schema atual (SCHEMA_VERSION),
+    para evitar correr init_db() - que recria reputation_checks - em cada execução.
+    """
+    if not os.path.exists(db_path):
+        return False
+    with get_db(db_path) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION
+
 # Funções auxiliares
 
+def _ensure_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> bool:
+    """
+    Adiciona uma coluna a uma tabela existente se ainda não existir (migração simples).
+    Retorna True se a coluna foi adicionada agora.
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column in {row[1] for row in cursor.fetchall()}:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+
+def _restore_unknown_statuses(cursor: sqlite3.Cursor) -> None:
+    """
+    Migração: até ao SCHEMA_VERSION 6 o UNKNOWN das fontes era gravado como
+    NEGATIVE. Recupera-o nas consultas com reason diferente de 'ok' e nas do
+    VirusTotal com reason 'ok' cuja resposta não tinha análises dos motores.
+    """
+    cursor.execute("""
+        UPDATE reputation_checks SET status = 'UNKNOWN'
+        WHERE status = 'NEGATIVE' AND COALESCE(reason, 'ok') != 'ok'
+    """)
+    cursor.execute("""
+        SELECT id, raw_json, raw_hash FROM reputation_checks
+        WHERE source = 'VIRUSTOTAL' AND status = 'NEGATIVE'
+    """)
+    rows = [dict(row) for row in cursor.fetchall()]
+    _load_blob_column(cursor, rows, "raw_json", "raw_hash")
+    unknown = []
+    for row in rows:
+        try:
+            stats = json.loads(row["raw_json"] or "{}").get("stats") or {}
+        except ValueError:
+            continue
+        # Mesma regra de services/vt: NEGATIVE só com motores que analisaram a URL
+        if not stats.get("total_engines") or not (stats.get("harmless") or stats.get("undetected")):
+            unknown.append((row["id"],))
+    cursor.executemany("UPDATE reputation_checks SET status = 'UNKNOWN' WHERE id = ?", unknown)
+
+
+def _replace_check(conn: sqlite3.Connection, table: str, old_check: str, new_check: str) -> bool:
+    """
+    Troca uma restrição CHECK de uma tabela existente (migração): o SQLite não
+    altera restrições, por isso a tabela é recriada com os mesmos dados, índices
+    e ids (procedimento de ALTER TABLE genérico da documentação do SQLite).
+    Retorna True se a tabela foi recriada agora.
+    """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if row is None or old_check not in row[0]:
+        return False
+    # O nome pode estar gravado com ou sem aspas: a definição começa no primeiro parêntese
+    columns_sql = row[0].replace(old_check, new_check)
+    create_sql = f"CREATE TABLE {table}_new " + columns_sql[columns_sql.index("("):]
+    index_sqls = [r[0] for r in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))]
+    conn.commit()
+    # Com as foreign keys ativas o DROP TABLE apagaria em cascata as linhas que apontam para a tabela
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.execute("BEGIN")
+        conn.execute(create_sql)
+        conn.execute(f"INSERT INTO {table}_new SELECT * FROM {table}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        for index_sql in index_sqls:
+            conn.execute(index_sql)
+        if conn.execute("PRAGMA foreign_key_check").fetchone() is not None:
+            raise sqlite3.IntegrityError(f"foreign keys inválidas ao recriar {table}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    return True
+
+
 def extract_hostname(url: str) -> str:
     """Extrai o hostname de uma URL."""
     try:
@@ -159,10 +302,18 @@ def insert_analysis(
     normalized_url: str,
     score: float,
     explanation: str,
+    enrichment_status: str = 'complete',
+    explanation_status: str = 'complete',
+    analysis_level: str = 'deep',
+    heuristics_only: bool = False,
     db_path: str = DB_PATH
 ) -> int:
     """
     Insere uma nova análise no banco de dados.
+    enrichment_status: 'pending' se ainda houver fontes a terminar em background
+    explanation_status: 'pending' se a explicação ainda estiver a ser gerada em background
+    analysis_level: nível de análise usado ('quick', 'standard' ou 'deep')
+    heuristics_only: o score veio só das heurísticas (nível sem fontes de reputação externas, ver app.uses_heuristics_only)
     Retorna o ID da análise inserida.
     """
     link_id = get_or_create_link(url, normalized_url, db_path)
@@ -170,12 +321,160 @@ def insert_analysis(
     with get_db(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO analyses (link_id, score, explanation, last_analyzed_at)
-            VALUES (?, ?, ?, datetime('now'))
-        """, (link_id, score, explanation))
+            INSERT INTO analyses (link_id, score, explanation, enrichment_status, explanation_status, analysis_level,
+                                  heuristics_only, last_analyzed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        """, (link_id, score, explanation, enrichment_status, explanation_status, analysis_level, int(heuristics_only)))
         return cursor.lastrowid
 
 
+def update_analysis_score(
+    analysis_id: int,
+    score: float,
+    enrichment_status: Optional[str] = None,
+    db_path: str = DB_PATH
+) -> None:
+    """
+    Atualiza o score de uma análise existente (ex.: depois de uma fonte terminar em background).
+    enrichment_status: novo estado ('pending'/'complete'/'failed'), ou None para manter
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE analyses
+            SET score = ?,
+                enrichment_status = COALESCE(?, enrichment_status),
+                last_analyzed_at = datetime('now')
+            WHERE id = ?
+        """, (score, enrichment_status, analysis_id))
+
+
+def update_analysis_scores(scores: Sequence[Any], db_path: str = DB_PATH) -> None:
+    """
+    Atualiza de uma vez os scores de várias análises (ex.: rescoring offline).
+    scores: pares (analysis_id, score); last_analyzed_at não muda (a análise não foi refeita)
+    """
+    with get_db(db_path) as conn:
+        conn.executemany("UPDATE analyses SET score = ? WHERE id = ?",
+                         [(score, analysis_id) for analysis_id, score in scores])
+
+
+def sync_heuristic_hit_severities(db_path: str = DB_PATH) -> int:
+    """
+    Copia a severidade atual de cada heurística (heuristics.default_severity)
+    para os heuristics_hits gravados com outra.
+    retorna o número de hits atualizados
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE heuristics_hits
+            SET severity = h.default_severity
+            FROM heuristics h
+            WHERE h.id = heuristics_hits.heuristic_id
+              AND heuristics_hits.severity != h.default_severity
+        """)
+        return cursor.rowcount
+
+
+def _values_table(name: str, columns: str, mapping: Dict[str, float]) -> Tuple[str, List[Any]]:
+    """CTE `name(columns) AS (VALUES ...)` com os pares de `mapping` (e os parâmetros)."""
+    rows = ", ".join("(?, ?)" for _ in mapping) or "(NULL, NULL)"
+    params = [value for pair in mapping.items() for value in pair]
+    return f"{name}({columns}) AS (VALUES {rows})", params
+
+
+def get_rescoring_inputs(
+    after_id: int,
+    limit: int,
+    severity_points: Dict[str, float],
+    source_weights: Dict[str, float],
+    status_values: Dict[str, float],
+    default_weight: float = 0.5,
+    db_path: str = DB_PATH
+) -> List[Dict[str, Any]]:
+    """
+    Agregados para recalcular o score das próximas `limit` análises completas
+    (id > after_id, por ordem de id), numa só consulta:
+    - heuristic_points: soma dos pontos (`severity_points`) das heurísticas
+      acionadas, com a severidade atual de cada heurística (heuristics.default_severity)
+    - reputation_checks, total_weight, weighted, positive_floor: o consenso
+      ponderado das fontes (ver services.reputation.score_sources), com os pesos
+      `source_weights` (`default_weight` para fontes desconhecidas) e o valor de
+      cada estado em `status_values`
+    retorna uma Lista de dicionários com id, heuristics_only, score e os agregados
+    """
+    points_cte, points_params = _values_table("points", "severity, points", severity_points)
+    weights_cte, weights_params = _values_table("weights", "source, weight", source_weights)
+    statuses_cte, statuses_params = _values_table("statuses", "status, value", status_values)
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            WITH {points_cte}, {weights_cte}, {statuses_cte},
+            batch AS (
+                SELECT id, heuristics_only, score FROM analyses
+                WHERE id > ? AND enrichment_status != 'pending'
+                ORDER BY id
+                LIMIT ?
+            ),
+            -- Intervalo de ids do bloco: os hits e as consultas são lidos pelo índice de analysis_id
+            -- (+triggered: o índice de triggered percorreria os hits acionados de todas as análises)
+            bounds AS (SELECT MAX(id) AS last_id FROM batch),
+            heuristic_scores AS (
+                SELECT hh.analysis_id, SUM(p.points) AS points
+                FROM heuristics_hits hh
+                JOIN heuristics h ON h.id = hh.heuristic_id
+                JOIN points p ON p.severity = h.default_severity
+                WHERE hh.analysis_id > ? AND hh.analysis_id <= (SELECT last_id FROM bounds)
+                  AND +hh.triggered = 1
+                GROUP BY hh.analysis_id
+            ),
+            reputation AS (
+                SELECT rc.analysis_id,
+                       COUNT(*) AS checks,
+                       SUM(COALESCE(w.weight, ?)) AS total_weight,
+                       SUM(COALESCE(w.weight, ?) * s.value) AS weighted,
+                       MAX(CASE WHEN rc.status = 'POSITIVE' THEN COALESCE(w.weight, ?) ELSE 0 END) AS positive_floor
+                FROM reputation_checks rc
+                LEFT JOIN weights w ON w.source = rc.source
+                JOIN statuses s ON s.status = rc.status
+                WHERE rc.analysis_id > ? AND rc.analysis_id <= (SELECT last_id FROM bounds)
+                GROUP BY rc.analysis_id
+            )
+            SELECT b.id, b.heuristics_only, b.score,
+                   COALESCE(hs.points, 0) AS heuristic_points,
+                   COALESCE(r.checks, 0) AS reputation_checks,
+                   COALESCE(r.total_weight, 0) AS total_weight,
+                   COALESCE(r.weighted, 0) AS weighted,
+                   COALESCE(r.positive_floor, 0) AS positive_floor
+            FROM batch b
+            LEFT JOIN heuristic_scores hs ON hs.analysis_id = b.id
+            LEFT JOIN reputation r ON r.analysis_id = b.id
+            ORDER BY b.id
+        """, points_params + weights_params + statuses_params
+             + [after_id, limit, after_id, default_weight, default_weight, default_weight, after_id])
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def update_analysis_explanation(
+    analysis_id: int,
+    explanation: str,
+    explanation_status: str = 'complete',
+    db_path: str = DB_PATH
+) -> None:
+    """
+    Atualiza a explicação de uma análise (ex.: depois de ser gerada em background).
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE analyses
+            SET explanation = ?,
+                explanation_status = ?
+            WHERE id = ?
+        """, (explanation, explanation_status, analysis_id))
+
+
 def insert_reputation_check(
     analysis_id: int,
     source: str,
@@ -187,15 +486,20 @@ def insert_reputation_check(
 ) -> int:
     """
     Insere uma verificação de reputação.
+    Com o blob store ativo, raw_json é gravado (comprimido e sem duplicados) na tabela blobs.
     retorna o ID da verificação inserida.
     """
     with get_db(db_path) as conn:
         cursor = conn.cursor()
+        raw_hash = None
+        if BLOB_STORE_ENABLED:
+            raw_hash = put_blob(cursor, raw_json)
+            raw_json = ''
         cursor.execute("""
             INSERT INTO reputation_checks 
-            (analysis_id, source, status, raw_json, reason, elapsed_ms)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (analysis_id, source, status, raw_json, reason, elapsed_ms))
+            (analysis_id, source, status, raw_json, raw_hash, reason, elapsed_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (analysis_id, source, status, raw_json, raw_hash, reason, elapsed_ms))
         return cursor.lastrowid
 
 
@@ -205,10 +509,12 @@ def insert_heuristic_hit(
     severity: str,
     triggered: bool,
     details: Optional[str] = None,
+    elapsed_ms: Optional[float] = None,
     db_path: str = DB_PATH
 ) -> int:
     """
     Insere um resultado de heurística.
+    elapsed_ms: duração da verificação (opcional)
     retorna o ID do resultado inserido
     """
     with get_db(db_path) as conn:
@@ -225,9 +531,9 @@ def insert_heuristic_hit(
         
         cursor.execute("""
             INSERT OR REPLACE INTO heuristics_hits 
-            (analysis_id, heuristic_id, severity, triggered, details)
-            VALUES (?, ?, ?, ?, ?)
-        """, (analysis_id, heuristic_id, severity, triggered_int, details))
+            (analysis_id, heuristic_id, severity, triggered, details, elapsed_ms)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (analysis_id, heuristic_id, severity, triggered_int, details, elapsed_ms))
         return cursor.lastrowid
 
 
@@ -242,15 +548,20 @@ def insert_ai_request(
 ) -> int:
     """
     Insere uma requisição de IA.
+    Com o blob store ativo, o prompt é gravado (comprimido e sem duplicados) na tabela blobs.
     retorna o ID da requisição inserida
     """
     with get_db(db_path) as conn:
         cursor = conn.cursor()
+        prompt_hash = None
+        if BLOB_STORE_ENABLED:
+            prompt_hash = put_blob(cursor, prompt)
+            prompt = ''
         cursor.execute("""
             INSERT INTO ai_requests 
-            (analysis_id, model, prompt, response, risk_score, meta)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (analysis_id, model, prompt, response, risk_score, meta))
+            (analysis_id, model, prompt, prompt_hash, response, risk_score, meta)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (analysis_id, model, prompt, prompt_hash, response, risk_score, meta))
         return cursor.lastrowid
 
 
@@ -273,28 +584,135 @@ def get_analysis_by_id(analysis_id: int, db_path: str = DB_PATH) -> Optional[Dic
         return dict(row) if row else None
 
 
-def get_analysis_by_url(normalized_url: str, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+def get_analysis_status(analysis_id: int, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Busca apenas o estado de uma análise (consulta leve para polling).
+    retorna o dicionário com id, score, enrichment_status, explanation_status e last_analyzed_at, ou None se não encontrado
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, score, enrichment_status, explanation_status, last_analyzed_at
+            FROM analyses
+            WHERE id = ?
+        """, (analysis_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+def get_analysis_explanation(analysis_id: int, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Busca apenas a explicação de uma análise (consulta leve para long-polling).
+    retorna o dicionário com id, explanation e explanation_status, ou None se não encontrado
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, explanation, explanation_status
+            FROM analyses
+            WHERE id = ?
+        """, (analysis_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+def get_stale_pending_explanations(older_than_seconds: float, db_path: str = DB_PATH) -> List[int]:
+    """
+    Busca as análises com a explicação pendente há mais de `older_than_seconds`
+    (desde a última atualização da análise).
+    retorna a Lista de IDs
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id FROM analyses
+            WHERE explanation_status = 'pending'
+              AND last_analyzed_at <= datetime('now', ?)
+            ORDER BY id
+        """, (f"-{float(older_than_seconds)} seconds",))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_analysis_by_url(
+    normalized_url: str,
+    analysis_levels: Optional[Sequence[str]] = None,
+    db_path: str = DB_PATH
+) -> Optional[Dict[str, Any]]:
     """
     Busca a análise mais recente de uma URL normalizada.
+    analysis_levels: se indicado, só considera análises feitas com um destes níveis
     retorna o Dicionário com os dados da análise e do link, ou None se não encontrado
     """
+    level_filter = ""
+    params: List[Any] = [normalized_url]
+    if analysis_levels is not None:
+        level_filter = f"AND a.analysis_level IN ({', '.join('?' for _ in analysis_levels)})"
+        params.extend(analysis_levels)
     with get_db(db_path) as conn:
         cursor = conn.cursor()
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT a.*, l.url, l.url_normalized, l.hostname
             FROM analyses a
             JOIN links l ON a.link_id = l.id
-            WHERE l.url_normalized = ? 
-            ORDER BY a.created_at DESC 
+            WHERE l.url_normalized = ? {level_filter}
+            ORDER BY a.created_at DESC, a.id DESC
             LIMIT 1
-        """, (normalized_url,))
+        """, params)
         row = cursor.fetchone()
         return dict(row) if row else None
 
 
-def get_reputation_checks(analysis_id: int, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+def get_latest_analyses_by_urls(
+    normalized_urls: Sequence[str],
+    analysis_levels: Optional[Sequence[str]] = None,
+    db_path: str = DB_PATH
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Busca de uma só vez a análise mais recente de cada URL normalizada (para lotes).
+    As URLs são consultadas em blocos de _IN_CHUNK_SIZE (limite de parâmetros do SQLite).
+    analysis_levels: se indicado, só considera análises feitas com um destes níveis
+    retorna um dicionário {url_normalized: análise} só com as URLs que já têm análise
+    """
+    level_filter = ""
+    level_params: List[Any] = []
+    if analysis_levels is not None:
+        level_filter = f"AND a.analysis_level IN ({', '.join('?' for _ in analysis_levels)})"
+        level_params = list(analysis_levels)
+    
+    results = {}
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(normalized_urls), _IN_CHUNK_SIZE):
+            chunk = list(normalized_urls[start:start + _IN_CHUNK_SIZE])
+            cursor.execute(f"""
+                SELECT a.*, l.url, l.url_normalized, l.hostname
+                FROM analyses a
+                JOIN links l ON a.link_id = l.id
+                WHERE l.url_normalized IN ({', '.join('?' for _ in chunk)}) {level_filter}
+                ORDER BY a.created_at, a.id
+            """, chunk + level_params)
+            # A mais recente de cada URL fica por último
+            for row in cursor.fetchall():
+                results[row["url_normalized"]] = dict(row)
+    return results
+
+
+def _load_blob_column(cursor: sqlite3.Cursor, rows: List[Dict[str, Any]], column: str, hash_column: str) -> None:
+    """Preenche `column` com o texto do blob referenciado em `hash_column` (linhas antigas já têm o texto)."""
+    for row in rows:
+        if row.get(hash_column) and not row.get(column):
+            row[column] = get_blob(cursor, row[hash_column])
+
+
+def get_reputation_checks(
+    analysis_id: int,
+    include_raw: bool = False,
+    db_path: str = DB_PATH
+) -> List[Dict[str, Any]]:
     """
     Busca todas as verificações de reputação de uma análise.
+    include_raw: se True, descomprime a resposta integral da fonte para raw_json
+                 (se False, raw_json pode vir vazio e fica apenas raw_hash)
     retorna uma Lista de dicionários com os dados das verificações
     """
     with get_db(db_path) as conn:
@@ -304,9 +722,110 @@ def get_reputation_checks(analysis_id: int, db_path: str = DB_PATH) -> List[Dict
             WHERE analysis_id = ?
             ORDER BY checked_at
         """, (analysis_id,))
+        checks = [dict(row) for row in cursor.fetchall()]
+        if include_raw:
+            _load_blob_column(cursor, checks, "raw_json", "raw_hash")
+        return checks
+
+
+def get_reputation_history(limit_per_source: int = 500, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """
+    Busca as verificações de reputação mais recentes de cada fonte (no máximo
+    `limit_per_source` por fonte), da mais antiga para a mais recente.
+    retorna uma Lista de dicionários com source, status, reason e elapsed_ms
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT source, status, reason, elapsed_ms FROM (
+                SELECT source, status, reason, elapsed_ms, checked_at, id,
+                       ROW_NUMBER() OVER (PARTITION BY source ORDER BY checked_at DESC, id DESC) AS rn
+                FROM reputation_checks
+            )
+            WHERE rn <= ?
+            ORDER BY checked_at, id
+        """, (limit_per_source,))
         return [dict(row) for row in cursor.fetchall()]
 
 
+def get_reputation_payloads(sources: Sequence[str], db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """
+    Busca as respostas integrais das consultas bem-sucedidas (reason 'ok') das
+    fontes indicadas, da mais antiga para a mais recente.
+    retorna uma Lista de dicionários com url_normalized, source, status, raw_json e elapsed_ms
+    """
+    if not sources:
+        return []
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT l.url_normalized, rc.source, rc.status, rc.raw_json, rc.raw_hash, rc.elapsed_ms
+            FROM reputation_checks rc
+            JOIN analyses a ON rc.analysis_id = a.id
+            JOIN links l ON a.link_id = l.id
+            WHERE rc.source IN ({', '.join('?' for _ in sources)}) AND rc.reason = 'ok'
+            ORDER BY rc.checked_at, rc.id
+        """, list(sources))
+        rows = [dict(row) for row in cursor.fetchall()]
+        _load_blob_column(cursor, rows, "raw_json", "raw_hash")
+        return rows
+
+
+def get_cached_explanation(signature: str, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Busca uma explicação em cache pela assinatura do veredito e marca-a como usada.
+    retorna o dicionário com signature, model, template e hits, ou None se não existir
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT signature, model, template, hits
+            FROM explanation_cache
+            WHERE signature = ?
+        """, (signature,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        cursor.execute("""
+            UPDATE explanation_cache
+            SET hits = hits + 1, last_used_at = datetime('now')
+            WHERE signature = ?
+        """, (signature,))
+        return dict(row)
+
+
+def save_cached_explanation(
+    signature: str,
+    model: str,
+    template: str,
+    max_entries: Optional[int] = None,
+    db_path: str = DB_PATH
+) -> None:
+    """
+    Guarda (ou substitui) uma explicação em cache.
+    max_entries: se indicado, remove as entradas usadas há mais tempo acima deste limite
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO explanation_cache (signature, model, template)
+            VALUES (?, ?, ?)
+            ON CONFLICT(signature) DO UPDATE SET
+                model = excluded.model,
+                template = excluded.template,
+                last_used_at = datetime('now')
+        """, (signature, model, template))
+        if max_entries is not None:
+            cursor.execute("""
+                DELETE FROM explanation_cache
+                WHERE signature NOT IN (
+                    SELECT signature FROM explanation_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT ?
+                )
+            """, (max_entries,))
+
+
 def get_heuristics_hits(analysis_id: int, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
     """
     Busca todos os resultados de heurísticas de uma análise, incluindo informações da heurística.
@@ -329,9 +848,60 @@ def get_heuristics_hits(analysis_id: int, db_path: str = DB_PATH) -> List[Dict[s
         return [dict(row) for row in cursor.fetchall()]
 
 
-def get_ai_requests(analysis_id: int, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+def insert_analysis_spans(analysis_id: int, spans: Sequence[Dict[str, Any]], db_path: str = DB_PATH) -> None:
+    """
+    Grava a linha temporal de uma análise (spans de services.tracing:
+    id, parent_id, name, start_ms, elapsed_ms, attrs).
+    """
+    if not spans:
+        return
+    with get_db(db_path) as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO analysis_spans
+            (analysis_id, span_id, parent_id, name, start_ms, elapsed_ms, attrs)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (analysis_id, s["id"], s.get("parent_id"), s["name"], s["start_ms"], s["elapsed_ms"],
+             json.dumps(s.get("attrs") or {}, default=str))
+            for s in spans
+        ])
+
+
+def get_analysis_spans(analysis_id: int, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """
+    Busca a linha temporal de uma análise, por ordem de início.
+    retorna uma lista de spans no formato de services.tracing (vazia se a análise não foi medida)
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT span_id, parent_id, name, start_ms, elapsed_ms, attrs
+            FROM analysis_spans
+            WHERE analysis_id = ?
+            ORDER BY start_ms, span_id
+        """, (analysis_id,))
+        return [
+            {
+                "id": row["span_id"],
+                "parent_id": row["parent_id"],
+                "name": row["name"],
+                "start_ms": row["start_ms"],
+                "elapsed_ms": row["elapsed_ms"],
+                "attrs": json.loads(row["attrs"]) if row["attrs"] else {},
+            }
+            for row in cursor.fetchall()
+        ]
+
+
+def get_ai_requests(
+    analysis_id: int,
+    include_prompt: bool = False,
+    db_path: str = DB_PATH
+) -> List[Dict[str, Any]]:
     """
     Busca todas as requisições de IA de uma análise.
+    include_prompt: se True, descomprime o prompt para o campo prompt
+                    (se False, prompt pode vir vazio e fica apenas prompt_hash)
     retorna uma lista de dicionários com os dados das requisições de IA
     """
     with get_db(db_path) as conn:
@@ -341,12 +911,20 @@ def get_ai_requests(analysis_id: int, db_path: str = DB_PATH) -> List[Dict[str,
             WHERE analysis_id = ?
             ORDER BY created_at
         """, (analysis_id,))
-        return [dict(row) for row in cursor.fetchall()]
+        requests = [dict(row) for row in cursor.fetchall()]
+        if include_prompt:
+            _load_blob_column(cursor, requests, "prompt", "prompt_hash")
+        return requests
 
 
-def get_full_analysis(analysis_id: int, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+def get_full_analysis(
+    analysis_id: int,
+    include_payloads: bool = False,
+    db_path: str = DB_PATH
+) -> Optional[Dict[str, Any]]:
     """
     Busca uma análise completa com todas as informações relacionadas.
+    include_payloads: se True, inclui as respostas integrais das fontes e os prompts de IA (descomprimidos dos blobs)
     retorna o Dicionário com análise, link, verificações de reputação, heurísticas e requisições de IA
     """
     analysis = get_analysis_by_id(analysis_id, db_path)
@@ -355,12 +933,193 @@ def get_full_analysis(analysis_id: int, db_path: str = DB_PATH) -> Optional[Dict
     
     return {
         **analysis,
-        'reputation_checks': get_reputation_checks(analysis_id, db_path),
+        'reputation_checks': get_reputation_checks(analysis_id, include_payloads, db_path),
         'heuristics_hits': get_heuristics_hits(analysis_id, db_path),
-        'ai_requests': get_ai_requests(analysis_id, db_path)
+        'ai_requests': get_ai_requests(analysis_id, include_payloads, db_path)
     }
 
 
+# Funções de jobs (fila durável de análises)
+
+def create_job(
+    urls: Sequence[str],
+    analysis_level: str = 'deep',
+    defer_vt: bool = False,
+    db_path: str = DB_PATH
+) -> int:
+    """
+    Cria um job com uma linha em job_items (estado 'queued') por URL.
+    retorna o ID do job
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO jobs (analysis_level, defer_vt, total)
+            VALUES (?, ?, ?)
+        """, (analysis_level, 1 if defer_vt else 0, len(urls)))
+        job_id = cursor.lastrowid
+        cursor.executemany("""
+            INSERT INTO job_items (job_id, position, url)
+            VALUES (?, ?, ?)
+        """, [(job_id, position, url) for position, url in enumerate(urls)])
+        return job_id
+
+
+def claim_job_items(
+    worker_id: str,
+    limit: int = 1,
+    lease_seconds: float = 60.0,
+    max_attempts: int = 3,
+    db_path: str = DB_PATH
+) -> List[Dict[str, Any]]:
+    """
+    Reclama até `limit` itens para o worker, com um lease de `lease_seconds`.
+    São reclamados os itens em fila e os 'running' cujo lease expirou (o
+    worker que os tinha morreu); estes últimos passam a 'failed' se já
+    tiverem `max_attempts` tentativas. A transação é IMMEDIATE, por isso dois
+    workers (mesmo em processos diferentes) nunca reclamam o mesmo item.
+    retorna uma lista de dicionários com id, job_id, url, attempts, analysis_level e defer_vt
+    """
+    now = time.time()
+    with get_db(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE job_items
+            SET status = 'failed',
+                error = COALESCE(error, 'lease expirado'),
+                lease_owner = NULL,
+                lease_expires_at = NULL,
+                finished_at = datetime('now')
+            WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?
+        """, (now, max_attempts))
+        cursor.execute("""
+            SELECT id FROM job_items
+            WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?)
+            ORDER BY job_id, position
+            LIMIT ?
+        """, (now, limit))
+        item_ids = [row[0] for row in cursor.fetchall()]
+        if not item_ids:
+            return []
+        
+        placeholders = ', '.join('?' for _ in item_ids)
+        cursor.execute(f"""
+            UPDATE job_items
+            SET status = 'running',
+                lease_owner = ?,
+                lease_expires_at = ?,
+                attempts = attempts + 1,
+                started_at = COALESCE(started_at, datetime('now'))
+            WHERE id IN ({placeholders})
+        """, [worker_id, now + lease_seconds] + item_ids)
+        cursor.execute(f"""
+            SELECT ji.id, ji.job_id, ji.url, ji.attempts, j.analysis_level, j.defer_vt
+            FROM job_items ji
+            JOIN jobs j ON ji.job_id = j.id
+            WHERE ji.id IN ({placeholders})
+            ORDER BY ji.job_id, ji.position
+        """, item_ids)
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def renew_job_leases(
+    worker_id: str,
+    item_ids: Sequence[int],
+    lease_seconds: float = 60.0,
+    db_path: str = DB_PATH
+) -> None:
+    """Prolonga o lease dos itens que o worker ainda está a processar (heartbeat)."""
+    if not item_ids:
+        return
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE job_items
+            SET lease_expires_at = ?
+            WHERE id IN ({', '.join('?' for _ in item_ids)})
+              AND lease_owner = ? AND status = 'running'
+        """, [time.time() + lease_seconds] + list(item_ids) + [worker_id])
+
+
+def finish_job_item(
+    item_id: int,
+    worker_id: str,
+    analysis_id: Optional[int] = None,
+    error: Optional[str] = None,
+    retry: bool = False,
+    db_path: str = DB_PATH
+) -> bool:
+    """
+    Termina um item reclamado pelo worker: 'complete' com o analysis_id, ou
+    em caso de erro volta à fila (`retry=True`) ou fica 'failed'.
+    retorna False se o worker já não tinha o lease (o item foi reclamado por outro)
+    """
+    if error is None:
+        status = 'complete'
+    else:
+        status = 'queued' if retry else 'failed'
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE job_items
+            SET status = ?,
+                analysis_id = COALESCE(?, analysis_id),
+                error = ?,
+                lease_owner = NULL,
+                lease_expires_at = NULL,
+                finished_at = CASE WHEN ? = 'queued' THEN NULL ELSE datetime('now') END
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+        """, (status, analysis_id, error, status, item_id, worker_id))
+        return cursor.rowcount == 1
+
+
+def get_job(job_id: int, include_items: bool = True, db_path: str = DB_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Busca um job com o progresso (itens por estado) e, se pedido, os itens
+    com o score da análise de cada URL.
+    status do job: 'queued' (nenhum item começou), 'running' ou 'complete' (todos terminaram, com ou sem erro)
+    retorna o dicionário do job, ou None se não existir
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['defer_vt'] = bool(job['defer_vt'])
+        
+        cursor.execute("""
+            SELECT status, COUNT(*) FROM job_items
+            WHERE job_id = ?
+            GROUP BY status
+        """, (job_id,))
+        progress = {'queued': 0, 'running': 0, 'complete': 0, 'failed': 0}
+        progress.update({status: count for status, count in cursor.fetchall()})
+        job['progress'] = progress
+        
+        done = progress['complete'] + progress['failed']
+        if done == job['total']:
+            job['status'] = 'complete'
+        elif done or progress['running']:
+            job['status'] = 'running'
+        else:
+            job['status'] = 'queued'
+        
+        if include_items:
+            cursor.execute("""
+                SELECT ji.position, ji.url, ji.status, ji.analysis_id, ji.error, ji.attempts,
+                       ji.started_at, ji.finished_at, a.score
+                FROM job_items ji
+                LEFT JOIN analyses a ON ji.analysis_id = a.id
+                WHERE ji.job_id = ?
+                ORDER BY ji.position
+            """, (job_id,))
+            job['items'] = [dict(item) for item in cursor.fetchall()]
+        return job
+
+
 # Funções de estatísticas
 
 def get_analyses_stats(db_path: str = DB_PATH) -> Dict[str, Any]:
@@ -397,9 +1156,35 @@ def get_analyses_stats(db_path: str = DB_PATH) -> Dict[str, Any]:
         cursor.execute("SELECT COUNT(*) FROM ai_requests")
         stats['total_ai_requests'] = cursor.fetchone()[0]
         
+        # Blobs (prompts e respostas brutas): quantidade, tamanho original e gravado
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs")
+        count, size, stored_size = cursor.fetchone()
+        stats['blobs'] = {
+            'count': count,
+            'size_bytes': size,
+            'stored_bytes': stored_size,
+            'compression_ratio': round(size / stored_size, 2) if stored_size else 0.0
+        }
+        
         return stats
 
 
+def prune_orphan_blobs(db_path: str = DB_PATH) -> int:
+    """
+    Remove os blobs que já não são referenciados por nenhuma linha de
+    reputation_checks ou ai_requests (ex.: depois de apagar análises).
+    retorna o número de blobs removidos
+    """
+    with get_db(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM blobs
+            WHERE hash NOT IN (SELECT raw_hash FROM reputation_checks WHERE raw_hash IS NOT NULL)
+              AND hash NOT IN (SELECT prompt_hash FROM ai_requests WHERE prompt_hash IS NOT NULL)
+        """)
+        return cursor.rowcount
+
+
 def clear_all_data(db_path: str = DB_PATH) -> None:
     """
     Limpa todos os dados das tabelas (exceto heuristics que são de referência).
@@ -412,14 +1197,19 @@ def clear_all_data(db_path: str = DB_PATH) -> None:
         
         # Ordem importante devido às foreign keys
         # Primeiro apaga dados dependentes
+        cursor.execute("DELETE FROM job_items")
+        cursor.execute("DELETE FROM jobs")
+        cursor.execute("DELETE FROM analysis_spans")
         cursor.execute("DELETE FROM ai_requests")
         cursor.execute("DELETE FROM heuristics_hits")
         cursor.execute("DELETE FROM reputation_checks")
         cursor.execute("DELETE FROM analyses")
         cursor.execute("DELETE FROM links")
+        cursor.execute("DELETE FROM explanation_cache")
+        cursor.execute("DELETE FROM blobs")
         
         # Reseta os contadores AUTOINCREMENT
-        cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('links', 'analyses', 'reputation_checks', 'heuristics_hits', 'ai_requests')")
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name IN ('links', 'analyses', 'reputation_checks', 'heuristics_hits', 'ai_requests', 'analysis_spans', 'jobs', 'job_items')")
         
         print(" Todas as tabelas de dados foram limpas (heuristics mantidas)")
 
@@ -29,6 +29,14 @@ CREATE TABLE IF NOT EXISTS analyses (
   score           REAL    NOT NULL                  -- 0..100 (agregado)
                     CHECK (score >= 0 AND score <= 100),
   explanation     TEXT    NOT NULL,                 -- texto (IA explicativa)
+  enrichment_status TEXT  NOT NULL DEFAULT 'complete' -- 'pending' enquanto houver fontes a terminar em background (ex.: VirusTotal); 'failed' se não terminaram
+                    CHECK (enrichment_status IN ('pending','complete','failed')),
+  explanation_status TEXT NOT NULL DEFAULT 'complete' -- 'pending' enquanto a explicação de IA é gerada em background
+                    CHECK (explanation_status IN ('pending','complete')),
+  analysis_level  TEXT  NOT NULL DEFAULT 'deep'     -- nível de análise: 'quick' (só local), 'standard' (+ reputação e DNS), 'deep' (tudo, incluindo IA)
+                    CHECK (analysis_level IN ('quick','standard','deep')),
+  heuristics_only INTEGER NOT NULL DEFAULT 0        -- 1 = sem fontes de reputação externas planeadas: score só das heurísticas (a lista de bloqueio local só o sobe)
+                    CHECK (heuristics_only IN (0, 1)),
   created_at      DATETIME NOT NULL DEFAULT (datetime('now')),
   last_analyzed_at DATETIME NOT NULL DEFAULT (datetime('now'))
 );
@@ -46,18 +54,19 @@ CREATE TABLE IF NOT EXISTS reputation_checks (
   analysis_id   INTEGER NOT NULL
                   REFERENCES analyses(id) ON DELETE CASCADE,
 
-  source        TEXT    NOT NULL
-                  CHECK (source IN ('VIRUSTOTAL','APIVOID','GOOGLE_SAFE_BROWSING')),
+  source        TEXT    NOT NULL,                  -- nome da fonte no registo (services/sources.py)
 
   status        TEXT    NOT NULL
-                  CHECK (status IN ('POSITIVE','NEGATIVE')),
+                  CHECK (status IN ('POSITIVE','NEGATIVE','UNKNOWN')),
   /* Convenção:
      - POSITIVE  = a fonte sinalizou risco/malicioso
      - NEGATIVE  = a fonte não encontrou problema (limpo)
-     (indisponibilidade/timeout serão sinalizadas em "reason" e não mudam status) */
+     - UNKNOWN   = sem veredito (indisponibilidade/timeout, com a causa em "reason",
+                   ou resposta sem dados suficientes, com reason 'ok') */
 
   reason        TEXT,                              -- ex.: 'timeout', 'no_key', 'rate_limit', 'ok'
-  raw_json      TEXT    NOT NULL,                  -- resposta integral da API (para auditoria)
+  raw_json      TEXT    NOT NULL,                  -- resposta integral da API (campo "raw" do resultado, para auditoria); '' se estiver em blobs
+  raw_hash      TEXT,                              -- hash do blob com a resposta integral (tabela blobs)
   elapsed_ms    INTEGER,                           -- latência daquela consulta
   checked_at    DATETIME NOT NULL DEFAULT (datetime('now')),
 
@@ -66,6 +75,7 @@ CREATE TABLE IF NOT EXISTS reputation_checks (
 
 CREATE INDEX IF NOT EXISTS idx_reputation_checks_analysis ON reputation_checks (analysis_id);
 CREATE INDEX IF NOT EXISTS idx_reputation_checks_source   ON reputation_checks (source);
+CREATE INDEX IF NOT EXISTS idx_reputation_checks_raw_hash ON reputation_checks (raw_hash);
 
 
 /* ======================================
@@ -99,6 +109,7 @@ CREATE TABLE IF NOT EXISTS heuristics_hits (
   triggered     INTEGER NOT NULL DEFAULT 0         -- 0 = não acionada, 1 = acionada
                     CHECK (triggered IN (0, 1)),
   details       TEXT,                               -- valores calculados, exemplos, etc.
+  elapsed_ms    REAL,                               -- duração da verificação (ms)
   created_at    DATETIME NOT NULL DEFAULT (datetime('now')),
 
   UNIQUE (analysis_id, heuristic_id)
@@ -118,7 +129,8 @@ CREATE TABLE IF NOT EXISTS ai_requests (
                   REFERENCES analyses(id) ON DELETE CASCADE,
 
   model         TEXT    NOT NULL,                   -- ex.: 'gpt-4', 'claude-3', etc.
-  prompt        TEXT    NOT NULL,                   -- prompt enviado à IA
+  prompt        TEXT    NOT NULL,                   -- prompt enviado à IA; '' se estiver em blobs
+  prompt_hash   TEXT,                               -- hash do blob com o prompt (tabela blobs)
   response      TEXT    NOT NULL,                   -- resposta da IA
   risk_score    REAL,                               -- score de risco calculado pela IA (0..100)
   meta          TEXT,                               -- metadados adicionais (JSON)
@@ -128,3 +140,87 @@ CREATE TABLE IF NOT EXISTS ai_requests (
 CREATE INDEX IF NOT EXISTS idx_ai_requests_analysis ON ai_requests (analysis_id);
 CREATE INDEX IF NOT EXISTS idx_ai_requests_model    ON ai_requests (model);
 CREATE INDEX IF NOT EXISTS idx_ai_requests_created  ON ai_requests (created_at);
+
+
+/* ======================================
+   7) Cache de explicações de IA
+   ====================================== */
+CREATE TABLE IF NOT EXISTS explanation_cache (
+  signature     TEXT    PRIMARY KEY,                -- hash da assinatura do veredito (sem a URL)
+  model         TEXT    NOT NULL,                   -- modelo que gerou a explicação
+  template      TEXT    NOT NULL,                   -- explicação com a URL/score substituídos por marcadores
+  hits          INTEGER NOT NULL DEFAULT 0,         -- vezes que foi reutilizada
+  created_at    DATETIME NOT NULL DEFAULT (datetime('now')),
+  last_used_at  DATETIME NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_explanation_cache_last_used ON explanation_cache (last_used_at);
+
+
+/* ======================================
+   8) Blobs endereçados por conteúdo
+   ====================================== */
+CREATE TABLE IF NOT EXISTS blobs (
+  hash          TEXT    PRIMARY KEY,                -- sha256 do texto original
+  codec         TEXT    NOT NULL                    -- compressão usada (storage/blobs.py)
+                    CHECK (codec IN ('none','zlib','zstd')),
+  size          INTEGER NOT NULL,                   -- tamanho original (bytes)
+  stored_size   INTEGER NOT NULL,                   -- tamanho gravado (bytes)
+  data          BLOB    NOT NULL,
+  created_at    DATETIME NOT NULL DEFAULT (datetime('now'))
+);
+
+
+/* ======================================
+   9) Jobs de análise (fila durável)
+   ====================================== */
+CREATE TABLE IF NOT EXISTS jobs (
+  id              INTEGER PRIMARY KEY AUTOINCREMENT,
+  analysis_level  TEXT    NOT NULL DEFAULT 'deep'
+                    CHECK (analysis_level IN ('quick','standard','deep')),
+  defer_vt        INTEGER NOT NULL DEFAULT 0        -- 1 = não esperar pelo VirusTotal
+                    CHECK (defer_vt IN (0, 1)),
+  total           INTEGER NOT NULL DEFAULT 0,       -- número de URLs do job
+  created_at      DATETIME NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE TABLE IF NOT EXISTS job_items (
+  id                INTEGER PRIMARY KEY AUTOINCREMENT,
+  job_id            INTEGER NOT NULL
+                      REFERENCES jobs(id) ON DELETE CASCADE,
+  position          INTEGER NOT NULL,               -- ordem da URL no pedido
+  url               TEXT    NOT NULL,
+  status            TEXT    NOT NULL DEFAULT 'queued'
+                      CHECK (status IN ('queued','running','complete','failed')),
+  analysis_id       INTEGER
+                      REFERENCES analyses(id) ON DELETE SET NULL,
+  error             TEXT,
+  attempts          INTEGER NOT NULL DEFAULT 0,     -- vezes que um worker reclamou o item
+  lease_owner       TEXT,                           -- worker que tem o item ('running')
+  lease_expires_at  REAL,                           -- epoch (s); expirado = o worker morreu e o item volta à fila
+  started_at        DATETIME,
+  finished_at       DATETIME
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_items_job    ON job_items (job_id, position);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status, lease_expires_at);
+
+
+/* ======================================
+   10) Linha temporal das análises (tracing)
+   ====================================== */
+CREATE TABLE IF NOT EXISTS analysis_spans (
+  id            INTEGER PRIMARY KEY AUTOINCREMENT,
+  analysis_id   INTEGER NOT NULL
+                  REFERENCES analyses(id) ON DELETE CASCADE,
+  span_id       INTEGER NOT NULL,                   -- id do span dentro da análise (0 = a análise inteira)
+  parent_id     INTEGER,                            -- span pai (NULL no span raiz)
+  name          TEXT    NOT NULL,                   -- ex.: 'reputation.GSB', 'heuristic.DOMAIN_AGE', 'llm.generate'
+  start_ms      REAL    NOT NULL,                   -- início relativo ao início da análise
+  elapsed_ms    REAL    NOT NULL,
+  attrs         TEXT,                               -- atributos (JSON)
+
+  UNIQUE (analysis_id, span_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_spans_analysis ON analysis_spans (analysis_id);
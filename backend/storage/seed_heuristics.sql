@@ -1,7 +1,9 @@
 -- Seed data para a tabela heuristics
 -- Este arquivo popula a tabela com todas as heurísticas disponíveis
+-- Upsert por code: não usa INSERT OR REPLACE, que apagaria as linhas (e, em cascata,
+-- os heuristics_hits gravados) e repunha a default_severity ajustada
 
-INSERT OR REPLACE INTO heuristics (code, name, category, description, default_severity) VALUES
+INSERT INTO heuristics (code, name, category, description, default_severity) VALUES
 -- Domain Heuristics
 ('DOMAIN_AGE', 'Idade do Domínio', 'DOMAIN', 'Verifica se o domínio é muito novo (potencialmente suspeito)', 'MEDIUM'),
 ('DOMAIN_EXPIRATION', 'Expiração do Domínio', 'DOMAIN', 'Verifica se o domínio está próximo do vencimento', 'LOW'),
@@ -37,4 +39,8 @@ INSERT OR REPLACE INTO heuristics (code, name, category, description, default_se
 ('LANGUAGE_MIX', 'Mistura de Idiomas', 'GENERAL', 'Detecta mistura de caracteres de diferentes idiomas', 'LOW'),
 ('EMOJI_OR_SYMBOL_USAGE', 'Uso de Emoji ou Símbolos', 'GENERAL', 'Identifica uso de emojis ou símbolos suspeitos', 'LOW'),
 ('ATTRACTIVE_PHRASES', 'Frases Atrativas', 'GENERAL', 'Detecta uso de frases comuns em phishing', 'MEDIUM'),
-('KEYWORD_REPETITION', 'Repetição de Palavras-chave', 'GENERAL', 'Identifica repetição excessiva de palavras-chave', 'LOW');
+('KEYWORD_REPETITION', 'Repetição de Palavras-chave', 'GENERAL', 'Identifica repetição excessiva de palavras-chave', 'LOW')
+ON CONFLICT(code) DO UPDATE SET
+    name = excluded.name,
+    category = excluded.category,
+    description = excluded.description;
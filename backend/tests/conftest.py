@@ -0,0 +1,36 @@
+"""
+Configuração dos testes (correr a partir de backend/: `python -m pytest -q`).
+
+Os módulos leem CLICKSAFE_DB_PATH ao serem importados: os testes usam um banco
+temporário, nunca o clicksafe.db de desenvolvimento.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_TEST_DIR = tempfile.mkdtemp(prefix="clicksafe-tests-")
+os.environ["CLICKSAFE_DB_PATH"] = os.path.join(_TEST_DIR, "clicksafe.db")
+os.environ.setdefault("CLICKSAFE_JOBS_IN_SERVER", "0")
+os.environ.setdefault("CLICKSAFE_METRICS", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage.db import DB_PATH, init_db
+
+
+@pytest.fixture(scope="session")
+def default_db() -> str:
+    """O banco padrão (DB_PATH) dos testes, inicializado uma vez por sessão."""
+    init_db(DB_PATH)
+    return DB_PATH
+
+
+@pytest.fixture
+def tmp_db(tmp_path) -> str:
+    """Banco novo e inicializado, para as funções que recebem `db_path`."""
+    db_path = str(tmp_path / "test.db")
+    init_db(db_path)
+    return db_path
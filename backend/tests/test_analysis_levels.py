@@ -0,0 +1,40 @@
+import pytest
+
+from app import (HEURISTIC_LEVELS, combine_scores, heuristic_checks, levels_covering, uses_heuristics_only,
+                 validate_analysis_level)
+
+_URL = "https://login-seguro.exemplo.pt/conta/verificar?user=a&redirect=https://x.pt"
+
+
+def _codes(level: str) -> set:
+    return {code for _, code, _, _ in heuristic_checks(_URL, level)}
+
+
+def test_levels_add_network_heuristics_progressively():
+    quick, standard, deep = _codes("quick"), _codes("standard"), _codes("deep")
+    assert quick < standard < deep
+    assert not quick & set(HEURISTIC_LEVELS)
+    assert standard - quick == {"DOMAIN_DNS_ANOMALY"}
+    assert set(HEURISTIC_LEVELS) <= deep
+
+
+def test_levels_covering_and_validation():
+    assert levels_covering("quick") == ("quick", "standard", "deep")
+    assert levels_covering("deep") == ("deep",)
+    assert validate_analysis_level("standard") == "standard"
+    with pytest.raises(ValueError):
+        validate_analysis_level("paranoid")
+
+
+def test_local_blocklist_does_not_change_the_level_rule():
+    # Com ou sem o ficheiro da lista de bloqueio, "quick" pontua só com as heurísticas
+    assert uses_heuristics_only("quick", [])
+    assert uses_heuristics_only("quick", ["LOCAL_BLOCKLIST"])
+    assert uses_heuristics_only("standard", ["LOCAL_BLOCKLIST"])
+    assert not uses_heuristics_only("standard", ["LOCAL_BLOCKLIST", "GOOGLE_SAFE_BROWSING"])
+    assert not uses_heuristics_only("deep", [])
+
+    # A lista de bloqueio só sobe o score: NEGATIVE não o dilui, POSITIVE dá pelo menos o seu peso
+    assert combine_scores(0.0, 40.0, True) == 40.0
+    assert combine_scores(0.0, 40.0, True, positive_floor=90.0) == 90.0
+    assert combine_scores(0.0, 40.0, False) == 12.0
@@ -0,0 +1,44 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import app
+import server
+
+
+def test_batch_endpoint_streams_one_ndjson_line_per_url(monkeypatch):
+    cached = {"id": 1, "url_normalized": "https://guardada.exemplo.pt", "score": 80.0, "analysis_level": "deep",
+              "enrichment_status": "complete", "explanation_status": "complete", "explanation": "já analisada"}
+    analyzed = []
+
+    async def analyze_url(url, defer_vt=False, defer_explanation=False, analysis_level=None):
+        analyzed.append(url)
+        if "falha" in url:
+            raise RuntimeError("fonte indisponível")
+        return {"id": 2, "url_normalized": url, "score": 10.0, "analysis_level": analysis_level,
+                "enrichment_status": "complete", "explanation_status": "complete", "explanation": "nova"}
+
+    monkeypatch.setattr(app, "get_latest_analyses_by_urls",
+                        lambda urls, levels: {u: cached for u in urls if "guardada" in u})
+    monkeypatch.setattr(app, "analyze_url", analyze_url)
+
+    urls = ["https://guardada.exemplo.pt", "https://nova.exemplo.pt", "https://nova.exemplo.pt",
+            "https://falha.exemplo.pt", ""]
+    response = TestClient(server.app).post("/api/analyze/batch", json={"urls": urls, "analysis_level": "quick"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 3  # duplicadas analisadas uma vez, linhas vazias ignoradas
+    assert lines[0]["url"] == "https://guardada.exemplo.pt" and lines[0]["cached"] is True
+    by_url = {line["url"]: line for line in lines}
+    assert by_url["https://nova.exemplo.pt"]["cached"] is False
+    assert by_url["https://nova.exemplo.pt"]["analysis_level"] == "quick"
+    assert by_url["https://falha.exemplo.pt"] == {"url": "https://falha.exemplo.pt", "error": "fonte indisponível"}
+    assert sorted(analyzed) == ["https://falha.exemplo.pt", "https://nova.exemplo.pt"]
+
+
+def test_batch_endpoint_rejects_too_many_urls(monkeypatch):
+    monkeypatch.setattr(server, "BATCH_MAX_URLS", 2)
+    response = TestClient(server.app).post("/api/analyze/batch", json={"urls": ["a.pt", "b.pt", "c.pt"]})
+    assert response.status_code == 413
@@ -0,0 +1,37 @@
+import argparse
+import json
+import time
+
+import httpx
+import pytest
+
+from benchmarks.bench_pipeline import _parse_latency, compare, summarize
+from benchmarks.upstreams import DEFAULT_LATENCY_MS, _gsb_route, run_http_standin
+
+
+def test_summarize_and_compare_flag_regressions(capsys):
+    assert summarize([1.0, 2.0, 3.0])["median"] == 2.0
+    baseline = {"results": {"normalize_url": {"median": 1.0}, "heuristics": {"median": 10.0}}}
+    current = {"results": {"normalize_url": {"median": 1.05}, "heuristics": {"median": 12.0},
+                           "novo": {"median": 3.0}}}
+    assert compare(baseline, current, threshold=0.1) == ["heuristics"]
+    assert "novo" in capsys.readouterr().out
+
+
+def test_parse_latency():
+    assert _parse_latency("5") == {name: 5.0 for name in DEFAULT_LATENCY_MS}
+    assert _parse_latency("gsb=80, vt=300") == {"gsb": 80.0, "vt": 300.0}
+    with pytest.raises(argparse.ArgumentTypeError):
+        _parse_latency("ftp=1")
+
+
+def test_gsb_standin_answers_after_the_configured_latency():
+    def find(base_url, url):
+        body = {"threatInfo": {"threatEntries": [{"url": url}]}}
+        return httpx.post(f"{base_url}/v4/threatMatches:find", content=json.dumps(body)).json()
+
+    with run_http_standin(_gsb_route, latency_ms=50) as base_url:
+        start = time.perf_counter()
+        assert find(base_url, "https://exemplo.pt") == {}
+        assert time.perf_counter() - start >= 0.05
+        assert find(base_url, "https://phishing.exemplo.pt")["matches"][0]["threatType"] == "SOCIAL_ENGINEERING"
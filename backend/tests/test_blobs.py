@@ -0,0 +1,46 @@
+import json
+import sqlite3
+
+from storage.blobs import blob_hash, compress, decompress, get_blob, put_blob
+from storage.db import get_reputation_checks, init_db, insert_analysis
+
+
+def test_put_get_round_trip_and_dedupe(tmp_db):
+    text = '{"matches": []} ' * 200
+    with sqlite3.connect(tmp_db) as conn:
+        cursor = conn.cursor()
+        digest = put_blob(cursor, text)
+        assert put_blob(cursor, text) == digest == blob_hash(text)
+        assert cursor.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 1
+        codec, size, stored_size = cursor.execute(
+            "SELECT codec, size, stored_size FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        assert codec != "none" and size == len(text.encode("utf-8")) and stored_size < size
+        assert get_blob(cursor, digest) == text
+        assert get_blob(cursor, None) is None
+        assert get_blob(cursor, "0" * 64) is None
+
+
+def test_short_text_is_stored_uncompressed():
+    data, codec = compress("curto".encode("utf-8"))
+    assert codec == "none" and decompress(data, codec) == b"curto"
+
+
+def test_zlib_round_trip_with_unicode():
+    raw = ("Análise de reputação — domínio suspeito 🚨 " * 50).encode("utf-8")
+    data, codec = compress(raw, codec="zlib")
+    assert codec == "zlib" and len(data) < len(raw)
+    assert decompress(data, codec) == raw
+
+
+def test_init_db_keeps_only_the_source_payload_in_legacy_rows(tmp_db):
+    legacy = json.dumps({"status": "NEGATIVE", "reason": "ok", "raw": {"matches": []}, "elapsed_ms": 12})
+    analysis_id = insert_analysis(url="https://legado.exemplo.pt", normalized_url="https://legado.exemplo.pt",
+                                  score=0.0, explanation="x", db_path=tmp_db)
+    with sqlite3.connect(tmp_db) as conn:
+        conn.execute("""
+            INSERT INTO reputation_checks (analysis_id, source, status, raw_json, reason, elapsed_ms)
+            VALUES (?, 'GOOGLE_SAFE_BROWSING', 'NEGATIVE', ?, 'ok', 12)
+        """, (analysis_id, legacy))
+    init_db(tmp_db)
+    [check] = get_reputation_checks(analysis_id, include_raw=True, db_path=tmp_db)
+    assert json.loads(check["raw_json"]) == {"matches": []}
@@ -0,0 +1,24 @@
+import asyncio
+import os
+
+from services import blocklist
+
+
+def test_check_blocklist_loads_and_reloads_off_the_event_loop(monkeypatch, tmp_path):
+    path = tmp_path / "blocklist.txt"
+    path.write_text("# phishing conhecido\nmau.exemplo.pt\nhttps://bom.exemplo.pt/login\n", encoding="utf-8")
+    monkeypatch.setattr(blocklist, "BLOCKLIST_PATH", str(path))
+
+    result = asyncio.run(blocklist.check_blocklist("https://a.mau.exemplo.pt/x"))
+    assert (result["status"], result["raw"]["match"]) == ("POSITIVE", "mau.exemplo.pt")
+    assert asyncio.run(blocklist.check_blocklist("https://bom.exemplo.pt/login/"))["status"] == "POSITIVE"
+    assert asyncio.run(blocklist.check_blocklist("https://bom.exemplo.pt"))["status"] == "NEGATIVE"
+
+    # Um ficheiro alterado é recarregado na verificação seguinte
+    path.write_text("bom.exemplo.pt\n", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+    assert asyncio.run(blocklist.check_blocklist("https://bom.exemplo.pt"))["status"] == "POSITIVE"
+
+    monkeypatch.setattr(blocklist, "BLOCKLIST_PATH", str(tmp_path / "missing.txt"))
+    assert asyncio.run(blocklist.check_blocklist("https://mau.exemplo.pt"))["reason"] == "no_list"
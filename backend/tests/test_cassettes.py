@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.cassettes import entries_from_db
+from services.cassettes import CassetteMiss, CassetteStore
+from services.gsb import gsb
+from services.vt import vt
+
+
+def test_record_then_replay_round_trip(tmp_path):
+    path = str(tmp_path / "cassetes.jsonl")
+    recorder = CassetteStore(path, mode="record")
+    assert recorder.call("dns", "exemplo.pt", lambda: ["192.0.2.1"]) == ["192.0.2.1"]
+
+    def whois_down():
+        raise ConnectionError("servidor WHOIS indisponível")
+
+    with pytest.raises(ConnectionError):
+        recorder.call("whois", "exemplo.pt", whois_down)
+
+    def offline():
+        raise AssertionError("o replay não pode chamar o serviço")
+
+    player = CassetteStore(path, mode="replay")
+    assert player.call("dns", "exemplo.pt", offline) == ["192.0.2.1"]
+    with pytest.raises(ConnectionError, match="WHOIS indisponível"):
+        player.call("whois", "exemplo.pt", offline)
+    with pytest.raises(CassetteMiss):
+        player.call("dns", "outro.pt", offline)
+
+
+def test_cassettes_from_db_replay_gsb_and_virustotal(monkeypatch, tmp_path):
+    url = "https://gravada.exemplo.pt"
+    rows = [
+        {"source": "GOOGLE_SAFE_BROWSING", "url_normalized": url, "elapsed_ms": 120,
+         "raw_json": json.dumps({"malicious": True, "threats": ["SOCIAL_ENGINEERING"]})},
+        {"source": "VIRUSTOTAL", "url_normalized": url, "elapsed_ms": 900,
+         "raw_json": json.dumps({"stats": {"malicious": 0, "suspicious": 0, "harmless": 70, "total_engines": 70}})},
+    ]
+    path = str(tmp_path / "cassetes.jsonl")
+    assert CassetteStore(path, mode="record").add_many(entries_from_db(rows)) == 2
+
+    player = CassetteStore(path, mode="replay")
+    monkeypatch.setattr(gsb, "CASSETTES", player)
+    monkeypatch.setattr(vt, "CASSETTES", player)
+    monkeypatch.delenv("GSB_API_KEY", raising=False)
+    monkeypatch.delenv("VT_API_KEY", raising=False)
+
+    gsb_result = asyncio.run(gsb.check_gsb(url))
+    vt_result = asyncio.run(vt.check_vt(url))
+    assert (gsb_result["status"], gsb_result["reason"]) == ("POSITIVE", "ok")
+    assert (vt_result["status"], vt_result["reason"]) == ("NEGATIVE", "ok")
+    # Sem gravação para a URL: erro da fonte, sem ir à rede
+    assert asyncio.run(gsb.check_gsb("https://nova.exemplo.pt"))["status"] == "UNKNOWN"
@@ -0,0 +1,102 @@
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, is_failure
+
+
+def _breaker(**kwargs) -> CircuitBreaker:
+    options = dict(default_timeout=3, min_timeout=0.5, max_timeout=10, window_size=10,
+                   min_calls=4, error_threshold=0.5, cooldown=60)
+    options.update(kwargs)
+    return CircuitBreaker("TEST", **options)
+
+
+def test_opens_when_error_rate_reaches_threshold():
+    breaker = _breaker()
+    for failed in (False, True, False):
+        breaker.record(failed, 100)
+    assert breaker.state == CLOSED  # ainda abaixo de min_calls
+
+    breaker.record(True)
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_half_open_allows_limited_probes_and_closes_on_success():
+    breaker = _breaker(cooldown=0, half_open_max_calls=1)
+    for _ in range(4):
+        breaker.record(True)
+    assert breaker.state == HALF_OPEN
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # só uma chamada de teste de cada vez
+    breaker.record(False, 120)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls"] == 0  # janela limpa depois de recuperar
+
+
+def test_half_open_failure_reopens():
+    breaker = _breaker(cooldown=0)
+    for _ in range(4):
+        breaker.record(True)
+    assert breaker.allow_request()
+    breaker.cooldown = 60
+    breaker.record(True)
+    assert breaker.state == OPEN
+
+
+def test_result_that_does_not_count_releases_probe_slot():
+    breaker = _breaker(cooldown=0, half_open_max_calls=1)
+    for _ in range(4):
+        breaker.record(True)
+    assert breaker.allow_request()
+    breaker.record(None)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_timeout_follows_p99_within_bounds():
+    breaker = _breaker()
+    assert breaker.current_timeout() == 3  # sem amostras suficientes
+    for elapsed_ms in (100, 200, 300, 2000):
+        breaker.record(False, elapsed_ms)
+    assert breaker.current_timeout() == 3.0  # p99 2 s x 1.5
+
+    fast = _breaker()
+    for _ in range(4):
+        fast.record(False, 10)
+    assert fast.current_timeout() == 0.5  # limitado por min_timeout
+
+
+def test_timeout_grows_again_when_source_slows_down():
+    breaker = _breaker(error_threshold=1.0)
+    for _ in range(4):
+        breaker.record(False, 10)
+    assert breaker.current_timeout() == 0.5
+
+    # A fonte ficou mais lenta: os timeouts entram como amostras censuradas
+    breaker.record(True, 500, timed_out=True)
+    assert breaker.current_timeout() == 0.75
+    breaker.record(True, 750, timed_out=True)
+    assert breaker.current_timeout() > 1.0
+
+    # Erros rápidos (não timeout) não contam como latência
+    errors = _breaker(error_threshold=1.0)
+    for _ in range(4):
+        errors.record(False, 10)
+    errors.record(True, 5)
+    assert errors.current_timeout() == 0.5
+
+
+def test_half_open_probe_uses_default_timeout():
+    breaker = _breaker(cooldown=0)
+    for _ in range(4):
+        breaker.record(False, 10)
+    for _ in range(4):
+        breaker.record(True, 500, timed_out=True)
+    assert breaker.state == HALF_OPEN
+    assert breaker.current_timeout() == 3
+
+def test_is_failure_classification():
+    assert is_failure({"status": "UNKNOWN", "reason": "timeout"}) is True
+    assert is_failure({"status": "UNKNOWN", "reason": "error:http_500"}) is True
+    assert is_failure({"status": "NEGATIVE", "reason": "ok"}) is False
+    assert is_failure({"status": "UNKNOWN", "reason": "no_key"}) is None
+    assert is_failure({"status": "UNKNOWN", "reason": "pending"}) is None
@@ -0,0 +1,56 @@
+import asyncio
+
+import app
+from services.worker_pool import WorkerPool
+from storage.db import get_analysis_explanation, get_db, insert_analysis
+
+
+def _pending_analysis(url: str) -> int:
+    # Score coerente com o rescoring (sem hits nem fontes), que corre sobre o mesmo banco
+    return insert_analysis(url, url, 0.0, app.EXPLANATION_PENDING_TEXT, explanation_status="pending",
+                           analysis_level="quick", heuristics_only=True)
+
+
+def test_full_explanation_queue_falls_back_to_manual_explanation(monkeypatch, default_db):
+    release = asyncio.Event()
+
+    async def generate_explanation(normalized_url, heuristics_result, rep_result, final_score):
+        await release.wait()
+        return "explicação da IA"
+
+    monkeypatch.setattr(app, "EXPLANATION_POOL", WorkerPool("teste", workers=1, max_pending=1))
+    monkeypatch.setattr(app, "_generate_explanation", generate_explanation)
+    monkeypatch.setattr(app, "_save_ai_request", lambda *args: None)
+    rep_result = {"sources": {}, "final_status": "UNKNOWN"}
+    heuristics_result = {"hits": []}
+
+    async def scenario():
+        ids = [_pending_analysis(f"https://fila{i}.exemplo.pt") for i in range(3)]
+        for analysis_id in ids:
+            app._submit_explanation_job(analysis_id, "u", "u", heuristics_result, rep_result, 30.0, 0.0, 0.0)
+            await asyncio.sleep(0)  # o worker tira o primeiro job da fila
+        states = [get_analysis_explanation(analysis_id)["explanation_status"] for analysis_id in ids]
+        release.set()
+        await app.EXPLANATION_POOL.join()
+        await app.EXPLANATION_POOL.stop()
+        return ids, states
+
+    ids, states = asyncio.run(scenario())
+    assert states == ["pending", "pending", "complete"]  # o terceiro não coube na fila
+    assert get_analysis_explanation(ids[0])["explanation"] == "explicação da IA"
+    assert get_analysis_explanation(ids[2])["explanation"] != app.EXPLANATION_PENDING_TEXT
+
+
+def test_recover_pending_explanations_only_touches_stale_rows(default_db):
+    stale = _pending_analysis("https://orfa.exemplo.pt")
+    recent = _pending_analysis("https://recente.exemplo.pt")
+    with get_db() as conn:
+        conn.execute("UPDATE analyses SET last_analyzed_at = datetime('now', '-1 hour') WHERE id = ?", (stale,))
+
+    assert app.recover_pending_explanations(older_than_seconds=600) == 1
+    assert get_analysis_explanation(stale)["explanation_status"] == "complete"
+    assert get_analysis_explanation(recent)["explanation_status"] == "pending"
+
+    # Long-polling: devolve o estado atual ao fim do tempo de espera
+    row = asyncio.run(app.wait_for_explanation(recent, timeout=0.05))
+    assert row["explanation_status"] == "pending"
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import app
+from services.reputation import score_sources
+from storage.db import get_analysis_by_id
+
+
+def _pending_vt() -> dict:
+    return {"status": "UNKNOWN", "reason": "pending", "raw": {"analysis_id": "u-123"}, "elapsed_ms": 50}
+
+
+@pytest.fixture
+def deferred_analysis(monkeypatch, default_db):
+    """Grava uma análise (por padrão "standard") com o VirusTotal pendente e corre o enriquecimento com `poll_vt`."""
+    def run(url: str, poll_vt, cancel: bool = False, analysis_level: str = "standard") -> int:
+        sources = {"GOOGLE_SAFE_BROWSING": {"status": "NEGATIVE", "reason": "ok", "raw": {}, "elapsed_ms": 10},
+                   "VIRUSTOTAL": _pending_vt()}
+
+        async def consolidate_reputation(normalized_url, **kwargs):
+            score, status = score_sources(sources)
+            return {"sources": sources, "_score": score, "final_status": status}
+
+        monkeypatch.setattr(app, "consolidate_reputation", consolidate_reputation)
+        monkeypatch.setattr(app, "heuristic_checks", lambda u, analysis_level="deep": [])
+        monkeypatch.setattr(app, "poll_vt", poll_vt)
+
+        async def scenario():
+            verdict = await app._score_url(url, defer_vt=True, analysis_level=analysis_level)
+            assert verdict["vt_pending"]
+            explanation = app._fallback_explanation(verdict["rep_result"], verdict["heuristics_result"], analysis_level)
+            analysis_id = app._store_analysis(url, url, verdict, explanation)
+            if cancel:
+                await asyncio.sleep(0)
+                for task in list(app._background_tasks):
+                    task.cancel()
+            await app.wait_background_tasks()
+            return analysis_id
+        return asyncio.run(scenario())
+    return run
+
+
+def test_deferred_vt_rescores_and_refreshes_explanation(deferred_analysis):
+    async def poll_vt(analysis_id):
+        return {"status": "POSITIVE", "reason": "ok", "raw": {"stats": {"malicious": 5}}, "elapsed_ms": 900}
+
+    analysis_id = deferred_analysis("https://adiado.exemplo.pt", poll_vt)
+    analysis = get_analysis_by_id(analysis_id)
+    assert analysis["enrichment_status"] == "complete"
+    assert analysis["score"] > 50  # VirusTotal POSITIVE entra no consenso
+    assert "VirusTotal" in analysis["explanation"]
+
+
+def test_deferred_vt_regenerates_ai_explanation_when_score_changes(deferred_analysis, monkeypatch):
+    scores = []
+
+    async def generate_explanation(normalized_url, heuristics_result, rep_result, final_score):
+        scores.append(final_score)
+        return f"explicação com score {final_score:.0f}"
+
+    async def poll_vt(analysis_id):
+        return {"status": "POSITIVE", "reason": "ok", "raw": {"stats": {"malicious": 5}}, "elapsed_ms": 900}
+
+    monkeypatch.setattr(app, "_generate_explanation", generate_explanation)
+    analysis_id = deferred_analysis("https://adiado-ia.exemplo.pt", poll_vt, analysis_level="deep")
+    analysis = get_analysis_by_id(analysis_id)
+    assert scores == [analysis["score"]]
+    assert analysis["explanation"] == f"explicação com score {analysis['score']:.0f}"
+    assert analysis["explanation_status"] == "complete"
+
+
+def test_deferred_vt_failure_is_not_marked_complete(deferred_analysis):
+    async def poll_vt(analysis_id):
+        raise RuntimeError("quota")
+
+    analysis_id = deferred_analysis("https://falha.exemplo.pt", poll_vt)
+    analysis = get_analysis_by_id(analysis_id)
+    assert analysis["enrichment_status"] == "failed"
+
+    async def poll_vt_timeout(analysis_id):
+        return {"status": "UNKNOWN", "reason": "timeout", "raw": {}, "elapsed_ms": 60000}
+
+    analysis_id = deferred_analysis("https://timeout-vt.exemplo.pt", poll_vt_timeout)
+    assert get_analysis_by_id(analysis_id)["enrichment_status"] == "failed"
+
+
+def test_cancelled_enrichment_is_marked_failed(deferred_analysis):
+    async def poll_vt(analysis_id):
+        await asyncio.sleep(60)
+
+    analysis_id = deferred_analysis("https://cancelado.exemplo.pt", poll_vt, cancel=True)
+    analysis = get_analysis_by_id(analysis_id)
+    assert analysis["enrichment_status"] == "failed"
+    assert analysis["score"] == pytest.approx(app.combine_scores(0.0, 0.0, False))
@@ -0,0 +1,56 @@
+import asyncio
+
+from benchmarks.evaluate import (
+    CORPUS_SCHEMA,
+    HEURISTIC_NETWORK_CALLS,
+    _stored_source_result,
+    classification_metrics,
+    evaluate_config,
+    read_labels,
+)
+from services.sources import SOURCE_REGISTRY
+
+
+def _entry(url: str, malicious: bool, status: str) -> dict:
+    sources = {name: {"status": "NEGATIVE", "reason": "ok", "raw": {}, "elapsed_ms": 100.0}
+               for name in SOURCE_REGISTRY}
+    sources["GOOGLE_SAFE_BROWSING"]["status"] = status
+    heuristics = {code: {"result": malicious, "elapsed_ms": 50.0} for code in HEURISTIC_NETWORK_CALLS}
+    return {"schema": CORPUS_SCHEMA, "url": url, "malicious": malicious, "recorded_from": "test",
+            "sources": sources, "heuristics": heuristics}
+
+
+def test_classification_metrics():
+    scores = [(90.0, True), (60.0, True), (85.0, False), (10.0, False), (40.0, True)]
+    assert classification_metrics(scores, 80.0) == {
+        "precision": 0.5, "recall": 0.3333, "tp": 1, "fp": 1, "fn": 2, "tn": 1}
+    assert classification_metrics([(10.0, False)], 50.0)["precision"] is None
+
+
+def test_read_labels(tmp_path):
+    path = tmp_path / "labels.csv"
+    path.write_text("# url,rótulo\nhttps://a.pt/?x=1,malicious\nhttps://b.pt,0\n", encoding="utf-8")
+    assert read_labels(str(path)) == [("https://a.pt/?x=1", True), ("https://b.pt", False)]
+
+
+def test_stored_status_is_kept():
+    # VirusTotal sem análises dos motores: UNKNOWN com reason "ok"
+    stored = {"status": "UNKNOWN", "reason": "ok", "raw_json": '{"stats": {}}', "elapsed_ms": 3000}
+    assert _stored_source_result(stored) == {"status": "UNKNOWN", "reason": "ok", "raw": {"stats": {}},
+                                             "elapsed_ms": 3000}
+    stored = {"status": "NEGATIVE", "reason": "ok", "raw_json": None, "elapsed_ms": 120}
+    assert _stored_source_result(stored)["status"] == "NEGATIVE"
+
+
+def test_replay_is_deterministic_and_offline(default_db):
+    corpus = [
+        _entry("https://phishing.exemplo.pt/login", True, "POSITIVE"),
+        _entry("https://www.exemplo.pt", False, "NEGATIVE"),
+    ]
+    first = asyncio.run(evaluate_config(corpus, "deep", "parallel", (50.0,)))
+    second = asyncio.run(evaluate_config(corpus, "deep", "parallel", (50.0,)))
+    assert first["scores"] == second["scores"]
+    assert first["missing_responses"] == 0
+    assert first["scores"]["https://phishing.exemplo.pt/login"] > first["scores"]["https://www.exemplo.pt"]
+    assert first["thresholds"]["50"]["recall"] == 1.0
+    assert first["network_calls_per_url"] > 0
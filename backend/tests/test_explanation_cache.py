@@ -0,0 +1,49 @@
+import asyncio
+
+from services.explanation_cache import ExplanationCache, from_template, to_template
+from services.xai import verdict_signature
+
+
+def test_template_round_trip_swaps_url_host_and_score():
+    explanation = "O site https://login.exemplo.pt/conta (login.exemplo.pt) tem score 72.50/100."
+    template = to_template(explanation, "https://login.exemplo.pt/conta", "72.50")
+    assert "exemplo" not in template and "72.50" not in template
+    assert from_template(template, "https://outro.pt/x", "10.00") == \
+        "O site https://outro.pt/x (outro.pt) tem score 10.00/100."
+
+
+def test_signature_ignores_url_and_untriggered_hits():
+    reputation = {"final_status": "NEGATIVE", "sources": {"GOOGLE_SAFE_BROWSING": {"status": "NEGATIVE"}}}
+    hits = {"hits": [{"code": "DOMAIN_AGE", "severity": "MEDIUM", "triggered": True},
+                     {"code": "LANGUAGE_MIX", "severity": "LOW", "triggered": False}]}
+    only_triggered = {"hits": [{"code": "DOMAIN_AGE", "severity": "MEDIUM", "triggered": True}]}
+    assert verdict_signature(hits, reputation, 20.0) == verdict_signature(only_triggered, reputation, 20.0)
+    assert verdict_signature(hits, reputation, 20.0) != verdict_signature(hits, reputation, 90.0)
+
+
+def test_lookup_reads_persisted_template_after_memory_is_cleared(tmp_db):
+    cache = ExplanationCache(db_path=tmp_db)
+
+    async def scenario():
+        assert await cache.lookup("sig") is None
+        await cache.store("sig", "Explicação de {{URL}}", "modelo")
+        cache.clear()
+        return await cache.lookup("sig"), await cache.lookup("sig")
+
+    from_db, from_memory = asyncio.run(scenario())
+    assert from_db == from_memory == "Explicação de {{URL}}"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+
+
+def test_memory_only_cache_evicts_least_recently_used():
+    cache = ExplanationCache(max_entries=2, persist=False)
+
+    async def scenario():
+        await cache.store("a", "A", "modelo")
+        await cache.store("b", "B", "modelo")
+        await cache.lookup("a")
+        await cache.store("c", "C", "modelo")
+        return [await cache.lookup(key) for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == ["A", None, "C"]
@@ -0,0 +1,54 @@
+from storage.db import claim_job_items, create_job, finish_job_item, get_job, insert_analysis, renew_job_leases
+
+
+def _status(db_path: str, job_id: int) -> dict:
+    return {item["url"]: item["status"] for item in get_job(job_id, db_path=db_path)["items"]}
+
+
+def test_claims_are_exclusive_and_in_order(tmp_db):
+    job_id = create_job(["https://a.pt", "https://b.pt", "https://c.pt"], db_path=tmp_db)
+    first = claim_job_items("w1", limit=2, db_path=tmp_db)
+    second = claim_job_items("w2", limit=2, db_path=tmp_db)
+    assert [item["url"] for item in first] == ["https://a.pt", "https://b.pt"]
+    assert [item["url"] for item in second] == ["https://c.pt"]
+    assert claim_job_items("w3", db_path=tmp_db) == []
+    assert get_job(job_id, db_path=tmp_db)["progress"]["running"] == 3
+
+
+def test_expired_lease_is_reclaimed_and_old_owner_loses_it(tmp_db):
+    job_id = create_job(["https://a.pt"], db_path=tmp_db)
+    [item] = claim_job_items("w1", lease_seconds=-1, db_path=tmp_db)  # lease já expirado
+
+    [reclaimed] = claim_job_items("w2", lease_seconds=60, db_path=tmp_db)
+    assert reclaimed["id"] == item["id"] and reclaimed["attempts"] == 2
+
+    analysis_id = insert_analysis("https://a.pt", "https://a.pt", 10.0, "explicação", db_path=tmp_db)
+    assert not finish_job_item(item["id"], "w1", analysis_id=analysis_id, db_path=tmp_db)
+    assert finish_job_item(item["id"], "w2", analysis_id=analysis_id, db_path=tmp_db)
+    job = get_job(job_id, db_path=tmp_db)
+    assert job["status"] == "complete" and job["progress"]["complete"] == 1
+
+
+def test_renewed_lease_is_not_reclaimed(tmp_db):
+    create_job(["https://a.pt"], db_path=tmp_db)
+    [item] = claim_job_items("w1", lease_seconds=-1, db_path=tmp_db)
+    renew_job_leases("w1", [item["id"]], lease_seconds=60, db_path=tmp_db)
+    assert claim_job_items("w2", db_path=tmp_db) == []
+
+
+def test_expired_lease_fails_after_max_attempts(tmp_db):
+    job_id = create_job(["https://a.pt"], db_path=tmp_db)
+    claim_job_items("w1", lease_seconds=-1, max_attempts=1, db_path=tmp_db)
+    assert claim_job_items("w2", max_attempts=1, db_path=tmp_db) == []
+    assert _status(tmp_db, job_id) == {"https://a.pt": "failed"}
+
+
+def test_retry_requeues_and_final_error_fails(tmp_db):
+    job_id = create_job(["https://a.pt"], db_path=tmp_db)
+    [item] = claim_job_items("w1", db_path=tmp_db)
+    assert finish_job_item(item["id"], "w1", error="timeout", retry=True, db_path=tmp_db)
+    assert _status(tmp_db, job_id) == {"https://a.pt": "queued"}
+
+    [item] = claim_job_items("w1", db_path=tmp_db)
+    assert finish_job_item(item["id"], "w1", error="timeout", retry=False, db_path=tmp_db)
+    assert _status(tmp_db, job_id) == {"https://a.pt": "failed"}
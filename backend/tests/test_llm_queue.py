@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+import app
+from services import llm_queue, xai
+from services.llm_queue import LLM_QUEUE_WAIT_SECONDS, LLMQueue, LLMUnavailable
+
+
+def test_full_queue_rejects_without_waiting():
+    queue = LLMQueue(workers=1, max_queue=0, max_wait_s=5)
+
+    async def scenario():
+        async with queue.slot():
+            with pytest.raises(LLMUnavailable) as rejected:
+                async with queue.slot():
+                    pass
+        return rejected.value.reason
+
+    assert asyncio.run(scenario()) == "queue_full"
+    snapshot = queue.snapshot()
+    assert snapshot["rejected"] == {"queue_full": 1}
+    assert snapshot["completed"] == 1
+    assert snapshot["in_flight"] == 0
+
+
+def test_wait_timeout_and_wait_histogram(monkeypatch):
+    monkeypatch.setattr(llm_queue, "METRICS_ENABLED", True)
+    queue = LLMQueue(workers=1, max_queue=1, max_wait_s=0.05)
+    before = LLM_QUEUE_WAIT_SECONDS._children[()].count
+
+    async def scenario():
+        async with queue.slot():
+            with pytest.raises(LLMUnavailable) as rejected:
+                async with queue.slot():
+                    pass
+        return rejected.value.reason
+
+    assert asyncio.run(scenario()) == "wait_timeout"
+    # Só o pedido admitido entra no histograma de espera
+    assert LLM_QUEUE_WAIT_SECONDS._children[()].count == before + 1
+
+
+def test_rejected_generation_falls_back_to_manual_explanation(monkeypatch):
+    queue = LLMQueue(workers=1, max_queue=0)
+    monkeypatch.setattr(xai, "LLM_QUEUE", queue)
+    monkeypatch.setattr(app, "LLM_QUEUE", queue)
+    monkeypatch.setattr(xai, "verdict_signature", lambda *args: None)
+    rep_result = {"sources": {}, "final_status": "UNKNOWN"}
+    heuristics_result = {"hits": []}
+
+    async def scenario():
+        async with queue.slot():  # o único worker está ocupado
+            return await app._generate_explanation("https://pico.exemplo.pt", heuristics_result, rep_result, 20.0)
+
+    explanation = asyncio.run(scenario())
+    assert explanation == app._fallback_explanation(rep_result, heuristics_result)
+    assert queue.snapshot()["fallbacks"] == {"queue_full": 1}
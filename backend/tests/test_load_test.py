@@ -0,0 +1,54 @@
+from benchmarks.load_test import (
+    LoadRecord,
+    arrival_times,
+    build_windows,
+    find_saturation,
+    parse_metrics,
+    window_metrics,
+)
+
+
+def _record(sent_at: float, latency_ms, status=200) -> LoadRecord:
+    record = LoadRecord(sent_at, hit=False)
+    record.latency_ms = latency_ms
+    record.status = status
+    return record
+
+
+def test_arrival_times_fixed_rate_and_ramp():
+    assert arrival_times(2, None, 2) == [0.5, 1.0, 1.5]
+    ramp = arrival_times(1, 10, 10)
+    gaps = [b - a for a, b in zip(ramp, ramp[1:])]
+    assert gaps[0] > gaps[-1]  # os pedidos ficam mais próximos à medida que o ritmo sobe
+
+
+def test_window_metrics_from_prometheus_text():
+    before = parse_metrics(
+        'clicksafe_stage_duration_seconds_sum{stage="llm.generate"} 1.0\n'
+        'clicksafe_stage_duration_seconds_count{stage="llm.generate"} 2\n'
+        'clicksafe_llm_fallbacks_total{reason="queue_full"} 1\n'
+    )
+    after = parse_metrics(
+        '# HELP ignorado\n'
+        'clicksafe_stage_duration_seconds_sum{stage="llm.generate"} 4.0\n'
+        'clicksafe_stage_duration_seconds_count{stage="llm.generate"} 4\n'
+        'clicksafe_llm_fallbacks_total{reason="queue_full"} 4\n'
+        'clicksafe_llm_queue_depth 3\n'
+    )
+    metrics = window_metrics(before, after)
+    assert metrics["llm_generate_ms"] == 1500.0
+    assert metrics["llm_fallbacks"] == 3
+    assert metrics["llm_queue_depth"] == 3
+    assert metrics["db_ms"] is None  # sem observações na janela
+
+
+def test_saturation_is_the_first_window_that_falls_behind():
+    records = [_record(t / 10, 50) for t in range(10)]            # 1.ª janela: 10 req/s a 50 ms
+    records += [_record(1 + t / 20, 900) for t in range(20)]      # 2.ª: 20 req/s, respostas a 900 ms
+    records += [_record(2 + t / 40, None, "pending") for t in range(40)]  # 3.ª: sem respostas
+    windows = build_windows(records, [], window=1.0, duration=3.0)
+    assert [w["offered_rps"] for w in windows] == [10.0, 20.0, 40.0]
+    saturation = find_saturation(windows)
+    assert saturation["start_s"] == 1.0
+    assert any(reason.startswith("p95") for reason in saturation["reasons"])
+    assert saturation["bottleneck"] == "indeterminado (sem métricas do servidor)"
@@ -0,0 +1,66 @@
+import asyncio
+import io
+import json
+import sys
+
+import pytest
+
+from services import log as log_module
+from services.log import bind_log_context, get_logger, setup_logging, start_log_context
+
+
+@pytest.fixture
+def captured_log():
+    """Escreve o logging do ClickSafe num buffer; `read()` para o listener (esvazia a fila) e devolve as linhas."""
+    output = io.StringIO()
+
+    def read(level="INFO", fmt="json"):
+        setup_logging(level, fmt, sys.stderr)
+        return output.getvalue().splitlines()
+
+    def start(level="INFO", fmt="json"):
+        setup_logging(level, fmt, output)
+    yield start, read
+    setup_logging(log_module.LOG_LEVEL, log_module.LOG_FORMAT, sys.stderr)
+
+
+def test_json_lines_carry_the_context_of_each_task(captured_log):
+    start, read = captured_log
+    start()
+    log = get_logger("teste")
+
+    async def analysis(url, analysis_id):
+        start_log_context(url=url, analysis_level="quick", stream=None)
+        await asyncio.sleep(0)
+        bind_log_context(analysis_id=analysis_id)
+        log.info("Análise gravada: score %.2f/100", 10.0, extra={"triggered": 0})
+
+    async def scenario():
+        await asyncio.gather(analysis("https://a.pt", 1), analysis("https://b.pt", 2))
+
+    asyncio.run(scenario())
+    entries = sorted((json.loads(line) for line in read()), key=lambda e: e["analysis_id"])
+    assert [(e["url"], e["analysis_id"]) for e in entries] == [("https://a.pt", 1), ("https://b.pt", 2)]
+    assert entries[0]["msg"] == "Análise gravada: score 10.00/100"
+    assert entries[0]["logger"] == "clicksafe.teste"
+    assert entries[0]["triggered"] == 0
+    assert "stream" not in entries[0]  # campos None não entram no contexto
+
+
+def test_messages_below_the_level_are_never_formatted(captured_log):
+    start, read = captured_log
+    start(level="WARNING", fmt="text")
+    formatted = []
+
+    class Expensive(object):
+        def __str__(self):
+            formatted.append(True)
+            return "caro"
+
+    log = get_logger("teste")
+    log.debug("valor %s", Expensive())
+    log.info("valor %s", Expensive())
+    log.warning("aviso %s", Expensive())
+    lines = read()
+    assert len(formatted) == 1
+    assert len(lines) == 1 and lines[0].endswith("aviso caro") and "WARNING" in lines[0]
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from services.loop_monitor import LoopMonitor
+
+
+def _blocking_call():
+    time.sleep(0.3)  # código síncrono no event loop
+
+
+def test_blocking_call_is_detected_with_its_location():
+    monitor = LoopMonitor(interval=0.02, threshold_ms=50)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        _blocking_call()
+        await asyncio.sleep(0.1)  # a task de amostragem acorda e fecha o bloqueio
+        snapshot = monitor.snapshot()
+        await monitor.stop()
+        return snapshot
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["enabled"] is True
+    assert snapshot["max_lag_ms"] >= 200
+    block = snapshot["recent_blocks"][-1]
+    assert block["location"].startswith("test_loop_monitor.py:")
+    assert block["location"].endswith("_blocking_call")
+    assert "_blocking_call" in block["stack"]
+    assert block["blocked_ms"] >= 200  # duração total, não só até à deteção
+    assert "_tick" not in block
+
+
+def test_idle_loop_has_no_blocks():
+    monitor = LoopMonitor(interval=0.01, threshold_ms=200)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+        return monitor.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["recent_blocks"] == []
+    assert snapshot["enabled"] is False  # parado
@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+
+import server
+from services import metrics
+from services.metrics import MetricsRegistry
+
+
+def test_render_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("pedidos_total", "Pedidos", ("route",))
+    requests.labels("/api/analyze").inc()
+    requests.labels("/api/analyze").inc(2)
+    registry.gauge("fila", "Pedidos na fila", function=lambda: 3)
+    latency = registry.histogram("duracao_seconds", "Duração", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    assert registry.counter("pedidos_total", "duplicada") is requests  # registar de novo não duplica
+
+    lines = registry.render().splitlines()
+    assert "# TYPE pedidos_total counter" in lines
+    assert 'pedidos_total{route="/api/analyze"} 3' in lines
+    assert "fila 3" in lines
+    assert [line for line in lines if line.startswith("duracao_seconds")] == [
+        'duracao_seconds_bucket{le="0.1"} 1',
+        'duracao_seconds_bucket{le="1"} 2',
+        'duracao_seconds_bucket{le="+Inf"} 3',
+        "duracao_seconds_sum 5.55",
+        "duracao_seconds_count 3",
+    ]
+
+
+def test_metrics_endpoint_records_requests_by_route(monkeypatch, default_db):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    client = TestClient(server.app)
+    client.get("/api/analysis/999999999/status")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    # A rota é o padrão, não o caminho com o id
+    assert 'route="/api/analysis/{analysis_id}/status"' in response.text
+    assert "# TYPE clicksafe_stage_duration_seconds histogram" in response.text
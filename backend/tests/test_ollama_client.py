@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from benchmarks.ollama_standin import run_standin
+from services.xai import OllamaClient
+
+
+def test_generate_and_stream_against_standin():
+    async def scenario(base_url):
+        client = OllamaClient(base_url=base_url, num_predict=4)
+        try:
+            text = await client.generate("explica esta URL")
+            tokens = [token async for token in client.generate_stream("explica esta URL")]
+            shorter = await client.generate("explica esta URL", num_predict=2)
+        finally:
+            await client.aclose()
+        return text, tokens, shorter
+
+    with run_standin(prefill_ms_per_token=0.0, eval_ms_per_token=0.0) as base_url:
+        text, tokens, shorter = asyncio.run(scenario(base_url))
+    assert len(tokens) == 4  # um pedaço por token gerado
+    assert "".join(tokens).strip() == text
+    assert len(shorter.split()) == 2  # as opções do pedido substituem as do cliente
+
+
+def test_request_payload_and_errors():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        if len(requests) == 1:
+            return httpx.Response(200, json={"response": " ok ", "done": True})
+        return httpx.Response(500, text="modelo não encontrado")
+
+    async def scenario():
+        client = OllamaClient(base_url="http://ollama.test", model="mistral", keep_alive="-1",
+                              transport=httpx.MockTransport(handler))
+        try:
+            assert await client.generate("p", temperature=0.1) == "ok"
+            with pytest.raises(RuntimeError, match="HTTP 500"):
+                await client.generate("p")
+        finally:
+            await client.aclose()
+
+    asyncio.run(scenario())
+    assert requests[0]["stream"] is False
+    assert requests[0]["keep_alive"] == "-1"
+    assert requests[0]["options"]["temperature"] == 0.1
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from services import profiler
+from services.profiler import ProfilerBusy, check_admin_token, run_profile
+
+
+def _busy_work():
+    end = time.perf_counter() + 0.05
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sample_mode_returns_collapsed_stacks():
+    async def scenario():
+        async def work():
+            await asyncio.sleep(0.01)
+            _busy_work()
+        task = asyncio.create_task(work())
+        report = await run_profile("sample", seconds=0.1, interval_ms=1)
+        await task
+        return report
+
+    report = asyncio.run(scenario())
+    header, *stacks = report.strip().splitlines()
+    assert header.startswith("# ") and "amostras" in header
+    assert any("_busy_work" in line for line in stacks)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+
+
+def test_cprofile_of_a_target_and_invalid_parameters():
+    async def target():
+        _busy_work()
+
+    report = asyncio.run(run_profile("cprofile", seconds=1, target=target, limit=5))
+    assert report.startswith("# cProfile de uma análise")
+    assert "_busy_work" in report
+    with pytest.raises(ValueError):
+        asyncio.run(run_profile("flamegraph", seconds=1))
+    with pytest.raises(ValueError):
+        asyncio.run(run_profile("sample", seconds=profiler.PROFILE_MAX_SECONDS + 1))
+
+
+def test_only_one_profile_at_a_time():
+    async def scenario():
+        first = asyncio.create_task(run_profile("sample", seconds=0.1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ProfilerBusy):
+            await run_profile("sample", seconds=0.1)
+        await first
+
+    asyncio.run(scenario())
+
+
+def test_admin_token_is_required(monkeypatch):
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", None)
+    assert not check_admin_token(None) and not check_admin_token("")
+    client = TestClient(server.app)
+    assert client.post("/api/admin/profile", params={"seconds": 0.01}).status_code == 403
+
+    monkeypatch.setattr(profiler, "ADMIN_TOKEN", "segredo")
+    assert not check_admin_token("outro")
+    response = client.post("/api/admin/profile", params={"seconds": 0.01}, headers={"X-Admin-Token": "segredo"})
+    assert response.status_code == 200
+    assert response.text.startswith("# ")
@@ -0,0 +1,35 @@
+from services.xai import build_prompt, estimate_tokens
+
+_SEVERITIES = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+
+
+def _verdict(triggered: int):
+    hits = [{"code": f"HEURISTIC_{i}", "severity": _SEVERITIES[i % 4], "triggered": True,
+             "details": f"Descrição longa da heurística número {i} com bastante texto: detectado"}
+            for i in range(triggered)]
+    hits.append({"code": "NOT_TRIGGERED", "severity": "LOW", "triggered": False, "details": "x"})
+    reputation = {
+        "_score": 0.9,
+        "final_status": "POSITIVE",
+        "sources": {
+            "GOOGLE_SAFE_BROWSING": {"status": "POSITIVE", "reason": "ok", "raw": {"threats": ["SOCIAL_ENGINEERING"]}},
+            "VIRUSTOTAL": {"status": "UNKNOWN", "reason": "over_budget", "raw": {}},
+        },
+    }
+    return {"score": 80.0, "hits": hits}, reputation
+
+
+def test_prompt_fits_budget_and_keeps_most_severe_hits():
+    heuristics, reputation = _verdict(triggered=20)
+    prompt = build_prompt("https://exemplo.pt/" + "a" * 400, heuristics, reputation, 87.0, token_budget=200)
+    assert estimate_tokens(prompt) <= 200
+    assert "CRITICAL" in prompt
+    assert "NOT_TRIGGERED" not in prompt
+
+
+def test_prompt_keeps_details_when_there_is_room():
+    heuristics, reputation = _verdict(triggered=2)
+    prompt = build_prompt("https://exemplo.pt/login", heuristics, reputation, 87.0, token_budget=1000)
+    assert "Descrição longa da heurística número 1" in prompt
+    assert "https://exemplo.pt/login" in prompt
+    assert "2 de 3 acionadas" in prompt
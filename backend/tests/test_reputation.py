@@ -0,0 +1,58 @@
+from services.reputation import score_sources, weighted_consensus
+
+_OK = "ok"
+
+
+def _result(status: str, reason: str = _OK) -> dict:
+    return {"status": status, "reason": reason, "raw": {}, "elapsed_ms": 10}
+
+
+def test_weighted_consensus_average_and_positive_floor():
+    assert weighted_consensus(0.0, 0.0, 0.0) == 0.5
+    assert weighted_consensus(2.0, 1.0, 0.0) == 0.5
+    # Uma fonte POSITIVE garante pelo menos o seu peso
+    assert weighted_consensus(1.8, 1.0, 1.0) == 1.0
+    assert weighted_consensus(1.8, 0.8, 0.8) == 0.8
+
+
+def test_single_positive_high_weight_source_dominates():
+    score, status = score_sources({
+        "GOOGLE_SAFE_BROWSING": _result("POSITIVE"),
+        "VIRUSTOTAL": _result("NEGATIVE"),
+    })
+    assert status == "POSITIVE"
+    assert score == 1.0
+
+
+def test_all_negative_sources():
+    score, status = score_sources({
+        "GOOGLE_SAFE_BROWSING": _result("NEGATIVE"),
+        "VIRUSTOTAL": _result("NEGATIVE"),
+    })
+    assert (score, status) == (0.0, "NEGATIVE")
+
+
+def test_not_queried_sources_are_ignored():
+    score, status = score_sources({
+        "GOOGLE_SAFE_BROWSING": _result("NEGATIVE"),
+        "VIRUSTOTAL": _result("UNKNOWN", "over_budget"),
+        "APIVOID": _result("UNKNOWN", "pending"),
+    })
+    assert (score, status) == (0.0, "NEGATIVE")
+
+
+def test_nothing_queried_is_unknown():
+    assert score_sources({}) == (0.5, "UNKNOWN")
+    assert score_sources({"VIRUSTOTAL": _result("UNKNOWN", "not_checked")}) == (0.5, "UNKNOWN")
+
+
+def test_score_sources_matches_weighted_consensus_aggregates():
+    sources = {
+        "GOOGLE_SAFE_BROWSING": _result("NEGATIVE"),
+        "VIRUSTOTAL": _result("UNKNOWN", "timeout"),
+        "UNREGISTERED": _result("POSITIVE"),  # fonte desconhecida: peso 0.5
+    }
+    score, status = score_sources(sources)
+    # GSB 1.0 x 0.0 + VT 0.8 x 0.5 + 0.5 x 1.0, piso 0.5 da fonte POSITIVE
+    assert status == "POSITIVE"
+    assert score == weighted_consensus(2.3, 0.9, 0.5)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import pytest
+
+import app
+from rescore import rescore_analyses, rescore_row
+from services.reputation import score_sources
+from services.sources import SOURCE_REGISTRY
+from storage.db import (get_analysis_by_id, get_db, get_reputation_checks, get_rescoring_inputs, init_db,
+                        insert_analysis, insert_heuristic_hit)
+
+# Heurísticas do teste: (código, resultado); as de rede não chegam a ser chamadas
+_HEURISTICS = (("DOMAIN_AGE", True), ("LANGUAGE_MIX", True), ("DOMAIN_TLD_RISK", False))
+
+
+def _source(status: str, reason: str = "ok") -> dict:
+    return {"status": status, "reason": reason, "raw": {}, "elapsed_ms": 10}
+
+
+@pytest.fixture
+def live_pipeline(monkeypatch, default_db):
+    """`_score_url` sem rede: fontes e heurísticas com resultados fixos."""
+    def analyze(url: str, level: str, sources: dict) -> dict:
+        async def consolidate_reputation(normalized_url, **kwargs):
+            score, status = score_sources(sources)
+            return {"sources": sources, "_score": score, "final_status": status}
+
+        monkeypatch.setattr(app, "consolidate_reputation", consolidate_reputation)
+        monkeypatch.setattr(app, "heuristic_checks", lambda u, analysis_level="deep": [
+            (lambda result=result: result, code, (), code) for code, result in _HEURISTICS
+        ])
+        return asyncio.run(app._score_url(url, analysis_level=level))
+    return analyze
+
+
+def _set_severity(code: str, severity: str) -> None:
+    with get_db() as conn:
+        conn.execute("UPDATE heuristics SET default_severity = ? WHERE code = ?", (severity, code))
+
+
+def _rows_by_id() -> dict:
+    weights = {name: source.weight for name, source in SOURCE_REGISTRY.items()}
+    statuses = {"POSITIVE": 1.0, "NEGATIVE": 0.0, "UNKNOWN": 0.5}
+    return {row["id"]: row for row in get_rescoring_inputs(0, 1000, app.SEVERITY_SCORES, weights, statuses)}
+
+
+_CASES = (
+    # Fonte do nível planeada mas fora do orçamento: não é gravada, mas o score é o consenso
+    ("https://orcamento.exemplo.pt", "standard", {"VIRUSTOTAL": _source("UNKNOWN", "over_budget")}),
+    # Nível sem fontes: só heurísticas
+    ("https://rapido.exemplo.pt", "quick", {}),
+    # Só a lista de bloqueio local (NEGATIVE): continua a ser só heurísticas
+    ("https://lista.exemplo.pt", "quick", {"LOCAL_BLOCKLIST": _source("NEGATIVE")}),
+    ("https://fontes.exemplo.pt", "deep", {"GOOGLE_SAFE_BROWSING": _source("POSITIVE"),
+                                           "VIRUSTOTAL": _source("NEGATIVE")}),
+    ("https://timeout.exemplo.pt", "standard", {"GOOGLE_SAFE_BROWSING": _source("UNKNOWN", "timeout")}),
+    # VirusTotal respondeu sem análises dos motores: UNKNOWN com reason "ok"
+    ("https://sem-dados.exemplo.pt", "deep", {"GOOGLE_SAFE_BROWSING": _source("NEGATIVE"),
+                                             "VIRUSTOTAL": _source("UNKNOWN")}),
+)
+
+
+def test_rescore_matches_live_scoring(live_pipeline):
+    stored = {}
+    for url, level, sources in _CASES:
+        verdict = live_pipeline(url, level, sources)
+        stored[app._store_analysis(url, url, verdict, "explicação")] = verdict
+
+    rows = _rows_by_id()
+    for analysis_id, verdict in stored.items():
+        assert rescore_row(rows[analysis_id]) == pytest.approx(verdict["final_score"]), verdict["analysis_level"]
+    assert rescore_analyses(dry_run=True)["changed"] == 0
+
+    # Depois de mudar a severidade, o rescoring dá o mesmo que repetir a análise
+    _set_severity("DOMAIN_AGE", "CRITICAL")
+    try:
+        result = rescore_analyses()
+        assert result["changed"] == len(_CASES)
+        for analysis_id, (url, level, sources) in zip(stored, _CASES):
+            expected = live_pipeline(url, level, sources)["final_score"]
+            assert get_analysis_by_id(analysis_id)["score"] == pytest.approx(expected), level
+    finally:
+        _set_severity("DOMAIN_AGE", "MEDIUM")
+        rescore_analyses()
+
+
+def test_rescore_without_config_change_changes_nothing(live_pipeline):
+    url, level, sources = _CASES[-1]
+    verdict = live_pipeline(url, level, sources)
+    analysis_id = app._store_analysis(url, url, verdict, "explicação")
+    statuses = {check["source"]: check["status"] for check in get_reputation_checks(analysis_id)}
+    assert statuses == {"GOOGLE_SAFE_BROWSING": "NEGATIVE", "VIRUSTOTAL": "UNKNOWN"}
+    assert rescore_analyses(dry_run=True)["changed"] == 0
+
+
+def test_init_db_restores_unknown_statuses_stored_as_negative(tmp_db):
+    analysis_id = insert_analysis("https://legado.pt", "https://legado.pt", 50.0, "explicação", db_path=tmp_db)
+    no_engines = json.dumps({"stats": {"malicious": 0, "suspicious": 0, "harmless": 0, "undetected": 0,
+                                       "total_engines": 0}})
+    with get_db(tmp_db) as conn:
+        conn.executemany("""
+            INSERT INTO reputation_checks (analysis_id, source, status, raw_json, reason)
+            VALUES (?, ?, 'NEGATIVE', ?, ?)
+        """, [(analysis_id, "GOOGLE_SAFE_BROWSING", "{}", "timeout"),
+              (analysis_id, "VIRUSTOTAL", no_engines, "ok")])
+
+    init_db(tmp_db)
+
+    checks = get_reputation_checks(analysis_id, db_path=tmp_db)
+    assert {check["source"]: check["status"] for check in checks} == {
+        "GOOGLE_SAFE_BROWSING": "UNKNOWN", "VIRUSTOTAL": "UNKNOWN"}
+
+
+def test_init_db_keeps_hits_and_tuned_severities(tmp_db):
+    analysis_id = insert_analysis("https://a.pt", "https://a.pt", 15.0, "explicação", db_path=tmp_db)
+    insert_heuristic_hit(analysis_id, "DOMAIN_AGE", "MEDIUM", True, db_path=tmp_db)
+    with get_db(tmp_db) as conn:
+        conn.execute("UPDATE heuristics SET default_severity = 'HIGH' WHERE code = 'DOMAIN_AGE'")
+
+    init_db(tmp_db)
+
+    with get_db(tmp_db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM heuristics_hits").fetchone()[0] == 1
+        assert conn.execute(
+            "SELECT default_severity FROM heuristics WHERE code = 'DOMAIN_AGE'").fetchone()[0] == "HIGH"
@@ -0,0 +1,69 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from scan import ScanCheckpoint
+
+
+def test_checkpoint_only_advances_over_contiguous_lines():
+    checkpoint = ScanCheckpoint(None, "urls.txt")
+    for line_no in (2, 3, 5):
+        checkpoint.done(line_no)
+    assert checkpoint.line == 0  # a linha 1 ainda não terminou
+    checkpoint.done(1)
+    assert checkpoint.line == 3
+    checkpoint.done(4)
+    assert checkpoint.line == 5
+    assert not checkpoint._done  # não guarda linhas já cobertas pelo checkpoint
+
+
+def test_checkpoint_saves_periodically_and_resumes(tmp_path):
+    path = str(tmp_path / "scan.ckpt")
+    checkpoint = ScanCheckpoint(path, "urls.txt", save_every=2)
+    checkpoint.done(1)
+    assert not (tmp_path / "scan.ckpt").exists()
+    checkpoint.done(2)
+    assert json.loads((tmp_path / "scan.ckpt").read_text())["line"] == 2
+
+    checkpoint.done(3)
+    checkpoint.save()
+    assert ScanCheckpoint(path, "urls.txt").load() == 3
+
+
+def test_checkpoint_from_another_input_is_rejected(tmp_path):
+    path = str(tmp_path / "scan.ckpt")
+    checkpoint = ScanCheckpoint(path, "a.txt")
+    checkpoint.done(1)
+    checkpoint.save()
+    with pytest.raises(ValueError):
+        ScanCheckpoint(path, "b.txt").load()
+    assert ScanCheckpoint(str(tmp_path / "missing.ckpt"), "a.txt").load() == 0
+
+
+def test_scan_waits_for_deferred_virustotal(monkeypatch):
+    import app
+    import scan as scan_module
+
+    enriched = []
+
+    async def enrichment(url):
+        await asyncio.sleep(0.05)
+        enriched.append(url)
+
+    async def analyze_url(url, defer_vt=False, analysis_level=None):
+        app._schedule_background(enrichment(url))
+        return {"id": 1, "url": url, "score": 10.0, "enrichment_status": "pending"}
+
+    monkeypatch.setattr(scan_module, "get_analysis_by_url", lambda url, levels: None)
+    monkeypatch.setattr(scan_module, "analyze_url", analyze_url)
+    monkeypatch.setattr(scan_module, "summarize_analysis", lambda url, analysis, cached: {"url": url})
+
+    output = io.StringIO()
+    summary = asyncio.run(scan_module.scan(io.StringIO("a.com\nb.com\n"), output,
+                                           concurrency=2, analysis_level="quick", defer_vt=True))
+    assert summary["total"] == 2
+    assert summary["errors"] == 0
+    assert len(output.getvalue().splitlines()) == 2
+    assert sorted(enriched) == ["a.com", "b.com"]  # o scan não termina antes do VirusTotal
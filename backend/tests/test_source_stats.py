@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+from services.source_stats import MIN_SAMPLES, SourceStatsRegistry, order_for_verdict
+
+
+def _source(name: str, expected_latency_ms: float, cost: float = 1.0, weight: float = 1.0):
+    return SimpleNamespace(name=name, expected_latency_ms=expected_latency_ms, cost=cost, weight=weight)
+
+
+def _seed(stats: SourceStatsRegistry, source: str, positives: int, negatives: int, elapsed_ms: int) -> None:
+    rows = [{"source": source, "status": "POSITIVE", "reason": "ok", "elapsed_ms": elapsed_ms}] * positives
+    rows += [{"source": source, "status": "NEGATIVE", "reason": "ok", "elapsed_ms": elapsed_ms}] * negatives
+    stats.seed(rows)
+
+
+def test_without_history_sources_are_ordered_by_expected_latency():
+    stats = SourceStatsRegistry()
+    sources = [_source("LENTA", 3000), _source("LOCAL", 1, cost=0), _source("RAPIDA", 300)]
+    assert [s.name for s in order_for_verdict(sources, stats)] == ["LOCAL", "RAPIDA", "LENTA"]
+
+
+def test_observed_hit_rate_and_latency_change_the_order():
+    stats = SourceStatsRegistry()
+    # A fonte "rápida" quase nunca dá um veredito; a lenta deteta metade das URLs
+    _seed(stats, "RAPIDA", positives=0, negatives=50, elapsed_ms=200)
+    _seed(stats, "LENTA", positives=25, negatives=25, elapsed_ms=1500)
+    sources = [_source("RAPIDA", 300), _source("LENTA", 3000)]
+    assert [s.name for s in order_for_verdict(sources, stats)] == ["LENTA", "RAPIDA"]
+    assert stats.expected_latency_ms("LENTA", 3000) == 1500
+
+
+def test_failures_and_unreached_checks_in_the_statistics():
+    stats = SourceStatsRegistry()
+    for _ in range(MIN_SAMPLES):
+        stats.record("FONTE", {"status": "NEGATIVE", "reason": "ok", "elapsed_ms": 100})
+        stats.record("FONTE", {"status": "UNKNOWN", "reason": "timeout", "elapsed_ms": 5000})
+        stats.record("FONTE", {"status": "UNKNOWN", "reason": "circuit_open", "elapsed_ms": 0})
+    snapshot = stats.snapshot()["FONTE"]
+    assert snapshot["samples"] == 2 * MIN_SAMPLES  # circuit_open não chegou à fonte
+    assert snapshot["failure_rate"] == 0.5
+    assert snapshot["p95_ms"] == 100  # a latência só conta consultas sem falha
+    assert 0 < snapshot["positive_rate"] < 0.1  # prior: nunca exatamente 0
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+import server
+from services.reputation import score_sources
+from storage.db import get_ai_requests, get_analysis_by_id
+
+
+def _events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.fixture
+def stream_analysis(monkeypatch, default_db):
+    """Pede /api/analyze/stream (nível deep) com fontes e modelo simulados; devolve os eventos."""
+    sources = {"GOOGLE_SAFE_BROWSING": {"status": "NEGATIVE", "reason": "ok", "raw": {}, "elapsed_ms": 10}}
+
+    async def consolidate_reputation(normalized_url, **kwargs):
+        score, status = score_sources(sources)
+        return {"sources": sources, "_score": score, "final_status": status}
+
+    monkeypatch.setattr(app, "consolidate_reputation", consolidate_reputation)
+    monkeypatch.setattr(app, "heuristic_checks", lambda u, analysis_level="deep": [])
+
+    def run(url: str, explain_result_stream) -> list:
+        monkeypatch.setattr(app, "explain_result_stream", explain_result_stream)
+        response = TestClient(server.app).get("/api/analyze/stream", params={"url": url, "analysis_level": "deep"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        return _events(response.text)
+    return run
+
+
+def test_stream_sends_tokens_then_the_persisted_explanation(stream_analysis):
+    async def explain_result_stream(url, heuristics, reputation, final_score):
+        for token in ("URL ", "sem ", "riscos."):
+            yield token
+
+    events = stream_analysis("https://stream.exemplo.pt", explain_result_stream)
+    assert [name for name, _ in events] == ["analysis", "token", "token", "token", "done"]
+    assert events[0][1]["explanation_status"] == "pending"  # o score chega antes da explicação
+    done = events[-1][1]
+    assert done == {"id": done["id"], "explanation": "URL sem riscos.", "explanation_status": "complete",
+                    "fallback": False}
+    assert get_analysis_by_id(done["id"])["explanation"] == "URL sem riscos."
+    assert get_ai_requests(done["id"])[0]["response"] == "URL sem riscos."
+
+
+def test_stream_falls_back_when_the_model_fails_midway(stream_analysis):
+    async def explain_result_stream(url, heuristics, reputation, final_score):
+        yield "URL "
+        raise RuntimeError("ollama erro: ligação perdida")
+
+    events = stream_analysis("https://stream-falha.exemplo.pt", explain_result_stream)
+    assert [name for name, _ in events] == ["analysis", "token", "done"]
+    done = events[-1][1]
+    assert done["fallback"] is True
+    assert get_analysis_by_id(done["id"])["explanation"] == done["explanation"] != "URL"
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from services import tracing
+from services.tracing import ROOT_SPAN_ID, span, start_trace
+from storage.db import get_analysis_spans, insert_analysis, insert_analysis_spans
+
+
+def test_spans_nest_across_tasks_and_record_errors(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", True)
+
+    async def source(name):
+        with span(f"reputation.{name}", source=name):
+            await asyncio.sleep(0)
+
+    async def scenario():
+        trace = start_trace("analyze_url")
+        with span("reputation"):
+            await asyncio.gather(source("GSB"), source("VT"))
+        with pytest.raises(ValueError):
+            with span("heuristics"):
+                raise ValueError("whois")
+        spans = trace.finish()
+        with span("depois_do_fim"):
+            pass
+        return trace, spans
+
+    trace, spans = asyncio.run(scenario())
+    by_name = {s["name"]: s for s in spans}
+    assert spans[0]["id"] == ROOT_SPAN_ID and spans[0]["name"] == "analyze_url"
+    assert by_name["reputation"]["parent_id"] == ROOT_SPAN_ID
+    # Os spans das tasks criadas dentro de "reputation" ficam como seus filhos
+    assert by_name["reputation.GSB"]["parent_id"] == by_name["reputation"]["id"]
+    assert by_name["reputation.VT"]["attrs"] == {"source": "VT"}
+    assert by_name["heuristics"]["attrs"]["error"] == "ValueError"
+    assert "depois_do_fim" not in {s["name"] for s in trace.to_list()}
+
+
+def test_disabled_tracing_still_measures_the_span(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", False)
+
+    async def scenario():
+        assert start_trace("analyze_url") is None
+        with span("reputation") as current:
+            await asyncio.sleep(0.01)
+        return current.elapsed_ms
+
+    assert asyncio.run(scenario()) >= 10
+
+
+def test_spans_are_persisted_with_the_analysis(default_db):
+    analysis_id = insert_analysis("https://trace.exemplo.pt", "https://trace.exemplo.pt", 0.0, "ok",
+                                  analysis_level="quick", heuristics_only=True)
+    spans = [{"id": 0, "parent_id": None, "name": "analyze_url", "start_ms": 0.0, "elapsed_ms": 12.5, "attrs": {}},
+             {"id": 1, "parent_id": 0, "name": "heuristics", "start_ms": 1.0, "elapsed_ms": 3.0,
+              "attrs": {"hits": 2}}]
+    insert_analysis_spans(analysis_id, spans)
+    assert get_analysis_spans(analysis_id) == spans
@@ -0,0 +1,205 @@
+"""
+Worker de jobs do ClickSafe - processa a fila durável de análises (tabelas jobs/job_items).
+
+Os jobs são criados com `POST /api/jobs` (ou `submit_job`) e ficam no banco,
+por isso sobrevivem a reinícios do servidor. Cada URL é reclamada por um
+worker com um lease que é renovado enquanto a análise corre; se o worker
+morrer, o lease expira e a URL volta à fila para outro worker.
+
+Os servidores correm um worker no próprio processo (CLICKSAFE_JOBS_IN_SERVER);
+para aumentar o débito basta arrancar mais processos:
+
+    python worker.py [--concurrency=N] [--id=NOME]
+"""
+import asyncio
+import os
+import socket
+import sys
+import uuid
+from typing import Dict, Iterable, Optional
+from storage.db import (
+    init_db,
+    is_db_initialized,
+    create_job,
+    claim_job_items,
+    renew_job_leases,
+    finish_job_item,
+)
+from app import analyze_url, normalize_url, validate_analysis_level, wait_background_tasks
+from services.loop_monitor import LOOP_MONITOR
+from services.log import get_logger
+
+# Análises em simultâneo por worker, duração do lease e tentativas por URL
+JOB_WORKER_CONCURRENCY = int(os.getenv("CLICKSAFE_JOB_WORKER_CONCURRENCY", "4"))
+JOB_LEASE_SECONDS = float(os.getenv("CLICKSAFE_JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("CLICKSAFE_JOB_MAX_ATTEMPTS", "3"))
+
+# Intervalo (s) entre consultas à fila quando não há trabalho
+JOB_POLL_INTERVAL = float(os.getenv("CLICKSAFE_JOB_POLL_INTERVAL", "1"))
+
+# Máximo de URLs por job
+JOB_MAX_URLS = int(os.getenv("CLICKSAFE_JOB_MAX_URLS", "100000"))
+
+# Worker dentro do processo do servidor ("0" desliga - só workers externos)
+JOBS_IN_SERVER = os.getenv("CLICKSAFE_JOBS_IN_SERVER", "1") != "0"
+
+log = get_logger("worker")
+
+
+def submit_job(urls: Iterable[str], analysis_level: Optional[str] = None, defer_vt: bool = False) -> Dict:
+    """
+    Cria um job com as URLs (normalizadas e sem duplicadas, pela ordem dada).
+    Lança ValueError se não houver URLs válidas ou se passarem JOB_MAX_URLS.
+    retorna {"job_id", "total", "status"}
+    """
+    analysis_level = validate_analysis_level(analysis_level)
+    unique = {}
+    for url in urls:
+        url = (url or "").strip()
+        if url:
+            unique.setdefault(normalize_url(url), url)
+    if not unique:
+        raise ValueError("Nenhuma URL válida no job")
+    if len(unique) > JOB_MAX_URLS:
+        raise ValueError(f"Máximo de {JOB_MAX_URLS} URLs por job")
+    job_id = create_job(list(unique.values()), analysis_level=analysis_level, defer_vt=defer_vt)
+    return {"job_id": job_id, "total": len(unique), "status": "queued"}
+
+
+class JobWorker(object):
+    """
+    Worker que reclama itens de job_items e os analisa com `analyze_url`.
+
+    No máximo `concurrency` análises correm em simultâneo; um heartbeat
+    renova o lease dos itens em curso a cada terço de `lease_seconds`.
+    Um item que falhe volta à fila até `max_attempts` tentativas. Ao parar,
+    os itens em curso são devolvidos à fila. As consultas à fila correm numa
+    thread (e as heurísticas de rede também, ver `run_heuristics`), por isso o
+    worker no processo do servidor não bloqueia a API.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None,
+                 concurrency: int = JOB_WORKER_CONCURRENCY,
+                 lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self._active: Dict[int, asyncio.Task] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.processed = 0
+        self.failed = 0
+
+    def notify(self) -> None:
+        """Acorda o worker (ex.: logo depois de criar um job neste processo)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self) -> None:
+        """Processa a fila até `stop()` ser chamado."""
+        self._wake = asyncio.Event()
+        self._stopping = False
+        heartbeat = asyncio.create_task(self._heartbeat())
+        log.info("Worker de jobs %s iniciado (%d em simultâneo)", self.worker_id, self.concurrency)
+        try:
+            while not self._stopping:
+                self._wake.clear()
+                free = self.concurrency - len(self._active)
+                items = []
+                if free > 0:
+                    try:
+                        items = await asyncio.to_thread(claim_job_items, self.worker_id, limit=free,
+                                                        lease_seconds=self.lease_seconds,
+                                                        max_attempts=self.max_attempts)
+                    except Exception as e:
+                        log.warning("Erro ao reclamar jobs (%s): %s", self.worker_id, e)
+                for item in items:
+                    self._active[item["id"]] = asyncio.create_task(self._process(item))
+                if not items or len(self._active) >= self.concurrency:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            heartbeat.cancel()
+            tasks = list(self._active.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(heartbeat, *tasks, return_exceptions=True)
+
+    async def stop(self) -> None:
+        """Para de reclamar itens; os que estão em curso voltam à fila."""
+        self._stopping = True
+        self.notify()
+
+    async def _process(self, item: Dict) -> None:
+        try:
+            analysis = await analyze_url(
+                item["url"],
+                defer_vt=bool(item["defer_vt"]),
+                analysis_level=item["analysis_level"]
+            )
+            await asyncio.to_thread(finish_job_item, item["id"], self.worker_id, analysis_id=analysis["id"])
+            self.processed += 1
+        except asyncio.CancelledError:
+            # Síncrono: a task já foi cancelada e o item tem de voltar à fila antes de o worker parar
+            finish_job_item(item["id"], self.worker_id, error="worker parado", retry=True)
+            raise
+        except Exception as e:
+            log.warning("Erro no job %s (%s): %s", item["job_id"], item["url"], e,
+                        extra={"job_id": item["job_id"], "attempts": item["attempts"]})
+            retry = item["attempts"] < self.max_attempts
+            await asyncio.to_thread(finish_job_item, item["id"], self.worker_id, error=str(e), retry=retry)
+            if not retry:
+                self.failed += 1
+        finally:
+            self._active.pop(item["id"], None)
+            self.notify()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(renew_job_leases, self.worker_id, list(self._active),
+                                        lease_seconds=self.lease_seconds)
+            except Exception as e:
+                log.warning("Erro ao renovar leases (%s): %s", self.worker_id, e)
+
+
+async def main():
+    """Arranca um worker de jobs standalone."""
+    args = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    # Não corre init_db() num banco já inicializado (recriaria reputation_checks com o servidor a correr)
+    if not is_db_initialized():
+        init_db()
+    worker = JobWorker(
+        worker_id=args.get("id"),
+        concurrency=int(args.get("concurrency", JOB_WORKER_CONCURRENCY))
+    )
+    LOOP_MONITOR.start()
+    try:
+        await worker.run()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        # Itens com defer_vt já terminados: o VirusTotal em background ainda atualiza o banco
+        await wait_background_tasks()
+        await LOOP_MONITOR.stop()
+    log.info("Worker %s parado (%d processados, %d falhados)", worker.worker_id, worker.processed, worker.failed)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ["--help", "-h"]:
+        print("Uso: python worker.py [--concurrency=N] [--id=NOME]")
+        print("\nOpções:")
+        print("  --concurrency=N  Análises em simultâneo (padrão: CLICKSAFE_JOB_WORKER_CONCURRENCY)")
+        print("  --id=NOME        Identificador do worker nos leases (padrão: host:pid:aleatório)")
+        sys.exit(0)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
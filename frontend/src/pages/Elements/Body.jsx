@@ -37,31 +37,54 @@ function Body(){
             if (isDevelopment) {
                 // Modo desenvolvimento: frontend e backend rodam separadamente
                 const apiUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
-                apiEndpoint = `${apiUrl}/api/analyze`;
+                apiEndpoint = `${apiUrl}/api/analyze/stream`;
             } else {
                 // Modo produção: frontend servido pelo mesmo servidor
-                apiEndpoint = '/api/analyze';
+                apiEndpoint = '/api/analyze/stream';
             }
             
-            console.log('[Frontend] Enviando requisição para:', apiEndpoint);
+            console.log('[Frontend] Abrindo stream para:', apiEndpoint);
             console.log('[Frontend] URL a analisar:', urlToSend);
             console.log('[Frontend] Origin atual:', window.location.origin);
             console.log('[Frontend] Modo desenvolvimento:', isDevelopment);
             
-            const result = await fetch(apiEndpoint, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ url: urlToSend })
+            // Server-Sent Events: o score chega primeiro (evento "analysis"),
+            // a explicação vai chegando token a token ("token") e termina em "done"
+            await new Promise((resolve, reject) => {
+                const source = new EventSource(`${apiEndpoint}?url=${encodeURIComponent(urlToSend)}`)
+                let received = false
+
+                source.addEventListener('analysis', (event) => {
+                    const data = JSON.parse(event.data)
+                    received = true
+                    setResponse({...data, explanation: ''})
+                    setLoading(false)
+                })
+
+                source.addEventListener('token', (event) => {
+                    const {text} = JSON.parse(event.data)
+                    setResponse((current) => current ? {...current, explanation: (current.explanation || '') + text} : current)
+                })
+
+                source.addEventListener('done', (event) => {
+                    const data = JSON.parse(event.data)
+                    setResponse((current) => current ? {...current, explanation: data.explanation, explanation_status: data.explanation_status} : current)
+                    source.close()
+                    resolve()
+                })
+
+                // Evento "error" enviado pelo servidor (com dados) ou erro de ligação (sem dados)
+                source.addEventListener('error', (event) => {
+                    source.close()
+                    if (event.data) {
+                        reject(new Error(JSON.parse(event.data).detail))
+                    } else if (!received) {
+                        reject(new Error('Failed to fetch'))
+                    } else {
+                        resolve()
+                    }
+                })
             })
-
-            if (!result.ok) {
-                throw new Error(`Erro do servidor: ${result.status}`)
-            }
-
-            const data = await result.json()
-            setResponse(data)
         } catch (e){
             console.error('[Frontend] Erro:', e);
             let errorMessage = `Problema no servidor: ${e.message}`;
@@ -148,6 +171,9 @@ const Resposta = ({response}) => {
                     {score.toFixed(2)}/100 - {status.text}
                 </span>
             </p>
+            {response.explanation_status === 'pending' && !response.explanation && (
+                <p><strong>Explicação:</strong> <em>a gerar...</em></p>
+            )}
             {response.explanation && (
                 <p><strong>Explicação:</strong> {response.explanation}</p>
             )}